@@ -46,7 +46,7 @@ cmake --build . --target chiaki-lib -j$(nproc)
 
 # Compile our Python wrapper
 echo "Compiling Python wrapper..."
-gcc -c -fPIC -o "$BUILD_DIR/python_wrapper.o" \
+gcc -c -fPIC -O2 -o "$BUILD_DIR/python_wrapper.o" \
     -I"$CHIAKI_DIR/lib/include" \
     -I"$BUILD_DIR/lib/include" \
     "$SRC_DIR/python_wrapper.c"
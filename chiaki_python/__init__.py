@@ -5,8 +5,16 @@ This package provides a Python API for controlling PS4/PS5 via Chiaki.
 """
 
 from .session import PS4Session, PS5Session
-from .controller import Controller
+from .async_session import AsyncPS4Session, AsyncPS5Session
+from .controller import Controller, AsyncController
 from .discovery import discover_consoles, get_console_status
+from .preview import PreviewServer
+from .live import LiveServer
+from .analytics import ActivityAnalyzer
+from .recorder import Recorder
+from .gop_index import RecordingReader
 
 __version__ = "0.1.0"
-__all__ = ["PS4Session", "PS5Session", "Controller", "discover_consoles", "get_console_status"]
+__all__ = ["PS4Session", "PS5Session", "AsyncPS4Session", "AsyncPS5Session", "Controller",
+           "AsyncController", "discover_consoles", "get_console_status", "PreviewServer",
+           "LiveServer", "ActivityAnalyzer", "Recorder", "RecordingReader"]
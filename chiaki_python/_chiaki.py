@@ -3,12 +3,17 @@ Low-level ctypes bindings for the Chiaki C library.
 """
 
 import ctypes
+import threading
+import time
+from typing import Iterable, List, Optional, Tuple
 from ctypes import (
     c_void_p, c_char_p, c_uint32, c_uint16, c_uint8, c_int8, c_int16,
     c_int32, c_uint64, c_size_t, c_bool, c_float, c_double, POINTER, Structure,
     CFUNCTYPE
 )
 
+import numpy as np
+
 # Load the Chiaki shared library
 import os
 _BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
@@ -25,6 +30,35 @@ CHIAKI_SESSION_AUTH_SIZE = 0x10
 CHIAKI_PSN_ACCOUNT_ID_SIZE = 8
 CHIAKI_CONTROLLER_TOUCHES_MAX = 2
 
+# Python wrapper limits (must match src/python_wrapper.c)
+MAX_FRAME_SIZE = 4 * 1024 * 1024
+FRAME_RING_SLOTS = 256
+FRAME_DESC_HISTORY = 1024
+BROADCAST_SLOTS = 256
+GOP_CACHE_MAX_BYTES = 32 * 1024 * 1024
+IDR_COOLDOWN_MS = 500
+MAX_CONSUMERS = 16
+
+# Slow-reader policies for chiaki_python_session_add_consumer
+CONSUMER_POLICY_BLOCK = 0
+CONSUMER_POLICY_DROP_OLDEST = 1
+CONSUMER_POLICY_SKIP_TO_KEYFRAME = 2
+
+# Decoder options (must match src/python_wrapper.c)
+DECODER_EXPORT_MVS = (1 << 0)  # Keep motion vectors for motion_vectors()/motion_grid(), H.264 only
+MOTION_GRID_CHANNELS = 3       # Mean motion, moving fraction, intra fraction
+
+# Decoder.convert output formats (must match src/python_wrapper.c)
+CONVERT_RGB = 0
+CONVERT_BGR = 1
+CONVERT_GREY = 2
+CONVERT_MAX_SCALE = 16
+
+# Decoder.encode_image formats (must match src/python_wrapper.c)
+IMAGE_JPEG = 0
+IMAGE_PNG = 1
+IMAGE_WEBP = 2  # Needs libavcodec built with libwebp
+
 # Error codes
 CHIAKI_ERR_SUCCESS = 0
 CHIAKI_ERR_UNKNOWN = 1
@@ -56,6 +90,17 @@ CHIAKI_VIDEO_FPS_PRESET_60 = 60
 CHIAKI_CODEC_H264 = 0
 CHIAKI_CODEC_H265 = 1
 
+# NAL classes reported by chiaki_python_scan_nals (NalScan.flags)
+NAL_FLAG_SPS = (1 << 0)
+NAL_FLAG_PPS = (1 << 1)
+NAL_FLAG_VPS = (1 << 2)
+NAL_FLAG_IDR = (1 << 3)
+NAL_FLAG_IRAP = (1 << 4)
+NAL_FLAG_I_SLICE = (1 << 5)
+NAL_FLAG_SLICE = (1 << 6)
+NAL_FLAG_SEI = (1 << 7)
+NAL_FLAG_INTER = (1 << 8)
+
 # Controller buttons (bitmask)
 CHIAKI_CONTROLLER_BUTTON_CROSS = (1 << 0)
 CHIAKI_CONTROLLER_BUTTON_MOON = (1 << 1)
@@ -88,13 +133,27 @@ CHIAKI_EVENT_CONNECTED = 0
 CHIAKI_EVENT_LOGIN_PIN_REQUEST = 1
 CHIAKI_EVENT_QUIT = 9
 
+# Readiness bits returned by chiaki_python_session_ack_events
+CHIAKI_PYTHON_EVENT_FRAME = (1 << 0)
+CHIAKI_PYTHON_EVENT_IFRAME = (1 << 1)
+CHIAKI_PYTHON_EVENT_CONNECTED = (1 << 2)
+CHIAKI_PYTHON_EVENT_QUIT = (1 << 3)
+CHIAKI_PYTHON_EVENT_LIFECYCLE = (1 << 4)  # Take it with chiaki_python_session_next_event
+
+# Lifecycle event queue (must match src/python_wrapper.c)
+EVENT_REASON_MAX = 128
+
 # Log levels
-CHIAKI_LOG_DEBUG = (1 << 0)
-CHIAKI_LOG_VERBOSE = (1 << 1)
+CHIAKI_LOG_DEBUG = (1 << 4)
+CHIAKI_LOG_VERBOSE = (1 << 3)
 CHIAKI_LOG_INFO = (1 << 2)
-CHIAKI_LOG_WARNING = (1 << 3)
-CHIAKI_LOG_ERROR = (1 << 4)
-CHIAKI_LOG_ALL = 0xffffffff
+CHIAKI_LOG_WARNING = (1 << 1)
+CHIAKI_LOG_ERROR = (1 << 0)
+CHIAKI_LOG_ALL = ((1 << 5) - 1)
+
+# Per-session log ring (must match src/python_wrapper.c)
+LOG_RING_SLOTS = 512
+LOG_MSG_MAX = 232
 
 
 # Callback types
@@ -189,6 +248,232 @@ class ChiakiEvent(Structure):
     ]
 
 
+class NalScan(Structure):
+    """Result of scanning every NAL unit of an Annex-B sample."""
+    _fields_ = [
+        ("flags", c_uint32),
+        ("nal_count", c_int32),
+        ("first_nal_type", c_int32),
+        # Only set when the sample carries an SPS
+        ("width", c_int32),
+        ("height", c_int32),
+        ("profile_idc", c_int32),
+        ("level_idc", c_int32),
+        ("bit_depth", c_int32),
+        ("chroma_format_idc", c_int32),
+    ]
+
+    @property
+    def is_keyframe(self) -> bool:
+        """IDR/IRAP, or an H.264 picture made only of I-slices."""
+        if self.flags & NAL_FLAG_IRAP:
+            return True
+        return bool(self.flags & NAL_FLAG_I_SLICE) and not self.flags & NAL_FLAG_INTER
+
+
+class PythonEvent(Structure):
+    """Lifecycle event from chiaki_python_session_next_event."""
+    _fields_ = [
+        ("type", c_int32),          # CHIAKI_EVENT_CONNECTED, _LOGIN_PIN_REQUEST or _QUIT
+        ("quit_reason", c_int32),   # CHIAKI_QUIT_REASON_* (QUIT only)
+        ("time_ns", c_uint64),      # CLOCK_MONOTONIC
+        ("pin_incorrect", c_uint8), # LOGIN_PIN_REQUEST: the previous PIN was wrong
+        ("reserved", c_uint8 * 7),
+        ("reason_str", ctypes.c_char * EVENT_REASON_MAX),
+    ]
+
+
+class LogEntry(Structure):
+    """One message from a session's log ring."""
+    _fields_ = [
+        ("seq", c_uint64),
+        ("time_ns", c_uint64),  # CLOCK_MONOTONIC
+        ("level", c_uint32),    # CHIAKI_LOG_* bit
+        ("len", c_uint32),
+        ("msg", ctypes.c_char * LOG_MSG_MAX),
+    ]
+
+
+class FrameDesc(Structure):
+    """Per-frame descriptor recorded by the wrapper's video callback."""
+    _fields_ = [
+        ("seq", c_uint64),
+        ("recv_time_ns", c_uint64),  # CLOCK_MONOTONIC, comparable with time.monotonic_ns()
+        ("size", c_uint32),
+        ("frames_lost", c_int32),
+        ("nal_flags", c_uint32),     # NAL_FLAG_* bits
+        ("keyframe", c_uint8),
+        ("recovered", c_uint8),
+        ("undecodable", c_uint8),    # Follows a loss, no keyframe since
+        ("reserved", c_uint8),
+    ]
+
+
+# NumPy view of a FrameDesc array, field for field
+FRAME_DESC_DTYPE = np.dtype([
+    ("seq", np.uint64),
+    ("recv_time_ns", np.uint64),
+    ("size", np.uint32),
+    ("frames_lost", np.int32),
+    ("nal_flags", np.uint32),
+    ("keyframe", np.uint8),
+    ("recovered", np.uint8),
+    ("undecodable", np.uint8),
+    ("reserved", np.uint8),
+])
+assert FRAME_DESC_DTYPE.itemsize == ctypes.sizeof(FrameDesc)
+
+
+# libavutil's AVMotionVector, as exported by a DECODER_EXPORT_MVS decoder
+MOTION_VECTOR_DTYPE = np.dtype([
+    ("source", np.int32),        # -1 past reference, 1 future reference
+    ("w", np.uint8),             # Block size
+    ("h", np.uint8),
+    ("src_x", np.int16),         # Block centre in the reference picture
+    ("src_y", np.int16),
+    ("dst_x", np.int16),         # Block centre in this picture
+    ("dst_y", np.int16),
+    ("flags", np.uint64),
+    ("motion_x", np.int32),      # Motion in 1 / motion_scale pixels
+    ("motion_y", np.int32),
+    ("motion_scale", np.uint16),
+], align=True)
+
+
+class ConsumerStats(Structure):
+    """Counters of one broadcast consumer."""
+    _fields_ = [
+        ("delivered", c_uint64),
+        ("dropped", c_uint64),
+        ("lag", c_uint64),         # Frames currently unread
+        ("peak_lag", c_uint64),
+        ("blocked_ns", c_uint64),  # Time the video callback waited for this consumer
+        ("policy", c_int32),
+        ("resync", c_int32),       # Waiting for a keyframe (SKIP_TO_KEYFRAME)
+    ]
+
+
+class RecoveryPolicy(Structure):
+    """How the wrapper reacts to frame loss."""
+    _fields_ = [
+        ("auto_idr", c_int32),        # Request an IDR when a loss leaves the stream undecodable
+        ("cooldown_ms", c_uint32),    # IDR requests inside this window are coalesced
+        ("loss_threshold", c_int32),  # frames_lost needed to count as a loss
+    ]
+
+
+class RecoveryStats(Structure):
+    """Loss and recovery counters of a session."""
+    _fields_ = [
+        ("loss_events", c_uint64),
+        ("frames_lost", c_uint64),
+        ("undecodable_frames", c_uint64),
+        ("idr_requests", c_uint64),       # Requests actually sent
+        ("idr_coalesced", c_uint64),      # Requests absorbed by a pending one
+        ("recoveries", c_uint64),         # Keyframes that ended an undecodable stretch
+        ("last_recovery_ns", c_uint64),   # Loss to keyframe time of the last recovery
+        ("recovering", c_uint32),
+        ("reserved", c_uint32),
+    ]
+
+
+class ScreenshotStats(Structure):
+    """Counters of the screenshot service."""
+    _fields_ = [
+        ("requests", c_uint64),
+        ("cache_hits", c_uint64),     # Served from a keyframe within max_age
+        ("idr_requests", c_uint64),   # Requests that asked the console for a keyframe
+        ("shared_waits", c_uint64),   # Requests that joined an IDR already in flight
+        ("timeouts", c_uint64),
+    ]
+
+
+class GopInfo(Structure):
+    """Summary of the session's cached GOP."""
+    _fields_ = [
+        ("keyframe_seq", c_uint64),
+        ("last_seq", c_uint64),
+        ("bytes", c_uint64),        # Buffer size needed to copy it
+        ("frame_count", c_uint32),  # Including a separate parameter set entry
+        ("complete", c_uint32),     # Decodes up to the latest frame
+    ]
+
+
+class ReplayInfo(Structure):
+    """Summary of the session's instant replay ring."""
+    _fields_ = [
+        ("first_seq", c_uint64),
+        ("last_seq", c_uint64),
+        ("start_time_ns", c_uint64),  # Arrival of the first keyframe, CLOCK_MONOTONIC
+        ("end_time_ns", c_uint64),    # Arrival of the last frame
+        ("bytes", c_uint64),          # Buffer size needed to copy all of it
+        ("dropped_gops", c_uint64),   # GOPs evicted by the time or byte limit
+        ("overflows", c_uint64),      # GOPs larger than the ring, lost entirely
+        ("frame_count", c_uint32),    # Including separate parameter set entries
+        ("gop_count", c_uint32),
+    ]
+
+
+class PythonVideoInfo(Structure):
+    """Stream parameters parsed from the session's last SPS."""
+    _fields_ = [
+        ("codec", c_int32),
+        ("width", c_int32),
+        ("height", c_int32),
+        ("profile_idc", c_int32),
+        ("level_idc", c_int32),
+        ("bit_depth", c_int32),
+        ("chroma_format_idc", c_int32),
+    ]
+
+
+class DecodedPicture(Structure):
+    """Description of a decoder's last picture."""
+    _fields_ = [
+        ("seq", c_uint64),      # Sequence number of the frame that produced it
+        ("width", c_int32),
+        ("height", c_int32),
+        ("pix_fmt", c_int32),   # AVPixelFormat
+        ("keyframe", c_int32),
+    ]
+
+
+class DecoderStats(Structure):
+    """Counters of a Decoder."""
+    _fields_ = [
+        ("packets", c_uint64),
+        ("pictures", c_uint64),
+        ("errors", c_uint64),
+        ("decode_ns", c_uint64),   # Time spent in libavcodec
+        ("convert_ns", c_uint64),  # Time spent converting to RGB
+        ("encode_ns", c_uint64),   # Time spent encoding images
+    ]
+
+
+class ConvertParams(Structure):
+    """Output format, region of interest and downscale factor for Decoder.convert."""
+    _fields_ = [
+        ("format", c_int32),  # CONVERT_RGB, CONVERT_BGR or CONVERT_GREY
+        ("x", c_int32),
+        ("y", c_int32),
+        ("width", c_int32),   # 0 = up to the right edge
+        ("height", c_int32),  # 0 = up to the bottom edge
+        ("scale", c_int32),   # Integer downscale factor, 1 = none
+    ]
+
+
+class PicturePlanes(Structure):
+    """Pointers to the planes of a decoder's last picture."""
+    _fields_ = [
+        ("data", c_void_p * 3),        # Y, U, V; or Y, interleaved UV, NULL
+        ("linesize", c_int32 * 3),
+        ("width", c_int32),
+        ("height", c_int32),
+        ("pix_fmt", c_int32),
+        ("bytes_per_sample", c_int32), # 2 for 10-bit pictures
+    ]
+
+
 # Opaque session structure - we don't need to define all fields
 class ChiakiSession(Structure):
     pass
@@ -292,6 +577,53 @@ _lib.chiaki_python_session_create.argtypes = [
 ]
 _lib.chiaki_python_session_create.restype = PythonSessionPtr
 
+# chiaki_python_session_create_ex - like create, with the CHIAKI_LOG_* levels handed to Python
+_lib.chiaki_python_session_create_ex.argtypes = [
+    c_char_p,           # host
+    c_char_p,           # regist_key_hex
+    c_char_p,           # rp_key_hex
+    POINTER(c_uint8),   # psn_account_id (8 bytes)
+    c_bool,             # is_ps5
+    c_int32,            # resolution_preset
+    c_int32,            # fps_preset
+    c_uint32            # log_mask
+]
+_lib.chiaki_python_session_create_ex.restype = PythonSessionPtr
+
+# chiaki_python_session_next_event - take the next lifecycle event (timeout_ms < 0 waits forever)
+_lib.chiaki_python_session_next_event.argtypes = [PythonSessionPtr, c_int32, POINTER(PythonEvent)]
+_lib.chiaki_python_session_next_event.restype = c_bool
+
+# chiaki_python_session_close_events - wake next_event/wait_connected waiters for good
+_lib.chiaki_python_session_close_events.argtypes = [PythonSessionPtr]
+_lib.chiaki_python_session_close_events.restype = None
+
+# chiaki_python_session_get_quit_event - the quit event, false while running
+_lib.chiaki_python_session_get_quit_event.argtypes = [PythonSessionPtr, POINTER(PythonEvent)]
+_lib.chiaki_python_session_get_quit_event.restype = c_bool
+
+# chiaki_python_session_set_login_pin - answer a LOGIN_PIN_REQUEST
+_lib.chiaki_python_session_set_login_pin.argtypes = [PythonSessionPtr, c_char_p]
+_lib.chiaki_python_session_set_login_pin.restype = c_bool
+
+# chiaki_python_session_set_log_mask - levels handed to Python from now on
+_lib.chiaki_python_session_set_log_mask.argtypes = [PythonSessionPtr, c_uint32]
+_lib.chiaki_python_session_set_log_mask.restype = None
+
+# chiaki_python_session_log_drain - take the messages logged since the last drain
+_lib.chiaki_python_session_log_drain.argtypes = [
+    PythonSessionPtr,
+    POINTER(LogEntry),  # out
+    c_size_t,           # max_entries
+    POINTER(c_uint64),  # dropped_out
+    POINTER(c_bool)     # quit_dump_out
+]
+_lib.chiaki_python_session_log_drain.restype = c_size_t
+
+# chiaki_python_session_log_dump - flight recorder, the most recent messages
+_lib.chiaki_python_session_log_dump.argtypes = [PythonSessionPtr, POINTER(LogEntry), c_size_t]
+_lib.chiaki_python_session_log_dump.restype = c_size_t
+
 # chiaki_python_session_start
 _lib.chiaki_python_session_start.argtypes = [PythonSessionPtr]
 _lib.chiaki_python_session_start.restype = c_bool
@@ -338,6 +670,156 @@ _lib.chiaki_python_session_get_frame_ex.restype = c_size_t
 _lib.chiaki_python_session_get_frame_seq.argtypes = [PythonSessionPtr]
 _lib.chiaki_python_session_get_frame_seq.restype = c_uint64
 
+# chiaki_python_session_drain_frames - get every frame queued since the last drain
+_lib.chiaki_python_session_drain_frames.argtypes = [
+    PythonSessionPtr,
+    POINTER(c_uint8),   # buffer
+    c_size_t,           # buffer_size
+    POINTER(c_size_t),  # sizes_out
+    POINTER(c_uint64),  # seqs_out (may be NULL)
+    c_size_t            # max_frames
+]
+_lib.chiaki_python_session_drain_frames.restype = c_size_t
+
+# chiaki_python_session_drain_frames_ex - like drain_frames, with a FrameDesc per frame
+_lib.chiaki_python_session_drain_frames_ex.argtypes = [
+    PythonSessionPtr,
+    POINTER(c_uint8),   # buffer
+    c_size_t,           # buffer_size
+    POINTER(FrameDesc), # descs_out
+    c_size_t            # max_frames
+]
+_lib.chiaki_python_session_drain_frames_ex.restype = c_size_t
+
+# chiaki_python_session_get_frame_desc - descriptor of one of the last FRAME_DESC_HISTORY frames
+_lib.chiaki_python_session_get_frame_desc.argtypes = [PythonSessionPtr, c_uint64, POINTER(FrameDesc)]
+_lib.chiaki_python_session_get_frame_desc.restype = c_bool
+
+# chiaki_python_session_get_frame_descs - descriptors of retained frames newer than since_seq
+_lib.chiaki_python_session_get_frame_descs.argtypes = [
+    PythonSessionPtr,
+    c_uint64,           # since_seq
+    POINTER(FrameDesc), # out
+    c_size_t            # max_descs
+]
+_lib.chiaki_python_session_get_frame_descs.restype = c_size_t
+
+# chiaki_python_session_add_consumer - register a broadcast reader, returns its id or -1
+_lib.chiaki_python_session_add_consumer.argtypes = [
+    PythonSessionPtr,
+    c_int32,            # policy (CONSUMER_POLICY_*)
+    c_uint32,           # max_lag (0 = BROADCAST_SLOTS)
+    c_int32             # block_timeout_ms
+]
+_lib.chiaki_python_session_add_consumer.restype = c_int32
+
+# chiaki_python_session_remove_consumer
+_lib.chiaki_python_session_remove_consumer.argtypes = [PythonSessionPtr, c_int32]
+_lib.chiaki_python_session_remove_consumer.restype = None
+
+# chiaki_python_session_consumer_read - frames the consumer hasn't seen yet, with a FrameDesc each
+_lib.chiaki_python_session_consumer_read.argtypes = [
+    PythonSessionPtr,
+    c_int32,            # consumer id
+    c_int32,            # timeout_ms (negative waits forever)
+    POINTER(c_uint8),   # buffer
+    c_size_t,           # buffer_size
+    POINTER(FrameDesc), # descs_out
+    c_size_t            # max_frames
+]
+_lib.chiaki_python_session_consumer_read.restype = c_size_t
+
+# chiaki_python_session_consumer_join_gop - start a new consumer with the cached GOP
+_lib.chiaki_python_session_consumer_join_gop.argtypes = [PythonSessionPtr, c_int32]
+_lib.chiaki_python_session_consumer_join_gop.restype = c_size_t
+
+# chiaki_python_session_set_gop_cache_limit - byte cap of the GOP cache (0 disables it)
+_lib.chiaki_python_session_set_gop_cache_limit.argtypes = [PythonSessionPtr, c_size_t]
+_lib.chiaki_python_session_set_gop_cache_limit.restype = None
+
+# chiaki_python_session_get_gop_info
+_lib.chiaki_python_session_get_gop_info.argtypes = [PythonSessionPtr, POINTER(GopInfo)]
+_lib.chiaki_python_session_get_gop_info.restype = c_bool
+
+# chiaki_python_session_get_gop - copy parameter sets + keyframe + following frames
+_lib.chiaki_python_session_get_gop.argtypes = [
+    PythonSessionPtr,
+    POINTER(c_uint8),   # buffer
+    c_size_t,           # buffer_size
+    POINTER(FrameDesc), # descs_out
+    c_size_t            # max_frames
+]
+_lib.chiaki_python_session_get_gop.restype = c_size_t
+
+# chiaki_python_session_get_gop_tail - only the GOP frames after after_seq, 0 if the GOP moved on
+_lib.chiaki_python_session_get_gop_tail.argtypes = [
+    PythonSessionPtr,
+    c_uint64,           # keyframe_seq
+    c_uint64,           # after_seq
+    POINTER(c_uint8),   # buffer
+    c_size_t,           # buffer_size
+    POINTER(FrameDesc), # descs_out
+    c_size_t            # max_frames
+]
+_lib.chiaki_python_session_get_gop_tail.restype = c_size_t
+
+# chiaki_python_session_set_replay - instant replay ring size, span and forced keyframe interval (0 bytes disables it)
+_lib.chiaki_python_session_set_replay.argtypes = [PythonSessionPtr, c_size_t, c_uint32, c_uint32]
+_lib.chiaki_python_session_set_replay.restype = c_bool
+
+# chiaki_python_session_get_replay_info
+_lib.chiaki_python_session_get_replay_info.argtypes = [PythonSessionPtr, POINTER(ReplayInfo)]
+_lib.chiaki_python_session_get_replay_info.restype = c_bool
+
+# chiaki_python_session_get_replay - copy the newest whole GOPs spanning max_ms (0 = all)
+_lib.chiaki_python_session_get_replay.argtypes = [
+    PythonSessionPtr,
+    c_uint32,           # max_ms
+    POINTER(c_uint8),   # buffer
+    c_size_t,           # buffer_size
+    POINTER(FrameDesc), # descs_out
+    c_size_t            # max_frames
+]
+_lib.chiaki_python_session_get_replay.restype = c_size_t
+
+# chiaki_python_session_get_consumer_stats
+_lib.chiaki_python_session_get_consumer_stats.argtypes = [PythonSessionPtr, c_int32, POINTER(ConsumerStats)]
+_lib.chiaki_python_session_get_consumer_stats.restype = c_bool
+
+# chiaki_python_session_pending_frames - number of frames waiting to be drained
+_lib.chiaki_python_session_pending_frames.argtypes = [PythonSessionPtr]
+_lib.chiaki_python_session_pending_frames.restype = c_size_t
+
+# chiaki_python_session_get_dropped_frames - frames lost because the ring was full
+_lib.chiaki_python_session_get_dropped_frames.argtypes = [PythonSessionPtr]
+_lib.chiaki_python_session_get_dropped_frames.restype = c_uint64
+
+# chiaki_python_session_wait_frame - block until a frame newer than since_seq, then copy it
+_lib.chiaki_python_session_wait_frame.argtypes = [
+    PythonSessionPtr,
+    c_uint64,           # since_seq
+    c_int32,            # timeout_ms (negative waits forever)
+    POINTER(c_uint8),   # buffer
+    c_size_t,           # buffer_size
+    POINTER(c_uint64)   # seq_out
+]
+_lib.chiaki_python_session_wait_frame.restype = c_size_t
+
+# chiaki_python_session_wait_iframe - block until an I-frame newer than since_seq, then copy it
+_lib.chiaki_python_session_wait_iframe.argtypes = [
+    PythonSessionPtr,
+    c_uint64,           # since_seq
+    c_int32,            # timeout_ms (negative waits forever)
+    POINTER(c_uint8),   # buffer
+    c_size_t,           # buffer_size
+    POINTER(c_uint64)   # seq_out
+]
+_lib.chiaki_python_session_wait_iframe.restype = c_size_t
+
+# chiaki_python_session_wait_seq - block until a frame newer than since_seq, no copy
+_lib.chiaki_python_session_wait_seq.argtypes = [PythonSessionPtr, c_uint64, c_int32]
+_lib.chiaki_python_session_wait_seq.restype = c_uint64
+
 # chiaki_python_session_get_iframe - get complete I-frame for screenshots
 _lib.chiaki_python_session_get_iframe.argtypes = [
     PythonSessionPtr,
@@ -346,6 +828,18 @@ _lib.chiaki_python_session_get_iframe.argtypes = [
 ]
 _lib.chiaki_python_session_get_iframe.restype = c_size_t
 
+# chiaki_python_session_get_max_frame_size - buffer size needed for the largest frame seen
+_lib.chiaki_python_session_get_max_frame_size.argtypes = [PythonSessionPtr]
+_lib.chiaki_python_session_get_max_frame_size.restype = c_size_t
+
+# chiaki_python_session_get_video_info - resolution/profile from the last SPS
+_lib.chiaki_python_session_get_video_info.argtypes = [PythonSessionPtr, POINTER(PythonVideoInfo)]
+_lib.chiaki_python_session_get_video_info.restype = c_bool
+
+# chiaki_python_scan_nals - classify every NAL unit of an Annex-B sample
+_lib.chiaki_python_scan_nals.argtypes = [c_void_p, c_size_t, c_int32, POINTER(NalScan)]
+_lib.chiaki_python_scan_nals.restype = None
+
 # chiaki_python_session_has_iframe - check if I-frame is available
 _lib.chiaki_python_session_has_iframe.argtypes = [PythonSessionPtr]
 _lib.chiaki_python_session_has_iframe.restype = c_bool
@@ -358,6 +852,40 @@ _lib.chiaki_python_session_clear_iframe.restype = None
 _lib.chiaki_python_session_request_idr.argtypes = [PythonSessionPtr]
 _lib.chiaki_python_session_request_idr.restype = c_bool
 
+# chiaki_python_session_screenshot - keyframe at most max_age_ms old, one shared IDR otherwise
+_lib.chiaki_python_session_screenshot.argtypes = [
+    PythonSessionPtr,
+    c_uint32,           # max_age_ms
+    c_int32,            # timeout_ms (negative waits forever)
+    POINTER(c_uint8),   # buffer
+    c_size_t,           # buffer_size
+    POINTER(c_uint64),  # seq_out
+    POINTER(c_uint64)   # age_ns_out
+]
+_lib.chiaki_python_session_screenshot.restype = c_size_t
+
+# chiaki_python_session_get_screenshot_stats
+_lib.chiaki_python_session_get_screenshot_stats.argtypes = [PythonSessionPtr, POINTER(ScreenshotStats)]
+_lib.chiaki_python_session_get_screenshot_stats.restype = c_bool
+
+# chiaki_python_session_set_recovery_policy / get_recovery_policy
+_lib.chiaki_python_session_set_recovery_policy.argtypes = [PythonSessionPtr, POINTER(RecoveryPolicy)]
+_lib.chiaki_python_session_set_recovery_policy.restype = None
+_lib.chiaki_python_session_get_recovery_policy.argtypes = [PythonSessionPtr, POINTER(RecoveryPolicy)]
+_lib.chiaki_python_session_get_recovery_policy.restype = c_bool
+
+# chiaki_python_session_get_recovery_stats - loss/IDR/recovery counters
+_lib.chiaki_python_session_get_recovery_stats.argtypes = [PythonSessionPtr, POINTER(RecoveryStats)]
+_lib.chiaki_python_session_get_recovery_stats.restype = c_bool
+
+# chiaki_python_session_get_fd - pollable readiness fd (eventfd), -1 if unavailable
+_lib.chiaki_python_session_get_fd.argtypes = [PythonSessionPtr]
+_lib.chiaki_python_session_get_fd.restype = c_int32
+
+# chiaki_python_session_ack_events - reset the fd and return pending CHIAKI_PYTHON_EVENT_* bits
+_lib.chiaki_python_session_ack_events.argtypes = [PythonSessionPtr]
+_lib.chiaki_python_session_ack_events.restype = c_uint32
+
 # chiaki_python_session_stop
 _lib.chiaki_python_session_stop.argtypes = [PythonSessionPtr]
 _lib.chiaki_python_session_stop.restype = None
@@ -365,3 +893,901 @@ _lib.chiaki_python_session_stop.restype = None
 # chiaki_python_session_destroy
 _lib.chiaki_python_session_destroy.argtypes = [PythonSessionPtr]
 _lib.chiaki_python_session_destroy.restype = None
+
+# Decoder (libavcodec, one per thread)
+class PythonDecoder(Structure):
+    pass
+
+
+PythonDecoderPtr = POINTER(PythonDecoder)
+
+# chiaki_python_decoder_create - codec is CHIAKI_CODEC_*, flags DECODER_*, NULL if libavcodec lacks it
+_lib.chiaki_python_decoder_create.argtypes = [c_int32, c_int32, c_int32]
+_lib.chiaki_python_decoder_create.restype = PythonDecoderPtr
+
+# chiaki_python_decoder_snapshot - codec-less decoder referencing the last picture, NULL without one
+_lib.chiaki_python_decoder_snapshot.argtypes = [PythonDecoderPtr]
+_lib.chiaki_python_decoder_snapshot.restype = PythonDecoderPtr
+
+# chiaki_python_decoder_take_picture - move src's picture into dst, false if src has none
+_lib.chiaki_python_decoder_take_picture.argtypes = [PythonDecoderPtr, PythonDecoderPtr]
+_lib.chiaki_python_decoder_take_picture.restype = c_bool
+
+# chiaki_python_decoder_destroy
+_lib.chiaki_python_decoder_destroy.argtypes = [PythonDecoderPtr]
+_lib.chiaki_python_decoder_destroy.restype = None
+
+# chiaki_python_decoder_decode - 1 new picture, 0 none yet, -1 error (size 0 drains)
+_lib.chiaki_python_decoder_decode.argtypes = [PythonDecoderPtr, c_void_p, c_size_t, c_uint64, POINTER(DecodedPicture)]
+_lib.chiaki_python_decoder_decode.restype = c_int32
+
+# chiaki_python_decoder_reset - drop buffered state before decoding from a new keyframe
+_lib.chiaki_python_decoder_reset.argtypes = [PythonDecoderPtr]
+_lib.chiaki_python_decoder_reset.restype = None
+
+# chiaki_python_decoder_get_picture - describe the last picture, false before the first
+_lib.chiaki_python_decoder_get_picture.argtypes = [PythonDecoderPtr, POINTER(DecodedPicture)]
+_lib.chiaki_python_decoder_get_picture.restype = c_bool
+
+# chiaki_python_decoder_get_stats
+_lib.chiaki_python_decoder_get_stats.argtypes = [PythonDecoderPtr, POINTER(DecoderStats)]
+_lib.chiaki_python_decoder_get_stats.restype = None
+
+# chiaki_python_decoder_get_rgb - convert the last picture to packed RGB (out, out_size, stride)
+_lib.chiaki_python_decoder_get_rgb.argtypes = [PythonDecoderPtr, c_void_p, c_size_t, c_size_t]
+_lib.chiaki_python_decoder_get_rgb.restype = c_bool
+
+# chiaki_python_decoder_convert - RGB/BGR/grey of a region, optionally downscaled (out, out_size, stride)
+_lib.chiaki_python_decoder_convert.argtypes = [PythonDecoderPtr, POINTER(ConvertParams), c_void_p, c_size_t, c_size_t]
+_lib.chiaki_python_decoder_convert.restype = c_bool
+
+# chiaki_python_decoder_get_planes - zero-copy plane pointers of the last picture
+_lib.chiaki_python_decoder_get_planes.argtypes = [PythonDecoderPtr, POINTER(PicturePlanes)]
+_lib.chiaki_python_decoder_get_planes.restype = c_bool
+
+# chiaki_python_decoder_encode_image - JPEG/PNG/WebP of a region, optionally downscaled (format, quality, out, out_size, size_out)
+_lib.chiaki_python_decoder_encode_image.argtypes = [PythonDecoderPtr, POINTER(ConvertParams), c_int32, c_int32, c_void_p, c_size_t, POINTER(c_size_t)]
+_lib.chiaki_python_decoder_encode_image.restype = c_bool
+
+# chiaki_python_decoder_get_motion_vectors - zero-copy AVMotionVector array of the last picture (vectors, count)
+_lib.chiaki_python_decoder_get_motion_vectors.argtypes = [PythonDecoderPtr, POINTER(c_void_p), POINTER(c_size_t)]
+_lib.chiaki_python_decoder_get_motion_vectors.restype = c_bool
+
+# chiaki_python_decoder_motion_grid - per-tile motion summary (tile, min_motion, out floats, out_count)
+_lib.chiaki_python_decoder_motion_grid.argtypes = [PythonDecoderPtr, c_int32, c_float, c_void_p, c_size_t]
+_lib.chiaki_python_decoder_motion_grid.restype = c_bool
+
+
+def drain_frames(session, buffer=None, max_frames=FRAME_RING_SLOTS):
+    """
+    Drain every frame queued since the last call.
+
+    The first call starts the queue and returns nothing, see
+    PS4Session.drain_frames().
+
+    Args:
+        session: PythonSession handle from chiaki_python_session_create
+        buffer: Optional (c_uint8 * n) array to reuse between calls
+        max_frames: Maximum number of frames to return
+
+    Returns:
+        List of (seq, data) tuples in arrival order
+    """
+    if buffer is None:
+        buffer = (c_uint8 * max(MAX_FRAME_SIZE * 2, _lib.chiaki_python_session_get_max_frame_size(session)))()
+    sizes = (c_size_t * max_frames)()
+    seqs = (c_uint64 * max_frames)()
+    count = _lib.chiaki_python_session_drain_frames(
+        session, buffer, len(buffer), sizes, seqs, max_frames
+    )
+
+    view = memoryview(buffer).cast('B')
+    frames = []
+    offset = 0
+    for i in range(count):
+        size = sizes[i]
+        frames.append((seqs[i], view[offset:offset + size].tobytes()))
+        offset += size
+    return frames
+
+
+def get_frame_descs(session, since_seq: int = 0, max_descs: int = FRAME_DESC_HISTORY) -> np.ndarray:
+    """
+    Descriptors of the retained frames newer than ``since_seq``.
+
+    Unlike drain_frames() this doesn't consume anything, any number of
+    readers can poll it.
+
+    Args:
+        session: PythonSession handle
+        since_seq: Last sequence number already seen
+        max_descs: Maximum number of (newest) descriptors to return
+
+    Returns:
+        Structured array with FRAME_DESC_DTYPE, oldest first
+    """
+    out = np.zeros(max_descs, dtype=FRAME_DESC_DTYPE)
+    count = _lib.chiaki_python_session_get_frame_descs(
+        session, since_seq, out.ctypes.data_as(POINTER(FrameDesc)), max_descs
+    )
+    return out[:count]
+
+
+def scan_nals(data, codec: int = CHIAKI_CODEC_H264) -> NalScan:
+    """
+    Classify every NAL unit of an encoded sample.
+
+    Args:
+        data: Annex-B sample (bytes, bytearray, memoryview or uint8 array)
+        codec: CHIAKI_CODEC_H264 or CHIAKI_CODEC_H265
+
+    Returns:
+        NalScan with NAL_FLAG_* flags and, if an SPS is present, resolution and profile
+    """
+    scan = NalScan()
+    view = memoryview(data).cast('B')
+    if len(view) == 0:
+        scan.first_nal_type = -1
+        return scan
+    if isinstance(data, bytes):
+        ptr = data  # ctypes passes the bytes object's own buffer
+    elif view.readonly:
+        ptr = view.tobytes()
+    else:
+        ptr = ctypes.addressof(ctypes.c_char.from_buffer(view))
+    _lib.chiaki_python_scan_nals(ptr, len(view), codec, ctypes.byref(scan))
+    return scan
+
+
+def _timeout_ms(timeout: Optional[float]) -> int:
+    """Convert a timeout in seconds (None = forever) to the wrapper's milliseconds."""
+    return -1 if timeout is None else max(0, int(timeout * 1000))
+
+
+class FrameBuffer:
+    """
+    Reusable caller-owned buffer that the wrapper copies frames into.
+
+    Frames are handed out as memoryview slices (or NumPy views) over this
+    buffer instead of ``bytes(buffer[:size])`` copies. A view is only valid
+    until the next fill: every fill releases the memoryviews returned by the
+    previous one, so touching a stale view raises ValueError instead of
+    silently reading newer data. NumPy views cannot be revoked, copy them
+    with ``.copy()`` if they have to outlive the next fill.
+
+    The buffer grows on demand when the session reports frames larger than
+    it (high bitrate PS5 I-frames can exceed MAX_FRAME_SIZE).
+    """
+
+    def __init__(self, size: int = MAX_FRAME_SIZE, max_frames: int = FRAME_RING_SLOTS):
+        """
+        Args:
+            size: Buffer size in bytes
+            max_frames: Maximum number of frames returned by one drain()
+        """
+        self._buffer = (c_uint8 * size)()
+        self._descs = np.zeros(max_frames, dtype=FRAME_DESC_DTYPE)
+        self._views = []
+        self.descs = self._descs[:0]
+        self.size = 0
+        self.seq = 0
+
+    def __len__(self):
+        return len(self._buffer)
+
+    @property
+    def pointer(self):
+        """Buffer as a ``POINTER(c_uint8)`` for direct _lib calls."""
+        return ctypes.cast(self._buffer, POINTER(c_uint8))
+
+    def _export(self, offset: int, size: int) -> memoryview:
+        view = memoryview(self._buffer).cast('B')[offset:offset + size]
+        self._views.append(view)
+        return view
+
+    def release(self):
+        """Invalidate every view handed out since the last fill."""
+        for view in self._views:
+            view.release()
+        self._views.clear()
+
+    def _grow(self, session) -> bool:
+        """Reallocate if the session has seen frames larger than the buffer."""
+        needed = _lib.chiaki_python_session_get_max_frame_size(session)
+        if needed <= len(self._buffer):
+            return False
+        self.release()
+        # Leave headroom so a slowly growing maximum doesn't reallocate every time
+        self._buffer = (c_uint8 * (needed + needed // 4))()
+        self.size = 0
+        return True
+
+    def fill(self, size: int, seq: int = 0) -> Optional[memoryview]:
+        """Mark the first ``size`` bytes as valid after a direct _lib call."""
+        self.release()
+        self.size = size
+        self.seq = seq
+        return self._export(0, size) if size > 0 else None
+
+    def view(self) -> Optional[memoryview]:
+        """Memoryview of the current contents, or None if empty."""
+        return self._export(0, self.size) if self.size > 0 else None
+
+    def array(self) -> Optional[np.ndarray]:
+        """Read-only uint8 NumPy view of the current contents, or None if empty."""
+        if self.size == 0:
+            return None
+        arr = np.frombuffer(self._buffer, dtype=np.uint8, count=self.size)
+        arr.flags.writeable = False
+        return arr
+
+    def get_frame(self, session) -> Optional[memoryview]:
+        """Copy the latest frame of ``session`` in and return a view of it."""
+        seq_out = c_uint64(0)
+        size = _lib.chiaki_python_session_get_frame_ex(
+            session, self.pointer, len(self._buffer), ctypes.byref(seq_out)
+        )
+        if size == 0 and self._grow(session):
+            return self.get_frame(session)
+        return self.fill(size, seq_out.value)
+
+    def get_iframe(self, session) -> Optional[memoryview]:
+        """Copy the last complete I-frame of ``session`` in and return a view of it."""
+        size = _lib.chiaki_python_session_get_iframe(session, self.pointer, len(self._buffer))
+        if size == 0 and self._grow(session):
+            return self.get_iframe(session)
+        return self.fill(size)
+
+    def wait_frame(self, session, since_seq: int = 0, timeout: Optional[float] = None) -> Optional[memoryview]:
+        """
+        Block until a frame newer than ``since_seq`` arrives and return a view of it.
+
+        Args:
+            session: PythonSession handle
+            since_seq: Last sequence number already seen (``self.seq`` after a fill)
+            timeout: Seconds to wait, None waits until a frame arrives or the session quits
+
+        Returns:
+            View of the new frame, or None on timeout (nothing is copied then)
+        """
+        seq_out = c_uint64(0)
+        size = _lib.chiaki_python_session_wait_frame(
+            session, since_seq, _timeout_ms(timeout), self.pointer, len(self._buffer), ctypes.byref(seq_out)
+        )
+        if size == 0 and self._grow(session):
+            # The newer frame may have been too large, fetch it without waiting again
+            return self.wait_frame(session, since_seq, 0)
+        return self.fill(size, seq_out.value)
+
+    def wait_iframe(self, session, since_seq: int = 0, timeout: Optional[float] = None) -> Optional[memoryview]:
+        """Like wait_frame(), but for the next complete I-frame (SPS + PPS + IDR)."""
+        seq_out = c_uint64(0)
+        size = _lib.chiaki_python_session_wait_iframe(
+            session, since_seq, _timeout_ms(timeout), self.pointer, len(self._buffer), ctypes.byref(seq_out)
+        )
+        if size == 0 and self._grow(session):
+            return self.wait_iframe(session, since_seq, 0)
+        return self.fill(size, seq_out.value)
+
+    def screenshot(self, session, max_age: float = 1.0,
+                   timeout: Optional[float] = 5.0) -> Tuple[Optional[memoryview], float]:
+        """
+        Copy a keyframe no older than ``max_age`` seconds in.
+
+        The stored keyframe is reused when it is fresh enough; otherwise all
+        concurrent callers share a single IDR request.
+
+        Returns:
+            (view, age) with the keyframe's age in seconds, or (None, 0.0) on timeout
+        """
+        seq_out = c_uint64(0)
+        age_out = c_uint64(0)
+        max_age_ms = int(max_age * 1000)
+        deadline = None if timeout is None else time.monotonic() + timeout
+        size = _lib.chiaki_python_session_screenshot(
+            session, max_age_ms, _timeout_ms(timeout), self.pointer, len(self._buffer),
+            ctypes.byref(seq_out), ctypes.byref(age_out)
+        )
+        if size == 0 and self._grow(session):
+            # The keyframe didn't fit. It is stored now and reused while it is still
+            # within max_age, past that the retry waits out the rest of the timeout.
+            remaining = None if deadline is None else deadline - time.monotonic()
+            size = _lib.chiaki_python_session_screenshot(
+                session, max_age_ms, _timeout_ms(remaining), self.pointer, len(self._buffer),
+                ctypes.byref(seq_out), ctypes.byref(age_out)
+            )
+        view = self.fill(size, seq_out.value)
+        return view, (age_out.value / 1e9 if view is not None else 0.0)
+
+    def drain(self, session) -> List[Tuple[int, memoryview]]:
+        """
+        Drain every queued frame of ``session`` into this buffer.
+
+        Afterwards ``self.descs`` holds the FRAME_DESC_DTYPE descriptors of
+        the drained frames (same order, same lifetime as the views).
+
+        Returns:
+            List of (seq, view) tuples, each view valid until the next fill
+        """
+        self.release()
+        self._grow(session)
+        count = _lib.chiaki_python_session_drain_frames_ex(
+            session, self.pointer, len(self._buffer),
+            self._descs.ctypes.data_as(POINTER(FrameDesc)), len(self._descs)
+        )
+        return self._unpack(count)
+
+    def consume(self, session, consumer_id: int, timeout: Optional[float] = None) -> List[Tuple[int, memoryview]]:
+        """
+        Read the frames a broadcast consumer hasn't seen yet into this buffer.
+
+        Args:
+            session: PythonSession handle
+            consumer_id: Id from chiaki_python_session_add_consumer
+            timeout: Seconds to wait for the first frame, None waits until one arrives or the session quits
+
+        Returns:
+            List of (seq, view) tuples like drain(), ``self.descs`` describes them
+        """
+        self.release()
+        self._grow(session)
+        count = _lib.chiaki_python_session_consumer_read(
+            session, consumer_id, _timeout_ms(timeout), self.pointer, len(self._buffer),
+            self._descs.ctypes.data_as(POINTER(FrameDesc)), len(self._descs)
+        )
+        if count == 0 and self._grow(session):
+            # The next frame didn't fit, it is still queued for this consumer
+            return self.consume(session, consumer_id, 0)
+        return self._unpack(count)
+
+    def get_gop(self, session, keyframe_seq: int = 0, after_seq: int = 0) -> List[Tuple[int, memoryview]]:
+        """
+        Copy the session's cached GOP into this buffer.
+
+        Feeding the frames to a decoder in order reproduces the picture of
+        the last one without waiting for (or requesting) a new keyframe.
+
+        Args:
+            session: PythonSession handle
+            keyframe_seq: Only copy if the GOP still starts at this keyframe (0 = any)
+            after_seq: Only copy the frames newer than this, for a decoder
+                that has already consumed the GOP up to it
+
+        Returns:
+            List of (seq, view) tuples like drain(), empty if there is no
+            (matching) GOP or nothing newer than ``after_seq``
+        """
+        self.release()
+        count = 0
+        info = GopInfo()
+        # A new frame can grow the GOP between sizing and copying, size it once more then
+        for _ in range(2):
+            if not _lib.chiaki_python_session_get_gop_info(session, ctypes.byref(info)):
+                break
+            if info.bytes > len(self._buffer):
+                self._buffer = (c_uint8 * (info.bytes + info.bytes // 4))()
+            if info.frame_count > len(self._descs):
+                self._descs = np.zeros(info.frame_count * 2, dtype=FRAME_DESC_DTYPE)
+            count = _lib.chiaki_python_session_get_gop_tail(
+                session, keyframe_seq, after_seq, self.pointer, len(self._buffer),
+                self._descs.ctypes.data_as(POINTER(FrameDesc)), len(self._descs)
+            )
+            if count > 0:
+                break
+        return self._unpack(count)
+
+    def get_replay(self, session, duration: Optional[float] = None) -> List[Tuple[int, memoryview]]:
+        """
+        Copy the session's instant replay ring into this buffer.
+
+        The copy starts at a GOP boundary, so it decodes from its first
+        frame; it can therefore reach somewhat further back than asked.
+
+        Args:
+            session: PythonSession handle
+            duration: Seconds to copy, at least (None = everything kept)
+
+        Returns:
+            List of (seq, view) tuples like drain(), empty if replay is
+            disabled or holds nothing yet
+        """
+        self.release()
+        count = 0
+        info = ReplayInfo()
+        max_ms = int(duration * 1000) if duration else 0
+        # Sized for the whole ring; the copy fails if the ring moved past it meanwhile
+        for _ in range(2):
+            if not _lib.chiaki_python_session_get_replay_info(session, ctypes.byref(info)):
+                break
+            if info.bytes > len(self._buffer):
+                self._buffer = (c_uint8 * (info.bytes + info.bytes // 4))()
+            if info.frame_count > len(self._descs):
+                self._descs = np.zeros(info.frame_count * 2, dtype=FRAME_DESC_DTYPE)
+            count = _lib.chiaki_python_session_get_replay(
+                session, max_ms, self.pointer, len(self._buffer),
+                self._descs.ctypes.data_as(POINTER(FrameDesc)), len(self._descs)
+            )
+            if count > 0:
+                break
+        return self._unpack(count)
+
+    def _unpack(self, count: int) -> List[Tuple[int, memoryview]]:
+        """Export the ``count`` frames described by ``self._descs`` as views."""
+        self.descs = self._descs[:count]
+        frames = []
+        offset = 0
+        for seq, size in zip(self.descs['seq'].tolist(), self.descs['size'].tolist()):
+            frames.append((seq, self._export(offset, size)))
+            offset += size
+        self.size = offset
+        self.seq = frames[-1][0] if count else 0
+        return frames
+
+
+class FrameConsumer:
+    """
+    One reader of a session's frame broadcast.
+
+    Every consumer has its own cursor, so a recorder, a preview and an
+    analyzer can all read the same session at their own pace. What happens
+    when one falls behind is decided by its policy alone:
+
+    - CONSUMER_POLICY_BLOCK: nothing is skipped; the video callback waits
+      up to ``block_timeout`` per frame for the consumer, then the oldest
+      unread frame is dropped after all.
+    - CONSUMER_POLICY_DROP_OLDEST: at most ``max_lag`` unread frames are
+      kept, older ones are skipped.
+    - CONSUMER_POLICY_SKIP_TO_KEYFRAME: past ``max_lag`` unread frames
+      everything is skipped up to the next keyframe, so the consumer can
+      always resume decoding cleanly.
+    """
+
+    def __init__(self, session, policy: int = CONSUMER_POLICY_DROP_OLDEST, max_lag: int = 0,
+                 block_timeout: float = 0.05, buffer: Optional[FrameBuffer] = None,
+                 from_gop: bool = False):
+        """
+        Args:
+            session: PythonSession handle
+            policy: CONSUMER_POLICY_* constant
+            max_lag: Unread frames tolerated before the policy applies (0 = BROADCAST_SLOTS)
+            block_timeout: BLOCK only, seconds the video callback may wait per frame
+            buffer: FrameBuffer to read into (a new one by default)
+            from_gop: Start with the cached GOP so the first reads are decodable
+                right away; ``gop_frames`` tells how many frames it added
+        """
+        self._session = session
+        self.id = _lib.chiaki_python_session_add_consumer(
+            session, policy, max_lag, int(block_timeout * 1000)
+        )
+        if self.id < 0:
+            raise RuntimeError(f"Failed to add frame consumer (at most {MAX_CONSUMERS} per session)")
+        self.buffer = buffer if buffer is not None else FrameBuffer(2 * MAX_FRAME_SIZE, BROADCAST_SLOTS)
+        self.gop_frames = _lib.chiaki_python_session_consumer_join_gop(session, self.id) if from_gop else 0
+
+    def read(self, timeout: Optional[float] = None) -> List[Tuple[int, memoryview]]:
+        """
+        Get every frame this consumer hasn't seen yet.
+
+        Returns:
+            List of (seq, view) tuples, empty on timeout/quit. The views and
+            ``descs`` are valid until the next read.
+        """
+        if self._session is None:
+            return []
+        return self.buffer.consume(self._session, self.id, timeout)
+
+    @property
+    def descs(self) -> np.ndarray:
+        """FRAME_DESC_DTYPE descriptors of the frames returned by the last read()."""
+        return self.buffer.descs
+
+    @property
+    def stats(self) -> Optional[ConsumerStats]:
+        """Delivered/dropped/lag counters, or None once closed."""
+        if self._session is None:
+            return None
+        stats = ConsumerStats()
+        if not _lib.chiaki_python_session_get_consumer_stats(self._session, self.id, ctypes.byref(stats)):
+            return None
+        return stats
+
+    @property
+    def closed(self) -> bool:
+        """Whether close() was called."""
+        return self._session is None
+
+    def close(self):
+        """Unregister the consumer."""
+        if self._session is None:
+            return
+        _lib.chiaki_python_session_remove_consumer(self._session, self.id)
+        self._session = None
+        self.buffer.release()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+class PicturePool:
+    """
+    Recycled output arrays for decoded pictures.
+
+    Converting every picture into a fresh (height, width, 3) array costs an
+    allocation and page faults per frame; the pool hands the same few arrays
+    out again instead. Arrays of another shape (after a resolution change)
+    are dropped.
+    """
+
+    def __init__(self, size: int = 4):
+        """
+        Args:
+            size: Free arrays kept for reuse
+        """
+        self.size = size
+        self._shape = None
+        self._free = []
+        self._lock = threading.Lock()
+
+    def acquire(self, shape: Tuple[int, ...]) -> np.ndarray:
+        """Get an uninitialised uint8 array of ``shape``."""
+        with self._lock:
+            if shape != self._shape:
+                self._shape = shape
+                self._free.clear()
+            if self._free:
+                return self._free.pop()
+        return np.empty(shape, dtype=np.uint8)
+
+    def release(self, array: np.ndarray):
+        """Hand an array from acquire() back; it must not be used afterwards."""
+        with self._lock:
+            if array.shape == self._shape and len(self._free) < self.size:
+                self._free.append(array)
+
+
+class Decoder:
+    """
+    In-process H.264/HEVC decoder (libavcodec, linked into libchiaki.so).
+
+    Feed it the session's frames in order, starting at a keyframe (a GOP,
+    an I-frame or a consumer created with ``from_gop=True``), and convert
+    the last picture to RGB when needed. Not thread safe: use one decoder
+    per thread.
+    """
+
+    def __init__(self, codec: int = CHIAKI_CODEC_H264, threads: int = 1, pool: Optional[PicturePool] = None,
+                 export_mvs: bool = False):
+        """
+        Args:
+            codec: CHIAKI_CODEC_H264 or CHIAKI_CODEC_H265 (``video_info['codec']``)
+            threads: Slice decoding threads; 1 keeps a session to a single core
+            pool: PicturePool for to_rgb() output (a private one by default)
+            export_mvs: Keep each picture's motion vectors for
+                motion_vectors() and motion_grid() (H.264; libavcodec's HEVC
+                decoder doesn't export them)
+        """
+        self._dec = _lib.chiaki_python_decoder_create(codec, threads, DECODER_EXPORT_MVS if export_mvs else 0)
+        if not self._dec:
+            raise RuntimeError(f"libavcodec has no decoder for codec {codec}")
+        self.codec = codec
+        self.pool = pool if pool is not None else PicturePool()
+        self.picture = DecodedPicture()
+        self._image_buffer = None
+
+    def decode(self, data, seq: int = 0) -> bool:
+        """
+        Decode one frame.
+
+        Args:
+            data: Annex-B frame (bytes, memoryview or uint8 array)
+            seq: Sequence number, reported back as ``picture.seq``
+
+        Returns:
+            True if it produced a new picture
+        """
+        if self._dec is None:
+            raise RuntimeError("Decoder is closed")
+        arr = np.frombuffer(data, dtype=np.uint8)
+        if arr.size == 0:
+            return False
+        return _lib.chiaki_python_decoder_decode(
+            self._dec, arr.ctypes.data, arr.size, seq, ctypes.byref(self.picture)
+        ) > 0
+
+    def decode_frames(self, frames: Iterable[Tuple[int, memoryview]]) -> bool:
+        """Decode (seq, data) tuples in order, True if any produced a picture."""
+        decoded = False
+        for seq, data in frames:
+            decoded |= self.decode(data, seq)
+        return decoded
+
+    def flush(self) -> bool:
+        """Output any picture libavcodec still holds and reset it, True if there was one."""
+        if self._dec is None:
+            return False
+        return _lib.chiaki_python_decoder_decode(self._dec, None, 0, 0, ctypes.byref(self.picture)) > 0
+
+    def reset(self):
+        """Forget the stream after a gap; feed a keyframe next. The last picture is kept."""
+        if self._dec is not None:
+            _lib.chiaki_python_decoder_reset(self._dec)
+
+    @property
+    def has_picture(self) -> bool:
+        """Whether a picture has been decoded (refreshes ``picture``)."""
+        return self._dec is not None and _lib.chiaki_python_decoder_get_picture(self._dec, ctypes.byref(self.picture))
+
+    def planes(self) -> Optional[Tuple[np.ndarray, ...]]:
+        """
+        Zero-copy views of the last picture's YUV planes.
+
+        Returns:
+            (y, u, v) for I420 pictures or (y, uv) for NV12 pictures, where
+            uv has shape (height / 2, width / 2, 2); uint16 for 10-bit
+            pictures. The views are read-only and alias libavcodec's
+            buffers: they are only valid until the next picture is decoded
+            or the decoder is closed, copy them to keep them. None without a
+            picture or for formats other than 4:2:0.
+        """
+        planes = PicturePlanes()
+        if self._dec is None or not _lib.chiaki_python_decoder_get_planes(self._dec, ctypes.byref(planes)):
+            return None
+        dtype = np.uint16 if planes.bytes_per_sample == 2 else np.uint8
+        chroma_rows = (planes.height + 1) // 2
+        chroma_cols = (planes.width + 1) // 2
+
+        def plane(i, rows, cols, components=1):
+            linesize = planes.linesize[i]
+            raw = (c_uint8 * (linesize * rows)).from_address(planes.data[i])
+            arr = np.frombuffer(raw, dtype=dtype).reshape(rows, linesize // planes.bytes_per_sample)
+            arr = arr[:, :cols * components]
+            if components > 1:
+                arr = arr.reshape(rows, cols, components)
+            arr.flags.writeable = False
+            return arr
+
+        y = plane(0, planes.height, planes.width)
+        if not planes.data[2]:
+            return y, plane(1, chroma_rows, chroma_cols, 2)
+        return y, plane(1, chroma_rows, chroma_cols), plane(2, chroma_rows, chroma_cols)
+
+    def convert_shape(self, format: int = CONVERT_RGB, roi: Optional[Tuple[int, int, int, int]] = None,
+                      scale: int = 1) -> Optional[Tuple[int, ...]]:
+        """
+        Shape of convert()'s output for the last picture, None without a picture.
+
+        A region outside the picture gives an empty shape. An unknown format,
+        a scale outside 1..CONVERT_MAX_SCALE or a negative region raise
+        ValueError, with or without a picture.
+        """
+        if format not in (CONVERT_RGB, CONVERT_BGR, CONVERT_GREY):
+            raise ValueError(f"Unknown convert format {format}")
+        if not 1 <= scale <= CONVERT_MAX_SCALE:
+            raise ValueError(f"scale must be between 1 and {CONVERT_MAX_SCALE}, got {scale}")
+        if roi is not None and (len(roi) != 4 or any(v < 0 for v in roi)):
+            raise ValueError(f"roi must be (x, y, width, height) with non-negative values, got {roi}")
+        if not self.has_picture:
+            return None
+        x, y, width, height = roi if roi is not None else (0, 0, 0, 0)
+        width = width or self.picture.width - x
+        height = height or self.picture.height - y
+        shape = (height // scale, width // scale)
+        return shape if format == CONVERT_GREY else shape + (3,)
+
+    def convert(self, format: int = CONVERT_RGB, roi: Optional[Tuple[int, int, int, int]] = None,
+                scale: int = 1, out: Optional[np.ndarray] = None) -> Optional[np.ndarray]:
+        """
+        Convert (part of) the last picture to RGB, BGR or grey.
+
+        The conversion runs in C straight from the decoder's planes,
+        cropping and downscaling on the way, so a region or a thumbnail
+        never costs a full resolution RGB picture.
+
+        Args:
+            format: CONVERT_RGB, CONVERT_BGR or CONVERT_GREY (full range luma)
+            roi: (x, y, width, height) region in picture pixels; a width or
+                height of 0 extends to the edge. None converts the whole picture.
+            scale: Integer downscale factor (box filter, up to CONVERT_MAX_SCALE)
+            out: uint8 array of convert_shape() to fill, with packed pixels
+                (rows may be padded, e.g. a slice of a larger image). By
+                default one is taken from the pool; release() it there when done.
+
+        Returns:
+            The filled array, or None without a picture, for an unsupported
+            pixel format or a region outside the picture
+        """
+        shape = self.convert_shape(format, roi, scale)
+        if shape is None or shape[0] <= 0 or shape[1] <= 0:
+            return None
+        channels = 1 if format == CONVERT_GREY else 3
+        pooled = out is None
+        if pooled:
+            out = self.pool.acquire(shape)
+        elif (out.shape != shape or out.dtype != np.uint8 or out.strides[-1] != 1
+              or (channels == 3 and out.strides[1] != 3)):
+            raise ValueError(f"out must be a uint8 array of shape {shape} with packed pixels")
+        params = ConvertParams(format, *(roi if roi is not None else (0, 0, 0, 0)), scale)
+        extent = out.strides[0] * (shape[0] - 1) + shape[1] * channels
+        if not _lib.chiaki_python_decoder_convert(self._dec, ctypes.byref(params), out.ctypes.data,
+                                                  extent, out.strides[0]):
+            if pooled:
+                self.pool.release(out)
+            return None
+        return out
+
+    def to_rgb(self, out: Optional[np.ndarray] = None) -> Optional[np.ndarray]:
+        """Convert the whole last picture to RGB, see convert()."""
+        return self.convert(CONVERT_RGB, out=out)
+
+    def encode_image(self, format: int = IMAGE_PNG, quality: int = 90,
+                     roi: Optional[Tuple[int, int, int, int]] = None, scale: int = 1,
+                     grey: bool = False) -> Optional[bytes]:
+        """
+        Encode (part of) the last picture as a JPEG, PNG or WebP image.
+
+        The picture goes from the decoder's planes through the same crop and
+        box downscale as convert() straight into a libavcodec encoder (JPEG
+        and WebP without an RGB picture in between). The encoder stays open
+        on this decoder for its next image of the same format, size and
+        quality; a fresh snapshot() opens its own, see take_picture().
+
+        Args:
+            format: IMAGE_JPEG, IMAGE_PNG or IMAGE_WEBP
+            quality: 1 (smallest) to 100 (best), JPEG and WebP only
+            roi, scale: Region and downscale factor, see convert()
+            grey: PNG only, encode the luma as a greyscale image
+
+        Returns:
+            The image file contents, or None without a picture, for an
+            unsupported pixel format, a region outside the picture or a
+            format libavcodec can't encode
+        """
+        shape = self.convert_shape(CONVERT_RGB, roi, scale)
+        if shape is None or shape[0] <= 0 or shape[1] <= 0:
+            return None
+        params = ConvertParams(CONVERT_GREY if grey else CONVERT_RGB, *(roi if roi is not None else (0, 0, 0, 0)),
+                               scale)
+        size = c_size_t()
+        # An image is practically never larger than its raw pixels
+        buf = self._image_buffer
+        if buf is None or len(buf) < shape[0] * shape[1] * 3 + 65536:
+            buf = self._image_buffer = ctypes.create_string_buffer(shape[0] * shape[1] * 3 + 65536)
+        if not _lib.chiaki_python_decoder_encode_image(self._dec, ctypes.byref(params), format, quality,
+                                                       buf, len(buf), ctypes.byref(size)):
+            if size.value <= len(buf):
+                return None
+            # Encoded but didn't fit, grow the buffer and encode again
+            buf = self._image_buffer = ctypes.create_string_buffer(size.value * 2)
+            if not _lib.chiaki_python_decoder_encode_image(self._dec, ctypes.byref(params), format, quality,
+                                                           buf, len(buf), ctypes.byref(size)):
+                return None
+        return ctypes.string_at(buf, size.value)
+
+    def encode_jpeg(self, quality: int = 80, roi: Optional[Tuple[int, int, int, int]] = None,
+                    scale: int = 1) -> Optional[bytes]:
+        """Encode (part of) the last picture as a JPEG image, see encode_image()."""
+        return self.encode_image(IMAGE_JPEG, quality, roi, scale)
+
+    def motion_vectors(self) -> Optional[np.ndarray]:
+        """
+        Zero-copy view of the last picture's motion vectors.
+
+        Returns:
+            Read-only structured array with MOTION_VECTOR_DTYPE, one entry
+            per inter block (empty for keyframes), valid until the next
+            picture is decoded or the decoder is closed. None without a
+            picture or without ``export_mvs``.
+        """
+        vectors = c_void_p()
+        count = c_size_t()
+        if self._dec is None or not _lib.chiaki_python_decoder_get_motion_vectors(
+                self._dec, ctypes.byref(vectors), ctypes.byref(count)):
+            return None
+        if not count.value:
+            return np.zeros(0, dtype=MOTION_VECTOR_DTYPE)
+        raw = (c_uint8 * (count.value * MOTION_VECTOR_DTYPE.itemsize)).from_address(vectors.value)
+        arr = np.frombuffer(raw, dtype=MOTION_VECTOR_DTYPE)
+        arr.flags.writeable = False
+        return arr
+
+    def motion_grid(self, tile: int = 64, min_motion: float = 1.0,
+                    out: Optional[np.ndarray] = None) -> Optional[np.ndarray]:
+        """
+        Summarise the last picture's motion per tile, from its motion vectors only.
+
+        No pixel is converted or compared: the grid comes from the vectors
+        libavcodec already computed while decoding, so it costs a fraction
+        of diffing frames.
+
+        Args:
+            tile: Tile size in pixels
+            min_motion: Pixels a block has to move to count as moving
+            out: float32 array of shape (rows, cols, MOTION_GRID_CHANNELS) to fill
+
+        Returns:
+            float32 array (ceil(height / tile), ceil(width / tile), 3) with,
+            per tile, the mean motion in pixels of its inter blocks, the
+            fraction of it that moves and the fraction that is intra coded
+            (keyframes are all intra). None without a picture or without
+            ``export_mvs``. A tile size below 1 raises ValueError, with
+            or without a picture.
+        """
+        if tile <= 0:
+            raise ValueError(f"tile must be positive, got {tile}")
+        if not self.has_picture:
+            return None
+        shape = (-(-self.picture.height // tile), -(-self.picture.width // tile), MOTION_GRID_CHANNELS)
+        if out is None:
+            out = np.empty(shape, dtype=np.float32)
+        elif out.shape != shape or out.dtype != np.float32 or not out.flags.c_contiguous:
+            raise ValueError(f"out must be a contiguous float32 array of shape {shape}")
+        if not _lib.chiaki_python_decoder_motion_grid(self._dec, tile, min_motion, out.ctypes.data, out.size):
+            return None
+        return out
+
+    def snapshot(self) -> Optional["Decoder"]:
+        """
+        Hold on to the last picture for work on another thread.
+
+        The snapshot references the picture's buffers instead of copying
+        them (libavcodec decodes later pictures into other buffers), and
+        converts and encodes like this decoder while it keeps decoding.
+        Decoding into the snapshot fails. Close it when done to free the
+        picture.
+
+        Returns:
+            Codec-less Decoder holding the picture, or None without a picture
+        """
+        if self._dec is None:
+            return None
+        dec = _lib.chiaki_python_decoder_snapshot(self._dec)
+        if not dec:
+            return None
+        snap = Decoder.__new__(Decoder)
+        snap._dec = dec
+        snap.codec = self.codec
+        snap.pool = self.pool
+        snap.picture = DecodedPicture()
+        snap._image_buffer = None
+        return snap
+
+    def take_picture(self, snapshot: "Decoder") -> bool:
+        """
+        Move another snapshot's picture into this one.
+
+        Meant for snapshots (see snapshot()) that encode on a worker
+        thread: the worker keeps one snapshot and takes the pictures of
+        the next ones into it, so its image encoder stays open instead of
+        being opened again for every picture. ``snapshot`` is left without
+        a picture and can be closed.
+
+        Returns:
+            Whether ``snapshot`` had a picture to take
+        """
+        if self._dec is None or snapshot._dec is None:
+            return False
+        return _lib.chiaki_python_decoder_take_picture(self._dec, snapshot._dec)
+
+    @property
+    def stats(self) -> Optional[DecoderStats]:
+        """Packet/picture/error counters and time spent, or None once closed."""
+        if self._dec is None:
+            return None
+        stats = DecoderStats()
+        _lib.chiaki_python_decoder_get_stats(self._dec, ctypes.byref(stats))
+        return stats
+
+    def close(self):
+        """Free the decoder."""
+        if self._dec is not None:
+            _lib.chiaki_python_decoder_destroy(self._dec)
+            self._dec = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
@@ -0,0 +1,340 @@
+"""
+Compressed-domain activity analytics from encoded frame sizes.
+
+The wrapper's video callback records a descriptor (arrival time, size,
+keyframe flag, losses) for every frame. An ActivityAnalyzer copies them into
+a longer NumPy ring and derives bitrate, size percentiles, keyframe
+intervals and an activity score from them, without decoding anything:
+static screens encode to tiny P-frames, motion and scene changes to large
+ones. Change-point detection on the activity score finds moments like "the
+game finished loading" or "the screen went idle".
+"""
+
+import threading
+from typing import Dict, List, Optional, Sequence, Tuple
+import numpy as np
+
+# One analyzed frame
+ANALYZER_DTYPE = np.dtype([
+    ("seq", np.uint64),
+    ("time_ns", np.uint64),   # Arrival, CLOCK_MONOTONIC
+    ("size", np.uint32),      # Encoded bytes
+    ("keyframe", np.uint8),
+    ("lost", np.int32),       # Frames lost right before this one
+])
+
+
+class ActivityAnalyzer:
+    """
+    Rolling statistics over a session's encoded frame sizes.
+
+    A poller thread copies new frame descriptors into the ring every
+    ``poll_interval`` seconds; the wrapper keeps the last FRAME_DESC_HISTORY
+    of them, so the interval only has to be shorter than that many frames.
+    Queries work on a snapshot of the ring and never block the session.
+
+    Example:
+        with ActivityAnalyzer(session) as analyzer:
+            ...
+            if analyzer.is_idle(2.0):
+                print("screen is static")
+    """
+
+    def __init__(self, session, history: int = 65536, poll_interval: float = 1.0, start: bool = True):
+        """
+        Args:
+            session: Connected PS4Session/PS5Session
+            history: Frames kept in the ring (65536 = 18 minutes at 60 fps)
+            poll_interval: Seconds between descriptor polls
+            start: Start polling right away
+        """
+        self.session = session
+        self.poll_interval = poll_interval
+        self._ring = np.zeros(history, dtype=ANALYZER_DTYPE)
+        self._count = 0           # Frames ever added
+        self._last_seq = 0
+        self._missed = 0          # Frames that left the wrapper's history before a poll
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        if start:
+            self.start()
+
+    def start(self):
+        """Start the poller thread."""
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._poll_loop, name="chiaki-analyzer", daemon=True)
+        self._thread.start()
+
+    def close(self):
+        """Stop polling. The collected frames stay available."""
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def _poll_loop(self):
+        while True:
+            self.update()
+            if self._stop.wait(self.poll_interval):
+                return
+
+    def update(self) -> int:
+        """
+        Copy the frames that arrived since the last update into the ring.
+
+        Called by the poller thread; call it directly with start=False.
+
+        Returns:
+            Number of new frames
+        """
+        descs = self.session.frame_descs(self._last_seq)
+        if descs.size == 0:
+            return 0
+        with self._lock:
+            if self._last_seq and int(descs['seq'][0]) > self._last_seq + 1:
+                self._missed += int(descs['seq'][0]) - self._last_seq - 1
+            self._last_seq = int(descs['seq'][-1])
+
+            new = np.empty(descs.size, dtype=ANALYZER_DTYPE)
+            new['seq'] = descs['seq']
+            new['time_ns'] = descs['recv_time_ns']
+            new['size'] = descs['size']
+            new['keyframe'] = descs['keyframe']
+            new['lost'] = descs['frames_lost']
+
+            capacity = self._ring.size
+            if new.size > capacity:
+                new = new[-capacity:]
+            start = self._count % capacity
+            first = min(new.size, capacity - start)
+            self._ring[start:start + first] = new[:first]
+            self._ring[:new.size - first] = new[first:]
+            self._count += new.size
+            return new.size
+
+    def frames(self, window: Optional[float] = None) -> np.ndarray:
+        """
+        The analyzed frames, oldest first.
+
+        Args:
+            window: Only the frames of the last ``window`` seconds (None = all)
+
+        Returns:
+            Structured array copy with ANALYZER_DTYPE
+        """
+        with self._lock:
+            capacity = self._ring.size
+            if self._count <= capacity:
+                frames = self._ring[:self._count].copy()
+            else:
+                start = self._count % capacity
+                frames = np.concatenate((self._ring[start:], self._ring[:start]))
+        if window is not None and frames.size:
+            cutoff = int(frames['time_ns'][-1]) - int(window * 1e9)
+            frames = frames[np.searchsorted(frames['time_ns'], cutoff, side='right'):]
+        return frames
+
+    @property
+    def stats(self) -> Dict[str, int]:
+        """frames analyzed, frames in the ring, frames missed between polls and frames lost by the session."""
+        with self._lock:
+            held = min(self._count, self._ring.size)
+            lost = int(self._ring['lost'][:held].clip(min=0).sum())
+            return {'frames': self._count, 'held': held, 'missed': self._missed, 'lost': lost}
+
+    # Rates and distributions
+
+    def bitrate(self, window: float = 1.0) -> float:
+        """Received bits per second over the last ``window`` seconds."""
+        frames = self.frames(window)
+        if frames.size < 2:
+            return 0.0
+        span = (int(frames['time_ns'][-1]) - int(frames['time_ns'][0])) / 1e9
+        if span <= 0:
+            return 0.0
+        # The first frame opens the window, its bytes arrived before it
+        return float(frames['size'][1:].sum()) * 8 / span
+
+    def bitrate_series(self, bin: float = 1.0, window: Optional[float] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Bitrate per time bin.
+
+        Returns:
+            (times, bits_per_second): bin start times in monotonic seconds
+            and the bitrate of each bin
+        """
+        frames = self.frames(window)
+        times, index = self._bins(frames, bin)
+        bits = np.bincount(index, weights=frames['size'].astype(np.float64) * 8, minlength=times.size)
+        return times, bits / bin
+
+    def size_percentiles(self, q: Sequence[float] = (50, 90, 99), window: Optional[float] = None,
+                         keyframes: bool = False) -> np.ndarray:
+        """
+        Percentiles of the encoded frame sizes in bytes.
+
+        Args:
+            q: Percentiles to compute
+            window: Only the last ``window`` seconds (None = the whole ring)
+            keyframes: Keyframe sizes instead of the other frames'
+
+        Returns:
+            One size per percentile, NaN without frames
+        """
+        frames = self.frames(window)
+        sizes = frames['size'][frames['keyframe'] == (1 if keyframes else 0)]
+        if sizes.size == 0:
+            return np.full(len(q), np.nan)
+        return np.percentile(sizes, q)
+
+    def keyframe_intervals(self, window: Optional[float] = None) -> np.ndarray:
+        """Seconds between consecutive keyframes, oldest first."""
+        frames = self.frames(window)
+        times = frames['time_ns'][frames['keyframe'] == 1].astype(np.int64)
+        return np.diff(times) / 1e9
+
+    # Activity
+
+    def activity(self, bin: float = 0.5, window: Optional[float] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Activity score per time bin.
+
+        The score is the mean size of the bin's non-keyframes relative to
+        the median non-keyframe size in the ring: around 1 for typical
+        content, near 0 for a static screen and well above 1 for motion and
+        scene changes. Keyframes are left out, they are large whatever the
+        content. Bins without non-keyframes score NaN.
+
+        Returns:
+            (times, scores): bin start times in monotonic seconds and scores
+        """
+        frames = self.frames(window)
+        inter = frames[frames['keyframe'] == 0]
+        times, index = self._bins(inter, bin)
+        if times.size == 0:
+            return times, np.zeros(0)
+        sums = np.bincount(index, weights=inter['size'].astype(np.float64), minlength=times.size)
+        counts = np.bincount(index, minlength=times.size)
+        baseline = self._baseline()
+        with np.errstate(invalid='ignore', divide='ignore'):
+            scores = sums / counts / baseline
+        return times, scores
+
+    def activity_score(self, window: float = 1.0) -> float:
+        """Activity score (see activity()) of the last ``window`` seconds, NaN without frames."""
+        frames = self.frames(window)
+        sizes = frames['size'][frames['keyframe'] == 0]
+        if sizes.size == 0:
+            return float('nan')
+        return float(sizes.mean()) / self._baseline()
+
+    def is_idle(self, duration: float = 2.0, max_frame_size: int = 2048) -> bool:
+        """
+        Whether the screen has been static for ``duration`` seconds.
+
+        A static picture encodes to P-frames of a few hundred bytes (skipped
+        macroblocks only), whatever the bitrate.
+
+        Args:
+            duration: Seconds the screen has to be static
+            max_frame_size: Largest non-keyframe, in bytes, a static screen produces
+        """
+        frames = self.frames(duration)
+        if frames.size == 0:
+            return False
+        span = (int(frames['time_ns'][-1]) - int(frames['time_ns'][0])) / 1e9
+        sizes = frames['size'][frames['keyframe'] == 0]
+        return span >= duration * 0.9 and sizes.size > 0 and int(sizes.max()) <= max_frame_size
+
+    def change_points(self, bin: float = 0.5, window: Optional[float] = None, penalty: float = 3.0,
+                      min_ratio: float = 1.5, min_bins: int = 4) -> List[Dict[str, float]]:
+        """
+        Find the moments where the activity level shifts.
+
+        Binary segmentation on the log activity score: a series is split
+        where the split explains most of its variance, as long as the gain
+        beats ``penalty`` times the noise variance (estimated from the
+        differences between neighbouring bins) times log(bins) and the
+        activity changes at least ``min_ratio`` fold, and the halves are
+        split again.
+
+        Args:
+            bin: Bin size in seconds, see activity()
+            window: Only the last ``window`` seconds (None = the whole ring)
+            penalty: Higher finds fewer, clearer changes
+            min_ratio: Smallest change of the (geometric) mean activity to report
+            min_bins: Shortest segment in bins
+
+        Returns:
+            Changes in time order, each with ``time`` (monotonic seconds),
+            ``before`` and ``after`` (mean activity score of the segments)
+        """
+        times, scores = self.activity(bin, window)
+        valid = ~np.isnan(scores)
+        times, scores = times[valid], scores[valid]
+        n = scores.size
+        if n < 2 * min_bins:
+            return []
+        series = np.log(scores + 1e-3)
+        # Robust noise estimate that step changes don't inflate
+        sigma = np.median(np.abs(np.diff(series))) / 0.6745 / np.sqrt(2)
+        threshold = penalty * max(sigma * sigma, 1e-6) * np.log(n)
+        min_step = np.log(min_ratio)
+
+        prefix = np.concatenate(([0.0], np.cumsum(series)))
+        splits = []
+        segments = [(0, n)]
+        while segments:
+            a, b = segments.pop()
+            if b - a < 2 * min_bins:
+                continue
+            k = np.arange(a + min_bins, b - min_bins + 1)
+            left = prefix[k] - prefix[a]
+            right = prefix[b] - prefix[k]
+            total = prefix[b] - prefix[a]
+            gain = left ** 2 / (k - a) + right ** 2 / (b - k) - total ** 2 / (b - a)
+            best = int(np.argmax(gain))
+            step = abs(right[best] / (b - k[best]) - left[best] / (k[best] - a))
+            if gain[best] <= threshold or step < min_step:
+                continue
+            split = int(k[best])
+            splits.append(split)
+            segments.append((a, split))
+            segments.append((split, b))
+
+        splits.sort()
+        bounds = [0] + splits + [n]
+        changes = []
+        for i, split in enumerate(splits):
+            changes.append({
+                'time': float(times[split]),
+                'before': float(scores[bounds[i]:split].mean()),
+                'after': float(scores[split:bounds[i + 2]].mean()),
+            })
+        return changes
+
+    def _baseline(self) -> float:
+        """Median non-keyframe size in the ring, the activity score's unit."""
+        frames = self.frames()
+        sizes = frames['size'][frames['keyframe'] == 0]
+        return float(np.median(sizes)) if sizes.size else 1.0
+
+    @staticmethod
+    def _bins(frames: np.ndarray, bin: float) -> Tuple[np.ndarray, np.ndarray]:
+        """Bin start times (monotonic seconds) and each frame's bin index."""
+        if frames.size == 0:
+            return np.zeros(0), np.zeros(0, dtype=np.intp)
+        times = frames['time_ns'].astype(np.int64)
+        start = int(times[0])
+        index = ((times - start) // int(bin * 1e9)).astype(np.intp)
+        return (start + np.arange(int(index[-1]) + 1) * int(bin * 1e9)) / 1e9, index
@@ -0,0 +1,209 @@
+"""
+asyncio interface for PlayStation Remote Play sessions.
+"""
+
+from typing import AsyncIterator, Optional, Tuple
+import asyncio
+import ctypes
+from . import _chiaki
+from . import logs
+from .session import PS4Session
+from .controller import AsyncController
+
+
+class AsyncPS4Session(PS4Session):
+    """
+    PlayStation 4 Remote Play session for asyncio.
+
+    Instead of blocking calls and polling threads, the session registers its
+    readiness fd (see PS4Session.fileno) with the event loop. Connection,
+    frames and quit are delivered by the wrapper and wake the awaiting
+    coroutines directly.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._controller = AsyncController(self)
+        self._loop = None
+        self._frame_event = None
+        self._iframe_event = None
+        self._quit = False
+
+    def _new_futures(self):
+        """Connected/quit futures bound to the running loop."""
+        self._connected_future = self._loop.create_future()
+        self._quit_future = self._loop.create_future()
+
+    def _on_ready(self):
+        """Event loop reader callback for the session's readiness fd."""
+        events = _chiaki._lib.chiaki_python_session_ack_events(self._session)
+
+        if events & _chiaki.CHIAKI_PYTHON_EVENT_LIFECYCLE:
+            # Lifecycle events resolve the futures and run callbacks on the loop
+            ev = _chiaki.PythonEvent()
+            while _chiaki._lib.chiaki_python_session_next_event(self._session, 0, ctypes.byref(ev)):
+                self._dispatch_event(ev)
+        if events & _chiaki.CHIAKI_PYTHON_EVENT_FRAME:
+            self._frame_event.set()
+        if events & _chiaki.CHIAKI_PYTHON_EVENT_IFRAME:
+            self._iframe_event.set()
+        if events & _chiaki.CHIAKI_PYTHON_EVENT_QUIT:
+            self._quit = True
+            # Wake every waiter so it can notice the quit
+            self._frame_event.set()
+            self._iframe_event.set()
+
+    async def connect(self, timeout: float = 15.0):
+        """
+        Connect to the PS4.
+
+        Args:
+            timeout: Seconds to wait for the console to accept the session
+        """
+        if self._connected:
+            return
+
+        self._loop = asyncio.get_running_loop()
+        self._new_futures()
+        self._quit_reason = None
+        self._quit_event = None
+        self._frame_event = asyncio.Event()
+        self._iframe_event = asyncio.Event()
+        self._quit = False
+
+        # Starting only spawns the session thread, it doesn't block
+        self._session = self._start_session()
+        fd = _chiaki._lib.chiaki_python_session_get_fd(self._session)
+        if fd < 0:
+            await self._close()
+            raise RuntimeError("Session has no readiness fd")
+        self._loop.add_reader(fd, self._on_ready)
+
+        try:
+            await asyncio.wait_for(asyncio.shield(self._connected_future), timeout)
+        except asyncio.TimeoutError:
+            await self._close()
+            raise RuntimeError(f"Failed to connect to {self.host}: timed out")
+        except BaseException:
+            await self._close()
+            raise
+
+        self._connected = True
+        if self._wants_decoding():
+            self._start_decode_thread()
+
+    async def _close(self):
+        """Stop and destroy the wrapper session."""
+        session = self._session
+        if session is None:
+            return
+        self._loop.remove_reader(_chiaki._lib.chiaki_python_session_get_fd(session))
+        self._connected = False
+        self._frame_buffer = None
+        # Joining the session thread can take a moment, keep it off the loop
+        await self._loop.run_in_executor(None, _chiaki._lib.chiaki_python_session_stop, session)
+        await self._loop.run_in_executor(None, self._stop_decode_thread)
+        await self._loop.run_in_executor(None, self._run_close_callbacks)
+        await self._loop.run_in_executor(None, self._close_recorders)
+        self._close_consumers()
+        self._close_lazy_decoder()
+        _chiaki._lib.chiaki_python_session_close_events(session)
+        logs.pump.unregister(session)
+        self._session = None
+        _chiaki._lib.chiaki_python_session_destroy(session)
+
+    async def disconnect(self):
+        """Disconnect from the PS4."""
+        await self._close()
+
+    async def frames(self) -> AsyncIterator[Tuple[int, memoryview]]:
+        """
+        Iterate over every received frame in order, until the session quits.
+
+        Yields:
+            (seq, view) tuples. Each view is only valid until the iterator
+            is advanced; copy it with ``bytes()`` to keep it.
+        """
+        while self._session is not None:
+            self._frame_event.clear()
+            frames = self.drain_frames()
+            if not frames:
+                if self._quit:
+                    return
+                await self._frame_event.wait()
+                continue
+            for frame in frames:
+                yield frame
+
+    async def wait_frame(self, since_seq: int = 0, timeout: Optional[float] = None) -> Optional[memoryview]:
+        """
+        Wait for a frame newer than ``since_seq``.
+
+        Returns:
+            memoryview with the same lifetime as get_frame(), or None on timeout/quit
+        """
+        async def newer():
+            while self._session is not None and not self._quit:
+                self._frame_event.clear()
+                if self.frame_seq > since_seq:
+                    return self.get_frame()
+                await self._frame_event.wait()
+            return None
+
+        try:
+            return await asyncio.wait_for(newer(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    async def wait_iframe(self, since_seq: int = 0, timeout: Optional[float] = None) -> Optional[memoryview]:
+        """
+        Wait for an I-frame newer than ``since_seq``.
+
+        Returns:
+            memoryview with the same lifetime as get_frame(), or None on timeout/quit
+        """
+        async def newer():
+            while self._session is not None and not self._quit:
+                self._iframe_event.clear()
+                # Non-blocking check (timeout 0) that only copies a newer I-frame
+                iframe = self._buffer().wait_iframe(self._session, since_seq, 0)
+                if iframe is not None:
+                    return iframe
+                await self._iframe_event.wait()
+            return None
+
+        try:
+            return await asyncio.wait_for(newer(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    async def request_idr(self, timeout: Optional[float] = 5.0) -> Optional[memoryview]:
+        """
+        Ask the console for a fresh keyframe and wait for it.
+
+        Returns:
+            The new I-frame (SPS + PPS + IDR), or None on failure/timeout
+        """
+        if self._session is None:
+            return None
+        seq = self.frame_seq
+        if not _chiaki._lib.chiaki_python_session_request_idr(self._session):
+            return None
+        return await self.wait_iframe(seq, timeout)
+
+    async def __aenter__(self):
+        """Async context manager entry."""
+        await self.connect()
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        """Async context manager exit."""
+        await self.disconnect()
+
+
+class AsyncPS5Session(AsyncPS4Session):
+    """
+    PlayStation 5 Remote Play session for asyncio.
+    """
+
+    _is_ps5 = True
@@ -3,6 +3,7 @@ Controller input module for sending button presses and joystick movements.
 """
 
 from typing import Tuple
+import asyncio
 import ctypes
 import time
 from . import _chiaki
@@ -34,6 +35,26 @@ class Controller:
     Controller interface for sending input to the PS4/PS5.
     """
 
+    # Button names accepted by press()
+    BUTTON_NAMES = {
+        "cross": Button.CROSS,
+        "circle": Button.CIRCLE,
+        "square": Button.SQUARE,
+        "triangle": Button.TRIANGLE,
+        "l1": Button.L1,
+        "r1": Button.R1,
+        "l3": Button.L3,
+        "r3": Button.R3,
+        "options": Button.OPTIONS,
+        "share": Button.SHARE,
+        "ps": Button.PS,
+        "touchpad": Button.TOUCHPAD,
+        "up": Button.DPAD_UP,
+        "down": Button.DPAD_DOWN,
+        "left": Button.DPAD_LEFT,
+        "right": Button.DPAD_RIGHT,
+    }
+
     def __init__(self, session):
         """
         Initialize controller for a session.
@@ -52,26 +73,7 @@ class Controller:
         Args:
             button: Button name (e.g., "cross", "circle", "square")
         """
-        button_map = {
-            "cross": Button.CROSS,
-            "circle": Button.CIRCLE,
-            "square": Button.SQUARE,
-            "triangle": Button.TRIANGLE,
-            "l1": Button.L1,
-            "r1": Button.R1,
-            "l3": Button.L3,
-            "r3": Button.R3,
-            "options": Button.OPTIONS,
-            "share": Button.SHARE,
-            "ps": Button.PS,
-            "touchpad": Button.TOUCHPAD,
-            "up": Button.DPAD_UP,
-            "down": Button.DPAD_DOWN,
-            "left": Button.DPAD_LEFT,
-            "right": Button.DPAD_RIGHT,
-        }
-
-        btn = button_map.get(button.lower())
+        btn = self.BUTTON_NAMES.get(button.lower())
         if btn is not None:
             self.button_down(btn)
             time.sleep(0.1)  # Brief press duration
@@ -137,9 +139,47 @@ class Controller:
     def _send_state(self):
         """Send current controller state to the session."""
         if self.session._connected and self.session._session is not None:
-            err = _chiaki._lib.chiaki_session_set_controller_state(
-                ctypes.byref(self.session._session),
-                ctypes.byref(self._state)
+            ok = _chiaki._lib.chiaki_python_session_set_controller(
+                self.session._session,
+                self._state.buttons,
+                self._state.left_x,
+                self._state.left_y,
+                self._state.right_x,
+                self._state.right_y,
+                self._state.l2_state,
+                self._state.r2_state
             )
-            if err != _chiaki.CHIAKI_ERR_SUCCESS:
-                print(f"Warning: Failed to send controller state: {_chiaki.error_string(err)}")
+            if not ok:
+                print("Warning: Failed to send controller state")
+
+
+class AsyncController(Controller):
+    """
+    Controller for asyncio sessions.
+
+    press() is a coroutine that holds the button with ``asyncio.sleep`` instead
+    of blocking the event loop; the other methods send state immediately and
+    are shared with Controller.
+    """
+
+    async def press(self, button: str, duration: float = 0.1):
+        """
+        Press a button (and release after ``duration`` seconds).
+
+        Args:
+            button: Button name (e.g., "cross", "circle", "square")
+            duration: How long to hold the button
+        """
+        btn = self.BUTTON_NAMES.get(button.lower())
+        if btn is not None:
+            self.button_down(btn)
+            await asyncio.sleep(duration)
+            self.button_up(btn)
+        elif button.lower() == "l2":
+            self.set_triggers(l2=1.0)
+            await asyncio.sleep(duration)
+            self.set_triggers(l2=0.0)
+        elif button.lower() == "r2":
+            self.set_triggers(r2=1.0)
+            await asyncio.sleep(duration)
+            self.set_triggers(r2=0.0)
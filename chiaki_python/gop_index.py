@@ -0,0 +1,261 @@
+"""
+GOP index sidecars for recordings, and a reader built on them.
+
+A Recorder writes ``<recording>.gidx`` next to the file: the container, the
+codec, the size of the file's header and the stream's parameter sets, then
+one fixed-size entry per GOP (byte offset and size of its fragments, start
+time, duration, frames). Every GOP starts a fragment (see mux.Fragmenter),
+so the file header plus a GOP's bytes is a complete file on its own.
+
+RecordingReader memory-maps a recording and its index. Seeking is a lookup
+in the small in-memory index and a slice of the mapping, nothing before
+the GOP is read or decoded, and map() hands GOP numbers to a process pool
+whose workers map the file themselves, so the video never crosses a
+process boundary.
+"""
+
+import concurrent.futures
+import functools
+import mmap
+import os
+import struct
+from typing import Callable, Iterable, Iterator, List, Optional, Tuple
+import numpy as np
+from . import mux
+
+INDEX_SUFFIX = ".gidx"
+
+_MAGIC = b'CHKGIDX1'
+# Container ("mp4"/"mkv"), codec, bytes of the recording's header, bytes of the parameter sets that follow
+_HEADER = struct.Struct('<4sIII')
+
+# One GOP of a recording
+GOP_INDEX_DTYPE = np.dtype([
+    ("offset", "<u8"),        # Of its first fragment in the recording
+    ("size", "<u8"),          # Bytes of its fragments
+    ("time_ns", "<i8"),       # Start, from the recording's first frame
+    ("duration_ns", "<i8"),
+    ("first_frame", "<u4"),   # Number of its keyframe in the recording
+    ("frame_count", "<u4"),
+])
+
+
+def index_header(container: str, codec: int, header_size: int, parameter_sets: bytes) -> bytes:
+    """Start of a GOP index file."""
+    return _MAGIC + _HEADER.pack(container.encode(), codec, header_size, len(parameter_sets)) + parameter_sets
+
+
+class GopIndexer:
+    """Follows the fragments written to a recording and makes an index entry per GOP."""
+
+    def __init__(self, timescale: int):
+        """
+        Args:
+            timescale: Ticks per second of the sample times
+        """
+        self.timescale = timescale
+        self.frame_count = 0    # Frames indexed so far
+        self.gop_count = 0
+        self._gop = None        # [offset, size, start time, first frame, frames, end time] of the open GOP
+
+    def fragment(self, samples: List[mux.Sample], offset: int, size: int) -> bytes:
+        """
+        Account a fragment written at ``offset``.
+
+        Returns:
+            The entry of the GOP it closed, if it starts a new one, else b''
+        """
+        if not samples:
+            return b''
+        entry = b''
+        if samples[0].keyframe or self._gop is None:
+            entry = self.flush()
+            self._gop = [offset, 0, samples[0].time, self.frame_count, 0, 0]
+        gop = self._gop
+        gop[1] = offset + size - gop[0]
+        gop[4] += len(samples)
+        gop[5] = samples[-1].time + samples[-1].duration
+        self.frame_count += len(samples)
+        return entry
+
+    def flush(self) -> bytes:
+        """The entry of the open GOP, b'' without one."""
+        if self._gop is None:
+            return b''
+        offset, size, start, first_frame, frames, end = self._gop
+        self._gop = None
+        self.gop_count += 1
+        to_ns = 1_000_000_000 / self.timescale
+        entry = np.array([(offset, size, int(start * to_ns), int((end - start) * to_ns), first_frame, frames)],
+                         dtype=GOP_INDEX_DTYPE)
+        return entry.tobytes()
+
+
+class GopSegment:
+    """One GOP of a recording, decodable on its own."""
+
+    def __init__(self, reader: "RecordingReader", index: int):
+        entry = reader.gops[index]
+        self.index = index
+        self.offset = int(entry['offset'])
+        self.time = int(entry['time_ns']) / 1e9         # Seconds from the recording's first frame
+        self.duration = int(entry['duration_ns']) / 1e9
+        self.first_frame = int(entry['first_frame'])
+        self.frame_count = int(entry['frame_count'])
+        self.codec = reader.codec
+        self.container = reader.container
+        self.header = reader.header
+        self.parameter_sets = reader.parameter_sets
+        # Only this GOP's pages are read
+        self.data = reader._mmap[self.offset:self.offset + int(entry['size'])]
+
+    def file(self) -> bytes:
+        """The recording's header and this GOP: a complete MP4/Matroska file of its own."""
+        return self.header + self.data
+
+    def samples(self) -> List[mux.Sample]:
+        """The GOP's samples, in the container's timescale."""
+        return mux.MUXERS[self.container].samples(self.data)
+
+    def frames(self) -> List[Tuple[int, bytes]]:
+        """
+        (frame number, Annex-B frame) tuples for Decoder.decode_frames().
+
+        The parameter sets are put in front of the keyframe, so a fresh
+        decoder starts at the first frame.
+        """
+        frames = []
+        for i, sample in enumerate(self.samples()):
+            data = mux.annex_b(sample.data)
+            frames.append((self.first_frame + i, self.parameter_sets + data if i == 0 else data))
+        return frames
+
+
+class RecordingReader:
+    """
+    Random access to a recording through its GOP index.
+
+    Example:
+        with RecordingReader("capture.mp4") as reader:
+            segment = reader.seek(3600.0)            # the GOP playing an hour in
+            decoder.decode_frames(segment.frames())
+            sizes = list(reader.map(analyze))        # every GOP, on all cores
+    """
+
+    def __init__(self, path: str, index_path: Optional[str] = None):
+        """
+        Args:
+            path: Recording written by a Recorder
+            index_path: Its GOP index, ``path + INDEX_SUFFIX`` by default
+        """
+        self.path = path
+        self.index_path = index_path or path + INDEX_SUFFIX
+        with open(self.index_path, 'rb') as f:
+            raw = f.read()
+        if raw[:len(_MAGIC)] != _MAGIC:
+            raise ValueError(f"{self.index_path} is not a GOP index")
+        container, codec, header_size, params_size = _HEADER.unpack_from(raw, len(_MAGIC))
+        start = len(_MAGIC) + _HEADER.size
+        self.container = container.rstrip(b'\0').decode()
+        if self.container not in mux.MUXERS:
+            raise ValueError(f"{self.index_path}: unsupported container {self.container!r}")
+        self.codec = codec
+        self.parameter_sets = raw[start:start + params_size]
+        entries = raw[start + params_size:]
+        # An entry cut short by a crash is left out
+        count = len(entries) // GOP_INDEX_DTYPE.itemsize
+        gops = np.frombuffer(entries[:count * GOP_INDEX_DTYPE.itemsize], dtype=GOP_INDEX_DTYPE)
+
+        self._file = open(path, 'rb')
+        size = os.fstat(self._file.fileno()).st_size
+        self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if size else b''
+        # So is a GOP whose data never reached the disk
+        self.gops = gops[gops['offset'] + gops['size'] <= size]
+        self.header = self._mmap[:header_size]
+
+    def __len__(self):
+        return len(self.gops)
+
+    def __getitem__(self, index: int) -> GopSegment:
+        if index < 0:
+            index += len(self.gops)
+        if not 0 <= index < len(self.gops):
+            raise IndexError(f"GOP {index} out of range")
+        return GopSegment(self, index)
+
+    def __iter__(self) -> Iterator[GopSegment]:
+        for index in range(len(self.gops)):
+            yield GopSegment(self, index)
+
+    @property
+    def duration(self) -> float:
+        """Seconds covered by the indexed GOPs."""
+        if not len(self.gops):
+            return 0.0
+        last = self.gops[-1]
+        return (int(last['time_ns']) + int(last['duration_ns'])) / 1e9
+
+    @property
+    def frame_count(self) -> int:
+        """Frames in the indexed GOPs."""
+        return int(self.gops['frame_count'].sum())
+
+    def find(self, time: float) -> int:
+        """Number of the GOP playing ``time`` seconds into the recording (clamped to the first/last)."""
+        if not len(self.gops):
+            raise IndexError("Recording has no indexed GOP")
+        index = int(np.searchsorted(self.gops['time_ns'], int(time * 1e9), side='right')) - 1
+        return min(max(index, 0), len(self.gops) - 1)
+
+    def seek(self, time: float) -> GopSegment:
+        """The GOP playing ``time`` seconds into the recording; decode it up to the wanted frame."""
+        return self[self.find(time)]
+
+    def map(self, fn: Callable[[GopSegment], object], gops: Optional[Iterable[int]] = None,
+            workers: Optional[int] = None, chunksize: int = 1) -> Iterator[object]:
+        """
+        Run ``fn`` on GOP segments in a process pool.
+
+        Every worker process opens the recording itself, only GOP numbers
+        and results are pickled. GOPs decode independently, so decoding,
+        frame extraction or analysis scales with the cores.
+
+        Args:
+            fn: Picklable (module level) function taking a GopSegment
+            gops: GOP numbers, all by default
+            workers: Processes, os.cpu_count() by default
+            chunksize: GOPs handed to a worker at a time
+
+        Returns:
+            Iterator over the results, in the order of ``gops``
+        """
+        indices = range(len(self.gops)) if gops is None else list(gops)
+        with concurrent.futures.ProcessPoolExecutor(workers, initializer=_open_worker,
+                                                    initargs=(self.path, self.index_path)) as pool:
+            yield from pool.map(functools.partial(_run_worker, fn), indices, chunksize=chunksize)
+
+    def close(self):
+        """Unmap the recording."""
+        if isinstance(self._mmap, mmap.mmap):
+            self._mmap.close()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+# Process pool workers: one reader per process
+
+_worker_reader: Optional[RecordingReader] = None
+
+
+def _open_worker(path: str, index_path: str):
+    global _worker_reader
+    _worker_reader = RecordingReader(path, index_path)
+
+
+def _run_worker(fn: Callable[[GopSegment], object], index: int):
+    return fn(_worker_reader[index])
@@ -0,0 +1,493 @@
+"""
+Live fan-out of sessions to any number of local viewers, without re-encoding.
+
+Remote Play allows one session per console. A LiveServer reads each added
+session once, packages its H.264/HEVC into fragmented MP4 in-process (see
+mux.py) and serves the same fragments to every client, both as one
+endless fMP4 response per client (lowest latency, plays in ffplay, VLC or a
+browser ``<video>``) and as an HLS playlist of GOP-aligned fMP4 segments.
+
+Fragments are shared, not copied per client: every client only keeps a
+cursor into the channel's recent history and writes from it on its own
+thread, so a slow client only delays itself. One that falls more than
+``max_lag`` seconds behind skips ahead to the newest keyframe.
+"""
+
+import collections
+import html
+import logging
+import math
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Deque, Dict, List, NamedTuple, Optional, Tuple
+from urllib.parse import quote, unquote
+from . import _chiaki
+from . import mux
+from .session import PS4Session
+
+logger = logging.getLogger(__name__)
+
+
+class _Fragment(NamedTuple):
+    """One moof/mdat pair, shared by every client."""
+    index: int        # Position in the channel's fragment sequence
+    segment: int      # GOP it belongs to, the HLS media sequence number
+    keyframe: bool    # Starts with a keyframe, i.e. starts a segment
+    time: float       # Seconds since the channel's first keyframe
+    duration: float
+    data: bytes
+
+
+class _Channel:
+    """Live state of one session."""
+
+    def __init__(self, session, name: str):
+        self.session = session
+        self.name = name
+        self.cond = threading.Condition()
+        self.init = None         # Init segment (ftyp + moov), once the first keyframe arrived
+        self.fragments: Deque[_Fragment] = collections.deque()
+        self.next_index = 0      # Index of the next fragment
+        self.segment = -1        # GOP being filled
+        self.ended = False       # The session quit or the channel was removed
+        self.thread = None
+        self.on_close = None     # Session close callback, set while the mux thread runs
+        self.stats = {'fragments': 0, 'segments': 0, 'bytes': 0, 'idr_requests': 0, 'dropped': 0,
+                      'clients': 0, 'skipped': 0}
+
+    def skip_target(self, cursor: int) -> Optional[int]:
+        """Newest keyframe fragment at or after ``cursor`` (any kept one if it was evicted), None if there is none."""
+        for fragment in reversed(self.fragments):
+            if fragment.index < cursor:
+                break
+            if fragment.keyframe:
+                return fragment.index
+        return None
+
+    def segments(self) -> List[Tuple[int, float]]:
+        """(number, duration) of the complete segments kept, oldest first."""
+        durations = {}
+        for fragment in self.fragments:
+            durations[fragment.segment] = durations.get(fragment.segment, 0.0) + fragment.duration
+        return [(number, duration) for number, duration in durations.items()
+                if number < self.segment or self.ended]
+
+
+class LiveServer:
+    """
+    Local HTTP server fanning each added session out to any number of viewers.
+
+    Endpoints:
+        ``/``: index page linking every stream
+        ``/<name>.mp4``: endless fragmented MP4, starting at the current GOP
+        ``/<name>/index.m3u8``: HLS playlist (version 7, fMP4 segments)
+        ``/<name>/init.mp4``, ``/<name>/<n>.m4s``: its init segment and segments
+
+    A fragment is cut before every keyframe and at least every
+    ``fragment_interval`` seconds (0: every frame is a fragment of its own,
+    the lowest latency). An HLS segment is one GOP; as Remote Play only
+    sends keyframes on request, one is requested whenever the current GOP
+    reaches ``segment_duration`` seconds.
+
+    Example:
+        with LiveServer(port=8090) as server:
+            server.add(session, "living-room")
+            ...  # ffplay http://127.0.0.1:8090/living-room.mp4
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 8090, fragment_interval: float = 0.0,
+                 segment_duration: Optional[float] = 2.0, playlist_size: int = 4, max_lag: float = 1.0):
+        """
+        Args:
+            host: Address to listen on, local only by default
+            port: TCP port, 0 picks a free one (see ``port``)
+            fragment_interval: Longest fMP4 fragment in seconds, 0 = one per frame
+            segment_duration: Seconds per HLS segment, kept by requesting keyframes;
+                None only cuts at the keyframes the console sends
+            playlist_size: Segments listed in the HLS playlist; one more is kept
+                for players still downloading it
+            max_lag: Seconds an fMP4 client may fall behind before it skips to the newest keyframe
+        """
+        self.host = host
+        self.port = port
+        self.fragment_interval = fragment_interval
+        self.segment_duration = segment_duration
+        self.playlist_size = max(1, playlist_size)
+        self.max_lag = max_lag
+        self._channels: Dict[str, _Channel] = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._httpd = None
+        self._http_thread = None
+
+    def add(self, session, name: str):
+        """
+        Serve a connected session as ``/<name>.mp4`` and ``/<name>/index.m3u8``.
+
+        The stream is removed when the session disconnects.
+
+        Args:
+            session: PS4Session/PS5Session (or their asyncio variants)
+            name: Stream name, unique per server, without "/"
+        """
+        if "/" in name:
+            raise ValueError(f"Stream name {name!r} must not contain '/'")
+        channel = _Channel(session, name)
+        with self._lock:
+            if name in self._channels:
+                raise ValueError(f"Stream {name!r} already exists")
+            if self._httpd is not None:
+                self._start_channel(channel)
+            self._channels[name] = channel
+
+    def remove(self, name: str):
+        """Stop serving a session; its clients' streams end."""
+        with self._lock:
+            channel = self._channels.pop(name, None)
+        if channel is not None:
+            self._end_channel(channel)
+
+    def _remove_channel(self, channel: _Channel):
+        """Session close callback: end the channel before the session is freed."""
+        with self._lock:
+            if self._channels.get(channel.name) is channel:
+                del self._channels[channel.name]
+        self._end_channel(channel)
+
+    @property
+    def stats(self) -> Dict[str, dict]:
+        """
+        Per stream: fragments and segments made, bytes muxed, keyframes
+        requested, frames dropped while the muxer fell behind, connected
+        fMP4 clients and fragments they skipped.
+        """
+        with self._lock:
+            return {name: dict(channel.stats) for name, channel in self._channels.items()}
+
+    def url(self, name: str) -> str:
+        """URL of a stream's fMP4 endpoint."""
+        return f"http://{self.host}:{self.port}/{quote(name)}.mp4"
+
+    def playlist_url(self, name: str) -> str:
+        """URL of a stream's HLS playlist."""
+        return f"http://{self.host}:{self.port}/{quote(name)}/index.m3u8"
+
+    def start(self):
+        """Start the HTTP server and muxing every added session."""
+        if self._httpd is not None:
+            return
+        self._stop.clear()
+        self._httpd = ThreadingHTTPServer((self.host, self.port), self._handler_class())
+        self._httpd.daemon_threads = True
+        self.port = self._httpd.server_address[1]
+        with self._lock:
+            channels = list(self._channels.values())
+        for channel in channels:
+            self._start_channel(channel)
+        self._http_thread = threading.Thread(target=self._httpd.serve_forever, name="chiaki-live-http",
+                                             daemon=True)
+        self._http_thread.start()
+
+    def stop(self):
+        """Stop serving. Sessions stay connected and added."""
+        if self._httpd is None:
+            return
+        self._stop.set()
+        with self._lock:
+            channels = list(self._channels.values())
+        for channel in channels:
+            self._end_channel(channel)
+        self._httpd.shutdown()
+        self._httpd.server_close()
+        self._http_thread.join()
+        self._httpd = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+    # Muxing
+
+    def _start_channel(self, channel: _Channel):
+        """Start the channel's mux thread, afresh if it ran before."""
+        consumer = channel.session.add_consumer(_chiaki.CONSUMER_POLICY_SKIP_TO_KEYFRAME, from_gop=True)
+        with channel.cond:
+            channel.init = None
+            channel.fragments.clear()
+            channel.segment = -1
+            channel.ended = False
+        channel.thread = threading.Thread(target=self._mux_loop, args=(channel, consumer),
+                                          name=f"chiaki-live-{channel.name}", daemon=True)
+        channel.thread.start()
+        # Disconnecting ends and joins the mux thread before the session is freed
+        channel.on_close = lambda: self._remove_channel(channel)
+        channel.session.add_close_callback(channel.on_close)
+
+    def _end_channel(self, channel: _Channel):
+        if channel.on_close is not None:
+            channel.session.remove_close_callback(channel.on_close)
+            channel.on_close = None
+        with channel.cond:
+            channel.ended = True
+            channel.cond.notify_all()
+        if channel.thread is not None and channel.thread is not threading.current_thread():
+            channel.thread.join()
+        channel.thread = None
+
+    def _mux_loop(self, channel: _Channel, consumer: _chiaki.FrameConsumer):
+        """Mux thread of a channel: turn the session's frames into shared fragments."""
+        session = channel.session
+        muxer = None
+        fragmenter = None
+        header = b''          # Latest codec header, for a keyframe without its own parameter sets
+        gop_time = 0          # Arrival of the current GOP's keyframe
+        idr_time = 0          # Last keyframe request
+        dropped = channel.stats['dropped']
+        try:
+            while not channel.ended:
+                frames = consumer.read(0.1)
+                if not frames:
+                    if session.quit_reason is not None:
+                        break
+                    continue
+                consumer_stats = consumer.stats
+                if consumer_stats is not None:
+                    channel.stats['dropped'] = dropped + consumer_stats.dropped
+                descs = consumer.descs
+                for (seq, frame), time_ns, keyframe, nal_flags in zip(
+                        frames, descs['recv_time_ns'].tolist(), descs['keyframe'].tolist(),
+                        descs['nal_flags'].tolist()):
+                    if muxer is None:
+                        # Like the recorder: start at a keyframe, with the parameter sets in front
+                        if nal_flags & _chiaki.NAL_FLAG_SPS and not nal_flags & _chiaki.NAL_FLAG_SLICE:
+                            header = bytes(frame)
+                            continue
+                        fmt = None
+                        if keyframe:
+                            if nal_flags & _chiaki.NAL_FLAG_SPS:
+                                header = b''
+                            fmt = mux.video_format(header + bytes(frame), session._codec())
+                        if fmt is None:
+                            if not idr_time:
+                                idr_time = time_ns
+                                self._request_idr(channel)
+                            continue
+                        muxer = mux.Mp4Muxer(fmt)
+                        fragmenter = mux.Fragmenter(fmt.codec, muxer.timescale, time_ns, self.fragment_interval,
+                                                    1 / session.fps)
+                        with channel.cond:
+                            channel.init = muxer.header()
+                            channel.cond.notify_all()
+                        if header:
+                            fragmenter.push(header, time_ns, False)
+                    samples = fragmenter.push(frame, time_ns, keyframe)
+                    if samples:
+                        self._publish(channel, muxer, samples)
+                    if keyframe:
+                        gop_time = time_ns
+                    elif (self.segment_duration
+                          and time_ns - max(gop_time, idr_time) >= self.segment_duration * 1e9):
+                        # Ends the segment at the requested keyframe
+                        idr_time = time_ns
+                        self._request_idr(channel)
+            if muxer is not None:
+                self._publish(channel, muxer, fragmenter.flush())
+        except Exception:
+            logger.exception("Live stream %s failed", channel.name)
+        finally:
+            consumer.close()
+            with channel.cond:
+                channel.ended = True
+                channel.cond.notify_all()
+
+    def _request_idr(self, channel: _Channel):
+        # Never waits, also for an AsyncPS4Session whose request_idr() is a coroutine
+        PS4Session.request_idr(channel.session)
+        channel.stats['idr_requests'] += 1
+
+    def _publish(self, channel: _Channel, muxer: mux.Mp4Muxer, samples: List[mux.Sample]):
+        """Append a fragment to the channel's history and wake its clients."""
+        if not samples:
+            return
+        data = muxer.fragment(samples)
+        keyframe = bool(samples[0].keyframe)
+        duration = sum(sample.duration for sample in samples) / muxer.timescale
+        with channel.cond:
+            if keyframe:
+                channel.segment += 1
+                channel.stats['segments'] += 1
+            channel.fragments.append(_Fragment(channel.next_index, channel.segment, keyframe,
+                                               samples[0].time / muxer.timescale, duration, data))
+            channel.next_index += 1
+            # The listed segments, the one being filled and one that just left the playlist
+            oldest = channel.segment - self.playlist_size - 1
+            while channel.fragments[0].segment < oldest:
+                channel.fragments.popleft()
+            channel.stats['fragments'] += 1
+            channel.stats['bytes'] += len(data)
+            channel.cond.notify_all()
+
+    # HTTP
+
+    def _channel(self, name: str) -> Optional[_Channel]:
+        with self._lock:
+            return self._channels.get(name)
+
+    def _next_fragments(self, channel: _Channel, cursor: int, timeout: float):
+        """
+        Wait for fragments at or after ``cursor``.
+
+        Returns:
+            (cursor, fragments): where the fragments start, which moves past
+            skipped ones if the client lags, and their data; None once the
+            channel ended and everything was sent
+        """
+        with channel.cond:
+            channel.cond.wait_for(lambda: channel.next_index > cursor or channel.ended, timeout)
+            if channel.next_index <= cursor:
+                return None if channel.ended else (cursor, [])
+            fragments = channel.fragments
+            start = cursor - fragments[0].index
+            newest = fragments[-1].time + fragments[-1].duration
+            if start < 0 or newest - fragments[start].time > self.max_lag:
+                target = channel.skip_target(cursor)
+                if target is not None and target > cursor:
+                    channel.stats['skipped'] += target - cursor
+                    cursor = target
+                    start = cursor - fragments[0].index
+            return cursor, [fragment.data for fragment in list(fragments)[start:]]
+
+    def _playlist(self, channel: _Channel) -> Optional[str]:
+        """HLS media playlist of the complete segments, None before the first one."""
+        with channel.cond:
+            segments = channel.segments()[-self.playlist_size:]
+            ended = channel.ended
+        if not segments:
+            return None
+        target = max(1, math.ceil(max(duration for _, duration in segments)),
+                     math.ceil(self.segment_duration or 0))
+        lines = [
+            "#EXTM3U",
+            "#EXT-X-VERSION:7",
+            f"#EXT-X-TARGETDURATION:{target}",
+            f"#EXT-X-MEDIA-SEQUENCE:{segments[0][0]}",
+            "#EXT-X-INDEPENDENT-SEGMENTS",
+            '#EXT-X-MAP:URI="init.mp4"',
+        ]
+        for number, duration in segments:
+            lines += [f"#EXTINF:{duration:.3f},", f"{number}.m4s"]
+        if ended:
+            lines.append("#EXT-X-ENDLIST")
+        return "\n".join(lines) + "\n"
+
+    def _segment(self, channel: _Channel, number: int) -> Optional[bytes]:
+        """A complete segment's fragments, None if it isn't complete or was evicted."""
+        with channel.cond:
+            if number >= channel.segment and not channel.ended:
+                return None
+            data = [fragment.data for fragment in channel.fragments if fragment.segment == number]
+        return b''.join(data) if data else None
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                logger.debug("%s - %s", self.address_string(), format % args)
+
+            def do_GET(self):
+                path = unquote(self.path.split("?", 1)[0]).lstrip("/")
+                name, _, resource = path.partition("/")
+                if path == "":
+                    self._index()
+                elif not resource and name.endswith(".mp4") and server._channel(name[:-4]) is not None:
+                    self._live(server._channel(name[:-4]))
+                elif resource and server._channel(name) is not None:
+                    self._hls(server._channel(name), resource)
+                else:
+                    self.send_error(404)
+
+            def _send(self, content_type: str, data: bytes, cache: bool = False):
+                self.send_response(200)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(data)))
+                self.send_header("Cache-Control", "max-age=60" if cache else "no-store")
+                self.send_header("Access-Control-Allow-Origin", "*")
+                self.end_headers()
+                self.wfile.write(data)
+
+            def _index(self):
+                with server._lock:
+                    names = sorted(server._channels)
+                body = "".join(
+                    f'<figure><video src="/{quote(name)}.mp4" autoplay muted></video>'
+                    f'<figcaption>{html.escape(name)}: <a href="/{quote(name)}.mp4">fMP4</a> '
+                    f'<a href="/{quote(name)}/index.m3u8">HLS</a></figcaption></figure>'
+                    for name in names
+                )
+                data = f"<!DOCTYPE html><title>chiaki-python live</title><body>{body}</body>".encode()
+                self._send("text/html; charset=utf-8", data)
+
+            def _hls(self, channel: _Channel, resource: str):
+                if resource == "index.m3u8":
+                    playlist = server._playlist(channel)
+                    if playlist is None:
+                        self.send_error(503, "No segment yet")
+                        return
+                    self._send("application/vnd.apple.mpegurl", playlist.encode())
+                elif resource == "init.mp4":
+                    with channel.cond:
+                        init = channel.init
+                    if init is None:
+                        self.send_error(503, "No keyframe yet")
+                        return
+                    self._send("video/mp4", init)
+                elif resource.endswith(".m4s") and resource[:-4].isdigit():
+                    data = server._segment(channel, int(resource[:-4]))
+                    if data is None:
+                        self.send_error(404)
+                        return
+                    self._send("video/iso.segment", data, cache=True)
+                else:
+                    self.send_error(404)
+
+            def _live(self, channel: _Channel):
+                with channel.cond:
+                    channel.cond.wait_for(lambda: channel.init is not None or channel.ended, 5.0)
+                    init = channel.init
+                    # Start at the current GOP, so the picture appears right away
+                    cursor = channel.skip_target(0) if channel.fragments else channel.next_index
+                if init is None:
+                    self.send_error(503, "No keyframe yet")
+                    return
+                self.send_response(200)
+                self.send_header("Content-Type", "video/mp4")
+                self.send_header("Cache-Control", "no-store")
+                self.send_header("Access-Control-Allow-Origin", "*")
+                self.end_headers()
+                with channel.cond:
+                    channel.stats['clients'] += 1
+                try:
+                    self.wfile.write(init)
+                    while not server._stop.is_set():
+                        batch = server._next_fragments(channel, cursor, 1.0)
+                        if batch is None:
+                            break
+                        cursor, fragments = batch
+                        if not fragments:
+                            continue
+                        # This client's socket is its only buffer: a slow one blocks
+                        # here and lags, while the others go on
+                        self.wfile.write(b''.join(fragments))
+                        self.wfile.flush()
+                        cursor += len(fragments)
+                except (BrokenPipeError, ConnectionResetError):
+                    pass
+                finally:
+                    with channel.cond:
+                        channel.stats['clients'] -= 1
+
+        return Handler
@@ -0,0 +1,190 @@
+"""
+Logging pipeline for wrapper sessions.
+
+libchiaki and the wrapper write log messages into a lock-free ring per
+session, without touching stderr on the receive thread. One background
+thread drains the rings of all registered sessions in batches into the
+``logging`` module (logger ``chiaki_python.libchiaki``), rate limited per
+session. When a session quits on an error, the last messages of every
+recorded level are dumped as a flight recorder.
+"""
+
+import ctypes
+import logging
+import threading
+import time
+from typing import Dict, Optional
+from . import _chiaki
+
+logger = logging.getLogger("chiaki_python.libchiaki")
+
+# chiaki level bit -> logging level
+_LEVELS = {
+    _chiaki.CHIAKI_LOG_ERROR: logging.ERROR,
+    _chiaki.CHIAKI_LOG_WARNING: logging.WARNING,
+    _chiaki.CHIAKI_LOG_INFO: logging.INFO,
+    _chiaki.CHIAKI_LOG_VERBOSE: logging.DEBUG,
+    _chiaki.CHIAKI_LOG_DEBUG: logging.DEBUG - 5,
+}
+
+_LEVEL_NAMES = {
+    _chiaki.CHIAKI_LOG_ERROR: "E",
+    _chiaki.CHIAKI_LOG_WARNING: "W",
+    _chiaki.CHIAKI_LOG_INFO: "I",
+    _chiaki.CHIAKI_LOG_VERBOSE: "V",
+    _chiaki.CHIAKI_LOG_DEBUG: "D",
+}
+
+
+def level_mask(level: int) -> int:
+    """
+    CHIAKI_LOG_* mask for everything at or above a ``logging`` level.
+
+    logging.DEBUG includes chiaki's verbose messages, anything below it
+    also the per-frame debug messages.
+    """
+    mask = 0
+    for bit, mapped in _LEVELS.items():
+        if mapped >= level:
+            mask |= bit
+    return mask
+
+
+class _RateLimiter:
+    """Token bucket: ``rate`` messages per second, bursts of up to ``burst``."""
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.last = time.monotonic()
+        self.suppressed = 0
+
+    def allow(self) -> bool:
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.last) * self.rate)
+        self.last = now
+        if self.tokens >= 1.0:
+            self.tokens -= 1.0
+            return True
+        self.suppressed += 1
+        return False
+
+
+class _Source:
+    """A registered session."""
+
+    def __init__(self, session, name: str, limiter: _RateLimiter):
+        self.session = session
+        self.name = name
+        self.limiter = limiter
+        self.dropped = 0
+
+
+class LogPump:
+    """
+    Drains the log rings of registered sessions into ``logging``.
+
+    Sessions register right after creation and unregister before they are
+    destroyed; unregistering drains whatever is left, including a flight
+    recorder dump if the session quit on an error.
+    """
+
+    def __init__(self, interval: float = 0.2, rate: float = 100.0, burst: int = 500,
+                 dump_entries: int = 128, batch: int = 256):
+        """
+        Args:
+            interval: Seconds between drains
+            rate: Messages per second and session passed on to logging
+            burst: Messages a session may log at once above ``rate``
+            dump_entries: Messages in a flight recorder dump
+            batch: Messages fetched per drain call
+        """
+        self.interval = interval
+        self.rate = rate
+        self.burst = burst
+        self.dump_entries = dump_entries
+        self._entries = (_chiaki.LogEntry * batch)()
+        self._dropped = ctypes.c_uint64(0)
+        self._quit_dump = ctypes.c_bool(False)
+        self._sources: Dict[int, _Source] = {}
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+
+    @staticmethod
+    def _key(session) -> int:
+        return ctypes.cast(session, ctypes.c_void_p).value
+
+    def register(self, session, name: str):
+        """Start forwarding a session's log messages, ``name`` prefixes them."""
+        with self._lock:
+            self._sources[self._key(session)] = _Source(session, name, _RateLimiter(self.rate, self.burst))
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="chiaki-log-pump", daemon=True)
+                self._thread.start()
+
+    def unregister(self, session):
+        """Drain a session one last time and forget it. Call before destroying it."""
+        with self._lock:
+            source = self._sources.pop(self._key(session), None)
+            if source is not None:
+                self._drain(source)
+
+    def flush(self):
+        """Drain every registered session now."""
+        with self._lock:
+            for source in self._sources.values():
+                self._drain(source)
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            self.flush()
+
+    def _drain(self, source: _Source):
+        """Forward everything queued for ``source``, called with the lock held."""
+        while True:
+            count = _chiaki._lib.chiaki_python_session_log_drain(
+                source.session, self._entries, len(self._entries),
+                ctypes.byref(self._dropped), ctypes.byref(self._quit_dump)
+            )
+            for i in range(count):
+                self._emit(source, self._entries[i])
+            if self._quit_dump.value:
+                self._dump(source)
+            if count < len(self._entries):
+                break
+
+        limiter = source.limiter
+        if limiter.suppressed and limiter.tokens >= 1.0:
+            logger.warning("%s: %d log messages suppressed by rate limit", source.name, limiter.suppressed)
+            limiter.suppressed = 0
+        if self._dropped.value > source.dropped:
+            logger.warning("%s: %d log messages lost, log ring overran",
+                           source.name, self._dropped.value - source.dropped)
+            source.dropped = self._dropped.value
+
+    def _emit(self, source: _Source, entry: _chiaki.LogEntry):
+        level = _LEVELS.get(entry.level, logging.INFO)
+        if not logger.isEnabledFor(level) or not source.limiter.allow():
+            return
+        logger.log(level, "%s: %s", source.name, entry.msg.decode('utf-8', 'replace'),
+                   extra={'chiaki_time_ns': entry.time_ns})
+
+    def _dump(self, source: _Source):
+        """Log the flight recorder of a session that quit on an error."""
+        entries = (_chiaki.LogEntry * self.dump_entries)()
+        count = _chiaki._lib.chiaki_python_session_log_dump(source.session, entries, len(entries))
+        if count == 0:
+            return
+        last = entries[count - 1].time_ns
+        lines = [
+            f"  {(e.time_ns - last) / 1e6:+10.1f} ms {_LEVEL_NAMES.get(e.level, '?')} "
+            f"{e.msg.decode('utf-8', 'replace')}"
+            for e in entries[:count]
+        ]
+        logger.error("%s: session quit, last %d log messages:\n%s", source.name, count, "\n".join(lines))
+
+
+# Process-wide pump used by PS4Session
+pump = LogPump()
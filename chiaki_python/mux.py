@@ -0,0 +1,540 @@
+"""
+Stream-copy muxing of the console's encoded video into MP4 and Matroska.
+
+Remote Play delivers H.264/HEVC as Annex-B samples: start codes between the
+NAL units, parameter sets in-band in front of keyframes. Containers want
+length-prefixed NAL units and a decoder configuration record (avcC/hvcC)
+instead. The helpers here do that conversion and write fragmented MP4 (an
+init segment, then a moof/mdat pair per fragment) and Matroska (a cluster
+per fragment). A fragment is self-contained once written, so a file cut
+short by a crash plays up to its last complete fragment.
+
+Remote Play streams have no B-frames: decode and presentation order are the
+same and a sample needs a single timestamp.
+"""
+
+import struct
+from typing import List, NamedTuple, Optional, Sequence
+import numpy as np
+from . import _chiaki
+
+# Track timescales, ticks per second
+MP4_TIMESCALE = 90000
+MKV_TIMESCALE = 1000    # Matroska TimestampScale of 1 ms
+
+_H264_AUD = 9
+_H264_SPS = 7
+_H264_PPS = 8
+_HEVC_AUD = 35
+_HEVC_VPS = 32
+_HEVC_SPS = 33
+_HEVC_PPS = 34
+
+# H.264 profiles whose avcC carries chroma format and bit depths
+_H264_HIGH_PROFILES = (100, 110, 122, 144)
+
+
+class Sample(NamedTuple):
+    """One frame, ready for a muxer."""
+    time: int         # Decode (= presentation) time in the muxer's timescale
+    duration: int
+    keyframe: bool
+    data: bytes       # NAL units, each behind a 4 byte big-endian size
+
+
+class VideoFormat(NamedTuple):
+    """What a container's track header needs to know about the stream."""
+    codec: int        # CHIAKI_CODEC_*
+    width: int
+    height: int
+    config: bytes     # avcC or hvcC decoder configuration record
+
+
+# Annex-B
+
+def split_nals(data) -> List[memoryview]:
+    """NAL units of an Annex-B sample, without start codes and trailing zero bytes."""
+    buf = data if isinstance(data, bytes) else bytes(data)
+    view = memoryview(buf)
+    nals = []
+    pos = buf.find(b'\x00\x00\x01')
+    while pos >= 0:
+        start = pos + 3
+        pos = buf.find(b'\x00\x00\x01', start)
+        end = pos if pos >= 0 else len(buf)
+        # A 4 byte start code's leading zero belongs to neither NAL
+        while end > start and buf[end - 1] == 0:
+            end -= 1
+        if end > start:
+            nals.append(view[start:end])
+    return nals
+
+
+def nal_type(nal, codec: int) -> int:
+    """NAL unit type from the header byte."""
+    if codec == _chiaki.CHIAKI_CODEC_H264:
+        return nal[0] & 0x1f
+    return (nal[0] >> 1) & 0x3f
+
+
+def length_prefixed(nals: Sequence, codec: int) -> bytes:
+    """
+    Join NAL units as 4 byte size + payload, the MP4/Matroska sample layout.
+
+    Access unit delimiters are dropped, containers mark sample boundaries
+    themselves. Parameter sets stay in-band, so a mid-stream resolution
+    change still decodes.
+    """
+    aud = _H264_AUD if codec == _chiaki.CHIAKI_CODEC_H264 else _HEVC_AUD
+    parts = []
+    for nal in nals:
+        if nal_type(nal, codec) == aud:
+            continue
+        parts.append(struct.pack('>I', len(nal)))
+        parts.append(nal)
+    return b''.join(parts)
+
+
+def has_picture(nals: Sequence, codec: int) -> bool:
+    """Whether the NAL units contain slice data, not just parameter sets or SEI."""
+    if codec == _chiaki.CHIAKI_CODEC_H264:
+        return any(1 <= nal_type(nal, codec) <= 5 for nal in nals)
+    return any(nal_type(nal, codec) <= 31 for nal in nals)
+
+
+def parameter_sets(data, codec: int) -> bytes:
+    """The VPS/SPS/PPS of an Annex-B sample, as Annex-B."""
+    kinds = (_H264_SPS, _H264_PPS) if codec == _chiaki.CHIAKI_CODEC_H264 else (_HEVC_VPS, _HEVC_SPS, _HEVC_PPS)
+    return b''.join(b'\x00\x00\x00\x01' + bytes(nal) for nal in split_nals(data) if nal_type(nal, codec) in kinds)
+
+
+def annex_b(data) -> bytes:
+    """Length-prefixed NAL units (a container sample) back to Annex-B, the inverse of length_prefixed()."""
+    view = memoryview(data)
+    parts = []
+    pos = 0
+    while pos + 4 <= len(view):
+        size = int.from_bytes(view[pos:pos + 4], 'big')
+        parts.append(b'\x00\x00\x00\x01')
+        parts.append(view[pos + 4:pos + 4 + size])
+        pos += 4 + size
+    return b''.join(parts)
+
+
+def _rbsp(nal, size: int = 64) -> bytes:
+    """The first ``size`` payload bytes of a NAL unit with emulation prevention removed."""
+    return bytes(nal[:size]).replace(b'\x00\x00\x03', b'\x00\x00')
+
+
+def _avcc(sps: List, pps: List, scan: _chiaki.NalScan) -> bytes:
+    """AVCDecoderConfigurationRecord (ISO/IEC 14496-15 5.3.3)."""
+    head = _rbsp(sps[0], 4)
+    profile = head[1]
+    out = bytearray((1, profile, head[2], head[3], 0xfc | 3, 0xe0 | len(sps)))
+    for nal in sps:
+        out += struct.pack('>H', len(nal)) + nal
+    out.append(len(pps))
+    for nal in pps:
+        out += struct.pack('>H', len(nal)) + nal
+    if profile in _H264_HIGH_PROFILES:
+        depth = max(scan.bit_depth, 8) - 8
+        out += bytes((0xfc | scan.chroma_format_idc, 0xf8 | depth, 0xf8 | depth, 0))
+    return bytes(out)
+
+
+def _hvcc(vps: List, sps: List, pps: List, scan: _chiaki.NalScan) -> bytes:
+    """HEVCDecoderConfigurationRecord (ISO/IEC 14496-15 8.3.3)."""
+    rbsp = _rbsp(sps[0])
+    # After the 2 byte NAL header: VPS id, max_sub_layers_minus1 and temporal
+    # id nesting, then the 12 byte general profile_tier_level
+    sub_layers = ((rbsp[2] >> 1) & 7) + 1
+    nested = rbsp[2] & 1
+    depth = max(scan.bit_depth, 8) - 8
+    out = bytearray((1,))
+    out += rbsp[3:15]
+    out += struct.pack('>HBBBBH', 0xf000, 0xfc, 0xfc | scan.chroma_format_idc, 0xf8 | depth, 0xf8 | depth, 0)
+    out.append((sub_layers << 3) | (nested << 2) | 3)
+    arrays = ((_HEVC_VPS, vps), (_HEVC_SPS, sps), (_HEVC_PPS, pps))
+    out.append(len(arrays))
+    for kind, nals in arrays:
+        # Complete: every parameter set is in the record (they also stay in-band)
+        out += struct.pack('>BH', 0x80 | kind, len(nals))
+        for nal in nals:
+            out += struct.pack('>H', len(nal)) + nal
+    return bytes(out)
+
+
+def video_format(data, codec: int) -> Optional[VideoFormat]:
+    """
+    Track format from a sample carrying the parameter sets.
+
+    Args:
+        data: Annex-B sample, usually a keyframe (SPS + PPS + IDR)
+        codec: CHIAKI_CODEC_H264 or CHIAKI_CODEC_H265
+
+    Returns:
+        VideoFormat, or None if the sample lacks a parameter set
+    """
+    scan = _chiaki.scan_nals(data, codec)
+    if not scan.flags & _chiaki.NAL_FLAG_SPS or scan.width <= 0 or scan.height <= 0:
+        return None
+    sets = {}
+    for nal in split_nals(data):
+        sets.setdefault(nal_type(nal, codec), []).append(bytes(nal))
+    if codec == _chiaki.CHIAKI_CODEC_H264:
+        if _H264_PPS not in sets:
+            return None
+        config = _avcc(sets[_H264_SPS], sets[_H264_PPS], scan)
+    else:
+        if _HEVC_VPS not in sets or _HEVC_PPS not in sets:
+            return None
+        config = _hvcc(sets[_HEVC_VPS], sets[_HEVC_SPS], sets[_HEVC_PPS], scan)
+    return VideoFormat(codec, scan.width, scan.height, config)
+
+
+class Fragmenter:
+    """
+    Turns Annex-B frames with arrival times into samples and cuts them into fragments.
+
+    A frame's duration is only known once the next one arrives, so the
+    newest frame is held back. A fragment ends before every keyframe, so
+    each GOP starts a fragment, and at least every ``interval`` seconds, as
+    Remote Play sends keyframes rarely. Chiaki hands over the codec header
+    (parameter sets without a picture) as a frame of its own; it is joined
+    with the next frame into one sample.
+    """
+
+    def __init__(self, codec: int, timescale: int, origin_ns: int, interval: float = 1.0,
+                 default_duration: float = 1 / 60):
+        """
+        Args:
+            codec: CHIAKI_CODEC_H264 or CHIAKI_CODEC_H265
+            timescale: Ticks per second of the sample times
+            origin_ns: Arrival time (CLOCK_MONOTONIC) that becomes time 0
+            interval: Longest fragment in seconds
+            default_duration: Seconds given to the last frame, whose successor never came
+        """
+        self.codec = codec
+        self.timescale = timescale
+        self.origin_ns = origin_ns
+        self.max_ticks = max(1, int(interval * timescale))
+        self.default_ticks = max(1, int(default_duration * timescale))
+        self._samples: List[Sample] = []
+        self._last = None       # (time, keyframe, data) of the held back frame
+        self._prefix = b''      # Header NAL units waiting for the next picture
+        self._duration = self.default_ticks
+
+    def push(self, data, time_ns: int, keyframe: bool) -> Optional[List[Sample]]:
+        """
+        Add an Annex-B frame.
+
+        Returns:
+            The fragment this frame completed, or None
+        """
+        nals = split_nals(data)
+        if not has_picture(nals, self.codec):
+            self._prefix += length_prefixed(nals, self.codec)
+            return None
+        data, self._prefix = self._prefix + length_prefixed(nals, self.codec), b''
+        time = (time_ns - self.origin_ns) * self.timescale // 1_000_000_000
+        fragment = None
+        if self._last is not None:
+            last_time, last_keyframe, last_data = self._last
+            # Frames handed over in one batch can share an arrival time
+            time = max(time, last_time + 1)
+            self._duration = time - last_time
+            self._samples.append(Sample(last_time, self._duration, last_keyframe, last_data))
+            if keyframe or time - self._samples[0].time >= self.max_ticks:
+                fragment, self._samples = self._samples, []
+        self._last = (time, keyframe, data)
+        return fragment
+
+    def flush(self) -> List[Sample]:
+        """Every remaining sample, the held back one with the previous frame's duration."""
+        if self._last is not None:
+            last_time, last_keyframe, last_data = self._last
+            self._samples.append(Sample(last_time, self._duration, last_keyframe, last_data))
+            self._last = None
+        fragment, self._samples = self._samples, []
+        return fragment
+
+
+# MP4
+
+_MATRIX = struct.pack('>9I', 0x10000, 0, 0, 0, 0x10000, 0, 0, 0, 0x40000000)
+
+# trun sample_flags: sample_depends_on 2 (none), or 1 with sample_is_non_sync_sample
+_SYNC_FLAGS = 0x02000000
+_NON_SYNC_FLAGS = 0x01010000
+
+
+def _box(kind: bytes, *payload: bytes) -> bytes:
+    body = b''.join(payload)
+    return struct.pack('>I', 8 + len(body)) + kind + body
+
+
+def _full_box(kind: bytes, version: int, flags: int, *payload: bytes) -> bytes:
+    return _box(kind, struct.pack('>I', (version << 24) | flags), *payload)
+
+
+class Mp4Muxer:
+    """
+    Fragmented MP4 with one video track.
+
+    header() is the init segment (ftyp, then a moov with an empty sample
+    table and mvex), every fragment() a moof/mdat pair carrying its own base
+    decode time (tfdt), so fragments play without the ones after them.
+    """
+
+    timescale = MP4_TIMESCALE
+    extension = "mp4"
+
+    def __init__(self, fmt: VideoFormat):
+        self.format = fmt
+        self.sequence = 0       # Fragments written
+
+    def header(self) -> bytes:
+        """ftyp + moov."""
+        fmt = self.format
+        h264 = fmt.codec == _chiaki.CHIAKI_CODEC_H264
+        ftyp = _box(b'ftyp', b'iso5', struct.pack('>I', 512), b'iso5iso6mp41', b'avc1' if h264 else b'hvc1')
+        mvhd = _full_box(b'mvhd', 0, 0, struct.pack('>IIIIIH', 0, 0, 1000, 0, 0x10000, 0x100),
+                         bytes(10), _MATRIX, bytes(24), struct.pack('>I', 2))
+        tkhd = _full_box(b'tkhd', 0, 3, struct.pack('>IIIII', 0, 0, 1, 0, 0), bytes(16), _MATRIX,
+                         struct.pack('>II', fmt.width << 16, fmt.height << 16))
+        mdhd = _full_box(b'mdhd', 0, 0, struct.pack('>IIIIHH', 0, 0, self.timescale, 0, 0x55c4, 0))
+        hdlr = _full_box(b'hdlr', 0, 0, bytes(4), b'vide', bytes(12), b'VideoHandler\x00')
+        entry = _box(
+            b'avc1' if h264 else b'hvc1',
+            bytes(6), struct.pack('>H', 1), bytes(16),
+            struct.pack('>HHIIIH', fmt.width, fmt.height, 0x00480000, 0x00480000, 0, 1),
+            bytes(32), struct.pack('>Hh', 0x18, -1),
+            _box(b'avcC' if h264 else b'hvcC', fmt.config),
+        )
+        stbl = _box(
+            b'stbl',
+            _full_box(b'stsd', 0, 0, struct.pack('>I', 1), entry),
+            _full_box(b'stts', 0, 0, bytes(4)),
+            _full_box(b'stsc', 0, 0, bytes(4)),
+            _full_box(b'stsz', 0, 0, bytes(8)),
+            _full_box(b'stco', 0, 0, bytes(4)),
+        )
+        minf = _box(
+            b'minf',
+            _full_box(b'vmhd', 0, 1, bytes(8)),
+            _box(b'dinf', _full_box(b'dref', 0, 0, struct.pack('>I', 1), _full_box(b'url ', 0, 1))),
+            stbl,
+        )
+        trak = _box(b'trak', tkhd, _box(b'mdia', mdhd, hdlr, minf))
+        mvex = _box(b'mvex', _full_box(b'trex', 0, 0, struct.pack('>IIIII', 1, 1, 0, 0, 0)))
+        return ftyp + _box(b'moov', mvhd, trak, mvex)
+
+    def fragment(self, samples: Sequence[Sample]) -> bytes:
+        """moof + mdat of consecutive samples."""
+        if not samples:
+            return b''
+        self.sequence += 1
+        table = np.empty((len(samples), 3), dtype='>u4')
+        table[:, 0] = [sample.duration for sample in samples]
+        table[:, 1] = [len(sample.data) for sample in samples]
+        table[:, 2] = [_SYNC_FLAGS if sample.keyframe else _NON_SYNC_FLAGS for sample in samples]
+
+        def moof(data_offset: int) -> bytes:
+            trun = _full_box(b'trun', 0, 0x000701, struct.pack('>Ii', len(samples), data_offset), table.tobytes())
+            traf = _box(
+                b'traf',
+                # default-base-is-moof: data offsets count from this moof
+                _full_box(b'tfhd', 0, 0x020000, struct.pack('>I', 1)),
+                _full_box(b'tfdt', 1, 0, struct.pack('>Q', samples[0].time)),
+                trun,
+            )
+            return _box(b'moof', _full_box(b'mfhd', 0, 0, struct.pack('>I', self.sequence)), traf)
+
+        size = len(moof(0))
+        data_size = int(table[:, 1].sum())
+        return b''.join([moof(size + 8), struct.pack('>I', 8 + data_size), b'mdat']
+                        + [sample.data for sample in samples])
+
+    def trailer(self) -> bytes:
+        """Nothing, a fragmented file is complete after its last fragment."""
+        return b''
+
+    @staticmethod
+    def samples(data) -> List[Sample]:
+        """Samples of moof/mdat pairs written by fragment(), to read a recording back."""
+        view = memoryview(data)
+        samples = []
+        pos = 0
+        while pos + 8 <= len(view):
+            size, kind = struct.unpack_from('>I4s', view, pos)
+            if size < 8:
+                break
+            if kind == b'moof':
+                base_time = 0
+                table = None
+                data_offset = 0
+                # moof > mfhd, traf > tfhd, tfdt, trun; the fixed layout fragment() writes
+                child = pos + 8
+                while child + 8 <= pos + size:
+                    child_size, child_kind = struct.unpack_from('>I4s', view, child)
+                    if child_kind == b'traf':
+                        box = child + 8
+                        while box + 8 <= child + child_size:
+                            box_size, box_kind = struct.unpack_from('>I4s', view, box)
+                            if box_kind == b'tfdt':
+                                base_time = struct.unpack_from('>Q', view, box + 12)[0]
+                            elif box_kind == b'trun':
+                                count, data_offset = struct.unpack_from('>Ii', view, box + 12)
+                                table = np.frombuffer(view[box + 20:box + 20 + count * 12], dtype='>u4').reshape(-1, 3)
+                            box += box_size
+                    child += child_size
+                if table is not None:
+                    offset = pos + data_offset
+                    time = base_time
+                    for duration, sample_size, flags in table.tolist():
+                        samples.append(Sample(time, duration, flags == _SYNC_FLAGS,
+                                              bytes(view[offset:offset + sample_size])))
+                        time += duration
+                        offset += sample_size
+            pos += size
+        return samples
+
+
+# Matroska
+
+def _ebml_id(element_id: int) -> bytes:
+    return element_id.to_bytes((element_id.bit_length() + 7) // 8, 'big')
+
+
+def _ebml_size(size: int) -> bytes:
+    length = 1
+    while size >= (1 << (7 * length)) - 1:
+        length += 1
+    return (size | (1 << (7 * length))).to_bytes(length, 'big')
+
+
+def _element(element_id: int, *payload: bytes) -> bytes:
+    body = b''.join(payload)
+    return _ebml_id(element_id) + _ebml_size(len(body)) + body
+
+
+def _uint(element_id: int, value: int) -> bytes:
+    return _element(element_id, value.to_bytes(max(1, (value.bit_length() + 7) // 8), 'big'))
+
+
+def _string(element_id: int, value: str) -> bytes:
+    return _element(element_id, value.encode())
+
+
+def _read_vint(data, pos: int, keep_marker: bool = False):
+    """EBML variable size integer at ``pos``: (value, position after it). IDs keep their length marker."""
+    length = 9 - data[pos].bit_length()
+    value = int.from_bytes(data[pos:pos + length], 'big')
+    if not keep_marker:
+        value &= (1 << (7 * length)) - 1
+    return value, pos + length
+
+
+# The Segment is written with an unknown size, so it never has to be patched
+_UNKNOWN_SIZE = b'\x01\xff\xff\xff\xff\xff\xff\xff'
+
+
+class MkvMuxer:
+    """
+    Matroska with one video track.
+
+    header() is the EBML header and the start of a live (unknown size)
+    Segment with its Info and Tracks, every fragment() one or more complete
+    Clusters of SimpleBlocks.
+    """
+
+    timescale = MKV_TIMESCALE
+    extension = "mkv"
+
+    def __init__(self, fmt: VideoFormat):
+        self.format = fmt
+        self.sequence = 0       # Fragments written
+
+    def header(self) -> bytes:
+        """EBML header, Segment start, Info and Tracks."""
+        fmt = self.format
+        ebml = _element(
+            0x1A45DFA3,
+            _uint(0x4286, 1), _uint(0x42F7, 1), _uint(0x42F2, 4), _uint(0x42F3, 8),
+            _string(0x4282, "matroska"), _uint(0x4287, 4), _uint(0x4285, 2),
+        )
+        info = _element(
+            0x1549A966,
+            _uint(0x2AD7B1, 1_000_000_000 // self.timescale),
+            _string(0x4D80, "chiaki-python"), _string(0x5741, "chiaki-python"),
+        )
+        codec_id = "V_MPEG4/ISO/AVC" if fmt.codec == _chiaki.CHIAKI_CODEC_H264 else "V_MPEGH/ISO/HEVC"
+        track = _element(
+            0xAE,
+            _uint(0xD7, 1), _uint(0x73C5, 1), _uint(0x83, 1), _uint(0x9C, 0),
+            _string(0x86, codec_id), _element(0x63A2, fmt.config),
+            _element(0xE0, _uint(0xB0, fmt.width), _uint(0xBA, fmt.height)),
+        )
+        return ebml + _ebml_id(0x18538067) + _UNKNOWN_SIZE + info + _element(0x1654AE6B, track)
+
+    def fragment(self, samples: Sequence[Sample]) -> bytes:
+        """Clusters of consecutive samples, a new one whenever the 16-bit relative time would overflow."""
+        if not samples:
+            return b''
+        self.sequence += 1
+        clusters = []
+        blocks = []
+        cluster_time = samples[0].time
+        for sample in samples:
+            if sample.time - cluster_time > 0x7fff:
+                clusters.append(_element(0x1F43B675, _uint(0xE7, cluster_time), *blocks))
+                blocks = []
+                cluster_time = sample.time
+            # Track 1, relative time, keyframe flag
+            head = struct.pack('>BhB', 0x81, sample.time - cluster_time, 0x80 if sample.keyframe else 0)
+            blocks.append(_element(0xA3, head, sample.data))
+        clusters.append(_element(0x1F43B675, _uint(0xE7, cluster_time), *blocks))
+        return b''.join(clusters)
+
+    def trailer(self) -> bytes:
+        """Nothing, the live Segment ends with its last Cluster."""
+        return b''
+
+    @staticmethod
+    def samples(data) -> List[Sample]:
+        """
+        Samples of Clusters written by fragment(), to read a recording back.
+
+        SimpleBlocks carry no duration: a sample lasts until the next one,
+        the last one gets 0.
+        """
+        view = memoryview(data)
+        samples = []
+        pos = 0
+        while pos < len(view):
+            element_id, pos = _read_vint(view, pos, keep_marker=True)
+            size, pos = _read_vint(view, pos)
+            if element_id != 0x1F43B675:
+                pos += size
+                continue
+            end = pos + size
+            cluster_time = 0
+            while pos < end:
+                child_id, pos = _read_vint(view, pos, keep_marker=True)
+                child_size, pos = _read_vint(view, pos)
+                if child_id == 0xE7:
+                    cluster_time = int.from_bytes(view[pos:pos + child_size], 'big')
+                elif child_id == 0xA3:
+                    _, relative, flags = struct.unpack_from('>BhB', view, pos)
+                    samples.append(Sample(cluster_time + relative, 0, bool(flags & 0x80),
+                                          bytes(view[pos + 4:pos + child_size])))
+                pos += child_size
+        for i in range(len(samples) - 1):
+            samples[i] = samples[i]._replace(duration=samples[i + 1].time - samples[i].time)
+        return samples
+
+
+MUXERS = {
+    'mp4': Mp4Muxer,
+    'mkv': MkvMuxer,
+}
@@ -0,0 +1,358 @@
+"""
+Low-resolution live previews of sessions, served as MJPEG over HTTP.
+
+Only keyframes are decoded: a poller thread picks up each session's newest
+stored I-frame (see PS4Session.wait_iframe()), a small thread pool
+decodes it, downscales it and encodes a JPEG straight from the YUV planes
+(see _chiaki.Decoder.encode_jpeg()), and a local HTTP server streams the
+images as ``multipart/x-mixed-replace``, one endpoint per session. A preview
+therefore costs one keyframe decode every few seconds instead of decoding
+the whole stream.
+"""
+
+import concurrent.futures
+import html
+import logging
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional
+from urllib.parse import quote, unquote
+from . import _chiaki
+from .session import PS4Session
+
+logger = logging.getLogger(__name__)
+
+_BOUNDARY = "frame"
+
+
+class _Source:
+    """Preview state of one session."""
+
+    def __init__(self, session, name: str):
+        self.session = session
+        self.name = name
+        self.buffer = _chiaki.FrameBuffer(0)
+        self.cond = threading.Condition()
+        self.jpeg = None       # Latest image
+        self.image_seq = 0     # Keyframe it was made from
+        self.last_seq = 0      # Newest keyframe picked up
+        self.last_time = time.monotonic()
+        self.pending = None    # (seq, data, codec) waiting for a worker
+        self.busy = False      # A worker owns the source
+        self.closed = False    # Removed, the session isn't read any more; set under cond
+        self.on_close = None   # Session close callback removing the source
+        self.stats = {'keyframes': 0, 'images': 0, 'skipped': 0, 'errors': 0, 'idr_requests': 0, 'clients': 0}
+
+
+class PreviewServer:
+    """
+    Local HTTP server with an MJPEG preview of every added session.
+
+    Endpoints:
+        ``/``: index page showing all previews
+        ``/<name>.mjpg``: ``multipart/x-mixed-replace`` stream, a new image per keyframe
+        ``/<name>.jpg``: the latest image
+
+    Example:
+        with PreviewServer(port=8080) as server:
+            server.add(session, "living-room")
+            ...  # http://127.0.0.1:8080/living-room.mjpg
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 8080, workers: int = 2,
+                 scale: int = 4, quality: int = 70, interval: float = 0.25,
+                 refresh: Optional[float] = 5.0):
+        """
+        Args:
+            host: Address to listen on, local only by default
+            port: TCP port, 0 picks a free one (see ``port``)
+            workers: Threads decoding and encoding keyframes, shared by all sessions
+            scale: Integer downscale factor (1080p / 4 = 480x270)
+            quality: JPEG quality, 1 to 100
+            interval: Seconds between checks for new keyframes
+            refresh: Request an IDR when a session sent no keyframe for this
+                many seconds (coalesced with other requests by the recovery
+                policy), None only shows the keyframes the console sends
+        """
+        self.host = host
+        self.port = port
+        self.workers = workers
+        self.scale = scale
+        self.quality = quality
+        self.interval = interval
+        self.refresh = refresh
+        self._sources: Dict[str, _Source] = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._httpd = None
+        self._http_thread = None
+        self._poll_thread = None
+        self._executor = None
+        self._local = threading.local()
+        self._decoders: List[_chiaki.Decoder] = []
+
+    def add(self, session, name: str):
+        """
+        Serve a preview of a connected session as ``/<name>.mjpg``.
+
+        The preview is removed when the session disconnects.
+
+        Args:
+            session: PS4Session/PS5Session (or their asyncio variants)
+            name: Endpoint name, unique per server
+        """
+        source = _Source(session, name)
+        with self._lock:
+            if name in self._sources:
+                raise ValueError(f"Preview {name!r} already exists")
+            self._sources[name] = source
+        source.on_close = lambda: self._remove_source(source)
+        session.add_close_callback(source.on_close)
+
+    def remove(self, name: str):
+        """Stop serving a session's preview; its open streams end."""
+        with self._lock:
+            source = self._sources.get(name)
+        if source is not None:
+            source.session.remove_close_callback(source.on_close)
+            self._remove_source(source)
+
+    def _remove_source(self, source: _Source):
+        """Drop a source. Once this returns the poller doesn't touch its session any more."""
+        with self._lock:
+            if self._sources.get(source.name) is source:
+                del self._sources[source.name]
+        with source.cond:
+            source.closed = True
+            source.pending = None
+            source.cond.notify_all()
+
+    @property
+    def stats(self) -> Dict[str, dict]:
+        """Per preview: keyframes picked up, images encoded, skipped keyframes, errors, IDR requests and clients."""
+        with self._lock:
+            return {name: dict(source.stats) for name, source in self._sources.items()}
+
+    def url(self, name: str) -> str:
+        """URL of a preview's MJPEG stream."""
+        return f"http://{self.host}:{self.port}/{quote(name)}.mjpg"
+
+    def start(self):
+        """Start the HTTP server, the keyframe poller and the worker pool."""
+        if self._httpd is not None:
+            return
+        self._stop.clear()
+        self._httpd = ThreadingHTTPServer((self.host, self.port), self._handler_class())
+        self._httpd.daemon_threads = True
+        self.port = self._httpd.server_address[1]
+        self._executor = concurrent.futures.ThreadPoolExecutor(self.workers, thread_name_prefix="chiaki-preview")
+        self._poll_thread = threading.Thread(target=self._poll_loop, name="chiaki-preview-poll", daemon=True)
+        self._poll_thread.start()
+        self._http_thread = threading.Thread(target=self._httpd.serve_forever, name="chiaki-preview-http",
+                                             daemon=True)
+        self._http_thread.start()
+
+    def stop(self):
+        """Stop serving and free the decoders. Sessions stay connected."""
+        if self._httpd is None:
+            return
+        self._stop.set()
+        with self._lock:
+            sources = list(self._sources.values())
+        for source in sources:
+            with source.cond:
+                source.cond.notify_all()
+        self._httpd.shutdown()
+        self._httpd.server_close()
+        self._http_thread.join()
+        self._poll_thread.join()
+        self._executor.shutdown(wait=True)
+        self._httpd = None
+        for decoder in self._decoders:
+            decoder.close()
+        self._decoders.clear()
+        self._local = threading.local()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+    # Keyframes
+
+    def _poll_loop(self):
+        """Hand each session's newest keyframe to the pool."""
+        while not self._stop.wait(self.interval):
+            with self._lock:
+                sources = list(self._sources.values())
+            now = time.monotonic()
+            for source in sources:
+                # Under the source's lock, so removing it on disconnect waits for the session calls
+                with source.cond:
+                    if source.closed:
+                        continue
+                    # Non-blocking, only copies an I-frame newer than the last one. The
+                    # PS4Session methods, as AsyncPS4Session's are coroutines.
+                    iframe = PS4Session.wait_iframe(source.session, source.last_seq, 0, buffer=source.buffer)
+                    if iframe is None:
+                        if self.refresh is not None and now - source.last_time >= self.refresh:
+                            PS4Session.request_idr(source.session)
+                            source.last_time = now
+                            source.stats['idr_requests'] += 1
+                        continue
+                    source.last_seq = source.buffer.seq
+                    source.last_time = now
+                    source.stats['keyframes'] += 1
+                    data = bytes(iframe)
+                    codec = source.session._codec()
+                self._submit(source, source.last_seq, data, codec)
+
+    def _submit(self, source: _Source, seq: int, data: bytes, codec: int):
+        """Queue a keyframe; one still waiting for a worker is replaced by the newer one."""
+        with source.cond:
+            if source.closed:
+                return
+            if source.pending is not None:
+                source.stats['skipped'] += 1
+            source.pending = (seq, data, codec)
+            if source.busy:
+                return
+            source.busy = True
+        self._executor.submit(self._work, source)
+
+    def _decoder(self, codec: int) -> _chiaki.Decoder:
+        """This worker thread's decoder for a codec."""
+        decoders = getattr(self._local, 'decoders', None)
+        if decoders is None:
+            decoders = self._local.decoders = {}
+        decoder = decoders.get(codec)
+        if decoder is None:
+            decoder = decoders[codec] = _chiaki.Decoder(codec)
+            with self._lock:
+                self._decoders.append(decoder)
+        return decoder
+
+    def _work(self, source: _Source):
+        """Encode the source's pending keyframes until none is left."""
+        while True:
+            with source.cond:
+                if source.pending is None or source.closed or self._stop.is_set():
+                    source.busy = False
+                    return
+                seq, data, codec = source.pending
+                source.pending = None
+            try:
+                jpeg = self._encode(codec, seq, data)
+            except Exception:
+                logger.exception("Preview %s: encoding keyframe %d failed", source.name, seq)
+                jpeg = None
+            with source.cond:
+                if jpeg is None:
+                    source.stats['errors'] += 1
+                    continue
+                source.jpeg = jpeg
+                source.image_seq = seq
+                source.stats['images'] += 1
+                source.cond.notify_all()
+
+    def _encode(self, codec: int, seq: int, data: bytes) -> Optional[bytes]:
+        """Decode one keyframe and encode its downscaled JPEG."""
+        decoder = self._decoder(codec)
+        # The decoder is shared by every source this thread serves, start clean
+        decoder.reset()
+        if not decoder.decode(data, seq):
+            decoder.flush()
+        if not decoder.has_picture or decoder.picture.seq != seq:
+            return None
+        scale = max(1, min(self.scale, _chiaki.CONVERT_MAX_SCALE))
+        return decoder.encode_jpeg(self.quality, scale=scale)
+
+    # HTTP
+
+    def _source(self, name: str) -> Optional[_Source]:
+        with self._lock:
+            return self._sources.get(name)
+
+    def _next_image(self, source: _Source, after_seq: int, timeout: float):
+        """Wait for an image newer than after_seq, (seq, jpeg) or None."""
+        with source.cond:
+            source.cond.wait_for(
+                lambda: source.image_seq > after_seq or source.closed or self._stop.is_set(), timeout)
+            if source.closed or self._stop.is_set() or source.image_seq <= after_seq:
+                return None
+            return source.image_seq, source.jpeg
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                logger.debug("%s - %s", self.address_string(), format % args)
+
+            def do_GET(self):
+                path = unquote(self.path.split("?", 1)[0]).lstrip("/")
+                if path == "":
+                    self._index()
+                elif path.endswith(".mjpg") and server._source(path[:-5]) is not None:
+                    self._stream(server._source(path[:-5]))
+                elif path.endswith(".jpg") and server._source(path[:-4]) is not None:
+                    self._still(server._source(path[:-4]))
+                else:
+                    self.send_error(404)
+
+            def _index(self):
+                with server._lock:
+                    names = sorted(server._sources)
+                body = "".join(
+                    f'<figure><img src="/{quote(name)}.mjpg"><figcaption>{html.escape(name)}</figcaption></figure>'
+                    for name in names
+                )
+                data = f"<!DOCTYPE html><title>chiaki-python preview</title><body>{body}</body>".encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/html; charset=utf-8")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def _still(self, source: _Source):
+                with source.cond:
+                    jpeg = source.jpeg
+                if jpeg is None:
+                    self.send_error(503, "No keyframe yet")
+                    return
+                self.send_response(200)
+                self.send_header("Content-Type", "image/jpeg")
+                self.send_header("Content-Length", str(len(jpeg)))
+                self.send_header("Cache-Control", "no-store")
+                self.end_headers()
+                self.wfile.write(jpeg)
+
+            def _stream(self, source: _Source):
+                self.send_response(200)
+                self.send_header("Content-Type", f"multipart/x-mixed-replace; boundary={_BOUNDARY}")
+                self.send_header("Cache-Control", "no-store")
+                self.end_headers()
+                with source.cond:
+                    source.stats['clients'] += 1
+                try:
+                    seq = 0
+                    while not source.closed and not server._stop.is_set():
+                        image = server._next_image(source, seq, 1.0)
+                        if image is None:
+                            continue
+                        seq, jpeg = image
+                        self.wfile.write(
+                            f"--{_BOUNDARY}\r\nContent-Type: image/jpeg\r\n"
+                            f"Content-Length: {len(jpeg)}\r\n\r\n".encode() + jpeg + b"\r\n"
+                        )
+                        self.wfile.flush()
+                except (BrokenPipeError, ConnectionResetError):
+                    pass
+                finally:
+                    with source.cond:
+                        source.stats['clients'] -= 1
+
+        return Handler
@@ -0,0 +1,363 @@
+"""
+Record a session's video to MP4 or Matroska without re-encoding.
+
+The console's H.264/HEVC is stream-copied: frames are converted from
+Annex-B to length-prefixed samples in-process and timestamped with their
+arrival times from the frame descriptors (see mux.py). Muxing and disk I/O
+run on separate threads joined by a bounded queue, so a slow disk never
+stalls frame delivery, and the file is fragmented, so it stays playable up
+to the last fragment if the process dies. A GOP index is written next to
+the file for random access (see gop_index.py). write_clip() muxes frames
+that are already in memory, like an instant replay, in one go.
+"""
+
+import logging
+import os
+import queue
+import threading
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+from . import _chiaki
+from . import gop_index
+from . import mux
+
+logger = logging.getLogger(__name__)
+
+
+class Recorder:
+    """
+    Stream-copy recording of one session.
+
+    The mux thread reads the session's frames through its own FrameConsumer,
+    starting with the cached GOP (or the next keyframe), converts them and
+    cuts a fragment at every keyframe and at least every ``fragment_interval``
+    seconds. The I/O thread writes the fragments behind it through a large
+    buffer and hands them to the OS whenever its queue runs dry. If the disk
+    stalls long enough for the queue to fill, the consumer skips ahead to the
+    next keyframe, so the recording has a gap but stays decodable.
+
+    With ``index`` an entry per GOP goes to ``path + gop_index.INDEX_SUFFIX``
+    as each GOP is completed, always behind the data it points to; open the
+    recording with gop_index.RecordingReader. Remote Play only sends
+    keyframes on request, so one is requested every ``keyframe_interval``
+    seconds: that is the longest GOP, hence how far a seek may have to
+    decode and the unit a RecordingReader hands to its workers.
+
+    Example:
+        with session.record("capture.mp4") as recorder:
+            time.sleep(60)
+        print(recorder.stats)
+    """
+
+    def __init__(self, session, path: str, container: Optional[str] = None,
+                 fragment_interval: float = 1.0, queue_size: int = 32,
+                 buffer_size: int = 4 * 1024 * 1024, index: bool = True,
+                 keyframe_interval: Optional[float] = 10.0, start: bool = True):
+        """
+        Args:
+            session: Connected PS4Session/PS5Session
+            path: Output file, truncated if it exists
+            container: "mp4" (fragmented) or "mkv", None picks by the extension (mp4 by default)
+            fragment_interval: Longest fragment in seconds, what a crash can lose at most
+            queue_size: Fragments waiting for the I/O thread
+            buffer_size: Write buffer in bytes
+            index: Write a GOP index sidecar
+            keyframe_interval: With ``index``, seconds between requested keyframes,
+                the seek and parallelism granularity (None = only the console's own)
+            start: Start recording right away
+        """
+        if container is None:
+            container = "mkv" if path.lower().endswith(".mkv") else "mp4"
+        muxer_class = mux.MUXERS.get(container.lower())
+        if muxer_class is None:
+            raise ValueError(f"Unsupported container {container!r}, use one of {sorted(mux.MUXERS)}")
+        if session._session is None:
+            raise RuntimeError("Session is not connected")
+
+        self.session = session
+        self.path = path
+        self.container = container.lower()
+        self.fragment_interval = fragment_interval
+        self.keyframe_interval = keyframe_interval if index else None
+        self._muxer_class = muxer_class
+        self._file = open(path, 'wb', buffering=buffer_size)
+        self.index_path = path + gop_index.INDEX_SUFFIX if index else None
+        self._index_file = open(self.index_path, 'wb') if index else None
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._stop = threading.Event()
+        self._error = None
+        self._consumer = None
+        self._mux_thread = None
+        self._io_thread = None
+        self._stats = {'frames': 0, 'keyframes': 0, 'fragments': 0, 'bytes': 0, 'gops': 0, 'skipped': 0,
+                       'queue_peak': 0}
+        if start:
+            self.start()
+
+    def start(self):
+        """Start the mux and I/O threads."""
+        if self._mux_thread is not None:
+            return
+        if self._file.closed:
+            raise RuntimeError("Recording already finished")
+        self._consumer = _chiaki.FrameConsumer(
+            self.session._session, _chiaki.CONSUMER_POLICY_SKIP_TO_KEYFRAME, from_gop=True
+        )
+        name = os.path.basename(self.path)
+        self._io_thread = threading.Thread(target=self._io_loop, name=f"chiaki-record-io-{name}", daemon=True)
+        self._io_thread.start()
+        self._mux_thread = threading.Thread(target=self._mux_loop, name=f"chiaki-record-{name}", daemon=True)
+        self._mux_thread.start()
+
+    def close(self):
+        """Finish the recording: write what is buffered and close the file."""
+        if self._mux_thread is None:
+            if not self._file.closed:
+                self._file.close()
+                if self._index_file is not None:
+                    self._index_file.close()
+            return
+        self._stop.set()
+        if self._mux_thread is not threading.current_thread():
+            self._mux_thread.join()
+            self._io_thread.join()
+        self._mux_thread = None
+
+    @property
+    def recording(self) -> bool:
+        """Whether frames are still being recorded."""
+        return self._mux_thread is not None and self._mux_thread.is_alive()
+
+    @property
+    def error(self) -> Optional[BaseException]:
+        """The exception that ended the recording early, if any."""
+        return self._error
+
+    @property
+    def stats(self) -> Dict[str, int]:
+        """
+        frames and keyframes recorded, fragments and bytes written, GOPs
+        indexed, frames the consumer skipped while the recorder fell behind,
+        and the deepest the write queue got.
+        """
+        stats = dict(self._stats)
+        consumer = self._consumer
+        consumer_stats = consumer.stats if consumer is not None else None
+        if consumer_stats is not None:
+            stats['skipped'] = consumer_stats.dropped
+        return stats
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    # Threads
+
+    def _put(self, chunk: bytes, index: bytes = b'') -> bool:
+        """
+        Queue a chunk for the I/O thread, and what to append to the index after it,
+        waiting while the queue is full. False once writing failed.
+        """
+        while self._error is None:
+            try:
+                self._queue.put((chunk, index), timeout=0.1)
+            except queue.Full:
+                continue
+            self._stats['queue_peak'] = max(self._stats['queue_peak'], self._queue.qsize())
+            return True
+        return False
+
+    def _mux_loop(self):
+        """Mux thread: turn frames into fragments until stopped or the session quits."""
+        consumer = self._consumer
+        muxer = None
+        fragmenter = None
+        indexer = None
+        offset = 0        # Bytes queued for the file
+        header = b''      # Latest codec header, for a keyframe without its own parameter sets
+        requested_idr = False
+        gop_time = 0      # Arrival of the current GOP's keyframe
+        idr_time = 0      # Last keyframe request
+        interval_ns = (self.keyframe_interval or 0) * 1e9
+        try:
+            while not self._stop.is_set() and self._error is None:
+                frames = consumer.read(0.1)
+                if not frames:
+                    if self.session._session is None or self.session._quit_event is not None:
+                        break
+                    continue
+                descs = consumer.descs
+                for (seq, frame), time_ns, keyframe, nal_flags in zip(
+                        frames, descs['recv_time_ns'].tolist(), descs['keyframe'].tolist(),
+                        descs['nal_flags'].tolist()):
+                    if muxer is None:
+                        # The file starts at a keyframe, with the parameter sets in front
+                        if nal_flags & _chiaki.NAL_FLAG_SPS and not nal_flags & _chiaki.NAL_FLAG_SLICE:
+                            header = bytes(frame)
+                            continue
+                        fmt = None
+                        if keyframe:
+                            if nal_flags & _chiaki.NAL_FLAG_SPS:
+                                header = b''
+                            fmt = mux.video_format(header + bytes(frame), self.session._codec())
+                        if fmt is None:
+                            if not requested_idr:
+                                self.session.request_idr()
+                                requested_idr = True
+                            continue
+                        muxer = self._muxer_class(fmt)
+                        fragmenter = mux.Fragmenter(fmt.codec, muxer.timescale, time_ns, self.fragment_interval,
+                                                    1 / self.session.fps)
+                        chunk = muxer.header()
+                        offset = len(chunk)
+                        index = b''
+                        if self._index_file is not None:
+                            indexer = gop_index.GopIndexer(muxer.timescale)
+                            index = gop_index.index_header(self.container, fmt.codec, len(chunk),
+                                                           mux.parameter_sets(header + bytes(frame), fmt.codec))
+                        if not self._put(chunk, index):
+                            return
+                        if header:
+                            fragmenter.push(header, time_ns, False)
+                    samples = fragmenter.push(frame, time_ns, keyframe)
+                    if nal_flags & _chiaki.NAL_FLAG_SLICE:
+                        self._stats['frames'] += 1
+                        self._stats['keyframes'] += int(bool(keyframe))
+                    if keyframe:
+                        gop_time = time_ns
+                    elif interval_ns and time_ns - max(gop_time, idr_time) >= interval_ns:
+                        # Keeps GOPs, and with them index entries, at most this long
+                        idr_time = time_ns
+                        self.session.request_idr()
+                    if samples:
+                        self._stats['fragments'] += 1
+                        chunk = muxer.fragment(samples)
+                        index = b''
+                        if indexer is not None:
+                            # Closes the previous GOP's entry when this fragment starts a new one
+                            index = indexer.fragment(samples, offset, len(chunk))
+                            self._stats['gops'] = indexer.gop_count
+                        offset += len(chunk)
+                        if not self._put(chunk, index):
+                            return
+            if muxer is not None:
+                samples = fragmenter.flush()
+                self._stats['fragments'] += int(bool(samples))
+                chunk = muxer.fragment(samples) + muxer.trailer()
+                index = b''
+                if indexer is not None:
+                    index = indexer.fragment(samples, offset, len(chunk)) + indexer.flush()
+                    self._stats['gops'] = indexer.gop_count
+                self._put(chunk, index)
+        except Exception as e:
+            logger.exception("Recording %s failed", self.path)
+            self._error = e
+        finally:
+            consumer_stats = consumer.stats
+            if consumer_stats is not None:
+                self._stats['skipped'] = consumer_stats.dropped
+            self._consumer = None
+            consumer.close()
+            # Ends the I/O thread once everything queued is written
+            self._queue.put(None)
+
+    def _io_loop(self):
+        """I/O thread: write queued chunks, flush whenever the queue is empty."""
+        f = self._file
+        index_file = self._index_file
+        try:
+            while True:
+                item = self._queue.get()
+                if item is None:
+                    break
+                if self._error is not None:
+                    continue  # Drain the queue so the mux thread never blocks
+                chunk, index = item
+                try:
+                    f.write(chunk)
+                    self._stats['bytes'] += len(chunk)
+                    if index:
+                        index_file.write(index)
+                    # Hand complete fragments to the OS, bursts still go out as large writes;
+                    # the index after the data, so it never points past it
+                    if self._queue.empty():
+                        f.flush()
+                        if index_file is not None:
+                            index_file.flush()
+                except OSError as e:
+                    logger.error("Writing %s failed: %s", self.path, e)
+                    self._error = e
+        finally:
+            for file, path in ((f, self.path), (index_file, self.index_path)):
+                if file is None:
+                    continue
+                try:
+                    file.close()
+                except OSError as e:
+                    logger.error("Closing %s failed: %s", path, e)
+                    self._error = self._error or e
+
+
+def write_clip(path: str, frames: List[Tuple[int, memoryview]], descs: np.ndarray, codec: int,
+               container: Optional[str] = None, fragment_interval: float = 1.0,
+               default_duration: float = 1 / 60) -> int:
+    """
+    Mux frames held in memory into a file, like Recorder does live.
+
+    The frames have to start at a GOP: parameter sets or a keyframe that
+    carries them, as FrameBuffer.get_gop() and get_replay() return them.
+
+    Args:
+        path: Output file, truncated if it exists
+        frames: (seq, view) tuples in decoding order
+        descs: FRAME_DESC_DTYPE descriptors of the frames
+        codec: CHIAKI_CODEC_H264 or CHIAKI_CODEC_H265
+        container: "mp4" (fragmented) or "mkv", None picks by the extension (mp4 by default)
+        fragment_interval: Longest fragment in seconds
+        default_duration: Seconds given to the last frame
+
+    Returns:
+        Number of pictures written, 0 (and no file) if the frames don't start at a usable keyframe
+    """
+    if container is None:
+        container = "mkv" if path.lower().endswith(".mkv") else "mp4"
+    muxer_class = mux.MUXERS.get(container.lower())
+    if muxer_class is None:
+        raise ValueError(f"Unsupported container {container!r}, use one of {sorted(mux.MUXERS)}")
+
+    # Like the recorder's start: a keyframe, behind the parameter sets unless it carries its own
+    header = b''
+    fmt = None
+    nal_flags = descs['nal_flags'].tolist()
+    keyframes = descs['keyframe'].tolist()
+    first = 0
+    for first, (seq, frame) in enumerate(frames):
+        if nal_flags[first] & _chiaki.NAL_FLAG_SPS and not nal_flags[first] & _chiaki.NAL_FLAG_SLICE:
+            header = bytes(frame)
+            continue
+        if keyframes[first]:
+            if nal_flags[first] & _chiaki.NAL_FLAG_SPS:
+                header = b''
+            fmt = mux.video_format(header + bytes(frame), codec)
+        break
+    if fmt is None:
+        return 0
+
+    muxer = muxer_class(fmt)
+    times = descs['recv_time_ns'].tolist()
+    fragmenter = mux.Fragmenter(fmt.codec, muxer.timescale, times[first], fragment_interval, default_duration)
+    pictures = 0
+    with open(path, 'wb') as f:
+        f.write(muxer.header())
+        if header:
+            fragmenter.push(header, times[first], False)
+        for i in range(first, len(frames)):
+            samples = fragmenter.push(frames[i][1], times[i], keyframes[i])
+            if nal_flags[i] & _chiaki.NAL_FLAG_SLICE:
+                pictures += 1
+            if samples:
+                f.write(muxer.fragment(samples))
+        f.write(muxer.fragment(fragmenter.flush()) + muxer.trailer())
+    return pictures
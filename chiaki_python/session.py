@@ -2,14 +2,34 @@
 Session management for PlayStation Remote Play connections.
 """
 
-from typing import Optional, Callable
+from typing import Optional, Callable, List, Tuple
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeoutError
 import numpy as np
 import base64
 import ctypes
-import threading
+import logging
 import queue
+import threading
+import time
 from . import _chiaki
+from . import logs
 from .controller import Controller
+from .recorder import Recorder, write_clip
+
+logger = logging.getLogger(__name__)
+
+_EVENT_NAMES = {
+    _chiaki.CHIAKI_EVENT_CONNECTED: 'connected',
+    _chiaki.CHIAKI_EVENT_LOGIN_PIN_REQUEST: 'login_pin_request',
+    _chiaki.CHIAKI_EVENT_QUIT: 'quit',
+}
+
+_IMAGE_FORMATS = {
+    'png': _chiaki.IMAGE_PNG,
+    'jpeg': _chiaki.IMAGE_JPEG,
+    'jpg': _chiaki.IMAGE_JPEG,
+    'webp': _chiaki.IMAGE_WEBP,
+}
 
 
 class PS4Session:
@@ -20,13 +40,16 @@ class PS4Session:
     from your Chiaki configuration.
     """
 
+    _is_ps5 = False
+
     def __init__(self,
                  host: str,
                  regist_key: str,
                  rp_key: str,
                  psn_account_id: Optional[str] = None,
                  resolution: str = "720p",
-                 fps: int = 60):
+                 fps: int = 60,
+                 log_level: int = logging.INFO):
         """
         Initialize a PS4 session.
 
@@ -37,6 +60,8 @@ class PS4Session:
             psn_account_id: PSN account ID (base64 encoded, e.g., "U3hhcG9sbG8=")
             resolution: Video resolution ("360p", "540p", "720p", "1080p")
             fps: Frame rate (30 or 60)
+            log_level: Lowest ``logging`` level of libchiaki messages forwarded
+                to the ``chiaki_python.libchiaki`` logger
         """
         self.host = host
         self.regist_key = regist_key
@@ -44,14 +69,36 @@ class PS4Session:
         self.psn_account_id = psn_account_id or "AAAAAAAAAAA="  # Default 8 zero bytes
         self.resolution = resolution
         self.fps = fps
+        self.log_level = log_level
 
         self._connected = False
         self._controller = Controller(self)
         self._frame_callback = None
+        self._frame_convert = (_chiaki.CONVERT_RGB, None, 1)
+        self._motion_callback = None
+        self._motion_grid = (64, 1.0)
         self._frame_queue = queue.Queue(maxsize=1)
+        self._picture_pool = _chiaki.PicturePool()
+        self._decode_thread = None
+        self._decode_stop = threading.Event()
+        self._lazy_lock = threading.Lock()
+        self._lazy_decoder = None
+        self._lazy_buffer = None
+        self._lazy_gop = (0, 0)
+        self._lazy_seq = None
+        self._lazy_image = None
         self._session = None
-        self._log = None
+        self._frame_buffer = None
+        self._consumers = []
+        self._recorders = []
         self._quit_reason = None
+        self._quit_event = None
+        self._event_callbacks = []
+        self._close_callbacks = []
+        self._pin_callback = None
+        self._event_thread = None
+        self._connected_future = None
+        self._quit_future = None
         self._status = {
             'online': False,
             'running_app': None,
@@ -74,68 +121,8 @@ class PS4Session:
         """Get current console status."""
         return self._status
 
-    def _log_callback(self, user, level, msg):
-        """Internal log callback from Chiaki"""
-        try:
-            msg_str = msg.decode('utf-8') if msg else ""
-            level_names = {
-                _chiaki.CHIAKI_LOG_DEBUG: "DEBUG",
-                _chiaki.CHIAKI_LOG_VERBOSE: "VERBOSE",
-                _chiaki.CHIAKI_LOG_INFO: "INFO",
-                _chiaki.CHIAKI_LOG_WARNING: "WARNING",
-                _chiaki.CHIAKI_LOG_ERROR: "ERROR",
-            }
-            level_name = level_names.get(level, f"LEVEL{level}")
-            print(f"[Chiaki {level_name}] {msg_str}")
-        except Exception as e:
-            print(f"Error in log callback: {e}")
-
-    def _event_callback(self, event_ptr, user):
-        """Internal event callback from Chiaki"""
-        try:
-            event = ctypes.cast(event_ptr, ctypes.POINTER(_chiaki.ChiakiEvent)).contents
-            if event.type == _chiaki.CHIAKI_EVENT_QUIT:
-                self._quit_reason = event.quit.reason
-                quit_str = event.quit.reason_str.decode('utf-8') if event.quit.reason_str else ""
-                print(f"Session quit: {_chiaki.quit_reason_string(event.quit.reason)} - {quit_str}")
-            elif event.type == _chiaki.CHIAKI_EVENT_CONNECTED:
-                print("Session connected!")
-        except Exception as e:
-            print(f"Error in event callback: {e}")
-
-    def _video_sample_callback(self, buf, buf_size, frames_lost, frame_recovered, user):
-        """Internal video callback from Chiaki"""
-        try:
-            # For now, just acknowledge receipt
-            # TODO: Decode video frames and convert to numpy arrays
-            return True
-        except Exception as e:
-            print(f"Error in video callback: {e}")
-            return False
-
-    def connect(self):
-        """
-        Connect to the PS4.
-
-        This establishes the Remote Play session.
-        """
-        if self._connected:
-            print("Already connected")
-            return
-
-        print(f"Connecting to PS4 at {self.host}...")
-        print(f"  Resolution: {self.resolution} @ {self.fps}fps")
-
-        # Initialize logging
-        self._log = _chiaki.ChiakiLog()
-        log_cb = _chiaki.ChiakiLogCb(self._log_callback)
-        _chiaki._lib.chiaki_log_init(
-            ctypes.byref(self._log),
-            _chiaki.CHIAKI_LOG_ALL,
-            log_cb,
-            None
-        )
-
+    def _start_session(self):
+        """Create and start a wrapper session handle, without waiting for the connection."""
         # Parse resolution
         res_map = {
             "360p": _chiaki.CHIAKI_VIDEO_RESOLUTION_PRESET_360p,
@@ -148,83 +135,135 @@ class PS4Session:
         fps_map = {30: _chiaki.CHIAKI_VIDEO_FPS_PRESET_30, 60: _chiaki.CHIAKI_VIDEO_FPS_PRESET_60}
         fps_preset = fps_map.get(self.fps, _chiaki.CHIAKI_VIDEO_FPS_PRESET_60)
 
-        # Set up video profile
-        video_profile = _chiaki.ChiakiConnectVideoProfile()
-        _chiaki._lib.chiaki_connect_video_profile_preset(
-            ctypes.byref(video_profile),
+        # Parse PSN account ID (base64 to bytes)
+        psn_id_bytes = base64.b64decode(self.psn_account_id)
+        psn_array = (ctypes.c_uint8 * 8)(*psn_id_bytes[:8])
+
+        # The wrapper owns the ChiakiSession and its callbacks
+        session = _chiaki._lib.chiaki_python_session_create_ex(
+            self.host.encode('utf-8'),
+            self.regist_key.encode('utf-8'),
+            self.rp_key.encode('utf-8'),
+            psn_array,
+            self._is_ps5,
             res_preset,
-            fps_preset
+            fps_preset,
+            logs.level_mask(self.log_level)
         )
+        if not session:
+            raise RuntimeError("Failed to initialize session")
+        logs.pump.register(session, self.host)
 
-        # Set up connect info
-        connect_info = _chiaki.ChiakiConnectInfo()
-        connect_info.ps5 = False
-        connect_info.host = self.host.encode('utf-8')
+        if not _chiaki._lib.chiaki_python_session_start(session):
+            logs.pump.unregister(session)
+            _chiaki._lib.chiaki_python_session_destroy(session)
+            raise RuntimeError("Failed to start session")
 
-        # Parse regist key (hex string to bytes, pad to 16 bytes)
-        regist_key_bytes = bytes.fromhex(self.regist_key)
-        regist_key_padded = regist_key_bytes + b'\x00' * (16 - len(regist_key_bytes))
-        for i, b in enumerate(regist_key_padded[:16]):
-            connect_info.regist_key[i] = b
+        return session
 
-        # Parse RP key (morning field)
-        rp_key_bytes = bytes.fromhex(self.rp_key)
-        for i, b in enumerate(rp_key_bytes[:16]):
-            connect_info.morning[i] = b
+    def _new_futures(self):
+        """Fresh connected/quit futures for a new connection attempt."""
+        self._connected_future = Future()
+        self._quit_future = Future()
 
-        # Parse PSN account ID (base64 to bytes)
-        psn_id_bytes = base64.b64decode(self.psn_account_id)
-        for i, b in enumerate(psn_id_bytes[:8]):
-            connect_info.psn_account_id[i] = b
-
-        connect_info.video_profile = video_profile
-        connect_info.video_profile_auto_downgrade = True
-        connect_info.enable_keyboard = False
-        connect_info.enable_dualsense = False
-        connect_info.audio_video_disabled = 0
-        connect_info.auto_regist = False
-        connect_info.holepunch_session = None
-        connect_info.rudp_sock = None
-        connect_info.packet_loss_max = 0.0
-        connect_info.enable_idr_on_fec_failure = True
-
-        # Initialize session - allocate enough space
-        # ChiakiSession is a large structure, allocate it properly
-        session_size = ctypes.sizeof(_chiaki.ChiakiSession)
-        self._session = _chiaki.ChiakiSession()
-
-        err = _chiaki._lib.chiaki_session_init(
-            ctypes.byref(self._session),
-            ctypes.byref(connect_info),
-            ctypes.byref(self._log)
-        )
+    def _dispatch_event(self, ev: _chiaki.PythonEvent) -> dict:
+        """Resolve the lifecycle futures and run the callbacks for one event."""
+        event = {
+            'type': _EVENT_NAMES.get(ev.type, ev.type),
+            'time_ns': ev.time_ns,
+        }
+        if ev.type == _chiaki.CHIAKI_EVENT_CONNECTED:
+            if not self._connected_future.done():
+                self._connected_future.set_result(True)
+        elif ev.type == _chiaki.CHIAKI_EVENT_LOGIN_PIN_REQUEST:
+            event['pin_incorrect'] = bool(ev.pin_incorrect)
+            if self._pin_callback is not None:
+                pin = self._pin_callback(event['pin_incorrect'])
+                if pin:
+                    self.set_login_pin(pin)
+        elif ev.type == _chiaki.CHIAKI_EVENT_QUIT:
+            reason = ev.reason_str.decode('utf-8', 'replace')
+            event['quit_reason'] = ev.quit_reason
+            event['reason'] = reason
+            self._quit_reason = ev.quit_reason
+            self._quit_event = event
+            if not self._connected_future.done():
+                self._connected_future.set_exception(RuntimeError(f"Failed to connect to {self.host}: {reason}"))
+            if not self._quit_future.done():
+                self._quit_future.set_result(event)
 
-        if err != _chiaki.CHIAKI_ERR_SUCCESS:
-            raise RuntimeError(f"Failed to initialize session: {_chiaki.error_string(err)}")
+        for callback in list(self._event_callbacks):
+            try:
+                callback(event)
+            except Exception:
+                logger.exception("Session event callback failed")
+        return event
 
-        # Set up callbacks using wrapper functions
-        # Store callbacks as instance variables to prevent garbage collection
-        self._event_cb = _chiaki.ChiakiEventCallback(self._event_callback)
-        _chiaki._lib.chiaki_session_set_event_cb_wrapper(
-            ctypes.byref(self._session),
-            self._event_cb,
-            None
-        )
+    def _event_loop(self, session):
+        """Event thread: deliver lifecycle events until the session quits or is closed."""
+        ev = _chiaki.PythonEvent()
+        while _chiaki._lib.chiaki_python_session_next_event(session, -1, ctypes.byref(ev)):
+            self._dispatch_event(ev)
+            if ev.type == _chiaki.CHIAKI_EVENT_QUIT:
+                break
+
+    def _teardown(self, session):
+        """Stop the session, end its event delivery and destroy it."""
+        _chiaki._lib.chiaki_python_session_stop(session)
+        self._stop_decode_thread()
+        self._run_close_callbacks()
+        self._close_recorders()
+        self._close_consumers()
+        self._close_lazy_decoder()
+        _chiaki._lib.chiaki_python_session_close_events(session)
+        if self._event_thread is not None and self._event_thread is not threading.current_thread():
+            self._event_thread.join()
+        self._event_thread = None
+        logs.pump.unregister(session)
+        _chiaki._lib.chiaki_python_session_destroy(session)
+
+    def connect(self, timeout: float = 15.0):
+        """
+        Connect to the PS4.
+
+        This establishes the Remote Play session. Returns as soon as the
+        console accepts it, and fails as soon as the session quits.
 
-        self._video_cb = _chiaki.ChiakiVideoSampleCallback(self._video_sample_callback)
-        _chiaki._lib.chiaki_session_set_video_sample_cb_wrapper(
-            ctypes.byref(self._session),
-            self._video_cb,
-            None
+        Args:
+            timeout: Seconds to wait for the console to accept the session
+        """
+        if self._connected:
+            print("Already connected")
+            return
+
+        print(f"Connecting to {'PS5' if self._is_ps5 else 'PS4'} at {self.host}...")
+        print(f"  Resolution: {self.resolution} @ {self.fps}fps")
+
+        self._new_futures()
+        self._quit_reason = None
+        self._quit_event = None
+        session = self._start_session()
+        # Set before any event is delivered: the console asks for the login PIN before it accepts
+        self._session = session
+        self._event_thread = threading.Thread(
+            target=self._event_loop, args=(session,), name=f"chiaki-events-{self.host}", daemon=True
         )
+        self._event_thread.start()
 
-        # Start session
-        err = _chiaki._lib.chiaki_session_start(ctypes.byref(self._session))
-        if err != _chiaki.CHIAKI_ERR_SUCCESS:
-            _chiaki._lib.chiaki_session_fini(ctypes.byref(self._session))
-            raise RuntimeError(f"Failed to start session: {_chiaki.error_string(err)}")
+        try:
+            self._connected_future.result(timeout)
+        except FutureTimeoutError:
+            self._teardown(session)
+            self._session = None
+            raise RuntimeError(f"Failed to connect to {self.host}: timed out")
+        except RuntimeError:
+            self._teardown(session)
+            self._session = None
+            raise
 
         self._connected = True
+        if self._wants_decoding():
+            self._start_decode_thread()
         print("✓ Session started!")
 
     def disconnect(self):
@@ -234,39 +273,967 @@ class PS4Session:
 
         print("Disconnecting from PS4...")
 
-        # Stop the session
-        _chiaki._lib.chiaki_session_stop(ctypes.byref(self._session))
-
-        # Wait for session thread to finish
-        _chiaki._lib.chiaki_session_join(ctypes.byref(self._session))
-
-        # Clean up session
-        _chiaki._lib.chiaki_session_fini(ctypes.byref(self._session))
+        # Stop the session, wait for its threads to finish and clean up
+        self._teardown(self._session)
 
         self._connected = False
         self._session = None
+        self._frame_buffer = None
         print("✓ Disconnected")
 
-    def screenshot(self) -> Optional[np.ndarray]:
+    @property
+    def connected_future(self) -> Optional[Future]:
+        """Future of the current connection attempt, resolves True or fails with the quit reason."""
+        return self._connected_future
+
+    @property
+    def quit_future(self) -> Optional[Future]:
+        """Future resolving to the quit event dict (type, quit_reason, reason, time_ns)."""
+        return self._quit_future
+
+    @property
+    def quit_reason(self) -> Optional[int]:
+        """CHIAKI_QUIT_REASON_* code once the session has quit, else None."""
+        return self._quit_reason
+
+    def add_event_callback(self, callback: Callable[[dict], None]):
         """
-        Capture a screenshot from the current video stream.
+        Call ``callback(event)`` for every lifecycle event.
+
+        Events are dicts with 'type' ('connected', 'login_pin_request' or
+        'quit') and 'time_ns', plus 'pin_incorrect' for PIN requests and
+        'quit_reason'/'reason' for quit. Callbacks run on the session's
+        event thread (the event loop for AsyncPS4Session).
+        """
+        self._event_callbacks.append(callback)
+
+    def remove_event_callback(self, callback: Callable[[dict], None]):
+        """Stop calling a callback added with add_event_callback()."""
+        self._event_callbacks.remove(callback)
+
+    def add_close_callback(self, callback: Callable[[], None]):
+        """
+        Call ``callback()`` once when the session is torn down.
+
+        It runs on the disconnecting thread after frame delivery stopped and
+        before the wrapper session is freed: helpers reading the session on
+        threads of their own (PreviewServer, LiveServer) stop and join them
+        there. Callbacks are dropped once they ran.
+        """
+        self._close_callbacks.append(callback)
+
+    def remove_close_callback(self, callback: Callable[[], None]):
+        """Stop calling a callback added with add_close_callback(), if it didn't run yet."""
+        if callback in self._close_callbacks:
+            self._close_callbacks.remove(callback)
+
+    def _run_close_callbacks(self):
+        callbacks, self._close_callbacks = self._close_callbacks, []
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception:
+                logger.exception("Session close callback failed")
+
+    def set_pin_callback(self, callback: Optional[Callable[[bool], Optional[str]]]):
+        """
+        Answer login PIN requests with ``callback(pin_incorrect)``.
+
+        The callback returns the PIN as a string, or None to leave the
+        request unanswered (the session then times out).
+        """
+        self._pin_callback = callback
+
+    def set_login_pin(self, pin: str) -> bool:
+        """Send the login PIN the console asked for."""
+        session = self._session
+        if session is None:
+            return False
+        return _chiaki._lib.chiaki_python_session_set_login_pin(session, pin.encode('utf-8'))
+
+    def _close_consumers(self):
+        """Unregister every consumer handed out by add_consumer()."""
+        for consumer in self._consumers:
+            consumer.close()
+        self._consumers.clear()
+
+    def add_consumer(self, policy: int = _chiaki.CONSUMER_POLICY_DROP_OLDEST, max_lag: int = 0,
+                     block_timeout: float = 0.05, from_gop: bool = False) -> _chiaki.FrameConsumer:
+        """
+        Register an independent reader of this session's frames.
+
+        Each consumer gets every frame through its own cursor, with its own
+        lag/drop accounting and slow-reader policy, so several readers can
+        share one Remote Play session. See _chiaki.FrameConsumer.
+
+        Args:
+            policy: _chiaki.CONSUMER_POLICY_BLOCK, _DROP_OLDEST or _SKIP_TO_KEYFRAME
+            max_lag: Unread frames tolerated before the policy applies (0 = ring size)
+            block_timeout: BLOCK only, seconds the video callback may wait per frame
+            from_gop: Start with the cached GOP instead of the next live frame,
+                so a decoder can pick up mid-stream without an IDR request
+
+        Returns:
+            FrameConsumer; close it when done (disconnect() closes the rest)
+        """
+        if self._session is None:
+            raise RuntimeError("Session is not connected")
+        consumer = _chiaki.FrameConsumer(self._session, policy, max_lag, block_timeout, from_gop=from_gop)
+        # Consumers closed by their owners are forgotten
+        self._consumers = [c for c in self._consumers if not c.closed]
+        self._consumers.append(consumer)
+        return consumer
+
+    def _close_recorders(self):
+        """Finish every recording started by record()."""
+        for recorder in self._recorders:
+            recorder.close()
+        self._recorders.clear()
+
+    def record(self, path: str, container: Optional[str] = None, fragment_interval: float = 1.0,
+               queue_size: int = 32, buffer_size: int = 4 * 1024 * 1024, index: bool = True,
+               keyframe_interval: Optional[float] = 10.0) -> Recorder:
+        """
+        Record the video to a file without re-encoding.
+
+        The stream is copied into fragmented MP4 or Matroska in-process, see
+        recorder.Recorder. Recording starts at the cached GOP (or the next
+        keyframe) and runs until the recorder is closed or the session ends.
+
+        Args:
+            path: Output file
+            container: "mp4" or "mkv", None picks by the extension (mp4 by default)
+            fragment_interval: Longest fragment in seconds, what a crash can lose at most
+            queue_size: Fragments waiting to be written before the recording skips ahead
+            buffer_size: Write buffer in bytes
+            index: Write a GOP index next to the file (see gop_index.RecordingReader)
+            keyframe_interval: With ``index``, seconds between requested keyframes: the
+                longest GOP, so how far a seek decodes and the unit of parallel reads
+                (None = only the console's own keyframes)
+
+        Returns:
+            Recorder; close it to finish the file (disconnect() closes the rest)
+        """
+        if self._session is None:
+            raise RuntimeError("Session is not connected")
+        recorder = Recorder(self, path, container, fragment_interval, queue_size, buffer_size, index,
+                            keyframe_interval)
+        self._recorders.append(recorder)
+        return recorder
+
+    def _buffer(self) -> _chiaki.FrameBuffer:
+        """Lazily allocated buffer backing the frame views."""
+        if self._frame_buffer is None:
+            self._frame_buffer = _chiaki.FrameBuffer()
+        return self._frame_buffer
+
+    def get_frame(self) -> Optional[memoryview]:
+        """
+        Get the latest encoded video frame.
+
+        Returns:
+            memoryview over the session's frame buffer, or None if no frame
+            has arrived yet. The view is released by the next get_frame(),
+            get_iframe() or drain_frames() call; copy it with ``bytes()`` to keep it.
+        """
+        if self._session is None:
+            return None
+        return self._buffer().get_frame(self._session)
+
+    def get_frame_array(self) -> Optional[np.ndarray]:
+        """
+        Get the latest encoded video frame as a read-only uint8 NumPy view.
+
+        Same lifetime as get_frame(): the array aliases the session's frame
+        buffer and must be copied if it has to outlive the next call.
+        """
+        if self.get_frame() is None:
+            return None
+        return self._buffer().array()
+
+    def get_iframe(self) -> Optional[memoryview]:
+        """
+        Get the last complete I-frame (SPS + PPS + IDR), decodable on its own.
+
+        Returns:
+            memoryview with the same lifetime as get_frame(), or None
+        """
+        if self._session is None:
+            return None
+        return self._buffer().get_iframe(self._session)
+
+    @property
+    def frame_seq(self) -> int:
+        """Sequence number of the latest received frame (0 before the first)."""
+        if self._session is None:
+            return 0
+        return _chiaki._lib.chiaki_python_session_get_frame_seq(self._session)
+
+    @property
+    def video_info(self) -> Optional[dict]:
+        """
+        Stream parameters parsed from the last SPS the console sent.
+
+        Returns:
+            dict with codec, width, height, profile_idc, level_idc, bit_depth
+            and chroma_format_idc, or None before the first SPS
+        """
+        if self._session is None:
+            return None
+        info = _chiaki.PythonVideoInfo()
+        if not _chiaki._lib.chiaki_python_session_get_video_info(self._session, ctypes.byref(info)):
+            return None
+        return {name: getattr(info, name) for name, _ in info._fields_}
+
+    @property
+    def last_seq(self) -> int:
+        """Sequence number of the frame most recently returned by this session."""
+        if self._frame_buffer is None:
+            return 0
+        return self._frame_buffer.seq
+
+    def wait_frame(self, since_seq: int = 0, timeout: Optional[float] = None) -> Optional[memoryview]:
+        """
+        Block until a frame newer than ``since_seq`` arrives.
+
+        Args:
+            since_seq: Sequence number of the last frame already handled
+            timeout: Seconds to wait, None waits until a frame arrives or the session quits
+
+        Returns:
+            memoryview with the same lifetime as get_frame(), or None on timeout.
+            The frame's sequence number is available as ``last_seq``.
+        """
+        if self._session is None:
+            return None
+        return self._buffer().wait_frame(self._session, since_seq, timeout)
+
+    def wait_iframe(self, since_seq: int = 0, timeout: Optional[float] = None,
+                    buffer: Optional[_chiaki.FrameBuffer] = None) -> Optional[memoryview]:
+        """
+        Block until an I-frame newer than ``since_seq`` is available.
+
+        Pass ``frame_seq`` read before request_idr() to wait for the requested keyframe.
+        With ``buffer`` the I-frame is copied there instead of the session's
+        own buffer, so views handed out by get_frame() stay valid.
+        """
+        if self._session is None:
+            return None
+        if buffer is None:
+            buffer = self._buffer()
+        return buffer.wait_iframe(self._session, since_seq, timeout)
+
+    def drain_frames(self) -> List[Tuple[int, memoryview]]:
+        """
+        Get every encoded frame received since the previous drain.
+
+        Frames are only queued once draining started: the first call returns
+        nothing and starts the queue. A reader that falls a full queue
+        (FRAME_RING_SLOTS frames) behind loses frames up to the next
+        keyframe, which is requested, and resumes there.
+
+        Returns:
+            List of (seq, view) tuples. The views share get_frame()'s lifetime.
+        """
+        if self._session is None:
+            return []
+        return self._buffer().drain(self._session)
+
+    def get_gop(self) -> List[Tuple[int, memoryview]]:
+        """
+        Get the current GOP: parameter sets, the last keyframe and every frame since.
+
+        Decoding them in order gives the current picture immediately, instead
+        of requesting an IDR and waiting for it.
+
+        Returns:
+            List of (seq, view) tuples sharing get_frame()'s lifetime, empty if
+            no GOP is cached yet. Check gop_info['complete'] before relying on
+            the last frame being the latest one.
+        """
+        if self._session is None:
+            return []
+        return self._buffer().get_gop(self._session)
+
+    @property
+    def gop_info(self) -> Optional[dict]:
+        """keyframe_seq, last_seq, bytes, frame_count and complete of the cached GOP, or None."""
+        if self._session is None:
+            return None
+        info = _chiaki.GopInfo()
+        if not _chiaki._lib.chiaki_python_session_get_gop_info(self._session, ctypes.byref(info)):
+            return None
+        return {name: getattr(info, name) for name, _ in info._fields_}
+
+    def set_gop_cache_limit(self, max_bytes: int):
+        """Cap the memory held by the GOP cache at ``max_bytes`` (0 disables it)."""
+        if self._session is not None:
+            _chiaki._lib.chiaki_python_session_set_gop_cache_limit(self._session, max_bytes)
+
+    def enable_replay(self, duration: float = 30.0, max_bytes: int = 64 * 1024 * 1024,
+                      keyframe_interval: Optional[float] = 10.0):
+        """
+        Keep the last ``duration`` seconds of video for save_replay().
+
+        The wrapper copies every frame into a ring of ``max_bytes`` and
+        evicts whole GOPs, so a replay always starts at a keyframe and
+        covers at least ``duration`` seconds once that much has arrived,
+        plus up to one GOP. Remote Play sends keyframes only on demand, so
+        one is requested every ``keyframe_interval`` seconds to keep the
+        GOPs, and with them the memory beyond ``duration``, bounded. If a
+        single GOP outgrows ``max_bytes`` it is lost (see replay_info).
+
+        Calling it again changes the limits; a new ``max_bytes`` starts
+        over with the cached GOP.
+
+        Args:
+            duration: Seconds to keep
+            max_bytes: Ring size in bytes, allocated up front
+            keyframe_interval: Seconds between requested keyframes (None = only the console's own)
+        """
+        if self._session is None:
+            raise RuntimeError("Session is not connected")
+        if duration <= 0 or max_bytes <= 0:
+            raise ValueError("duration and max_bytes must be positive")
+        if not _chiaki._lib.chiaki_python_session_set_replay(
+                self._session, max_bytes, int(duration * 1000), int((keyframe_interval or 0) * 1000)):
+            raise RuntimeError(f"Failed to allocate a {max_bytes} byte replay buffer")
+        if self.replay_info is None:
+            self.request_idr()
+
+    def disable_replay(self):
+        """Stop keeping video for replays and free the ring."""
+        if self._session is not None:
+            _chiaki._lib.chiaki_python_session_set_replay(self._session, 0, 0, 0)
+
+    @property
+    def replay_info(self) -> Optional[dict]:
+        """
+        first_seq, last_seq, start_time_ns, end_time_ns, bytes, dropped_gops,
+        overflows, frame_count and gop_count of the replay ring, or None while it is empty.
+        """
+        if self._session is None:
+            return None
+        info = _chiaki.ReplayInfo()
+        if not _chiaki._lib.chiaki_python_session_get_replay_info(self._session, ctypes.byref(info)):
+            return None
+        return {name: getattr(info, name) for name, _ in info._fields_}
+
+    def save_replay(self, path: str, duration: Optional[float] = None, container: Optional[str] = None) -> int:
+        """
+        Write the kept video to a file without re-encoding (see enable_replay()).
+
+        The frames are copied out of the ring first, the video callback only
+        waits for a chunk of that copy at a time; muxing and writing then run
+        on the calling thread.
+
+        Args:
+            path: Output file
+            duration: Seconds to save, at least (None = everything kept)
+            container: "mp4" or "mkv", None picks by the extension (mp4 by default)
+
+        Returns:
+            Number of frames saved, 0 if nothing is kept yet (no file is written then)
+        """
+        if self._session is None:
+            raise RuntimeError("Session is not connected")
+        # A buffer of its own, so the copy doesn't revoke get_frame()'s views
+        buffer = _chiaki.FrameBuffer(0, 0)
+        frames = buffer.get_replay(self._session, duration)
+        if not frames:
+            return 0
+        try:
+            return write_clip(path, frames, buffer.descs, self._codec(), container, default_duration=1 / self.fps)
+        finally:
+            buffer.release()
+
+    @property
+    def drained_descs(self) -> np.ndarray:
+        """FRAME_DESC_DTYPE descriptors of the frames returned by the last drain_frames()."""
+        if self._frame_buffer is None:
+            return np.zeros(0, dtype=_chiaki.FRAME_DESC_DTYPE)
+        return self._frame_buffer.descs
+
+    def frame_desc(self, seq: int) -> Optional[_chiaki.FrameDesc]:
+        """
+        Descriptor of a recent frame: receive time, size, frames lost, FEC
+        recovery, keyframe and NAL flags.
+
+        Args:
+            seq: Frame sequence number (e.g. ``last_seq``)
+
+        Returns:
+            FrameDesc, or None if seq is unknown or older than FRAME_DESC_HISTORY frames
+        """
+        if self._session is None:
+            return None
+        desc = _chiaki.FrameDesc()
+        if not _chiaki._lib.chiaki_python_session_get_frame_desc(self._session, seq, ctypes.byref(desc)):
+            return None
+        return desc
+
+    def frame_descs(self, since_seq: int = 0) -> np.ndarray:
+        """
+        Descriptors of the retained frames newer than ``since_seq``, oldest first.
 
         Returns:
-            numpy array with shape (height, width, 3) in RGB format,
-            or None if no frame is available
+            Structured array with ``_chiaki.FRAME_DESC_DTYPE`` fields
         """
-        # TODO: Implement frame capture from Chiaki video stream
-        # This will extract the latest decoded frame
+        if self._session is None:
+            return np.zeros(0, dtype=_chiaki.FRAME_DESC_DTYPE)
+        return _chiaki.get_frame_descs(self._session, since_seq)
+
+    def fileno(self) -> int:
+        """
+        Readiness fd for ``selectors``, ``select``, epoll or ``loop.add_reader``.
+
+        The fd becomes readable when frames or session events are pending;
+        call ack_events() once it fires to find out which and re-arm it.
+        """
+        if self._session is None:
+            raise RuntimeError("Session is not connected")
+        fd = _chiaki._lib.chiaki_python_session_get_fd(self._session)
+        if fd < 0:
+            raise RuntimeError("Session has no readiness fd")
+        return fd
+
+    def ack_events(self) -> int:
+        """
+        Reset the readiness fd.
+
+        Returns:
+            Bitmask of ``_chiaki.CHIAKI_PYTHON_EVENT_*`` flags pending since the last ack
+        """
+        if self._session is None:
+            return 0
+        return _chiaki._lib.chiaki_python_session_ack_events(self._session)
+
+    def request_idr(self) -> bool:
+        """
+        Ask the console for a fresh keyframe.
+
+        Requests are coalesced by the recovery policy's cooldown, so several
+        callers asking at once cost a single IDR.
+        """
+        if self._session is None:
+            return False
+        return _chiaki._lib.chiaki_python_session_request_idr(self._session)
+
+    def screenshot_keyframe(self, max_age: float = 1.0,
+                            timeout: Optional[float] = 5.0) -> Tuple[Optional[memoryview], float]:
+        """
+        Get a keyframe (SPS + PPS + IDR) for a screenshot, at most ``max_age`` seconds old.
+
+        A fresh enough stored keyframe is returned immediately. Otherwise one
+        IDR is requested and shared by every thread asking at the same time,
+        instead of each firing its own request.
+
+        Args:
+            max_age: Oldest acceptable keyframe in seconds
+            timeout: Seconds to wait for a new keyframe, None waits forever
+
+        Returns:
+            (view, age): the keyframe with get_frame()'s lifetime and its age
+            in seconds, or (None, 0.0) on timeout
+        """
+        if self._session is None:
+            return None, 0.0
+        return self._buffer().screenshot(self._session, max_age, timeout)
+
+    @property
+    def screenshot_stats(self) -> Optional[dict]:
+        """requests, cache_hits, idr_requests, shared_waits and timeouts of screenshot_keyframe()."""
+        if self._session is None:
+            return None
+        stats = _chiaki.ScreenshotStats()
+        _chiaki._lib.chiaki_python_session_get_screenshot_stats(self._session, ctypes.byref(stats))
+        return {name: getattr(stats, name) for name, _ in stats._fields_}
+
+    def set_recovery_policy(self, auto_idr: bool = True, cooldown: float = _chiaki.IDR_COOLDOWN_MS / 1000,
+                            loss_threshold: int = 1):
+        """
+        Configure how the session recovers from frame loss.
+
+        After a loss every frame is flagged undecodable (FrameDesc.undecodable)
+        until the next keyframe.
+
+        Args:
+            auto_idr: Request an IDR automatically while frames are undecodable
+            cooldown: Seconds after an IDR request in which further requests
+                are coalesced into one sent when the window ends
+            loss_threshold: Frames lost at once that count as a loss
+        """
+        if self._session is None:
+            raise RuntimeError("Session is not connected")
+        policy = _chiaki.RecoveryPolicy(int(auto_idr), int(cooldown * 1000), loss_threshold)
+        _chiaki._lib.chiaki_python_session_set_recovery_policy(self._session, ctypes.byref(policy))
+
+    @property
+    def recovery_stats(self) -> Optional[dict]:
+        """
+        Loss and recovery counters: loss_events, frames_lost, undecodable_frames,
+        idr_requests, idr_coalesced, recoveries, last_recovery_ns and recovering.
+        """
+        if self._session is None:
+            return None
+        stats = _chiaki.RecoveryStats()
+        _chiaki._lib.chiaki_python_session_get_recovery_stats(self._session, ctypes.byref(stats))
+        return {name: getattr(stats, name) for name, _ in stats._fields_ if name != 'reserved'}
+
+    def _codec(self) -> int:
+        """Codec of the stream, H.264 until the first SPS says otherwise."""
+        info = self.video_info
+        return info['codec'] if info else _chiaki.CHIAKI_CODEC_H264
+
+    def _close_lazy_decoder(self):
+        with self._lazy_lock:
+            if self._lazy_decoder is not None:
+                self._lazy_decoder.close()
+                self._lazy_decoder = None
+            self._lazy_buffer = None
+            self._lazy_gop = (0, 0)
+            self._lazy_seq = None
+            self._lazy_image = None
+
+    def _lazy_decoder_for(self, codec: int) -> _chiaki.Decoder:
+        """The on-demand decoder, recreated if the codec changed. Caller holds _lazy_lock."""
+        if self._lazy_decoder is None or self._lazy_decoder.codec != codec:
+            if self._lazy_decoder is not None:
+                self._lazy_decoder.close()
+            self._lazy_decoder = _chiaki.Decoder(codec)
+            self._lazy_gop = (0, 0)
+            self._lazy_seq = None
+        return self._lazy_decoder
+
+    def _lazy_convert(self, seq: int, format: int, roi: Optional[Tuple[int, int, int, int]], scale: int,
+                      out: Optional[np.ndarray]) -> Optional[np.ndarray]:
+        """
+        Convert the on-demand decoder's picture. Caller holds _lazy_lock.
+
+        Without ``out`` the result is memoised, so asking again for the same
+        frame in the same form costs a copy.
+        """
+        key = (seq, format, roi, scale)
+        if out is None and self._lazy_image is not None and self._lazy_image[0] == key:
+            return self._lazy_image[1].copy()
+        decoder = self._lazy_decoder
+        if out is not None:
+            return decoder.convert(format, roi, scale, out=out)
+        shape = decoder.convert_shape(format, roi, scale)
+        if shape is None or shape[0] <= 0 or shape[1] <= 0:
+            return None
+        image = decoder.convert(format, roi, scale, out=np.empty(shape, dtype=np.uint8))
+        if image is None:
+            return None
+        self._lazy_image = (key, image)
+        return image.copy()
+
+    def _lazy_catch_up(self) -> Optional[int]:
+        """
+        Decode the cached GOP up to its last frame. Caller holds _lazy_lock.
+
+        Only the frames the decoder hasn't seen are decoded as long as the
+        GOP starts at the same keyframe, so the picture is only decoded
+        again once a new frame arrives.
+
+        Returns:
+            Sequence number of the decoded picture (the GOP's last frame),
+            or None without a GOP
+        """
+        for _ in range(2):
+            info = self.gop_info
+            if info is None or not info['keyframe_seq']:
+                return None
+            if self._lazy_seq is not None and self._lazy_gop == (info['keyframe_seq'], info['last_seq']):
+                return self._lazy_seq
+
+            decoder = self._lazy_decoder_for(self._codec())
+            keyframe_seq, decoded_seq = self._lazy_gop
+            if keyframe_seq != info['keyframe_seq']:
+                decoder.reset()
+                self._lazy_seq = None
+                keyframe_seq, decoded_seq = info['keyframe_seq'], 0
+            if self._lazy_buffer is None:
+                self._lazy_buffer = _chiaki.FrameBuffer(0)
+            frames = self._lazy_buffer.get_gop(self._session, keyframe_seq, decoded_seq)
+            if not frames:
+                continue  # A new keyframe replaced the GOP meanwhile
+            decoder.decode_frames(frames)
+            self._lazy_gop = (keyframe_seq, frames[-1][0])
+            self._lazy_buffer.release()
+            self._lazy_seq = frames[-1][0] if decoder.has_picture and decoder.picture.seq == frames[-1][0] else None
+            return self._lazy_seq
         return None
 
-    def set_frame_callback(self, callback: Callable[[np.ndarray], None]):
+    def _frame_age(self, seq: int) -> Optional[float]:
+        """Seconds since frame ``seq`` was received, None if its descriptor is gone."""
+        desc = self.frame_desc(seq)
+        if desc is None:
+            return None
+        return (time.monotonic_ns() - desc.recv_time_ns) / 1e9
+
+    def latest_image(self, format: int = _chiaki.CONVERT_RGB, roi: Optional[Tuple[int, int, int, int]] = None,
+                     scale: int = 1, out: Optional[np.ndarray] = None) -> Optional[np.ndarray]:
+        """
+        Decode the current picture on demand.
+
+        Nothing is decoded in the background: the decoder catches up from
+        the cached GOP's keyframe to its last frame only when asked, resumes
+        where the previous call stopped, and the result is reused until the
+        next frame arrives. For occasional checks this costs a fraction of
+        set_frame_callback()'s continuous decoding.
+
+        Args:
+            format, roi, scale, out: Output form, see _chiaki.Decoder.convert()
+
+        Returns:
+            Image of the GOP's last frame ((height, width, 3) RGB by
+            default), or None without a GOP. After a loss the GOP ends before
+            the latest frame (``gop_info['complete']`` is False) until the
+            next keyframe.
+        """
+        if self._session is None:
+            return None
+        with self._lazy_lock:
+            seq = self._lazy_catch_up()
+            return self._lazy_convert(seq, format, roi, scale, out) if seq is not None else None
+
+    def latest_planes(self) -> Optional[Tuple[np.ndarray, ...]]:
+        """
+        Decode the current picture on demand and return its YUV planes.
+
+        Like latest_image(), without any colour conversion: (y, u, v) or
+        (y, uv) zero-copy views, see _chiaki.Decoder.planes(). They stay
+        valid until the next latest_image()/latest_planes()/screenshot()
+        call decodes a newer frame; copy them to keep them.
+        """
+        if self._session is None:
+            return None
+        with self._lazy_lock:
+            if self._lazy_catch_up() is None:
+                return None
+            return self._lazy_decoder.planes()
+
+    def screenshot(self, max_age: float = 1.0, timeout: Optional[float] = 5.0,
+                   max_catch_up: int = 600, format: int = _chiaki.CONVERT_RGB,
+                   roi: Optional[Tuple[int, int, int, int]] = None, scale: int = 1,
+                   out: Optional[np.ndarray] = None) -> Optional[np.ndarray]:
+        """
+        Capture a screenshot from the current video stream.
+
+        The picture is decoded on demand from the cached GOP (see
+        latest_image()) when that gives one at most ``max_age`` seconds old.
+        Otherwise the keyframe from screenshot_keyframe() is decoded.
+
+        Args:
+            max_age: Oldest acceptable picture in seconds
+            timeout: Seconds to wait for a new keyframe, None waits forever
+            max_catch_up: Undecoded GOP frames beyond which waiting for a
+                keyframe is cheaper than catching up
+            format, roi, scale, out: Output form, see _chiaki.Decoder.convert()
+
+        Returns:
+            numpy array with shape (height, width, 3) in RGB format by
+            default, or None if no frame is available
+        """
+        if self._session is None:
+            return None
+        with self._lazy_lock:
+            seq = self._screenshot_seq(max_age, timeout, max_catch_up)
+            return self._lazy_convert(seq, format, roi, scale, out) if seq is not None else None
+
+    def _screenshot_seq(self, max_age: float, timeout: Optional[float], max_catch_up: int) -> Optional[int]:
+        """
+        Get a picture for screenshot() into the on-demand decoder. Caller holds _lazy_lock.
+
+        Returns:
+            Sequence number of the decoder's picture, or None without one
+        """
+        info = self.gop_info
+        if info is not None:
+            keyframe_seq, decoded_seq = self._lazy_gop
+            if keyframe_seq != info['keyframe_seq']:
+                decoded_seq = info['keyframe_seq'] - 1
+        if info is not None and info['last_seq'] - decoded_seq <= max_catch_up:
+            seq = self._lazy_catch_up()
+            if seq is not None:
+                age = self._frame_age(seq)
+                if age is not None and age <= max_age:
+                    return seq
+
+        keyframe, _ = self.screenshot_keyframe(max_age, timeout)
+        if keyframe is None:
+            return None
+        seq = self._frame_buffer.seq
+        if self._lazy_seq == seq:
+            return seq
+
+        decoder = self._lazy_decoder_for(self._codec())
+        decoder.reset()
+        if decoder.decode(keyframe, seq):
+            # The GOP cache starts at this keyframe too, later calls continue from it
+            self._lazy_gop = (seq, seq)
+            decoded = True
+        else:
+            # A lone keyframe may need the end of stream to come out, which resets the decoder
+            self._lazy_gop = (0, 0)
+            decoded = decoder.flush()
+        self._lazy_seq = seq if decoded else None
+        return self._lazy_seq
+
+    def screenshot_burst(self, count: int, interval: float, format: str = "png", quality: int = 90,
+                         roi: Optional[Tuple[int, int, int, int]] = None, scale: int = 1,
+                         workers: int = 4, queue_size: int = 8, max_age: float = 1.0,
+                         timeout: Optional[float] = 5.0) -> List[Optional[bytes]]:
+        """
+        Capture ``count`` screenshots ``interval`` seconds apart as encoded images.
+
+        Capture and compression are decoupled: at every tick the current
+        picture is decoded like screenshot() and a reference to it (no
+        copy, see _chiaki.Decoder.snapshot()) goes to a thread pool that
+        encodes it while the next ticks are captured, each worker keeping
+        its image encoder open from one picture to the next (see
+        _chiaki.Decoder.take_picture()). Ticks are scheduled from the start
+        time, so a slow capture doesn't shift the later ones: a capture
+        waits at most ``interval`` for a keyframe, and a tick whose time
+        passed by a whole interval while an earlier capture was still
+        decoding is missed (None) rather than taken late. Ticks that see
+        the same frame share one encode.
+
+        Args:
+            count: Number of screenshots
+            interval: Seconds between captures
+            format: "png", "jpeg" or "webp" (needs libavcodec with libwebp)
+            quality: JPEG/WebP quality, 1 to 100
+            roi, scale: Region and downscale factor, see _chiaki.Decoder.convert()
+            workers: Encoding threads
+            queue_size: Captured pictures waiting for or being encoded; a
+                capture finding the queue full is skipped instead of waiting
+            max_age, timeout: See screenshot(); ``timeout`` is capped at
+                ``interval`` per capture
+
+        Returns:
+            One image (file contents) per capture in order, None for a
+            capture that got no picture, was skipped or missed, or failed to
+            encode
+        """
+        image_format = _IMAGE_FORMATS.get(format.lower())
+        if image_format is None:
+            raise ValueError(f"Unsupported image format {format!r}, use one of {sorted(_IMAGE_FORMATS)}")
+        if self._session is None:
+            raise RuntimeError("Session is not connected")
+
+        slots = threading.BoundedSemaphore(queue_size)
+        # The first snapshot a worker encodes stays with it and takes the later pictures
+        worker = threading.local()
+        holders: List[_chiaki.Decoder] = []
+
+        def encode(snapshot: _chiaki.Decoder) -> Optional[bytes]:
+            holder = getattr(worker, "decoder", None)
+            try:
+                if holder is None:
+                    holder = worker.decoder = snapshot
+                    holders.append(holder)
+                else:
+                    holder.take_picture(snapshot)
+                return holder.encode_image(image_format, quality, roi, scale)
+            finally:
+                if snapshot is not holder:
+                    snapshot.close()
+                slots.release()
+
+        futures: List[Optional[Future]] = [None] * count
+        skipped = missed = 0
+        tick_timeout = timeout if interval <= 0 else interval if timeout is None else min(timeout, interval)
+        try:
+            with ThreadPoolExecutor(workers, thread_name_prefix="chiaki-burst") as pool:
+                start = time.monotonic()
+                last = None
+                for i in range(count):
+                    delay = start + i * interval - time.monotonic()
+                    if delay > 0:
+                        time.sleep(delay)
+                    elif interval > 0 and -delay >= interval:
+                        # An earlier capture took this tick's time
+                        missed += 1
+                        continue
+                    if self._session is None:
+                        break
+                    with self._lazy_lock:
+                        seq = self._screenshot_seq(max_age, tick_timeout, 600)
+                        if seq is None:
+                            continue
+                        if last is not None and last[0] == seq:
+                            futures[i] = last[1]
+                            continue
+                        if not slots.acquire(blocking=False):
+                            skipped += 1
+                            continue
+                        snapshot = self._lazy_decoder.snapshot()
+                    if snapshot is None:
+                        slots.release()
+                        continue
+                    last = (seq, pool.submit(encode, snapshot))
+                    futures[i] = last[1]
+        finally:
+            for holder in holders:
+                holder.close()
+        if skipped:
+            logger.warning("Screenshot burst skipped %d of %d captures, encoding fell behind", skipped, count)
+        if missed:
+            logger.warning("Screenshot burst missed %d of %d ticks, captures took longer than the interval",
+                           missed, count)
+        images: List[Optional[bytes]] = []
+        failed = []
+        for future in futures:
+            try:
+                images.append(future.result() if future is not None else None)
+            except Exception as e:
+                images.append(None)
+                failed.append(e)
+        if failed:
+            logger.error("Screenshot burst failed to encode %d of %d captures", len(failed), count,
+                         exc_info=failed[0])
+        return images
+
+    def set_frame_callback(self, callback: Optional[Callable[[np.ndarray], None]],
+                           format: int = _chiaki.CONVERT_RGB, roi: Optional[Tuple[int, int, int, int]] = None,
+                           scale: int = 1):
         """
         Set a callback to receive video frames.
 
+        Frames are decoded in-process on a session thread, which calls
+        ``callback`` with the newest picture after each batch of frames. The
+        array comes from a pool and is reused once the callback returns,
+        copy it to keep it. When the callback falls behind, frames are
+        skipped up to the next keyframe instead of queueing up.
+
         Args:
-            callback: Function that takes a numpy array (height, width, 3) RGB frame
+            callback: Function that takes a numpy array (height, width, 3) RGB frame,
+                or None to stop decoding
+            format, roi, scale: Deliver BGR or grey frames, a region or a
+                downscaled picture instead, see _chiaki.Decoder.convert()
         """
         self._frame_callback = callback
+        self._frame_convert = (format, roi, scale)
+        if not self._wants_decoding():
+            self._stop_decode_thread()
+        elif self._session is not None:
+            self._start_decode_thread()
+
+    def set_motion_callback(self, callback: Optional[Callable[[int, np.ndarray], None]],
+                            tile: int = 64, min_motion: float = 1.0):
+        """
+        Set a callback to receive a motion grid for every decoded frame.
+
+        The session's decode thread (see set_frame_callback()) asks
+        libavcodec to keep the motion vectors it decodes anyway and sums
+        them up per tile, see _chiaki.Decoder.motion_grid(). Where and how
+        much the screen moves comes without any RGB conversion or pixel
+        comparison. H.264 streams only; HEVC frames report no vectors.
+
+        Args:
+            callback: Function taking (seq, grid) with a float32 array of
+                shape (rows, cols, 3): mean motion in pixels, moving fraction
+                and intra fraction per tile. None stops the motion analysis.
+            tile: Tile size in pixels
+            min_motion: Pixels a block has to move to count as moving
+
+        Called from a frame or motion callback, the change applies from the
+        next keyframe on without restarting the decode thread.
+        """
+        if callback is not None and tile <= 0:
+            raise ValueError(f"tile must be positive, got {tile}")
+        self._motion_callback = callback
+        self._motion_grid = (tile, min_motion)
+        if threading.current_thread() is self._decode_thread:
+            # From a callback: no second thread, the running loop switches decoders
+            # itself at the next parameter sets
+            if not self._wants_decoding():
+                self._stop_decode_thread()
+            return
+        # The decoder only keeps motion vectors when created for it
+        self._stop_decode_thread()
+        if self._wants_decoding() and self._session is not None:
+            self._start_decode_thread()
+
+    def _wants_decoding(self) -> bool:
+        """Whether a frame or motion callback needs the decode thread."""
+        return self._frame_callback is not None or self._motion_callback is not None
+
+    def _start_decode_thread(self):
+        if self._decode_thread is not None:
+            return
+        consumer = _chiaki.FrameConsumer(
+            self._session, _chiaki.CONSUMER_POLICY_SKIP_TO_KEYFRAME, from_gop=True
+        )
+        # A thread stopped from its own callback may still be finishing, it keeps its own event
+        self._decode_stop = threading.Event()
+        self._decode_thread = threading.Thread(
+            target=self._decode_loop, args=(consumer, self._decode_stop), name=f"chiaki-decode-{self.host}",
+            daemon=True
+        )
+        self._decode_thread.start()
+
+    def _stop_decode_thread(self):
+        if self._decode_thread is None:
+            return
+        self._decode_stop.set()
+        if self._decode_thread is not threading.current_thread():
+            self._decode_thread.join()
+        self._decode_thread = None
+
+    def _decode_loop(self, consumer: _chiaki.FrameConsumer, stop: threading.Event):
+        """
+        Decode thread: decode every frame, hand each motion grid to the
+        motion callback and the newest picture to the frame callback.
+        """
+        decoder = None
+        export_mvs = self._motion_callback is not None
+        try:
+            while not stop.is_set() and self._quit_event is None:
+                frames = consumer.read(0.1)
+                if not frames:
+                    continue
+                if decoder is None:
+                    decoder = _chiaki.Decoder(self._codec(), pool=self._picture_pool, export_mvs=export_mvs)
+                decoded = False
+                descs = consumer.descs
+                for (seq, frame), undecodable, nal_flags in zip(
+                        frames, descs['undecodable'].tolist(), descs['nal_flags'].tolist()):
+                    if nal_flags & _chiaki.NAL_FLAG_SPS and export_mvs != (self._motion_callback is not None):
+                        # Motion analysis was switched from a callback, a fresh decoder starts here
+                        decoder.close()
+                        export_mvs = not export_mvs
+                        decoder = _chiaki.Decoder(self._codec(), pool=self._picture_pool, export_mvs=export_mvs)
+                    # Frames after a loss only smear the picture until the next keyframe
+                    if undecodable or not decoder.decode(frame, seq):
+                        continue
+                    decoded = True
+                    motion_callback = self._motion_callback
+                    if motion_callback is not None:
+                        grid = decoder.motion_grid(*self._motion_grid)
+                        if grid is not None:
+                            try:
+                                motion_callback(seq, grid)
+                            except Exception:
+                                logger.exception("Motion callback failed")
+                callback = self._frame_callback
+                if not decoded or callback is None:
+                    continue
+                image = decoder.convert(*self._frame_convert)
+                if image is None:
+                    continue
+                try:
+                    callback(image)
+                except Exception:
+                    logger.exception("Frame callback failed")
+                finally:
+                    self._picture_pool.release(image)
+        finally:
+            consumer.close()
+            if decoder is not None:
+                decoder.close()
 
     def is_online(self) -> bool:
         """Check if the PS4 is online and reachable."""
@@ -298,6 +1265,8 @@ class PS5Session(PS4Session):
     Inherits from PS4Session with PS5-specific features.
     """
 
+    _is_ps5 = True
+
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         # PS5-specific initialization
@@ -197,31 +197,21 @@ def run_script(console_name: str, script_path: str):
     print("Connected! Waiting for keyframe...")
 
     # Buffer for frames
-    FRAME_BUFFER_SIZE = 4 * 1024 * 1024
-    frame_buffer = (ctypes.c_uint8 * FRAME_BUFFER_SIZE)()
-    seq_out = ctypes.c_uint64(0)
+    frame_buffer = _chiaki.FrameBuffer()
 
     # Request IDR frame
+    seq_before_idr = _chiaki._lib.chiaki_python_session_get_frame_seq(session)
     _chiaki._lib.chiaki_python_session_request_idr(session)
 
     # Wait for I-frame
-    iframe_timeout = time.time() + 5.0
-    while not _chiaki._lib.chiaki_python_session_has_iframe(session):
-        if time.time() > iframe_timeout:
-            print("Timeout waiting for I-frame")
-            _chiaki._lib.chiaki_python_session_stop(session)
-            _chiaki._lib.chiaki_python_session_destroy(session)
-            return False
-        time.sleep(0.01)
-
-    iframe_size = _chiaki._lib.chiaki_python_session_get_iframe(session, frame_buffer, FRAME_BUFFER_SIZE)
-    if iframe_size == 0:
-        print("Failed to get I-frame")
+    iframe = frame_buffer.wait_iframe(session, seq_before_idr, 5.0)
+    if iframe is None:
+        print("Timeout waiting for I-frame")
         _chiaki._lib.chiaki_python_session_stop(session)
         _chiaki._lib.chiaki_python_session_destroy(session)
         return False
 
-    print(f"Got I-frame: {iframe_size} bytes, starting ffplay...")
+    print(f"Got I-frame: {len(iframe)} bytes, starting ffplay...")
 
     # Start ffplay
     ffplay = subprocess.Popen(
@@ -242,30 +232,25 @@ def run_script(console_name: str, script_path: str):
     )
 
     # Send I-frame
-    iframe_data = bytes(frame_buffer[:iframe_size])
-    ffplay.stdin.write(iframe_data)
+    ffplay.stdin.write(iframe)
     ffplay.stdin.flush()
 
     # Start streaming thread
     running = True
-    last_seq = 0
+    last_seq = frame_buffer.seq  # The I-frame already sent
 
     def stream_frames():
         nonlocal last_seq
         while running and ffplay.poll() is None:
-            frame_size = _chiaki._lib.chiaki_python_session_get_frame_ex(
-                session, frame_buffer, FRAME_BUFFER_SIZE, ctypes.byref(seq_out)
-            )
-            current_seq = seq_out.value
-            if frame_size > 0 and current_seq > last_seq:
-                frame_data = bytes(frame_buffer[:frame_size])
-                last_seq = current_seq
+            # Blocks until a newer frame arrives, nothing is copied on timeout
+            frame_data = frame_buffer.wait_frame(session, last_seq, 0.1)
+            if frame_data is not None:
+                last_seq = frame_buffer.seq
                 try:
                     ffplay.stdin.write(frame_data)
                     ffplay.stdin.flush()
                 except BrokenPipeError:
                     break
-            time.sleep(0.002)
 
     stream_thread = threading.Thread(target=stream_frames, daemon=True)
     stream_thread.start()
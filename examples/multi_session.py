@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""
+PS4 Remote Play Multi-Console Monitor Example
+
+Connects to several consoles and watches all of their video streams from a
+single thread. Every session exposes a readiness fd (session.fileno()), so
+one selectors loop waits on all of them instead of polling each session.
+
+Usage:
+    python3 multi_session.py console_name [console_name ...]
+
+Press Ctrl+C to stop.
+"""
+
+import sys
+import os
+import time
+import selectors
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from chiaki_python import _chiaki, PS4Session
+from chiaki_python.config_parser import get_host_by_name
+
+
+def monitor(console_names):
+    """Print per-console frame rates until Ctrl+C."""
+    selector = selectors.DefaultSelector()
+    sessions = []
+
+    for name in console_names:
+        host_config = get_host_by_name(name)
+        if not host_config:
+            print(f"Unknown console: {name}")
+            continue
+
+        session = PS4Session(
+            host_config['host'],
+            host_config['regist_key'],
+            host_config['rp_key'],
+            host_config.get('psn_account_id'),
+        )
+        try:
+            session.connect()
+        except RuntimeError as e:
+            print(f"{name}: {e}")
+            continue
+
+        sessions.append(session)
+        selector.register(session, selectors.EVENT_READ, {'name': name, 'frames': 0, 'bytes': 0})
+
+    if not sessions:
+        return False
+
+    print("Monitoring... Press Ctrl+C to stop")
+    last_report = time.time()
+
+    try:
+        while sessions:
+            for key, _ in selector.select(timeout=1.0):
+                session = key.fileobj
+                stats = key.data
+                events = session.ack_events()
+
+                if events & _chiaki.CHIAKI_PYTHON_EVENT_FRAME:
+                    for seq, frame in session.drain_frames():
+                        stats['frames'] += 1
+                        stats['bytes'] += len(frame)
+
+                if events & _chiaki.CHIAKI_PYTHON_EVENT_QUIT:
+                    print(f"{stats['name']}: session quit")
+                    selector.unregister(session)
+                    sessions.remove(session)
+                    session.disconnect()
+
+            now = time.time()
+            if now - last_report >= 5.0:
+                elapsed = now - last_report
+                for key in selector.get_map().values():
+                    stats = key.data
+                    print(f"{stats['name']}: {stats['frames'] / elapsed:.1f} fps, "
+                          f"{stats['bytes'] * 8 / elapsed / 1e6:.2f} Mbit/s")
+                    stats['frames'] = 0
+                    stats['bytes'] = 0
+                last_report = now
+    except KeyboardInterrupt:
+        print("\nStopping...")
+
+    for session in sessions:
+        session.disconnect()
+    selector.close()
+
+    return True
+
+
+def main():
+    if len(sys.argv) < 2:
+        print("Usage: python3 multi_session.py console_name [console_name ...]")
+        sys.exit(1)
+
+    monitor(sys.argv[1:])
+
+
+if __name__ == "__main__":
+    main()
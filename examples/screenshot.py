@@ -6,41 +6,82 @@ This example demonstrates how to:
 1. Connect to a PS4 using credentials from Chiaki config
 2. Send controller input (PS button to wake display)
 3. Request and capture a screenshot (IDR frame)
-4. Decode the H.264 frame to PNG using ffmpeg
+4. Decode it in-process (libavcodec) and save it as PNG, JPEG or WebP
+5. Capture a burst of screenshots at a fixed interval
 
 Requirements:
-- ffmpeg installed (for decoding H.264 to PNG)
 - Chiaki credentials configured (~/.config/Chiaki/Chiaki.conf)
 - PS4 in rest mode or powered on
 
 Usage:
-    python3 screenshot.py [console_name] [output_path]
+    python3 screenshot.py [console_name] [output_path] [count] [interval]
 
     console_name: Name of console in Chiaki config (default: PS4-910)
-    output_path: Where to save the screenshot (default: ./screenshot.png)
+    output_path: Where to save the screenshot (default: ./screenshot.png),
+        the extension picks the format (.png, .jpg or .webp)
+    count: Screenshots to capture (default: 1); a burst is saved as
+        output_000.png, output_001.png, ...
+    interval: Seconds between burst screenshots (default: 0.5)
 """
 
 import sys
 import ctypes
 import time
 import base64
-import subprocess
 import os
 
 # Add parent directory to path for imports
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from chiaki_python import _chiaki
+from chiaki_python import _chiaki, PS4Session
 from chiaki_python.config_parser import get_host_by_name
 
 
+def image_format(path: str) -> str:
+    """Image format for a file name: png, jpeg or webp."""
+    ext = os.path.splitext(path)[1].lower().lstrip('.')
+    return {'jpg': 'jpeg', 'jpeg': 'jpeg', 'webp': 'webp'}.get(ext, 'png')
+
+
+def take_burst(console_name: str, output_path: str, count: int, interval: float) -> bool:
+    """
+    Capture ``count`` screenshots ``interval`` seconds apart.
+
+    Encoding runs on a thread pool while the next screenshots are
+    captured, so compression doesn't delay the capture schedule.
+    """
+    host_config = get_host_by_name(console_name)
+    if not host_config:
+        print(f"Unknown console: {console_name}")
+        return False
+
+    fmt = image_format(output_path)
+    base, ext = os.path.splitext(output_path)
+    with PS4Session(host_config['host'], host_config['regist_key'], host_config['rp_key'],
+                    host_config.get('psn_account_id')) as session:
+        print(f"Capturing {count} screenshots every {interval}s...")
+        images = session.screenshot_burst(count, interval, format=fmt)
+
+    saved = 0
+    for i, data in enumerate(images):
+        if data is None:
+            print(f"  {i}: no picture")
+            continue
+        path = f"{base}_{i:03d}{ext or '.png'}"
+        with open(path, 'wb') as f:
+            f.write(data)
+        saved += 1
+    print(f"Saved {saved} of {count} screenshots to {base}_*{ext or '.png'}")
+    return saved > 0
+
+
 def take_screenshot(console_name: str = "PS4-910", output_path: str = "screenshot.png") -> bool:
     """
     Connect to PS4 and capture a screenshot.
 
     Args:
         console_name: Name of the console in Chiaki config
-        output_path: Path to save the PNG screenshot
+        output_path: Path to save the screenshot (.png, .jpg or .webp)
 
     Returns:
         True if screenshot was captured successfully
@@ -114,50 +155,50 @@ def take_screenshot(console_name: str = "PS4-910", output_path: str = "screensho
     print("Waiting for display...")
     time.sleep(1.5)
 
-    # Request a fresh IDR frame (keyframe)
-    print("Requesting screenshot...")
-    _chiaki._lib.chiaki_python_session_request_idr(session)
+    frame_buffer = _chiaki.FrameBuffer()
 
-    # Wait for I-frame to arrive (up to 5 seconds)
-    for i in range(50):
-        if _chiaki._lib.chiaki_python_session_has_iframe(session):
-            break
-        time.sleep(0.1)
+    decoder = _chiaki.Decoder(_chiaki.CHIAKI_CODEC_H264)
 
-    # Capture the I-frame
-    FRAME_BUFFER_SIZE = 4 * 1024 * 1024  # 4MB buffer
-    frame_buffer = (ctypes.c_uint8 * FRAME_BUFFER_SIZE)()
+    # The cached GOP decodes to the current picture without a new keyframe
+    gop_info = _chiaki.GopInfo()
+    frames = []
+    if (_chiaki._lib.chiaki_python_session_get_gop_info(session, ctypes.byref(gop_info))
+            and gop_info.complete):
+        print(f"Using cached GOP ({gop_info.frame_count} frames)...")
+        frames = frame_buffer.get_gop(session)
 
-    frame_size = _chiaki._lib.chiaki_python_session_get_iframe(
-        session, frame_buffer, FRAME_BUFFER_SIZE
-    )
+    if not frames:
+        # Request a fresh IDR frame (keyframe)
+        print("Requesting screenshot...")
+        seq_before_idr = _chiaki._lib.chiaki_python_session_get_frame_seq(session)
+        _chiaki._lib.chiaki_python_session_request_idr(session)
+
+        # Wait for the requested I-frame to arrive (up to 5 seconds)
+        iframe = frame_buffer.wait_iframe(session, seq_before_idr, 5.0)
+        if iframe is not None:
+            frames = [(frame_buffer.seq, iframe)]
 
     success = False
-    if frame_size > 0:
-        print(f"Captured frame: {frame_size} bytes")
-
-        # Save raw H.264 frame
-        frame_data = bytes(frame_buffer[:frame_size])
-        h264_path = '/tmp/ps4_frame.h264'
-        with open(h264_path, 'wb') as f:
-            f.write(frame_data)
-
-        # Decode to PNG using ffmpeg
-        result = subprocess.run(
-            ['ffmpeg', '-y', '-i', h264_path, '-frames:v', '1', output_path],
-            capture_output=True, text=True
-        )
-
-        if result.returncode == 0:
-            print(f"Screenshot saved to: {output_path}")
+    if frames:
+        print(f"Captured {len(frames)} frame(s): {sum(len(frame) for _, frame in frames)} bytes")
+
+        # Every frame must be decoded in order, the last picture is the screenshot
+        decoded = decoder.decode_frames(frames)
+        decoded = decoder.flush() or decoded
+        fmt = {'png': _chiaki.IMAGE_PNG, 'jpeg': _chiaki.IMAGE_JPEG,
+               'webp': _chiaki.IMAGE_WEBP}[image_format(output_path)]
+        data = decoder.encode_image(fmt) if decoded else None
+
+        if data is not None:
+            with open(output_path, 'wb') as f:
+                f.write(data)
+            print(f"Screenshot saved to: {output_path} ({decoder.picture.width}x{decoder.picture.height})")
             success = True
         else:
-            print(f"ffmpeg decode failed: {result.stderr[:200]}")
-
-        # Cleanup temp file
-        os.remove(h264_path)
+            print("Decoding failed!")
     else:
         print("No frame captured!")
+    decoder.close()
 
     # Cleanup
     _chiaki._lib.chiaki_python_session_stop(session)
@@ -169,8 +210,13 @@ def take_screenshot(console_name: str = "PS4-910", output_path: str = "screensho
 def main():
     console_name = sys.argv[1] if len(sys.argv) > 1 else "PS4-910"
     output_path = sys.argv[2] if len(sys.argv) > 2 else "screenshot.png"
+    count = int(sys.argv[3]) if len(sys.argv) > 3 else 1
+    interval = float(sys.argv[4]) if len(sys.argv) > 4 else 0.5
 
-    success = take_screenshot(console_name, output_path)
+    if count > 1:
+        success = take_burst(console_name, output_path, count, interval)
+    else:
+        success = take_screenshot(console_name, output_path)
     sys.exit(0 if success else 1)
 
 
@@ -23,337 +23,2594 @@
 #include <chiaki/discovery.h>
 #include <chiaki/thread.h>
 #include <chiaki/log.h>
+#include <chiaki/streamconnection.h>
 #include <string.h>
 #include <stdlib.h>
-#include <stdio.h>   // for fprintf debug
-#include <unistd.h>  // for usleep
-
-// Maximum frame buffer size (4MB should be enough for 1080p)
+#include <stdio.h>
+#include <stdarg.h>
+#include <unistd.h>
+#include <stdatomic.h>
+#include <sys/eventfd.h>
+#include <time.h>
+#include <math.h>
+#include <libavcodec/avcodec.h>
+#include <libavutil/motion_vector.h>
+
+// Default frame buffer size for callers (4MB should be enough for 1080p).
+// Frames are not limited to it, see chiaki_python_session_get_max_frame_size.
 #define MAX_FRAME_SIZE (4 * 1024 * 1024)
 
+// Free buffers kept around by a FramePool for reuse, per size class
+#define FRAME_POOL_MAX_FREE 8
+
+// FramePool size classes: powers of two from 4 KB to 64 MB. Larger frames get
+// buffers of their exact size that are freed on release.
+#define FRAME_POOL_MIN_SHIFT 12
+#define FRAME_POOL_CLASSES 15
+
+// Readiness bits reported through the notify fd (see chiaki_python_session_ack_events)
+#define PYTHON_EVENT_FRAME      (1 << 0)
+#define PYTHON_EVENT_IFRAME     (1 << 1)
+#define PYTHON_EVENT_CONNECTED  (1 << 2)
+#define PYTHON_EVENT_QUIT       (1 << 3)
+#define PYTHON_EVENT_LIFECYCLE  (1 << 4)  // A lifecycle event is queued (see chiaki_python_session_next_event)
+
+// Lifecycle events kept until Python takes them
+#define EVENT_QUEUE_SLOTS 32
+#define EVENT_REASON_MAX 128
+
+// Lifecycle event (mirrored by _chiaki.PythonEvent)
+typedef struct {
+    int32_t type;         // CHIAKI_EVENT_CONNECTED, _LOGIN_PIN_REQUEST or _QUIT
+    int32_t quit_reason;  // ChiakiQuitReason (QUIT only)
+    uint64_t time_ns;     // CLOCK_MONOTONIC
+    uint8_t pin_incorrect;  // LOGIN_PIN_REQUEST: the previous PIN was wrong
+    uint8_t reserved[7];
+    char reason_str[EVENT_REASON_MAX];  // QUIT: chiaki's reason string plus details
+} PythonEvent;
+
+// Number of encoded frames the ring can hold between drains (~4s at 60fps)
+#define FRAME_RING_SLOTS 256
+
+// Descriptors of the most recent frames kept for lookup by sequence number
+#define FRAME_DESC_HISTORY 1024
+
+// Compact per-frame descriptor (32 bytes, mirrored by _chiaki.FrameDesc / FRAME_DESC_DTYPE)
+typedef struct {
+    uint64_t seq;
+    uint64_t recv_time_ns;  // CLOCK_MONOTONIC when the video callback received it
+    uint32_t size;          // Encoded size in bytes
+    int32_t frames_lost;    // As reported by chiaki for this frame
+    uint32_t nal_flags;     // NAL_FLAG_* classes found in the sample
+    uint8_t keyframe;
+    uint8_t recovered;      // chiaki recovered the frame through FEC
+    uint8_t undecodable;    // Follows a loss, references are missing until the next keyframe
+    uint8_t reserved;
+} FrameDesc;
+
+// Default minimum interval between two IDR requests
+#define IDR_COOLDOWN_MS 500
+
+// How the wrapper reacts to frame loss (mirrored by _chiaki.RecoveryPolicy)
+typedef struct {
+    int32_t auto_idr;          // Request an IDR when a loss leaves the stream undecodable
+    uint32_t cooldown_ms;      // IDR requests inside this window after the last one are coalesced
+    int32_t loss_threshold;    // frames_lost needed to count as a loss
+} RecoveryPolicy;
+
+// Log messages kept per session, for Python to drain and as a flight recorder
+#define LOG_RING_SLOTS 512
+#define LOG_MSG_MAX 232
+
+// Levels recorded even when Python doesn't ask for them, dumped when the session quits on an error
+#define LOG_RECORDER_MASK (CHIAKI_LOG_ERROR | CHIAKI_LOG_WARNING | CHIAKI_LOG_INFO)
+
+// Default levels handed to Python
+#define LOG_DEFAULT_MASK (CHIAKI_LOG_ERROR | CHIAKI_LOG_WARNING | CHIAKI_LOG_INFO)
+
+// One log message (256 bytes, mirrored by _chiaki.LogEntry)
+typedef struct {
+    uint64_t seq;
+    uint64_t time_ns;  // CLOCK_MONOTONIC
+    uint32_t level;    // CHIAKI_LOG_* bit
+    uint32_t len;
+    char msg[LOG_MSG_MAX];  // NUL terminated, truncated to LOG_MSG_MAX - 1
+} LogEntry;
+
+// A LogRing slot guarded by a per-slot sequence lock: state is 2*seq+1 while
+// the entry for seq is written and 2*seq+2 once it is complete.
+typedef struct {
+    _Atomic uint64_t state;
+    LogEntry entry;
+} LogSlot;
+
+// Multi-producer overwrite ring. Any chiaki thread logs without locking or
+// syscalls; the oldest messages are overwritten when Python doesn't keep up,
+// so the newest LOG_RING_SLOTS are always there for the flight recorder.
+typedef struct {
+    LogSlot slots[LOG_RING_SLOTS];
+    _Atomic uint64_t head;     // Next sequence to write
+    uint64_t tail;             // Next sequence to drain (single consumer)
+    _Atomic uint32_t level_mask;  // Levels handed to Python by drain
+    uint64_t dropped;          // Overwritten or torn before they were drained
+    _Atomic bool quit_dump;    // Session quit on an error, Python should dump the recorder
+} LogRing;
+
+// Screenshot service counters (mirrored by _chiaki.ScreenshotStats)
+typedef struct {
+    uint64_t requests;
+    uint64_t cache_hits;     // Served from a keyframe within max_age
+    uint64_t idr_requests;   // Requests that asked the console for a keyframe
+    uint64_t shared_waits;   // Requests that joined an IDR already in flight
+    uint64_t timeouts;
+} ScreenshotStats;
+
+// Loss/recovery counters (mirrored by _chiaki.RecoveryStats)
+typedef struct {
+    uint64_t loss_events;
+    uint64_t frames_lost;         // Sum of frames_lost reported by chiaki
+    uint64_t undecodable_frames;  // Frames received while recovering
+    uint64_t idr_requests;        // Requests actually sent
+    uint64_t idr_coalesced;       // Requests absorbed by a pending one or the cooldown
+    uint64_t recoveries;          // Keyframes that ended an undecodable stretch
+    uint64_t last_recovery_ns;    // Loss to keyframe time of the last recovery
+    uint32_t recovering;
+    uint32_t reserved;
+} RecoveryStats;
+
+// One encoded frame in the ring. The buffer is kept between uses and only grows.
+typedef struct {
+    uint8_t *data;
+    size_t size;
+    size_t capacity;
+    FrameDesc desc;
+} FrameSlot;
+
+// Single-producer/single-consumer ring of encoded frames.
+// video_frame_cb is the only producer and only writes head, the drain side is
+// the only consumer and only writes tail, so neither side takes a lock.
+// Nothing is copied until the first drain enables the ring. When the consumer
+// falls a full ring behind, the producer drops frames up to the next keyframe
+// that fits and flags an overrun, and the next drain skips the stale frames
+// queued before that keyframe, so a late reader resumes at a current,
+// decodable picture.
+typedef struct {
+    FrameSlot slots[FRAME_RING_SLOTS];
+    _Atomic uint64_t head;     // Next slot the producer writes
+    _Atomic uint64_t tail;     // Next slot the consumer reads
+    _Atomic uint64_t dropped;  // Frames dropped or discarded because the consumer fell behind
+    _Atomic bool enabled;      // Set by the first drain
+    _Atomic uint64_t resume;   // Slot of the keyframe that ended the last overrun
+    _Atomic bool overrun;      // resume is set, the consumer skips to it
+    bool resync;               // Producer only: dropping frames until a keyframe fits
+} FrameRing;
+
+// Default byte cap of the GOP cache (~17s of 1080p60 at 15 Mbit/s)
+#define GOP_CACHE_MAX_BYTES (32 * 1024 * 1024)
+
+// Frames retained for registered consumers (see chiaki_python_session_add_consumer)
+#define BROADCAST_SLOTS 256
+#define MAX_CONSUMERS 16
+
+// What happens when a consumer falls too far behind
+#define CONSUMER_POLICY_BLOCK             0  // Video callback waits (bounded) for the consumer
+#define CONSUMER_POLICY_DROP_OLDEST       1  // Oldest unread frames are skipped
+#define CONSUMER_POLICY_SKIP_TO_KEYFRAME  2  // Unread frames are skipped up to the next keyframe
+
+// Reference counted frame buffer handed out by a FramePool
+typedef struct FrameBuf {
+    struct FrameBuf *next;  // Free list link
+    uint8_t *data;
+    size_t size;
+    size_t capacity;
+    unsigned refs;
+} FrameBuf;
+
+// Per-session pool of frame buffers. Buffers are recycled instead of freed, so
+// steady state streaming does no malloc/free. Each comes from a power of two size
+// class, so a buffer is never more than twice its frame: a retained P-frame
+// doesn't pin a keyframe-sized buffer. All access happens under frame_mutex.
+typedef struct {
+    FrameBuf *free_lists[FRAME_POOL_CLASSES];
+    size_t free_counts[FRAME_POOL_CLASSES];
+    size_t max_size;  // Largest frame seen so far
+} FramePool;
+
+// Stream parameters parsed from the SPS
+typedef struct {
+    int32_t codec;  // ChiakiCodec
+    int32_t width;
+    int32_t height;
+    int32_t profile_idc;
+    int32_t level_idc;
+    int32_t bit_depth;
+    int32_t chroma_format_idc;
+} PythonVideoInfo;
+
+// A retained frame: buffer reference plus its descriptor
+typedef struct {
+    FrameBuf *buf;
+    FrameDesc desc;
+} FrameRef;
+
+// A registered reader of the broadcast ring with its own cursor.
+// Reads of one consumer must not run concurrently, different consumers may.
+typedef struct {
+    bool active;
+    int32_t policy;            // CONSUMER_POLICY_*
+    uint32_t max_lag;          // Unread frames tolerated before the policy kicks in
+    int32_t block_timeout_ms;  // BLOCK: longest the video callback waits per frame
+    uint64_t next_seq;         // Next frame sequence to hand out
+    bool resync;               // SKIP_TO_KEYFRAME: discard frames until a keyframe
+    // GOP frames handed out before the broadcast ring (see consumer_join_gop)
+    FrameRef *preroll;
+    size_t preroll_count;
+    size_t preroll_pos;
+    uint64_t delivered;
+    uint64_t dropped;
+    uint64_t peak_lag;
+    uint64_t blocked_ns;       // Time the video callback spent waiting for this consumer
+} FrameConsumer;
+
+// Per-consumer counters (mirrored by _chiaki.ConsumerStats)
+typedef struct {
+    uint64_t delivered;
+    uint64_t dropped;
+    uint64_t lag;       // Frames currently unread
+    uint64_t peak_lag;
+    uint64_t blocked_ns;
+    int32_t policy;
+    int32_t resync;
+} ConsumerStats;
+
+// The current GOP: parameter sets + last keyframe + every frame since, up to a byte cap.
+// The cap counts the capacity of the buffers held, at most twice the frame sizes
+// thanks to the pool's size classes.
+typedef struct {
+    FrameRef *entries;
+    size_t count;
+    size_t capacity;
+    size_t bytes;      // Frame data
+    size_t held;       // Capacity of the buffers referenced, what max_bytes caps
+    size_t max_bytes;  // 0 disables the cache
+    bool complete;     // Every frame since the keyframe is present (decodes up to the latest frame)
+} GopCache;
+
+// Summary of the cached GOP (mirrored by _chiaki.GopInfo)
+typedef struct {
+    uint64_t keyframe_seq;
+    uint64_t last_seq;    // Last frame in the cache
+    uint64_t bytes;       // Buffer size needed by chiaki_python_session_get_gop
+    uint32_t frame_count; // Including a separate parameter set entry
+    uint32_t complete;
+} GopInfo;
+
+// Bytes copied per lock hold when a replay is copied out
+#define REPLAY_COPY_CHUNK (1024 * 1024)
+
+// One frame in the replay ring
+typedef struct {
+    FrameDesc desc;
+    uint64_t pos;    // Absolute byte position of its data in the arena
+    bool gop_start;  // First entry of a GOP: its parameter sets or a self-contained keyframe
+} ReplayEntry;
+
+// Instant replay: whole GOPs covering the last max_ns of video, copied into a
+// circular byte arena of max_bytes, so the cap is the memory actually used.
+// Positions only ever grow; arena bytes at pos are valid while pos >= tail_pos.
+typedef struct {
+    uint8_t *data;         // Arena of max_bytes, NULL while disabled
+    size_t max_bytes;
+    uint64_t head_pos;     // Where the next frame goes
+    uint64_t tail_pos;     // Oldest byte still kept
+    ReplayEntry *entries;  // Circular, oldest at head
+    size_t capacity;
+    size_t head;
+    size_t count;
+    size_t gops;
+    size_t next_gop;       // Offset of the second GOP's first entry, 0 with a single GOP
+    uint64_t max_ns;       // Older GOPs are dropped once the newer ones cover this span (0 = bytes only)
+    uint64_t keyframe_interval_ns;  // Ask for a keyframe when the newest GOP is this old (0 = never)
+    uint64_t gop_time_ns;  // Arrival of the newest GOP's keyframe
+    uint64_t idr_time_ns;  // Last keyframe request
+    uint64_t dropped_gops;
+    uint64_t overflows;    // GOPs that outgrew the arena and were thrown away
+} ReplayRing;
+
+// Summary of the replay ring (mirrored by _chiaki.ReplayInfo)
+typedef struct {
+    uint64_t first_seq;
+    uint64_t last_seq;
+    uint64_t start_time_ns;  // Arrival of the first keyframe
+    uint64_t end_time_ns;    // Arrival of the last frame
+    uint64_t bytes;          // Buffer size needed by chiaki_python_session_get_replay
+    uint64_t dropped_gops;
+    uint64_t overflows;
+    uint32_t frame_count;    // Including separate parameter set entries
+    uint32_t gop_count;
+} ReplayInfo;
+
 // Simple session handle that Python can use
 typedef struct {
     ChiakiSession session;
     ChiakiLog log;
     ChiakiThread session_thread;
-    bool connected;
-    bool quit;
-    uint8_t *latest_frame;
-    size_t latest_frame_size;
+    bool hevc;  // Negotiated codec is H.265, NAL headers are parsed accordingly
+    _Atomic bool connected;
+    bool quit;  // Under frame_mutex (and event_mutex)
+    FramePool pool;  // Backs latest_frame, sps_pps and the I-frame references
+    FrameBuf *latest_frame;
     uint64_t frame_seq;  // Increments with each new frame
     // Store SPS/PPS for building complete I-frames
-    uint8_t *sps_pps;
-    size_t sps_pps_size;
-    // Store a complete I-frame (SPS + PPS + IDR)
-    uint8_t *iframe;
-    size_t iframe_size;
+    FrameBuf *sps_pps;
+    FrameDesc sps_pps_desc;
+    // A complete I-frame is SPS/PPS + IDR, kept as two references and
+    // only concatenated when someone copies it out
+    FrameBuf *iframe_header;
+    FrameBuf *iframe_body;
+    uint64_t iframe_seq;  // frame_seq of the stored I-frame
+    uint64_t iframe_time_ns;  // Receive time of the stored I-frame
     bool have_iframe;
+    PythonVideoInfo video_info;  // From the most recent SPS
+    FrameDesc desc_history[FRAME_DESC_HISTORY];  // Indexed by seq % FRAME_DESC_HISTORY
     ChiakiMutex frame_mutex;
+    ChiakiCond frame_cond;  // Broadcast on every new frame and on quit
+    // Every frame since the last drain (see chiaki_python_session_drain_frames)
+    FrameRing ring;
+    ChiakiMutex drain_mutex;  // Serializes consumers, never taken by the producer
+    // Broadcast ring shared by all registered consumers, indexed by seq % BROADCAST_SLOTS.
+    // Only filled while at least one consumer is registered. Under frame_mutex.
+    FrameRef broadcast[BROADCAST_SLOTS];
+    FrameConsumer consumers[MAX_CONSUMERS];
+    int consumer_count;
+    ChiakiCond space_cond;  // Broadcast when a consumer advances or goes away
+    GopCache gop;  // Under frame_mutex
+    ReplayRing replay;  // Under frame_mutex
+    // Loss recovery, under frame_mutex
+    RecoveryPolicy recovery_policy;
+    RecoveryStats recovery;
+    uint64_t loss_time_ns;     // When the current undecodable stretch started
+    bool idr_wanted;           // An IDR is owed, sent once the cooldown allows
+    uint64_t last_idr_ns;      // When the last IDR request went out
+    // Screenshot service, under frame_mutex
+    bool screenshot_idr_pending;  // A screenshot IDR is in flight, later requests wait for it
+    ScreenshotStats screenshot_stats;
+    LogRing log_ring;
+    // Lifecycle: connected/quit state and a queue of events, under event_mutex
+    ChiakiMutex event_mutex;
+    ChiakiCond event_cond;  // Broadcast on every queued event and on close
+    PythonEvent events[EVENT_QUEUE_SLOTS];
+    uint64_t event_head;
+    uint64_t event_tail;
+    bool events_closed;     // next_event returns immediately, see close_events
+    PythonEvent quit_event; // Kept after it has been taken from the queue
+    // Pollable readiness notification (eventfd), readable while pending_events != 0
+    int notify_fd;
+    _Atomic uint32_t pending_events;
 } PythonSession;
 
-// Debug: track frame count and sizes
-static int frame_count = 0;
-static size_t max_frame_size = 0;
-
-// Helper: Find NAL unit type from buffer (looks for 00 00 00 01 or 00 00 01 start code)
-static int get_first_nal_type(uint8_t *buf, size_t buf_size)
+// Size class of a buffer of at least size bytes, FRAME_POOL_CLASSES if it is too large to pool
+static int frame_pool_class(size_t size)
 {
-    if (buf_size < 5)
-        return -1;
-    // Check for 4-byte start code: 00 00 00 01
-    if (buf[0] == 0 && buf[1] == 0 && buf[2] == 0 && buf[3] == 1)
-        return buf[4] & 0x1f;
-    // Check for 3-byte start code: 00 00 01
-    if (buf[0] == 0 && buf[1] == 0 && buf[2] == 1)
-        return buf[3] & 0x1f;
-    return -1;
+    int cls = 0;
+    while (cls < FRAME_POOL_CLASSES && ((size_t)1 << (FRAME_POOL_MIN_SHIFT + cls)) < size)
+        cls++;
+    return cls;
 }
 
-// Global callback for video frames
-// Chiaki sends: 1) header (SPS/PPS, small) 2) frame data (I or P frames, larger)
-static bool video_frame_cb(uint8_t *buf, size_t buf_size, int32_t frames_lost, bool frame_recovered, void *user)
+// Get a buffer of at least size bytes with one reference
+static FrameBuf *frame_pool_acquire(FramePool *pool, size_t size)
 {
-    PythonSession *sess = (PythonSession *)user;
-    if (!sess || buf_size == 0)
-        return true;
+    if (size > pool->max_size)
+        pool->max_size = size;
+
+    int cls = frame_pool_class(size);
+    FrameBuf *buf = cls < FRAME_POOL_CLASSES ? pool->free_lists[cls] : NULL;
+    if (buf) {
+        pool->free_lists[cls] = buf->next;
+        pool->free_counts[cls]--;
+    } else {
+        size_t capacity = cls < FRAME_POOL_CLASSES ? (size_t)1 << (FRAME_POOL_MIN_SHIFT + cls) : size;
+        buf = calloc(1, sizeof(FrameBuf));
+        if (!buf)
+            return NULL;
+        buf->data = malloc(capacity);
+        if (!buf->data) {
+            free(buf);
+            return NULL;
+        }
+        buf->capacity = capacity;
+    }
+
+    buf->next = NULL;
+    buf->size = size;
+    buf->refs = 1;
+    return buf;
+}
 
-    frame_count++;
-    if (buf_size > max_frame_size)
-        max_frame_size = buf_size;
+static FrameBuf *frame_buf_ref(FrameBuf *buf)
+{
+    if (buf)
+        buf->refs++;
+    return buf;
+}
 
-    int nal_type = get_first_nal_type(buf, buf_size);
+// Drop a reference, the last one returns the buffer to the pool
+static void frame_pool_release(FramePool *pool, FrameBuf *buf)
+{
+    if (!buf || --buf->refs > 0)
+        return;
+    int cls = frame_pool_class(buf->capacity);
+    if (cls < FRAME_POOL_CLASSES && pool->free_counts[cls] < FRAME_POOL_MAX_FREE) {
+        buf->next = pool->free_lists[cls];
+        pool->free_lists[cls] = buf;
+        pool->free_counts[cls]++;
+    } else {
+        free(buf->data);
+        free(buf);
+    }
+}
 
-    // Log first 20 frames and every 100th frame, with NAL type
-    if (frame_count <= 20 || frame_count % 100 == 0) {
-        fprintf(stderr, "[PY_WRAPPER] Frame %d: size=%zu NAL=%d", frame_count, buf_size, nal_type);
-        if (buf_size >= 8) {
-            fprintf(stderr, " [%02x %02x %02x %02x %02x %02x %02x %02x]",
-                    buf[0], buf[1], buf[2], buf[3], buf[4], buf[5], buf[6], buf[7]);
+static void frame_pool_fini(FramePool *pool)
+{
+    for (int cls = 0; cls < FRAME_POOL_CLASSES; cls++) {
+        FrameBuf *buf = pool->free_lists[cls];
+        while (buf) {
+            FrameBuf *next = buf->next;
+            free(buf->data);
+            free(buf);
+            buf = next;
         }
-        fprintf(stderr, "\n");
-        fflush(stderr);
+        pool->free_lists[cls] = NULL;
+        pool->free_counts[cls] = 0;
     }
+}
 
-    chiaki_mutex_lock(&sess->frame_mutex);
+// Size of the stored I-frame (header + body), frame_mutex held.
+// The header is NULL when the keyframe carried its own parameter sets.
+static size_t iframe_size(PythonSession *sess)
+{
+    if (!sess->have_iframe || !sess->iframe_body)
+        return 0;
+    return (sess->iframe_header ? sess->iframe_header->size : 0) + sess->iframe_body->size;
+}
 
-    // Store the latest frame (always)
-    if (sess->latest_frame)
-        free(sess->latest_frame);
-    sess->latest_frame = malloc(buf_size);
-    if (sess->latest_frame) {
-        memcpy(sess->latest_frame, buf, buf_size);
-        sess->latest_frame_size = buf_size;
-        sess->frame_seq++;  // Increment sequence for new frame detection
+// Copy the stored I-frame into buffer, frame_mutex held. Returns 0 if it doesn't fit.
+static size_t copy_iframe(PythonSession *sess, uint8_t *buffer, size_t buffer_size)
+{
+    size_t size = iframe_size(sess);
+    if (size == 0 || size > buffer_size)
+        return 0;
+    size_t offset = 0;
+    if (sess->iframe_header) {
+        memcpy(buffer, sess->iframe_header->data, sess->iframe_header->size);
+        offset = sess->iframe_header->size;
     }
+    memcpy(buffer + offset, sess->iframe_body->data, sess->iframe_body->size);
+    return size;
+}
 
-    // Detect SPS (NAL type 7) or PPS (NAL type 8) - these are the codec headers
-    // Also accept if buf contains both SPS and PPS (profile header from chiaki)
-    bool is_header = (nal_type == 7 || nal_type == 8);
+// ============================================================
+// Annex-B NAL unit scanner (H.264 and HEVC)
+// ============================================================
+
+// NAL classes found in a sample (NalScan.flags)
+#define NAL_FLAG_SPS        (1 << 0)
+#define NAL_FLAG_PPS        (1 << 1)
+#define NAL_FLAG_VPS        (1 << 2)  // HEVC only
+#define NAL_FLAG_IDR        (1 << 3)  // H.264 IDR, HEVC IDR_W_RADL/IDR_N_LP
+#define NAL_FLAG_IRAP       (1 << 4)  // Any random access point (IDR, CRA, BLA)
+#define NAL_FLAG_I_SLICE    (1 << 5)  // H.264 non-IDR slice with slice_type I
+#define NAL_FLAG_SLICE      (1 << 6)  // Contains picture data
+#define NAL_FLAG_SEI        (1 << 7)
+#define NAL_FLAG_INTER      (1 << 8)  // H.264 slice that is not intra (P/B/SP)
+
+// Result of scanning one sample. Resolution/profile fields are only set
+// (non-zero) when the sample carries an SPS.
+typedef struct {
+    uint32_t flags;
+    int32_t nal_count;
+    int32_t first_nal_type;
+    int32_t width;
+    int32_t height;
+    int32_t profile_idc;
+    int32_t level_idc;
+    int32_t bit_depth;
+    int32_t chroma_format_idc;
+} NalScan;
+
+// Bit reader over a NAL payload that skips emulation prevention bytes (00 00 03)
+typedef struct {
+    const uint8_t *buf;
+    size_t size;
+    size_t pos;      // Byte position
+    int bit;         // Bits consumed in buf[pos]
+    int zeros;       // Consecutive zero bytes before pos
+    bool overrun;
+} BitReader;
+
+static void bits_init(BitReader *br, const uint8_t *buf, size_t size)
+{
+    br->buf = buf;
+    br->size = size;
+    br->pos = 0;
+    br->bit = 0;
+    br->zeros = 0;
+    br->overrun = false;
+}
 
-    // Store headers (SPS/PPS) when we see them
-    if (is_header || (buf_size < 500 && nal_type == 7)) {
-        fprintf(stderr, "[PY_WRAPPER] Got header! NAL=%d size=%zu\n", nal_type, buf_size);
-        fflush(stderr);
-        // Replace header buffer with new header
-        if (sess->sps_pps)
-            free(sess->sps_pps);
-        sess->sps_pps = malloc(buf_size);
-        if (sess->sps_pps) {
-            memcpy(sess->sps_pps, buf, buf_size);
-            sess->sps_pps_size = buf_size;
+static uint32_t bits_read1(BitReader *br)
+{
+    if (br->pos >= br->size) {
+        br->overrun = true;
+        return 0;
+    }
+    if (br->bit == 0 && br->zeros >= 2 && br->buf[br->pos] == 3) {
+        // Emulation prevention byte, not part of the payload
+        br->pos++;
+        br->zeros = 0;
+        if (br->pos >= br->size) {
+            br->overrun = true;
+            return 0;
         }
     }
+    uint8_t byte = br->buf[br->pos];
+    uint32_t v = (byte >> (7 - br->bit)) & 1;
+    if (++br->bit == 8) {
+        br->bit = 0;
+        br->zeros = byte == 0 ? br->zeros + 1 : 0;
+        br->pos++;
+    }
+    return v;
+}
 
-    // Detect I-frames: NAL type 5 (IDR) or large frames > 50KB (non-IDR I-slices)
-    bool is_idr = (nal_type == 5);
-    bool is_large_iframe = (buf_size > 50000);
-    bool is_iframe = is_idr || is_large_iframe;
+static uint32_t bits_read(BitReader *br, int n)
+{
+    uint32_t v = 0;
+    while (n-- > 0)
+        v = (v << 1) | bits_read1(br);
+    return v;
+}
 
-    // Store I-frames with header for screenshots
-    if (is_iframe) {
-        fprintf(stderr, "[PY_WRAPPER] I-frame detected! NAL=%d size=%zu sps_pps=%zu\n",
-                nal_type, buf_size, sess->sps_pps_size);
-        fflush(stderr);
-    }
-    if (is_iframe && sess->sps_pps && sess->sps_pps_size > 0) {
-        size_t total_size = sess->sps_pps_size + buf_size;
-        if (total_size <= MAX_FRAME_SIZE) {
-            if (sess->iframe)
-                free(sess->iframe);
-            sess->iframe = malloc(total_size);
-            if (sess->iframe) {
-                // Prepend header (SPS/PPS) to frame data
-                memcpy(sess->iframe, sess->sps_pps, sess->sps_pps_size);
-                memcpy(sess->iframe + sess->sps_pps_size, buf, buf_size);
-                sess->iframe_size = total_size;
-                sess->have_iframe = true;
-                fprintf(stderr, "[PY_WRAPPER] Stored complete I-frame: %zu bytes\n", total_size);
-                fflush(stderr);
-            }
+static void bits_skip(BitReader *br, int n)
+{
+    while (n-- > 0 && !br->overrun)
+        bits_read1(br);
+}
+
+// Unsigned Exp-Golomb
+static uint32_t bits_read_ue(BitReader *br)
+{
+    int leading = 0;
+    while (!bits_read1(br) && !br->overrun) {
+        if (++leading > 31) {
+            br->overrun = true;
+            return 0;
         }
     }
-
-    chiaki_mutex_unlock(&sess->frame_mutex);
-    return true;
+    return leading ? ((1u << leading) - 1 + bits_read(br, leading)) : 0;
 }
 
-// Event callback
-static void event_cb(ChiakiEvent *event, void *user)
+// Signed Exp-Golomb
+static int32_t bits_read_se(BitReader *br)
 {
-    PythonSession *sess = (PythonSession *)user;
-    if (!sess)
-        return;
+    uint32_t v = bits_read_ue(br);
+    return (v & 1) ? (int32_t)((v + 1) / 2) : -(int32_t)(v / 2);
+}
 
-    switch(event->type) {
-        case CHIAKI_EVENT_CONNECTED:
-            sess->connected = true;
-            break;
-        case CHIAKI_EVENT_QUIT:
-            sess->quit = true;
-            break;
-        default:
-            break;
+static void h264_skip_scaling_list(BitReader *br, int size)
+{
+    int last = 8, next = 8;
+    for (int i = 0; i < size && !br->overrun; i++) {
+        if (next != 0)
+            next = (last + bits_read_se(br) + 256) % 256;
+        last = next == 0 ? last : next;
     }
 }
 
-// Simplified session creation that loads from Chiaki config
-CHIAKI_EXPORT PythonSession *chiaki_python_session_create(
-    const char *host,
-    const char *regist_key_hex,
-    const char *rp_key_hex,
-    const uint8_t *psn_account_id,  // 8 bytes
-    bool is_ps5,
-    int resolution_preset,  // 1=360p, 2=540p, 3=720p, 4=1080p
-    int fps_preset)         // 30 or 60
+// Parse an H.264 SPS (payload after the 1 byte NAL header)
+static void h264_parse_sps(const uint8_t *buf, size_t size, NalScan *scan)
 {
-    PythonSession *sess = calloc(1, sizeof(PythonSession));
-    if (!sess)
-        return NULL;
-
-    // Initialize mutex
-    chiaki_mutex_init(&sess->frame_mutex, false);
+    BitReader br;
+    bits_init(&br, buf, size);
+
+    int profile_idc = bits_read(&br, 8);
+    bits_skip(&br, 8);  // constraint_set flags + reserved
+    int level_idc = bits_read(&br, 8);
+    bits_read_ue(&br);  // seq_parameter_set_id
+
+    int chroma_format_idc = 1;
+    int bit_depth = 8;
+    if (profile_idc == 100 || profile_idc == 110 || profile_idc == 122 || profile_idc == 244 ||
+        profile_idc == 44 || profile_idc == 83 || profile_idc == 86 || profile_idc == 118 ||
+        profile_idc == 128 || profile_idc == 138 || profile_idc == 139 || profile_idc == 134 ||
+        profile_idc == 135) {
+        chroma_format_idc = bits_read_ue(&br);
+        if (chroma_format_idc == 3)
+            bits_skip(&br, 1);  // separate_colour_plane_flag
+        bit_depth = bits_read_ue(&br) + 8;
+        bits_read_ue(&br);  // bit_depth_chroma_minus8
+        bits_skip(&br, 1);  // qpprime_y_zero_transform_bypass_flag
+        if (bits_read1(&br)) {  // seq_scaling_matrix_present_flag
+            int lists = chroma_format_idc != 3 ? 8 : 12;
+            for (int i = 0; i < lists; i++) {
+                if (bits_read1(&br))
+                    h264_skip_scaling_list(&br, i < 6 ? 16 : 64);
+            }
+        }
+    }
 
-    // Set up logging
-    chiaki_log_init(&sess->log, CHIAKI_LOG_ALL, NULL, NULL);
+    bits_read_ue(&br);  // log2_max_frame_num_minus4
+    uint32_t poc_type = bits_read_ue(&br);
+    if (poc_type == 0) {
+        bits_read_ue(&br);  // log2_max_pic_order_cnt_lsb_minus4
+    } else if (poc_type == 1) {
+        bits_skip(&br, 1);  // delta_pic_order_always_zero_flag
+        bits_read_se(&br);  // offset_for_non_ref_pic
+        bits_read_se(&br);  // offset_for_top_to_bottom_field
+        uint32_t cycle = bits_read_ue(&br);
+        for (uint32_t i = 0; i < cycle && !br.overrun; i++)
+            bits_read_se(&br);
+    }
+    bits_read_ue(&br);  // max_num_ref_frames
+    bits_skip(&br, 1);  // gaps_in_frame_num_value_allowed_flag
+
+    uint32_t width_mbs = bits_read_ue(&br) + 1;
+    uint32_t height_map_units = bits_read_ue(&br) + 1;
+    uint32_t frame_mbs_only = bits_read1(&br);
+    if (!frame_mbs_only)
+        bits_skip(&br, 1);  // mb_adaptive_frame_field_flag
+    bits_skip(&br, 1);  // direct_8x8_inference_flag
+
+    uint32_t crop_left = 0, crop_right = 0, crop_top = 0, crop_bottom = 0;
+    if (bits_read1(&br)) {
+        crop_left = bits_read_ue(&br);
+        crop_right = bits_read_ue(&br);
+        crop_top = bits_read_ue(&br);
+        crop_bottom = bits_read_ue(&br);
+    }
+    if (br.overrun)
+        return;
 
-    // Set up video profile
-    ChiakiConnectVideoProfile video_profile;
-    chiaki_connect_video_profile_preset(&video_profile, resolution_preset, fps_preset);
+    int crop_unit_x = chroma_format_idc == 0 ? 1 : (chroma_format_idc == 3 ? 1 : 2);
+    int crop_unit_y = (chroma_format_idc == 1 ? 2 : 1) * (2 - frame_mbs_only);
 
-    // Set up connect info
-    ChiakiConnectInfo connect_info = {0};
-    connect_info.ps5 = is_ps5;
-    connect_info.host = host;
+    scan->width = (int32_t)(width_mbs * 16 - (crop_left + crop_right) * crop_unit_x);
+    scan->height = (int32_t)((2 - frame_mbs_only) * height_map_units * 16 - (crop_top + crop_bottom) * crop_unit_y);
+    scan->profile_idc = profile_idc;
+    scan->level_idc = level_idc;
+    scan->bit_depth = bit_depth;
+    scan->chroma_format_idc = chroma_format_idc;
+}
 
-    // Regist key is stored as ASCII string (e.g., "d77687f8"), not hex-decoded
-    // It gets sent directly in the HTTP header
-    memset(connect_info.regist_key, 0, sizeof(connect_info.regist_key));
-    size_t regist_len = strlen(regist_key_hex);
-    if (regist_len > sizeof(connect_info.regist_key))
-        regist_len = sizeof(connect_info.regist_key);
-    memcpy(connect_info.regist_key, regist_key_hex, regist_len);
+// Parse an HEVC SPS (payload after the 2 byte NAL header)
+static void hevc_parse_sps(const uint8_t *buf, size_t size, NalScan *scan)
+{
+    BitReader br;
+    bits_init(&br, buf, size);
+
+    bits_skip(&br, 4);  // sps_video_parameter_set_id
+    int max_sub_layers_minus1 = bits_read(&br, 3);
+    bits_skip(&br, 1);  // sps_temporal_id_nesting_flag
+
+    // profile_tier_level(1, max_sub_layers_minus1)
+    bits_skip(&br, 3);  // general_profile_space, general_tier_flag
+    int profile_idc = bits_read(&br, 5);
+    bits_skip(&br, 32);  // general_profile_compatibility_flags
+    bits_skip(&br, 48);  // progressive/interlaced/non-packed/frame-only + reserved
+    int level_idc = bits_read(&br, 8);
+    bool sub_profile[8] = {0}, sub_level[8] = {0};
+    for (int i = 0; i < max_sub_layers_minus1; i++) {
+        sub_profile[i] = bits_read1(&br);
+        sub_level[i] = bits_read1(&br);
+    }
+    if (max_sub_layers_minus1 > 0) {
+        for (int i = max_sub_layers_minus1; i < 8; i++)
+            bits_skip(&br, 2);  // reserved_zero_2bits
+    }
+    for (int i = 0; i < max_sub_layers_minus1; i++) {
+        if (sub_profile[i])
+            bits_skip(&br, 88);
+        if (sub_level[i])
+            bits_skip(&br, 8);
+    }
 
-    // RP key (morning field) IS hex-decoded (16 bytes from 32 hex chars)
-    size_t rp_len = strlen(rp_key_hex);
-    for (size_t i = 0; i < rp_len && i < 32; i += 2) {
-        char hex[3] = {rp_key_hex[i], rp_key_hex[i+1], 0};
-        connect_info.morning[i/2] = (uint8_t)strtol(hex, NULL, 16);
+    bits_read_ue(&br);  // sps_seq_parameter_set_id
+    uint32_t chroma_format_idc = bits_read_ue(&br);
+    if (chroma_format_idc == 3)
+        bits_skip(&br, 1);  // separate_colour_plane_flag
+    uint32_t width = bits_read_ue(&br);
+    uint32_t height = bits_read_ue(&br);
+
+    uint32_t conf_left = 0, conf_right = 0, conf_top = 0, conf_bottom = 0;
+    if (bits_read1(&br)) {  // conformance_window_flag
+        conf_left = bits_read_ue(&br);
+        conf_right = bits_read_ue(&br);
+        conf_top = bits_read_ue(&br);
+        conf_bottom = bits_read_ue(&br);
     }
+    uint32_t bit_depth = bits_read_ue(&br) + 8;
+    if (br.overrun)
+        return;
 
-    // PSN account ID
-    if (psn_account_id)
-        memcpy(connect_info.psn_account_id, psn_account_id, 8);
+    int sub_width = (chroma_format_idc == 1 || chroma_format_idc == 2) ? 2 : 1;
+    int sub_height = chroma_format_idc == 1 ? 2 : 1;
 
-    connect_info.video_profile = video_profile;
-    connect_info.video_profile_auto_downgrade = true;
-    connect_info.enable_keyboard = false;
-    connect_info.enable_dualsense = false;
-    connect_info.audio_video_disabled = 0;
-    connect_info.auto_regist = false;
-    connect_info.holepunch_session = NULL;
-    connect_info.rudp_sock = NULL;
-    connect_info.packet_loss_max = 0.0;
-    connect_info.enable_idr_on_fec_failure = true;
+    scan->width = (int32_t)(width - (conf_left + conf_right) * sub_width);
+    scan->height = (int32_t)(height - (conf_top + conf_bottom) * sub_height);
+    scan->profile_idc = profile_idc;
+    scan->level_idc = level_idc;
+    scan->bit_depth = (int32_t)bit_depth;
+    scan->chroma_format_idc = (int32_t)chroma_format_idc;
+}
 
-    // Initialize session
-    ChiakiErrorCode err = chiaki_session_init(&sess->session, &connect_info, &sess->log);
-    if (err != CHIAKI_ERR_SUCCESS) {
-        free(sess);
-        return NULL;
+// Find the next 00 00 01 start code at or after pos. Uses memchr to jump
+// between candidate 0x01 bytes instead of testing every byte.
+// Returns the offset of the first payload byte after the start code, or size.
+static size_t find_start_code(const uint8_t *buf, size_t size, size_t pos)
+{
+    while (pos + 2 < size) {
+        const uint8_t *one = memchr(buf + pos + 2, 1, size - pos - 2);
+        if (!one)
+            return size;
+        size_t i = (size_t)(one - buf);
+        if (buf[i - 1] == 0 && buf[i - 2] == 0)
+            return i + 1;
+        pos = i - 1;
     }
+    return size;
+}
 
-    // Set up callbacks
-    chiaki_session_set_event_cb(&sess->session, event_cb, sess);
-    chiaki_session_set_video_sample_cb(&sess->session, video_frame_cb, sess);
+// Classify one NAL unit (payload without start code, size excludes trailing zeros)
+static void scan_nal(const uint8_t *nal, size_t size, bool hevc, NalScan *scan)
+{
+    if (size < (hevc ? 2u : 1u))
+        return;
 
-    fprintf(stderr, "[PY_WRAPPER] Session created, video callback set: %p, user: %p\n",
-            (void*)sess->session.video_sample_cb, (void*)sess->session.video_sample_cb_user);
-    fflush(stderr);
+    int type;
+    if (hevc) {
+        type = (nal[0] >> 1) & 0x3f;
+        if (type <= 31)
+            scan->flags |= NAL_FLAG_SLICE;
+        if (type >= 16 && type <= 23)
+            scan->flags |= NAL_FLAG_IRAP;
+        if (type == 19 || type == 20)
+            scan->flags |= NAL_FLAG_IDR;
+        if (type == 32)
+            scan->flags |= NAL_FLAG_VPS;
+        if (type == 33) {
+            scan->flags |= NAL_FLAG_SPS;
+            hevc_parse_sps(nal + 2, size - 2, scan);
+        }
+        if (type == 34)
+            scan->flags |= NAL_FLAG_PPS;
+        if (type == 39 || type == 40)
+            scan->flags |= NAL_FLAG_SEI;
+    } else {
+        type = nal[0] & 0x1f;
+        if (type == 1 || type == 5)
+            scan->flags |= NAL_FLAG_SLICE;
+        if (type == 5)
+            scan->flags |= NAL_FLAG_IDR | NAL_FLAG_IRAP;
+        if (type == 1 && size > 1) {
+            // first_mb_in_slice, then slice_type (2/7 = I, 4/9 = SI)
+            BitReader br;
+            bits_init(&br, nal + 1, size - 1);
+            bits_read_ue(&br);
+            uint32_t slice_type = bits_read_ue(&br) % 5;
+            if (!br.overrun && (slice_type == 2 || slice_type == 4))
+                scan->flags |= NAL_FLAG_I_SLICE;
+            else
+                scan->flags |= NAL_FLAG_INTER;
+        }
+        if (type == 6)
+            scan->flags |= NAL_FLAG_SEI;
+        if (type == 7) {
+            scan->flags |= NAL_FLAG_SPS;
+            h264_parse_sps(nal + 1, size - 1, scan);
+        }
+        if (type == 8)
+            scan->flags |= NAL_FLAG_PPS;
+    }
 
-    return sess;
+    if (scan->nal_count == 0)
+        scan->first_nal_type = type;
+    scan->nal_count++;
 }
 
-// Start the session
-CHIAKI_EXPORT bool chiaki_python_session_start(PythonSession *sess)
+// Walk every NAL unit of an Annex-B sample
+static void nal_scan(const uint8_t *buf, size_t size, bool hevc, NalScan *scan)
 {
-    if (!sess)
-        return false;
+    memset(scan, 0, sizeof(*scan));
+    scan->first_nal_type = -1;
+
+    size_t start = find_start_code(buf, size, 0);
+    while (start < size) {
+        size_t next = find_start_code(buf, size, start);
+        // The NAL ends where the next start code (and any leading zero byte of a 4 byte one) begins
+        size_t end = next < size ? next - 3 : size;
+        while (end > start && buf[end - 1] == 0)
+            end--;
+        scan_nal(buf + start, end - start, hevc, scan);
+        start = next;
+    }
+}
 
-    ChiakiErrorCode err = chiaki_session_start(&sess->session);
-    return err == CHIAKI_ERR_SUCCESS;
+// A sample a decoder can start from: IDR/IRAP, or an H.264 picture made only of I-slices
+static bool nal_scan_is_keyframe(const NalScan *scan)
+{
+    if (scan->flags & NAL_FLAG_IRAP)
+        return true;
+    return (scan->flags & NAL_FLAG_I_SLICE) && !(scan->flags & NAL_FLAG_INTER);
 }
 
-// Wait for connection
-CHIAKI_EXPORT bool chiaki_python_session_wait_connected(PythonSession *sess, int timeout_ms)
+// Scan a sample from Python. codec is a ChiakiCodec.
+CHIAKI_EXPORT void chiaki_python_scan_nals(const uint8_t *buf, size_t size, int codec, NalScan *out)
 {
-    if (!sess)
+    if (!out)
+        return;
+    if (!buf) {
+        memset(out, 0, sizeof(*out));
+        out->first_nal_type = -1;
+        return;
+    }
+    nal_scan(buf, size, codec != CHIAKI_CODEC_H264, out);
+}
+
+// Push a frame into the ring (producer side, called from the video callback only).
+// Never blocks: if the consumer has fallen a full ring behind, frames are dropped up
+// to the next keyframe. Returns true when that starts, so the caller asks for one.
+static bool frame_ring_push(FrameRing *ring, const uint8_t *buf, size_t buf_size, const FrameDesc *desc)
+{
+    if (!atomic_load_explicit(&ring->enabled, memory_order_acquire))
         return false;
 
-    int elapsed = 0;
-    while (!sess->connected && !sess->quit && elapsed < timeout_ms) {
-        usleep(100000);  // 100ms
-        elapsed += 100;
+    uint64_t head = atomic_load_explicit(&ring->head, memory_order_relaxed);
+    uint64_t tail = atomic_load_explicit(&ring->tail, memory_order_acquire);
+    if (head - tail >= FRAME_RING_SLOTS) {
+        atomic_fetch_add_explicit(&ring->dropped, 1, memory_order_relaxed);
+        bool started = !ring->resync;
+        ring->resync = true;
+        return started;
+    }
+    if (ring->resync) {
+        if (!desc->keyframe) {
+            atomic_fetch_add_explicit(&ring->dropped, 1, memory_order_relaxed);
+            return false;
+        }
+    }
+
+    FrameSlot *slot = &ring->slots[head % FRAME_RING_SLOTS];
+    if (slot->capacity < buf_size) {
+        uint8_t *data = realloc(slot->data, buf_size);
+        if (!data) {
+            atomic_fetch_add_explicit(&ring->dropped, 1, memory_order_relaxed);
+            return false;
+        }
+        slot->data = data;
+        slot->capacity = buf_size;
+    }
+    memcpy(slot->data, buf, buf_size);
+    slot->size = buf_size;
+    slot->desc = *desc;
+    if (ring->resync) {
+        ring->resync = false;
+        atomic_store_explicit(&ring->resume, head, memory_order_relaxed);
+        atomic_store_explicit(&ring->overrun, true, memory_order_release);
     }
 
-    return sess->connected;
+    // Publish the slot to the consumer
+    atomic_store_explicit(&ring->head, head + 1, memory_order_release);
+    return false;
 }
 
-// Check if connected
-CHIAKI_EXPORT bool chiaki_python_session_is_connected(PythonSession *sess)
+static void frame_ring_fini(FrameRing *ring)
 {
-    return sess && sess->connected;
+    for (size_t i = 0; i < FRAME_RING_SLOTS; i++)
+        free(ring->slots[i].data);
 }
 
-// Send controller state
-CHIAKI_EXPORT bool chiaki_python_session_set_controller(
-    PythonSession *sess,
-    uint32_t buttons,        // Bitmask of buttons
-    int16_t left_x,          // -32768 to 32767
-    int16_t left_y,
-    int16_t right_x,
-    int16_t right_y,
-    uint8_t l2_state,        // 0-255
-    uint8_t r2_state)
+// Flag events as pending and make notify_fd readable.
+// Only the transition from "nothing pending" writes to the fd, so a burst of
+// frames between two acks costs a single syscall.
+static void notify_events(PythonSession *sess, uint32_t events)
 {
-    if (!sess || !sess->connected)
-        return false;
-
-    ChiakiControllerState state;
-    chiaki_controller_state_set_idle(&state);
-
-    state.buttons = buttons;
-    state.left_x = left_x;
-    state.left_y = left_y;
-    state.right_x = right_x;
-    state.right_y = right_y;
-    state.l2_state = l2_state;
-    state.r2_state = r2_state;
+    uint32_t prev = atomic_fetch_or_explicit(&sess->pending_events, events, memory_order_acq_rel);
+    if (prev == 0 && sess->notify_fd >= 0)
+        eventfd_write(sess->notify_fd, 1);
+}
 
-    ChiakiErrorCode err = chiaki_session_set_controller_state(&sess->session, &state);
-    return err == CHIAKI_ERR_SUCCESS;
+static uint64_t monotonic_ns(void)
+{
+    struct timespec now;
+    clock_gettime(CLOCK_MONOTONIC, &now);
+    return (uint64_t)now.tv_sec * 1000000000ull + (uint64_t)now.tv_nsec;
 }
 
-// Get latest video frame (returns size, writes to buffer)
-// Also returns the frame sequence number via out parameter
-CHIAKI_EXPORT size_t chiaki_python_session_get_frame_ex(
-    PythonSession *sess,
-    uint8_t *buffer,
-    size_t buffer_size,
-    uint64_t *seq_out)
+// Append a message to the log ring. Lock-free, safe from any thread.
+static void log_ring_write(LogRing *ring, uint32_t level, const char *fmt, va_list args)
 {
-    if (!sess || !buffer)
-        return 0;
+    uint64_t seq = atomic_fetch_add_explicit(&ring->head, 1, memory_order_relaxed);
+    LogSlot *slot = &ring->slots[seq % LOG_RING_SLOTS];
 
-    chiaki_mutex_lock(&sess->frame_mutex);
+    atomic_store_explicit(&slot->state, 2 * seq + 1, memory_order_relaxed);
+    atomic_thread_fence(memory_order_release);
 
-    size_t size = 0;
-    if (sess->latest_frame && sess->latest_frame_size <= buffer_size) {
-        memcpy(buffer, sess->latest_frame, sess->latest_frame_size);
-        size = sess->latest_frame_size;
-        if (seq_out)
-            *seq_out = sess->frame_seq;
-    }
+    LogEntry *entry = &slot->entry;
+    entry->seq = seq;
+    entry->time_ns = monotonic_ns();
+    entry->level = level;
+    int len = vsnprintf(entry->msg, LOG_MSG_MAX, fmt, args);
+    entry->len = len < 0 ? 0 : (len >= LOG_MSG_MAX ? LOG_MSG_MAX - 1 : (uint32_t)len);
 
-    chiaki_mutex_unlock(&sess->frame_mutex);
+    atomic_store_explicit(&slot->state, 2 * seq + 2, memory_order_release);
+}
 
-    return size;
+// Levels worth formatting at all: what Python wants plus what the recorder keeps
+static bool log_enabled(PythonSession *sess, uint32_t level)
+{
+    return (level & sess->log.level_mask) != 0;
 }
 
-// Simple version without sequence number
-CHIAKI_EXPORT size_t chiaki_python_session_get_frame(
-    PythonSession *sess,
+// Wrapper's own log messages, they share the ring with chiaki's
+static void py_log(PythonSession *sess, uint32_t level, const char *fmt, ...)
+{
+    if (!log_enabled(sess, level))
+        return;
+    va_list args;
+    va_start(args, fmt);
+    log_ring_write(&sess->log_ring, level, fmt, args);
+    va_end(args);
+}
+
+// ChiakiLog callback: chiaki formats the message, we only copy it into the ring
+static void log_cb(ChiakiLogLevel level, const char *msg, void *user)
+{
+    PythonSession *sess = user;
+    py_log(sess, (uint32_t)level, "%s", msg);
+}
+
+// Predicate state for waits on one consumer (producer for space, reader for frames)
+typedef struct {
+    PythonSession *sess;
+    FrameConsumer *consumer;
+} ConsumerWait;
+
+static bool consumer_has_space_pred(void *user)
+{
+    ConsumerWait *wait = user;
+    FrameConsumer *c = wait->consumer;
+    // Storing frame_seq + 1 must not overwrite the consumer's next unread frame
+    return wait->sess->quit || !c->active || wait->sess->frame_seq + 1 - c->next_seq < BROADCAST_SLOTS;
+}
+
+// Give lagging BLOCK consumers up to their block_timeout_ms to make room
+// before the next frame is stored, frame_mutex held (released while waiting).
+static void broadcast_wait_space(PythonSession *sess)
+{
+    for (int i = 0; i < MAX_CONSUMERS; i++) {
+        FrameConsumer *c = &sess->consumers[i];
+        if (!c->active || c->policy != CONSUMER_POLICY_BLOCK || c->block_timeout_ms <= 0)
+            continue;
+        ConsumerWait wait = { sess, c };
+        if (consumer_has_space_pred(&wait))
+            continue;
+        uint64_t start = monotonic_ns();
+        chiaki_cond_timedwait_pred(&sess->space_cond, &sess->frame_mutex, (uint64_t)c->block_timeout_ms,
+                                   consumer_has_space_pred, &wait);
+        c->blocked_ns += monotonic_ns() - start;
+    }
+}
+
+// Store a frame in the broadcast ring and apply every consumer's slow-reader
+// policy, frame_mutex held
+static void broadcast_push(PythonSession *sess, FrameBuf *frame, const FrameDesc *desc)
+{
+    FrameRef *slot = &sess->broadcast[desc->seq % BROADCAST_SLOTS];
+    frame_pool_release(&sess->pool, slot->buf);
+    slot->buf = frame_buf_ref(frame);
+    slot->desc = *desc;
+
+    for (int i = 0; i < MAX_CONSUMERS; i++) {
+        FrameConsumer *c = &sess->consumers[i];
+        if (!c->active)
+            continue;
+
+        uint64_t limit = c->policy == CONSUMER_POLICY_BLOCK ? BROADCAST_SLOTS : c->max_lag;
+        uint64_t lag = desc->seq + 1 - c->next_seq;
+        if (lag > limit) {
+            uint64_t next = desc->seq + 1 - limit;
+            c->dropped += next - c->next_seq;
+            c->next_seq = next;
+            if (c->policy == CONSUMER_POLICY_SKIP_TO_KEYFRAME)
+                c->resync = true;
+            lag = limit;
+        }
+        if (lag > c->peak_lag)
+            c->peak_lag = lag;
+    }
+}
+
+// Drop every reference in refs[0..count), frame_mutex held
+static void frame_refs_release(FramePool *pool, FrameRef *refs, size_t count)
+{
+    for (size_t i = 0; i < count; i++) {
+        frame_pool_release(pool, refs[i].buf);
+        refs[i].buf = NULL;
+    }
+}
+
+static void gop_cache_clear(PythonSession *sess)
+{
+    GopCache *gop = &sess->gop;
+    frame_refs_release(&sess->pool, gop->entries, gop->count);
+    gop->count = 0;
+    gop->bytes = 0;
+    gop->held = 0;
+    gop->complete = false;
+}
+
+static bool gop_cache_append(PythonSession *sess, FrameBuf *frame, const FrameDesc *desc)
+{
+    GopCache *gop = &sess->gop;
+    if (gop->held + frame->capacity > gop->max_bytes)
+        return false;
+    if (gop->count == gop->capacity) {
+        size_t capacity = gop->capacity ? gop->capacity * 2 : 64;
+        FrameRef *entries = realloc(gop->entries, capacity * sizeof(FrameRef));
+        if (!entries)
+            return false;
+        gop->entries = entries;
+        gop->capacity = capacity;
+    }
+    gop->entries[gop->count].buf = frame_buf_ref(frame);
+    gop->entries[gop->count].desc = *desc;
+    gop->count++;
+    gop->bytes += frame->size;
+    gop->held += frame->capacity;
+    return true;
+}
+
+// Track the current GOP, frame_mutex held. A keyframe starts a new one (with the
+// stored parameter sets in front unless it carries its own); every other frame
+// extends it until the byte cap or a loss is hit, after which the GOP stays
+// incomplete until the next keyframe.
+static void gop_cache_push(PythonSession *sess, FrameBuf *frame, const FrameDesc *desc, bool keyframe, bool self_contained)
+{
+    GopCache *gop = &sess->gop;
+    if (gop->max_bytes == 0)
+        return;
+
+    if (keyframe && (self_contained || sess->sps_pps)) {
+        gop_cache_clear(sess);
+        gop->complete = (self_contained || gop_cache_append(sess, sess->sps_pps, &sess->sps_pps_desc))
+                        && gop_cache_append(sess, frame, desc);
+        if (!gop->complete)
+            gop_cache_clear(sess);
+        return;
+    }
+
+    // A frame that follows a loss breaks the chain, the GOP no longer reaches the current picture
+    if (gop->complete && (desc->undecodable || !gop_cache_append(sess, frame, desc)))
+        gop->complete = false;
+}
+
+static ReplayEntry *replay_entry(ReplayRing *replay, size_t i)
+{
+    return &replay->entries[(replay->head + i) % replay->capacity];
+}
+
+// Arrival of the GOP starting at entry i: its keyframe's, not that of parameter sets sent earlier
+static uint64_t replay_gop_time(ReplayRing *replay, size_t i)
+{
+    if (!replay_entry(replay, i)->desc.keyframe && i + 1 < replay->count)
+        i++;
+    return replay_entry(replay, i)->desc.recv_time_ns;
+}
+
+// Copy size arena bytes starting at absolute position pos
+static void replay_read(const ReplayRing *replay, uint64_t pos, uint8_t *out, size_t size)
+{
+    size_t offset = (size_t)(pos % replay->max_bytes);
+    size_t first = size < replay->max_bytes - offset ? size : replay->max_bytes - offset;
+    memcpy(out, replay->data + offset, first);
+    memcpy(out + first, replay->data, size - first);
+}
+
+static void replay_write(ReplayRing *replay, const uint8_t *buf, size_t size)
+{
+    size_t offset = (size_t)(replay->head_pos % replay->max_bytes);
+    size_t first = size < replay->max_bytes - offset ? size : replay->max_bytes - offset;
+    memcpy(replay->data + offset, buf, first);
+    memcpy(replay->data, buf + first, size - first);
+    replay->head_pos += size;
+}
+
+// Forget the n oldest entries
+static void replay_drop_front(ReplayRing *replay, size_t n)
+{
+    for (size_t i = 0; i < n; i++) {
+        if (replay_entry(replay, 0)->gop_start)
+            replay->gops--;
+        replay->head = (replay->head + 1) % replay->capacity;
+        replay->count--;
+    }
+    replay->tail_pos = replay->count ? replay_entry(replay, 0)->pos : replay->head_pos;
+    replay->next_gop = 0;
+    for (size_t i = 1; i < replay->count; i++) {
+        if (replay_entry(replay, i)->gop_start) {
+            replay->next_gop = i;
+            break;
+        }
+    }
+}
+
+// Append a frame, dropping the oldest GOPs until it fits. Returns false if the
+// frame's own GOP had to go (or memory ran out); the ring is then empty.
+static bool replay_append(ReplayRing *replay, const uint8_t *buf, size_t size, const FrameDesc *desc, bool gop_start)
+{
+    if (size > replay->max_bytes) {
+        replay_drop_front(replay, replay->count);
+        replay->overflows++;
+        return false;
+    }
+    while (replay->head_pos + size - replay->tail_pos > replay->max_bytes) {
+        if (replay->next_gop > 0) {
+            replay_drop_front(replay, replay->next_gop);
+            replay->dropped_gops++;
+            continue;
+        }
+        // A single GOP is left: an older one makes room for a new GOP, but a
+        // GOP that outgrew the arena itself is lost with the frame
+        replay_drop_front(replay, replay->count);
+        if (!gop_start) {
+            replay->overflows++;
+            return false;
+        }
+        replay->dropped_gops++;
+    }
+    if (replay->count == replay->capacity) {
+        size_t capacity = replay->capacity ? replay->capacity * 2 : 256;
+        ReplayEntry *entries = malloc(capacity * sizeof(ReplayEntry));
+        if (!entries) {
+            replay_drop_front(replay, replay->count);
+            return false;
+        }
+        for (size_t i = 0; i < replay->count; i++)
+            entries[i] = *replay_entry(replay, i);
+        free(replay->entries);
+        replay->entries = entries;
+        replay->capacity = capacity;
+        replay->head = 0;
+    }
+
+    ReplayEntry *entry = &replay->entries[(replay->head + replay->count) % replay->capacity];
+    entry->desc = *desc;
+    entry->pos = replay->head_pos;
+    entry->gop_start = gop_start;
+    if (gop_start) {
+        if (replay->gops > 0 && replay->next_gop == 0)
+            replay->next_gop = replay->count;
+        replay->gops++;
+    }
+    replay->count++;
+    replay_write(replay, buf, size);
+    return true;
+}
+
+// Drop the oldest GOPs while the ones after them still cover max_ns
+static void replay_trim(ReplayRing *replay)
+{
+    while (replay->max_ns && replay->next_gop > 0) {
+        uint64_t newest = replay_entry(replay, replay->count - 1)->desc.recv_time_ns;
+        if (newest - replay_gop_time(replay, replay->next_gop) < replay->max_ns)
+            break;
+        replay_drop_front(replay, replay->next_gop);
+        replay->dropped_gops++;
+    }
+}
+
+// Keep a frame for instant replay, frame_mutex held. Like the GOP cache, a
+// keyframe starts a GOP (behind the stored parameter sets unless it carries
+// its own) and nothing is kept before the first one. Frames following a loss
+// are kept: a replay shows what the viewer saw.
+// Returns true if a keyframe should be requested to bound the GOP length.
+static bool replay_push(PythonSession *sess, const uint8_t *buf, size_t size, const FrameDesc *desc, bool keyframe,
+                        bool self_contained)
+{
+    ReplayRing *replay = &sess->replay;
+    if (!replay->data)
+        return false;
+
+    if (keyframe && (self_contained || sess->sps_pps)) {
+        bool ok = (self_contained
+                   || replay_append(replay, sess->sps_pps->data, sess->sps_pps->size, &sess->sps_pps_desc, true))
+                  && replay_append(replay, buf, size, desc, self_contained);
+        if (ok)
+            replay->gop_time_ns = desc->recv_time_ns;
+        else
+            replay_drop_front(replay, replay->count);
+    } else if (replay->count > 0) {
+        replay_append(replay, buf, size, desc, false);
+    }
+    replay_trim(replay);
+
+    // Remote Play sends keyframes rarely, and whole GOPs are the unit of eviction
+    uint64_t interval = replay->keyframe_interval_ns;
+    uint64_t now = desc->recv_time_ns;
+    if (!interval || now - replay->gop_time_ns < interval || now - replay->idr_time_ns < interval)
+        return false;
+    replay->idr_time_ns = now;
+    return true;
+}
+
+static void replay_free(ReplayRing *replay)
+{
+    free(replay->data);
+    free(replay->entries);
+    replay->data = NULL;
+    replay->entries = NULL;
+    replay->capacity = 0;
+    replay->head = 0;
+    replay->count = 0;
+    replay->gops = 0;
+    replay->next_gop = 0;
+    replay->tail_pos = replay->head_pos;
+}
+
+// Drop every broadcast reference, frame_mutex held
+static void broadcast_clear(PythonSession *sess)
+{
+    for (size_t i = 0; i < BROADCAST_SLOTS; i++) {
+        frame_pool_release(&sess->pool, sess->broadcast[i].buf);
+        sess->broadcast[i].buf = NULL;
+    }
+}
+
+// Ask for an IDR, coalesced: a request is only remembered while the cooldown
+// after the last one runs, later calls (request or not) send it once the window
+// has passed, and any keyframe arriving meanwhile satisfies it. Requests made
+// while one is already owed are absorbed and counted as coalesced.
+// Returns false only if sending failed.
+static bool idr_request(PythonSession *sess, bool new_request)
+{
+    chiaki_mutex_lock(&sess->frame_mutex);
+    if (new_request) {
+        if (sess->idr_wanted)
+            sess->recovery.idr_coalesced++;
+        sess->idr_wanted = true;
+    }
+    bool send = false;
+    if (sess->idr_wanted) {
+        uint64_t now = monotonic_ns();
+        uint64_t cooldown_ns = (uint64_t)sess->recovery_policy.cooldown_ms * 1000000ull;
+        if (sess->last_idr_ns == 0 || now - sess->last_idr_ns >= cooldown_ns) {
+            send = true;
+            sess->idr_wanted = false;
+            sess->last_idr_ns = now;
+            sess->recovery.idr_requests++;
+        }
+    }
+    chiaki_mutex_unlock(&sess->frame_mutex);
+
+    if (!send)
+        return true;
+    ChiakiErrorCode err = stream_connection_send_idr_request(&sess->session.stream_connection);
+    py_log(sess, err == CHIAKI_ERR_SUCCESS ? CHIAKI_LOG_VERBOSE : CHIAKI_LOG_WARNING,
+           "IDR request %s", err == CHIAKI_ERR_SUCCESS ? "sent" : "failed");
+    if (err != CHIAKI_ERR_SUCCESS) {
+        // Owed again, retried with the next frame
+        chiaki_mutex_lock(&sess->frame_mutex);
+        sess->idr_wanted = true;
+        chiaki_mutex_unlock(&sess->frame_mutex);
+    }
+    return err == CHIAKI_ERR_SUCCESS;
+}
+
+// What the video callback should do about IDRs after a frame (see recovery_update)
+#define IDR_NONE     0
+#define IDR_FLUSH    1  // Send an owed request if the cooldown allows
+#define IDR_REQUEST  2  // New request
+
+// Track loss and recovery for a frame and mark it undecodable if it follows a
+// loss without a keyframe in between, frame_mutex held.
+// Returns one of IDR_NONE/IDR_FLUSH/IDR_REQUEST.
+static int recovery_update(PythonSession *sess, FrameDesc *desc)
+{
+    RecoveryStats *rec = &sess->recovery;
+    const RecoveryPolicy *policy = &sess->recovery_policy;
+
+    bool loss = desc->frames_lost > 0 && desc->frames_lost >= policy->loss_threshold;
+    if (desc->frames_lost > 0)
+        rec->frames_lost += (uint64_t)desc->frames_lost;
+    if (loss)
+        rec->loss_events++;
+
+    if (desc->keyframe) {
+        if (rec->recovering) {
+            rec->recovering = false;
+            rec->recoveries++;
+            rec->last_recovery_ns = desc->recv_time_ns - sess->loss_time_ns;
+        }
+        // Any keyframe satisfies an owed request
+        sess->idr_wanted = false;
+        return IDR_NONE;
+    }
+
+    if (loss && !rec->recovering) {
+        rec->recovering = true;
+        sess->loss_time_ns = desc->recv_time_ns;
+    }
+    if (rec->recovering) {
+        desc->undecodable = 1;
+        rec->undecodable_frames++;
+        if (policy->auto_idr) {
+            if (loss)
+                return IDR_REQUEST;
+            // The keyframe of the last request never came, ask again once the cooldown has passed
+            uint64_t cooldown_ns = (uint64_t)policy->cooldown_ms * 1000000ull;
+            if (!sess->idr_wanted && desc->recv_time_ns - sess->last_idr_ns >= cooldown_ns)
+                return IDR_REQUEST;
+        }
+    }
+    return sess->idr_wanted ? IDR_FLUSH : IDR_NONE;
+}
+
+// Global callback for video frames
+// Chiaki sends: 1) header (SPS/PPS, small) 2) frame data (I or P frames, larger)
+static bool video_frame_cb(uint8_t *buf, size_t buf_size, int32_t frames_lost, bool frame_recovered, void *user)
+{
+    PythonSession *sess = (PythonSession *)user;
+    if (!sess || buf_size == 0)
+        return true;
+
+    // Classify every NAL in the sample before taking the lock
+    NalScan scan;
+    nal_scan(buf, buf_size, sess->hevc, &scan);
+    int nal_type = scan.first_nal_type;
+
+    FrameDesc desc = {0};
+    desc.recv_time_ns = monotonic_ns();
+    desc.size = (uint32_t)buf_size;
+    desc.frames_lost = frames_lost;
+    desc.nal_flags = scan.flags;
+    desc.keyframe = nal_scan_is_keyframe(&scan);
+    desc.recovered = frame_recovered;
+
+    chiaki_mutex_lock(&sess->frame_mutex);
+
+    if (sess->consumer_count > 0)
+        broadcast_wait_space(sess);
+
+    // After a loss nothing decodes until the next keyframe
+    int idr = recovery_update(sess, &desc);
+
+    // Store the latest frame (always). The previous one goes back to the pool
+    // unless it is still referenced as SPS/PPS or I-frame.
+    // Out of memory the frame still takes its own seq, so nothing reports an
+    // older frame under it: consumers count the gap as dropped, the GOP cache
+    // stops reaching the current picture and the copying rings keep it.
+    FrameBuf *frame = frame_pool_acquire(&sess->pool, buf_size);
+    if (frame)
+        memcpy(frame->data, buf, buf_size);
+    else
+        py_log(sess, CHIAKI_LOG_WARNING, "No memory for a %zu byte frame, dropped", buf_size);
+    frame_pool_release(&sess->pool, sess->latest_frame);
+    sess->latest_frame = frame;
+    sess->frame_seq++;  // Increment sequence for new frame detection
+    desc.seq = sess->frame_seq;
+    sess->desc_history[desc.seq % FRAME_DESC_HISTORY] = desc;
+
+    // Queue it for drain_frames as well once someone drains, so slow readers don't lose P-frames
+    if (frame_ring_push(&sess->ring, buf, buf_size, &desc) && idr == IDR_NONE)
+        idr = IDR_REQUEST;
+
+    // Hand it to the registered consumers without another copy
+    if (frame && sess->consumer_count > 0)
+        broadcast_push(sess, frame, &desc);
+
+    // Parameter sets without picture data are the codec header (chiaki sends them separately)
+    bool is_header = (scan.flags & (NAL_FLAG_SPS | NAL_FLAG_PPS | NAL_FLAG_VPS)) && !(scan.flags & NAL_FLAG_SLICE);
+
+    if (scan.flags & NAL_FLAG_SPS && scan.width > 0) {
+        sess->video_info.width = scan.width;
+        sess->video_info.height = scan.height;
+        sess->video_info.profile_idc = scan.profile_idc;
+        sess->video_info.level_idc = scan.level_idc;
+        sess->video_info.bit_depth = scan.bit_depth;
+        sess->video_info.chroma_format_idc = scan.chroma_format_idc;
+    }
+
+    // Store headers (SPS/PPS) when we see them
+    if (is_header) {
+        py_log(sess, CHIAKI_LOG_DEBUG, "Got header: NAL=%d size=%zu", nal_type, buf_size);
+        // Replace header with a reference to this frame
+        if (frame) {
+            frame_pool_release(&sess->pool, sess->sps_pps);
+            sess->sps_pps = frame_buf_ref(frame);
+            sess->sps_pps_desc = desc;
+        }
+    }
+
+    // Detect I-frames: IDR/IRAP, or H.264 pictures made only of I-slices
+    bool is_iframe = desc.keyframe;
+    bool self_contained = is_iframe && (scan.flags & NAL_FLAG_SPS) && (scan.flags & NAL_FLAG_PPS);
+
+    // Store I-frames with header for screenshots
+    bool stored_iframe = false;
+    if (is_iframe) {
+        py_log(sess, CHIAKI_LOG_DEBUG, "I-frame detected: NAL=%d size=%zu sps_pps=%zu",
+               nal_type, buf_size, sess->sps_pps ? sess->sps_pps->size : 0);
+    }
+    if (is_iframe && frame && (self_contained || (sess->sps_pps && sess->sps_pps->size > 0))) {
+        // Reference header and frame instead of copying them together
+        frame_pool_release(&sess->pool, sess->iframe_header);
+        frame_pool_release(&sess->pool, sess->iframe_body);
+        sess->iframe_header = self_contained ? NULL : frame_buf_ref(sess->sps_pps);
+        sess->iframe_body = frame_buf_ref(frame);
+        sess->iframe_seq = sess->frame_seq;
+        sess->iframe_time_ns = desc.recv_time_ns;
+        sess->have_iframe = true;
+        sess->screenshot_idr_pending = false;
+        stored_iframe = true;
+        py_log(sess, CHIAKI_LOG_DEBUG, "Stored complete I-frame: %zu bytes", iframe_size(sess));
+    }
+
+    // Keep the GOP so late joiners can decode the current picture right away
+    if (frame)
+        gop_cache_push(sess, frame, &desc, is_iframe, self_contained);
+    else
+        sess->gop.complete = false;
+
+    // And the last GOPs for instant replay
+    if (replay_push(sess, buf, buf_size, &desc, is_iframe, self_contained) && idr == IDR_NONE)
+        idr = IDR_REQUEST;
+
+    chiaki_cond_broadcast(&sess->frame_cond);
+    chiaki_mutex_unlock(&sess->frame_mutex);
+
+    notify_events(sess, stored_iframe ? (PYTHON_EVENT_FRAME | PYTHON_EVENT_IFRAME) : PYTHON_EVENT_FRAME);
+
+    py_log(sess, CHIAKI_LOG_DEBUG, "Frame %llu: size=%zu NAL=%d keyframe=%d lost=%d%s",
+           (unsigned long long)desc.seq, buf_size, nal_type, desc.keyframe, frames_lost,
+           desc.undecodable ? " undecodable" : "");
+
+    if (idr != IDR_NONE)
+        idr_request(sess, idr == IDR_REQUEST);
+    return true;
+}
+
+// Queue a lifecycle event and wake its waiters, event_mutex held.
+// A full queue loses its oldest event; the quit event is also kept separately.
+static void event_queue_push(PythonSession *sess, const PythonEvent *event)
+{
+    if (sess->event_head - sess->event_tail == EVENT_QUEUE_SLOTS)
+        sess->event_tail++;
+    sess->events[sess->event_head % EVENT_QUEUE_SLOTS] = *event;
+    sess->event_head++;
+    chiaki_cond_broadcast(&sess->event_cond);
+}
+
+// Event callback
+static void event_cb(ChiakiEvent *event, void *user)
+{
+    PythonSession *sess = (PythonSession *)user;
+    if (!sess)
+        return;
+
+    PythonEvent ev = {0};
+    ev.type = event->type;
+    ev.time_ns = monotonic_ns();
+
+    switch(event->type) {
+        case CHIAKI_EVENT_CONNECTED:
+            chiaki_mutex_lock(&sess->event_mutex);
+            sess->connected = true;
+            event_queue_push(sess, &ev);
+            chiaki_mutex_unlock(&sess->event_mutex);
+            notify_events(sess, PYTHON_EVENT_CONNECTED | PYTHON_EVENT_LIFECYCLE);
+            break;
+        case CHIAKI_EVENT_LOGIN_PIN_REQUEST:
+            ev.pin_incorrect = event->login_pin_request.pin_incorrect;
+            py_log(sess, CHIAKI_LOG_INFO, "Login PIN requested%s", ev.pin_incorrect ? " (previous PIN incorrect)" : "");
+            chiaki_mutex_lock(&sess->event_mutex);
+            event_queue_push(sess, &ev);
+            chiaki_mutex_unlock(&sess->event_mutex);
+            notify_events(sess, PYTHON_EVENT_LIFECYCLE);
+            break;
+        case CHIAKI_EVENT_QUIT:
+            ev.quit_reason = event->quit.reason;
+            snprintf(ev.reason_str, sizeof(ev.reason_str), "%s%s%s", chiaki_quit_reason_string(event->quit.reason),
+                     event->quit.reason_str ? ": " : "", event->quit.reason_str ? event->quit.reason_str : "");
+            if (event->quit.reason != CHIAKI_QUIT_REASON_STOPPED) {
+                py_log(sess, CHIAKI_LOG_ERROR, "Session quit: %s", ev.reason_str);
+                // Ask Python to dump what led up to it
+                atomic_store_explicit(&sess->log_ring.quit_dump, true, memory_order_release);
+            }
+            // Wake up anyone blocked in wait_frame/wait_iframe
+            chiaki_mutex_lock(&sess->frame_mutex);
+            sess->quit = true;
+            chiaki_cond_broadcast(&sess->frame_cond);
+            chiaki_cond_broadcast(&sess->space_cond);
+            chiaki_mutex_unlock(&sess->frame_mutex);
+            // Wake up wait_connected and next_event
+            chiaki_mutex_lock(&sess->event_mutex);
+            sess->quit_event = ev;
+            event_queue_push(sess, &ev);
+            chiaki_mutex_unlock(&sess->event_mutex);
+            notify_events(sess, PYTHON_EVENT_QUIT | PYTHON_EVENT_LIFECYCLE);
+            break;
+        default:
+            break;
+    }
+}
+
+// Simplified session creation that loads from Chiaki config.
+// log_mask: CHIAKI_LOG_* levels handed to Python through chiaki_python_session_log_drain
+CHIAKI_EXPORT PythonSession *chiaki_python_session_create_ex(
+    const char *host,
+    const char *regist_key_hex,
+    const char *rp_key_hex,
+    const uint8_t *psn_account_id,  // 8 bytes
+    bool is_ps5,
+    int resolution_preset,  // 1=360p, 2=540p, 3=720p, 4=1080p
+    int fps_preset,         // 30 or 60
+    uint32_t log_mask)
+{
+    PythonSession *sess = calloc(1, sizeof(PythonSession));
+    if (!sess)
+        return NULL;
+
+    // Initialize mutexes
+    chiaki_mutex_init(&sess->frame_mutex, false);
+    chiaki_mutex_init(&sess->drain_mutex, false);
+    chiaki_cond_init(&sess->frame_cond);
+    chiaki_cond_init(&sess->space_cond);
+    chiaki_mutex_init(&sess->event_mutex, false);
+    chiaki_cond_init(&sess->event_cond);
+    sess->gop.max_bytes = GOP_CACHE_MAX_BYTES;
+    sess->recovery_policy.auto_idr = true;
+    sess->recovery_policy.cooldown_ms = IDR_COOLDOWN_MS;
+    sess->recovery_policy.loss_threshold = 1;
+
+    // Readiness fd for select/epoll/asyncio (-1 if unavailable, waits still work)
+    sess->notify_fd = eventfd(0, EFD_NONBLOCK | EFD_CLOEXEC);
+
+    // Set up logging: messages only land in the log ring, chiaki formats
+    // just the levels Python or the flight recorder wants
+    atomic_store_explicit(&sess->log_ring.level_mask, log_mask, memory_order_relaxed);
+    chiaki_log_init(&sess->log, log_mask | LOG_RECORDER_MASK, log_cb, sess);
+
+    // Set up video profile
+    ChiakiConnectVideoProfile video_profile;
+    chiaki_connect_video_profile_preset(&video_profile, resolution_preset, fps_preset);
+
+    // Set up connect info
+    ChiakiConnectInfo connect_info = {0};
+    connect_info.ps5 = is_ps5;
+    connect_info.host = host;
+
+    // Regist key is stored as ASCII string (e.g., "d77687f8"), not hex-decoded
+    // It gets sent directly in the HTTP header
+    memset(connect_info.regist_key, 0, sizeof(connect_info.regist_key));
+    size_t regist_len = strlen(regist_key_hex);
+    if (regist_len > sizeof(connect_info.regist_key))
+        regist_len = sizeof(connect_info.regist_key);
+    memcpy(connect_info.regist_key, regist_key_hex, regist_len);
+
+    // RP key (morning field) IS hex-decoded (16 bytes from 32 hex chars)
+    size_t rp_len = strlen(rp_key_hex);
+    for (size_t i = 0; i < rp_len && i < 32; i += 2) {
+        char hex[3] = {rp_key_hex[i], rp_key_hex[i+1], 0};
+        connect_info.morning[i/2] = (uint8_t)strtol(hex, NULL, 16);
+    }
+
+    // PSN account ID
+    if (psn_account_id)
+        memcpy(connect_info.psn_account_id, psn_account_id, 8);
+
+    connect_info.video_profile = video_profile;
+    sess->hevc = video_profile.codec != CHIAKI_CODEC_H264;
+    sess->video_info.codec = video_profile.codec;
+    connect_info.video_profile_auto_downgrade = true;
+    connect_info.enable_keyboard = false;
+    connect_info.enable_dualsense = false;
+    connect_info.audio_video_disabled = 0;
+    connect_info.auto_regist = false;
+    connect_info.holepunch_session = NULL;
+    connect_info.rudp_sock = NULL;
+    connect_info.packet_loss_max = 0.0;
+    // IDRs after loss are requested by the wrapper's recovery policy, coalesced
+    // across the cooldown instead of once per FEC failure
+    connect_info.enable_idr_on_fec_failure = false;
+
+    // Initialize session
+    ChiakiErrorCode err = chiaki_session_init(&sess->session, &connect_info, &sess->log);
+    if (err != CHIAKI_ERR_SUCCESS) {
+        if (sess->notify_fd >= 0)
+            close(sess->notify_fd);
+        chiaki_cond_fini(&sess->event_cond);
+        chiaki_mutex_fini(&sess->event_mutex);
+        chiaki_cond_fini(&sess->space_cond);
+        chiaki_cond_fini(&sess->frame_cond);
+        chiaki_mutex_fini(&sess->drain_mutex);
+        chiaki_mutex_fini(&sess->frame_mutex);
+        free(sess);
+        return NULL;
+    }
+
+    // Set up callbacks
+    chiaki_session_set_event_cb(&sess->session, event_cb, sess);
+    chiaki_session_set_video_sample_cb(&sess->session, video_frame_cb, sess);
+
+    py_log(sess, CHIAKI_LOG_DEBUG, "Session created, video callback set: %p, user: %p",
+           (void *)sess->session.video_sample_cb, sess->session.video_sample_cb_user);
+
+    return sess;
+}
+
+// Session creation with the default log levels (error, warning, info)
+CHIAKI_EXPORT PythonSession *chiaki_python_session_create(
+    const char *host,
+    const char *regist_key_hex,
+    const char *rp_key_hex,
+    const uint8_t *psn_account_id,  // 8 bytes
+    bool is_ps5,
+    int resolution_preset,  // 1=360p, 2=540p, 3=720p, 4=1080p
+    int fps_preset)         // 30 or 60
+{
+    return chiaki_python_session_create_ex(host, regist_key_hex, rp_key_hex, psn_account_id,
+                                           is_ps5, resolution_preset, fps_preset, LOG_DEFAULT_MASK);
+}
+
+// Start the session
+CHIAKI_EXPORT bool chiaki_python_session_start(PythonSession *sess)
+{
+    if (!sess)
+        return false;
+
+    ChiakiErrorCode err = chiaki_session_start(&sess->session);
+    return err == CHIAKI_ERR_SUCCESS;
+}
+
+static bool connected_or_quit_pred(void *user)
+{
+    PythonSession *sess = user;
+    return sess->connected || sess->quit_event.type == CHIAKI_EVENT_QUIT || sess->events_closed;
+}
+
+// Wait for connection. Returns as soon as the session connects or quits,
+// a negative timeout_ms waits forever.
+CHIAKI_EXPORT bool chiaki_python_session_wait_connected(PythonSession *sess, int timeout_ms)
+{
+    if (!sess)
+        return false;
+
+    chiaki_mutex_lock(&sess->event_mutex);
+    if (timeout_ms < 0)
+        chiaki_cond_wait_pred(&sess->event_cond, &sess->event_mutex, connected_or_quit_pred, sess);
+    else
+        chiaki_cond_timedwait_pred(&sess->event_cond, &sess->event_mutex, (uint64_t)timeout_ms,
+                                   connected_or_quit_pred, sess);
+    bool connected = sess->connected;
+    chiaki_mutex_unlock(&sess->event_mutex);
+
+    return connected;
+}
+
+static bool event_queued_pred(void *user)
+{
+    PythonSession *sess = user;
+    return sess->event_head != sess->event_tail || sess->events_closed;
+}
+
+// Take the next lifecycle event, waiting up to timeout_ms (negative waits
+// forever, 0 polls). Returns false on timeout or after close_events.
+CHIAKI_EXPORT bool chiaki_python_session_next_event(PythonSession *sess, int timeout_ms, PythonEvent *out)
+{
+    if (!sess || !out)
+        return false;
+
+    chiaki_mutex_lock(&sess->event_mutex);
+    if (timeout_ms < 0)
+        chiaki_cond_wait_pred(&sess->event_cond, &sess->event_mutex, event_queued_pred, sess);
+    else if (timeout_ms > 0)
+        chiaki_cond_timedwait_pred(&sess->event_cond, &sess->event_mutex, (uint64_t)timeout_ms,
+                                   event_queued_pred, sess);
+    bool have = sess->event_head != sess->event_tail;
+    if (have) {
+        *out = sess->events[sess->event_tail % EVENT_QUEUE_SLOTS];
+        sess->event_tail++;
+    }
+    chiaki_mutex_unlock(&sess->event_mutex);
+
+    return have;
+}
+
+// Wake everyone blocked in next_event/wait_connected for good, e.g. before destroy
+CHIAKI_EXPORT void chiaki_python_session_close_events(PythonSession *sess)
+{
+    if (!sess)
+        return;
+    chiaki_mutex_lock(&sess->event_mutex);
+    sess->events_closed = true;
+    chiaki_cond_broadcast(&sess->event_cond);
+    chiaki_mutex_unlock(&sess->event_mutex);
+}
+
+// Get the quit event. Returns false while the session hasn't quit.
+CHIAKI_EXPORT bool chiaki_python_session_get_quit_event(PythonSession *sess, PythonEvent *out)
+{
+    if (!sess || !out)
+        return false;
+    chiaki_mutex_lock(&sess->event_mutex);
+    bool quit = sess->quit_event.type == CHIAKI_EVENT_QUIT;
+    if (quit)
+        *out = sess->quit_event;
+    chiaki_mutex_unlock(&sess->event_mutex);
+    return quit;
+}
+
+// Answer a LOGIN_PIN_REQUEST event
+CHIAKI_EXPORT bool chiaki_python_session_set_login_pin(PythonSession *sess, const char *pin)
+{
+    if (!sess || !pin)
+        return false;
+    ChiakiErrorCode err = chiaki_session_set_login_pin(&sess->session, (const uint8_t *)pin, strlen(pin));
+    return err == CHIAKI_ERR_SUCCESS;
+}
+
+// Check if connected
+CHIAKI_EXPORT bool chiaki_python_session_is_connected(PythonSession *sess)
+{
+    return sess && sess->connected;
+}
+
+// Send controller state
+CHIAKI_EXPORT bool chiaki_python_session_set_controller(
+    PythonSession *sess,
+    uint32_t buttons,        // Bitmask of buttons
+    int16_t left_x,          // -32768 to 32767
+    int16_t left_y,
+    int16_t right_x,
+    int16_t right_y,
+    uint8_t l2_state,        // 0-255
+    uint8_t r2_state)
+{
+    if (!sess || !sess->connected)
+        return false;
+
+    ChiakiControllerState state;
+    chiaki_controller_state_set_idle(&state);
+
+    state.buttons = buttons;
+    state.left_x = left_x;
+    state.left_y = left_y;
+    state.right_x = right_x;
+    state.right_y = right_y;
+    state.l2_state = l2_state;
+    state.r2_state = r2_state;
+
+    ChiakiErrorCode err = chiaki_session_set_controller_state(&sess->session, &state);
+    return err == CHIAKI_ERR_SUCCESS;
+}
+
+// Get latest video frame (returns size, writes to buffer)
+// Also returns the frame sequence number via out parameter
+CHIAKI_EXPORT size_t chiaki_python_session_get_frame_ex(
+    PythonSession *sess,
+    uint8_t *buffer,
+    size_t buffer_size,
+    uint64_t *seq_out)
+{
+    if (!sess || !buffer)
+        return 0;
+
+    chiaki_mutex_lock(&sess->frame_mutex);
+
+    size_t size = 0;
+    if (sess->latest_frame && sess->latest_frame->size <= buffer_size) {
+        memcpy(buffer, sess->latest_frame->data, sess->latest_frame->size);
+        size = sess->latest_frame->size;
+        if (seq_out)
+            *seq_out = sess->frame_seq;
+    }
+
+    chiaki_mutex_unlock(&sess->frame_mutex);
+
+    return size;
+}
+
+// Simple version without sequence number
+CHIAKI_EXPORT size_t chiaki_python_session_get_frame(
+    PythonSession *sess,
+    uint8_t *buffer,
+    size_t buffer_size)
+{
+    return chiaki_python_session_get_frame_ex(sess, buffer, buffer_size, NULL);
+}
+
+// Predicate state for the wait functions below
+typedef struct {
+    PythonSession *sess;
+    uint64_t since_seq;
+} FrameWait;
+
+static bool newer_frame_pred(void *user)
+{
+    FrameWait *wait = user;
+    return wait->sess->quit || (wait->sess->latest_frame && wait->sess->frame_seq > wait->since_seq);
+}
+
+static bool newer_iframe_pred(void *user)
+{
+    FrameWait *wait = user;
+    return wait->sess->quit || (wait->sess->have_iframe && wait->sess->iframe_seq > wait->since_seq);
+}
+
+// Wait on frame_cond (frame_mutex held) until pred holds. A negative timeout waits forever.
+static void frame_cond_wait(PythonSession *sess, int timeout_ms, ChiakiCheckPred pred, void *user)
+{
+    if (timeout_ms < 0)
+        chiaki_cond_wait_pred(&sess->frame_cond, &sess->frame_mutex, pred, user);
+    else
+        chiaki_cond_timedwait_pred(&sess->frame_cond, &sess->frame_mutex, (uint64_t)timeout_ms, pred, user);
+}
+
+// Block until a frame newer than since_seq arrives, then copy it out.
+// Nothing is copied if no newer frame shows up within timeout_ms (or the session quits),
+// a negative timeout_ms waits forever.
+// Returns the frame size, or 0 on timeout/quit/buffer too small.
+CHIAKI_EXPORT size_t chiaki_python_session_wait_frame(
+    PythonSession *sess,
+    uint64_t since_seq,
+    int timeout_ms,
+    uint8_t *buffer,
+    size_t buffer_size,
+    uint64_t *seq_out)
+{
+    if (!sess || !buffer)
+        return 0;
+
+    FrameWait wait = { sess, since_seq };
+
+    chiaki_mutex_lock(&sess->frame_mutex);
+
+    frame_cond_wait(sess, timeout_ms, newer_frame_pred, &wait);
+
+    size_t size = 0;
+    if (sess->latest_frame && sess->frame_seq > since_seq && sess->latest_frame->size <= buffer_size) {
+        memcpy(buffer, sess->latest_frame->data, sess->latest_frame->size);
+        size = sess->latest_frame->size;
+        if (seq_out)
+            *seq_out = sess->frame_seq;
+    }
+
+    chiaki_mutex_unlock(&sess->frame_mutex);
+
+    return size;
+}
+
+// Block until an I-frame newer than since_seq is stored, then copy it out.
+// Same contract as chiaki_python_session_wait_frame, seq_out receives the I-frame's sequence.
+CHIAKI_EXPORT size_t chiaki_python_session_wait_iframe(
+    PythonSession *sess,
+    uint64_t since_seq,
+    int timeout_ms,
+    uint8_t *buffer,
+    size_t buffer_size,
+    uint64_t *seq_out)
+{
+    if (!sess || !buffer)
+        return 0;
+
+    FrameWait wait = { sess, since_seq };
+
+    chiaki_mutex_lock(&sess->frame_mutex);
+
+    frame_cond_wait(sess, timeout_ms, newer_iframe_pred, &wait);
+
+    size_t size = 0;
+    if (sess->iframe_seq > since_seq)
+        size = copy_iframe(sess, buffer, buffer_size);
+    if (size > 0) {
+        if (seq_out)
+            *seq_out = sess->iframe_seq;
+    }
+
+    chiaki_mutex_unlock(&sess->frame_mutex);
+
+    return size;
+}
+
+// Block until a frame newer than since_seq arrives without copying anything.
+// Returns the current frame sequence number (== since_seq or lower on timeout/quit).
+CHIAKI_EXPORT uint64_t chiaki_python_session_wait_seq(PythonSession *sess, uint64_t since_seq, int timeout_ms)
+{
+    if (!sess)
+        return 0;
+
+    FrameWait wait = { sess, since_seq };
+
+    chiaki_mutex_lock(&sess->frame_mutex);
+    frame_cond_wait(sess, timeout_ms, newer_frame_pred, &wait);
+    uint64_t seq = sess->frame_seq;
+    chiaki_mutex_unlock(&sess->frame_mutex);
+
+    return seq;
+}
+
+// Get current frame sequence number (for detecting new frames)
+CHIAKI_EXPORT uint64_t chiaki_python_session_get_frame_seq(PythonSession *sess)
+{
+    if (!sess)
+        return 0;
+    return sess->frame_seq;
+}
+
+// Drain every frame queued since the last drain in one call.
+// Frames are copied back to back into buffer; sizes_out[i], seqs_out[i] and
+// descs_out[i] (each optional) describe frame i. Stops early when buffer or
+// max_frames is exhausted, the rest stays queued for the next call.
+// The first call only starts queueing. After an overrun the unread frames
+// before the keyframe that ended it are skipped (counted as dropped).
+// Returns the number of frames written.
+static size_t frame_ring_drain(
+    PythonSession *sess,
+    uint8_t *buffer,
+    size_t buffer_size,
+    size_t *sizes_out,
+    uint64_t *seqs_out,
+    FrameDesc *descs_out,
+    size_t max_frames)
+{
+    if (!sess || !buffer || buffer_size == 0)
+        return 0;
+
+    chiaki_mutex_lock(&sess->drain_mutex);
+
+    FrameRing *ring = &sess->ring;
+    uint64_t tail = atomic_load_explicit(&ring->tail, memory_order_relaxed);
+    uint64_t head = atomic_load_explicit(&ring->head, memory_order_acquire);
+
+    if (!atomic_load_explicit(&ring->enabled, memory_order_relaxed)) {
+        // The producer hasn't pushed anything, start it from here
+        atomic_store_explicit(&ring->enabled, true, memory_order_release);
+        chiaki_mutex_unlock(&sess->drain_mutex);
+        return 0;
+    }
+    if (atomic_exchange_explicit(&ring->overrun, false, memory_order_acq_rel)) {
+        // The frames before the keyframe that ended the overrun are stale and end in a gap
+        uint64_t resume = atomic_load_explicit(&ring->resume, memory_order_relaxed);
+        if (resume > tail) {
+            atomic_fetch_add_explicit(&ring->dropped, resume - tail, memory_order_relaxed);
+            tail = resume;
+        }
+        head = atomic_load_explicit(&ring->head, memory_order_acquire);
+    }
+
+    size_t count = 0;
+    size_t offset = 0;
+    while (tail != head && count < max_frames) {
+        FrameSlot *slot = &ring->slots[tail % FRAME_RING_SLOTS];
+        if (slot->size > buffer_size - offset) {
+            // A frame that can never fit would stall the ring, skip it
+            if (count == 0 && slot->size > buffer_size) {
+                atomic_fetch_add_explicit(&ring->dropped, 1, memory_order_relaxed);
+                tail++;
+                continue;
+            }
+            break;
+        }
+        memcpy(buffer + offset, slot->data, slot->size);
+        if (sizes_out)
+            sizes_out[count] = slot->size;
+        if (seqs_out)
+            seqs_out[count] = slot->desc.seq;
+        if (descs_out)
+            descs_out[count] = slot->desc;
+        offset += slot->size;
+        count++;
+        tail++;
+    }
+
+    // Hand the slots back to the producer
+    atomic_store_explicit(&ring->tail, tail, memory_order_release);
+
+    chiaki_mutex_unlock(&sess->drain_mutex);
+
+    return count;
+}
+
+// Drain queued frames, describing them by size and sequence number (seqs_out may be NULL)
+CHIAKI_EXPORT size_t chiaki_python_session_drain_frames(
+    PythonSession *sess,
+    uint8_t *buffer,
+    size_t buffer_size,
+    size_t *sizes_out,
+    uint64_t *seqs_out,
+    size_t max_frames)
+{
+    if (!sizes_out)
+        return 0;
+    return frame_ring_drain(sess, buffer, buffer_size, sizes_out, seqs_out, NULL, max_frames);
+}
+
+// Drain queued frames with a full FrameDesc each (descs_out[i].size is frame i's size)
+CHIAKI_EXPORT size_t chiaki_python_session_drain_frames_ex(
+    PythonSession *sess,
+    uint8_t *buffer,
+    size_t buffer_size,
+    FrameDesc *descs_out,
+    size_t max_frames)
+{
+    if (!descs_out)
+        return 0;
+    return frame_ring_drain(sess, buffer, buffer_size, NULL, NULL, descs_out, max_frames);
+}
+
+// Look up the descriptor of a recent frame by sequence number.
+// Returns false if seq hasn't arrived yet or is older than the last FRAME_DESC_HISTORY frames.
+CHIAKI_EXPORT bool chiaki_python_session_get_frame_desc(PythonSession *sess, uint64_t seq, FrameDesc *out)
+{
+    if (!sess || !out || seq == 0)
+        return false;
+
+    chiaki_mutex_lock(&sess->frame_mutex);
+    const FrameDesc *desc = &sess->desc_history[seq % FRAME_DESC_HISTORY];
+    bool found = desc->seq == seq;
+    if (found)
+        *out = *desc;
+    chiaki_mutex_unlock(&sess->frame_mutex);
+
+    return found;
+}
+
+// Copy the descriptors of all retained frames newer than since_seq, oldest first.
+// Does not touch the frame ring. Returns the number of descriptors written.
+CHIAKI_EXPORT size_t chiaki_python_session_get_frame_descs(
+    PythonSession *sess,
+    uint64_t since_seq,
+    FrameDesc *out,
+    size_t max_descs)
+{
+    if (!sess || !out)
+        return 0;
+
+    chiaki_mutex_lock(&sess->frame_mutex);
+
+    uint64_t last = sess->frame_seq;
+    uint64_t first = since_seq + 1;
+    if (last >= FRAME_DESC_HISTORY && first <= last - FRAME_DESC_HISTORY)
+        first = last - FRAME_DESC_HISTORY + 1;
+    if (last - first + 1 > max_descs && last >= first)
+        first = last - max_descs + 1;  // Keep the newest ones
+
+    size_t count = 0;
+    for (uint64_t seq = first; seq <= last && count < max_descs; seq++) {
+        const FrameDesc *desc = &sess->desc_history[seq % FRAME_DESC_HISTORY];
+        if (desc->seq == seq)
+            out[count++] = *desc;
+    }
+
+    chiaki_mutex_unlock(&sess->frame_mutex);
+
+    return count;
+}
+
+// Number of frames waiting in the ring
+CHIAKI_EXPORT size_t chiaki_python_session_pending_frames(PythonSession *sess)
+{
+    if (!sess)
+        return 0;
+    uint64_t head = atomic_load_explicit(&sess->ring.head, memory_order_acquire);
+    uint64_t tail = atomic_load_explicit(&sess->ring.tail, memory_order_acquire);
+    return (size_t)(head - tail);
+}
+
+// Number of frames lost because the ring was full (consumer too slow), or discarded after it
+CHIAKI_EXPORT uint64_t chiaki_python_session_get_dropped_frames(PythonSession *sess)
+{
+    if (!sess)
+        return 0;
+    return atomic_load_explicit(&sess->ring.dropped, memory_order_relaxed);
+}
+
+// ============================================================
+// Multi-consumer broadcast
+// ============================================================
+
+// Register a consumer that sees every frame from now on through its own cursor.
+// max_lag: unread frames tolerated before the policy applies (0 or > BROADCAST_SLOTS
+// means BROADCAST_SLOTS, ignored for BLOCK). block_timeout_ms: BLOCK only, how long
+// the video callback may wait per frame before the consumer loses its oldest frame;
+// keep it short, chiaki's receive thread is stalled meanwhile.
+// Returns the consumer id, or -1 if the policy is invalid or all slots are taken.
+CHIAKI_EXPORT int chiaki_python_session_add_consumer(
+    PythonSession *sess,
+    int policy,
+    uint32_t max_lag,
+    int block_timeout_ms)
+{
+    if (!sess || policy < CONSUMER_POLICY_BLOCK || policy > CONSUMER_POLICY_SKIP_TO_KEYFRAME)
+        return -1;
+
+    chiaki_mutex_lock(&sess->frame_mutex);
+
+    int id = -1;
+    for (int i = 0; i < MAX_CONSUMERS; i++) {
+        if (!sess->consumers[i].active) {
+            id = i;
+            break;
+        }
+    }
+    if (id >= 0) {
+        FrameConsumer *c = &sess->consumers[id];
+        memset(c, 0, sizeof(*c));
+        c->active = true;
+        c->policy = policy;
+        c->max_lag = (max_lag == 0 || max_lag > BROADCAST_SLOTS) ? BROADCAST_SLOTS : max_lag;
+        c->block_timeout_ms = block_timeout_ms;
+        c->next_seq = sess->frame_seq + 1;
+        sess->consumer_count++;
+    }
+
+    chiaki_mutex_unlock(&sess->frame_mutex);
+
+    return id;
+}
+
+// Unregister a consumer. The last one releases the retained frames.
+CHIAKI_EXPORT void chiaki_python_session_remove_consumer(PythonSession *sess, int id)
+{
+    if (!sess || id < 0 || id >= MAX_CONSUMERS)
+        return;
+
+    chiaki_mutex_lock(&sess->frame_mutex);
+    FrameConsumer *c = &sess->consumers[id];
+    if (c->active) {
+        c->active = false;
+        frame_refs_release(&sess->pool, c->preroll, c->preroll_count);
+        free(c->preroll);
+        c->preroll = NULL;
+        c->preroll_count = 0;
+        if (--sess->consumer_count == 0)
+            broadcast_clear(sess);
+        // A blocked producer or reader may be waiting on this consumer
+        chiaki_cond_broadcast(&sess->space_cond);
+        chiaki_cond_broadcast(&sess->frame_cond);
+    }
+    chiaki_mutex_unlock(&sess->frame_mutex);
+}
+
+static bool consumer_readable_pred(void *user)
+{
+    ConsumerWait *wait = user;
+    FrameConsumer *c = wait->consumer;
+    return wait->sess->quit || !c->active || c->preroll_pos < c->preroll_count || c->next_seq <= wait->sess->frame_seq;
+}
+
+// Read every frame the consumer hasn't seen yet, waiting up to timeout_ms for the
+// first one (negative waits forever, 0 polls). Frames are copied back to back into
+// buffer with descs_out[i] describing frame i. The copy happens outside the lock on
+// referenced buffers, so a slow reader never holds up the video callback.
+// Stops at max_frames or when the next frame doesn't fit; a frame larger than the
+// whole buffer is left in place (grow to chiaki_python_session_get_max_frame_size).
+// Returns the number of frames written.
+CHIAKI_EXPORT size_t chiaki_python_session_consumer_read(
+    PythonSession *sess,
+    int id,
+    int timeout_ms,
     uint8_t *buffer,
-    size_t buffer_size)
+    size_t buffer_size,
+    FrameDesc *descs_out,
+    size_t max_frames)
 {
-    return chiaki_python_session_get_frame_ex(sess, buffer, buffer_size, NULL);
+    if (!sess || id < 0 || id >= MAX_CONSUMERS || !buffer || !descs_out)
+        return 0;
+    if (max_frames > BROADCAST_SLOTS)
+        max_frames = BROADCAST_SLOTS;
+
+    FrameBuf *bufs[BROADCAST_SLOTS];
+    FrameConsumer *c = &sess->consumers[id];
+    ConsumerWait wait = { sess, c };
+
+    chiaki_mutex_lock(&sess->frame_mutex);
+
+    if (!c->active) {
+        chiaki_mutex_unlock(&sess->frame_mutex);
+        return 0;
+    }
+    frame_cond_wait(sess, timeout_ms, consumer_readable_pred, &wait);
+
+    size_t count = 0;
+    size_t offset = 0;
+    // GOP frames from consumer_join_gop come first
+    while (c->active && c->preroll_pos < c->preroll_count && count < max_frames) {
+        FrameRef *ref = &c->preroll[c->preroll_pos];
+        if (ref->buf->size > buffer_size - offset)
+            break;
+        bufs[count] = ref->buf;  // Hand over the preroll's reference
+        ref->buf = NULL;
+        descs_out[count] = ref->desc;
+        offset += bufs[count]->size;
+        count++;
+        c->preroll_pos++;
+    }
+    if (c->preroll && c->preroll_pos == c->preroll_count) {
+        free(c->preroll);
+        c->preroll = NULL;
+        c->preroll_count = 0;
+        c->preroll_pos = 0;
+    }
+    while (c->active && !c->preroll && c->next_seq <= sess->frame_seq && count < max_frames) {
+        FrameRef *slot = &sess->broadcast[c->next_seq % BROADCAST_SLOTS];
+        if (!slot->buf || slot->desc.seq != c->next_seq) {
+            // Never stored (allocation failure), nothing to hand out
+            c->dropped++;
+            c->next_seq++;
+            continue;
+        }
+        if (c->resync) {
+            if (!slot->desc.keyframe) {
+                c->dropped++;
+                c->next_seq++;
+                continue;
+            }
+            c->resync = false;
+        }
+        if (slot->buf->size > buffer_size - offset)
+            break;
+        bufs[count] = frame_buf_ref(slot->buf);
+        descs_out[count] = slot->desc;
+        offset += slot->buf->size;
+        count++;
+        c->next_seq++;
+    }
+    c->delivered += count;
+    if (count > 0)
+        chiaki_cond_broadcast(&sess->space_cond);
+
+    chiaki_mutex_unlock(&sess->frame_mutex);
+
+    offset = 0;
+    for (size_t i = 0; i < count; i++) {
+        memcpy(buffer + offset, bufs[i]->data, bufs[i]->size);
+        offset += bufs[i]->size;
+    }
+
+    if (count > 0) {
+        chiaki_mutex_lock(&sess->frame_mutex);
+        for (size_t i = 0; i < count; i++)
+            frame_pool_release(&sess->pool, bufs[i]);
+        chiaki_mutex_unlock(&sess->frame_mutex);
+    }
+
+    return count;
 }
 
-// Get current frame sequence number (for detecting new frames)
-CHIAKI_EXPORT uint64_t chiaki_python_session_get_frame_seq(PythonSession *sess)
+// Let a freshly added consumer start with the cached GOP: its next reads return
+// the parameter sets, the last keyframe and every frame since, then continue with
+// live frames, so it can decode the current picture without an IDR request.
+// Returns the number of GOP frames queued, 0 if there is no complete GOP.
+CHIAKI_EXPORT size_t chiaki_python_session_consumer_join_gop(PythonSession *sess, int id)
+{
+    if (!sess || id < 0 || id >= MAX_CONSUMERS)
+        return 0;
+
+    chiaki_mutex_lock(&sess->frame_mutex);
+
+    FrameConsumer *c = &sess->consumers[id];
+    GopCache *gop = &sess->gop;
+    size_t count = 0;
+    if (c->active && !c->preroll && gop->complete && gop->count > 0
+        && gop->entries[gop->count - 1].desc.seq == sess->frame_seq) {
+        c->preroll = malloc(gop->count * sizeof(FrameRef));
+        if (c->preroll) {
+            for (size_t i = 0; i < gop->count; i++) {
+                c->preroll[i].buf = frame_buf_ref(gop->entries[i].buf);
+                c->preroll[i].desc = gop->entries[i].desc;
+            }
+            count = c->preroll_count = gop->count;
+            c->preroll_pos = 0;
+            // Live frames continue right after the GOP
+            c->next_seq = sess->frame_seq + 1;
+            c->resync = false;
+        }
+    }
+
+    chiaki_mutex_unlock(&sess->frame_mutex);
+
+    return count;
+}
+
+// Get a consumer's counters. Returns false if id is not a registered consumer.
+CHIAKI_EXPORT bool chiaki_python_session_get_consumer_stats(PythonSession *sess, int id, ConsumerStats *out)
+{
+    if (!sess || id < 0 || id >= MAX_CONSUMERS || !out)
+        return false;
+
+    chiaki_mutex_lock(&sess->frame_mutex);
+    FrameConsumer *c = &sess->consumers[id];
+    bool active = c->active;
+    if (active) {
+        out->delivered = c->delivered;
+        out->dropped = c->dropped;
+        out->lag = sess->frame_seq + 1 - c->next_seq;
+        out->peak_lag = c->peak_lag;
+        out->blocked_ns = c->blocked_ns;
+        out->policy = c->policy;
+        out->resync = c->resync;
+    }
+    chiaki_mutex_unlock(&sess->frame_mutex);
+
+    return active;
+}
+
+// ============================================================
+// GOP cache
+// ============================================================
+
+// Set the GOP cache's byte cap. 0 disables the cache and frees it.
+CHIAKI_EXPORT void chiaki_python_session_set_gop_cache_limit(PythonSession *sess, size_t max_bytes)
+{
+    if (!sess)
+        return;
+    chiaki_mutex_lock(&sess->frame_mutex);
+    sess->gop.max_bytes = max_bytes;
+    if (sess->gop.held > max_bytes)
+        gop_cache_clear(sess);  // Refilled from the next keyframe
+    chiaki_mutex_unlock(&sess->frame_mutex);
+}
+
+// Sequence number of the GOP's keyframe, 0 without one. Caller holds frame_mutex.
+static uint64_t gop_keyframe_seq(const GopCache *gop)
+{
+    // A separate parameter set entry may precede the keyframe
+    for (size_t i = 0; i < gop->count; i++) {
+        if (gop->entries[i].desc.keyframe)
+            return gop->entries[i].desc.seq;
+    }
+    return 0;
+}
+
+// Describe the cached GOP. Returns false if there is none.
+CHIAKI_EXPORT bool chiaki_python_session_get_gop_info(PythonSession *sess, GopInfo *out)
+{
+    if (!sess || !out)
+        return false;
+
+    chiaki_mutex_lock(&sess->frame_mutex);
+    GopCache *gop = &sess->gop;
+    memset(out, 0, sizeof(*out));
+    bool have = gop->count > 0;
+    if (have) {
+        out->keyframe_seq = gop_keyframe_seq(gop);
+        out->last_seq = gop->entries[gop->count - 1].desc.seq;
+        out->bytes = gop->bytes;
+        out->frame_count = (uint32_t)gop->count;
+        out->complete = gop->complete;
+    }
+    chiaki_mutex_unlock(&sess->frame_mutex);
+
+    return have;
+}
+
+// Copy the GOP entries newer than after_seq, see chiaki_python_session_get_gop_tail
+static size_t gop_copy(
+    PythonSession *sess,
+    uint64_t keyframe_seq,
+    uint64_t after_seq,
+    uint8_t *buffer,
+    size_t buffer_size,
+    FrameDesc *descs_out,
+    size_t max_frames)
+{
+    chiaki_mutex_lock(&sess->frame_mutex);
+    GopCache *gop = &sess->gop;
+    size_t first = 0;
+    size_t bytes = gop->bytes;
+    if (keyframe_seq && gop_keyframe_seq(gop) != keyframe_seq) {
+        first = gop->count;  // Replaced by a newer GOP
+    } else {
+        while (first < gop->count && gop->entries[first].desc.seq <= after_seq)
+            bytes -= gop->entries[first++].buf->size;
+    }
+    size_t count = gop->count - first;
+    FrameBuf **bufs = NULL;
+    if (count > 0 && count <= max_frames && bytes <= buffer_size)
+        bufs = malloc(count * sizeof(FrameBuf *));
+    if (bufs) {
+        for (size_t i = 0; i < count; i++) {
+            bufs[i] = frame_buf_ref(gop->entries[first + i].buf);
+            descs_out[i] = gop->entries[first + i].desc;
+        }
+    }
+    chiaki_mutex_unlock(&sess->frame_mutex);
+
+    if (!bufs)
+        return 0;
+
+    size_t offset = 0;
+    for (size_t i = 0; i < count; i++) {
+        memcpy(buffer + offset, bufs[i]->data, bufs[i]->size);
+        offset += bufs[i]->size;
+    }
+
+    chiaki_mutex_lock(&sess->frame_mutex);
+    for (size_t i = 0; i < count; i++)
+        frame_pool_release(&sess->pool, bufs[i]);
+    chiaki_mutex_unlock(&sess->frame_mutex);
+    free(bufs);
+
+    return count;
+}
+
+// Copy the cached GOP, decodable on its own from the first frame, back to back
+// into buffer with descs_out[i] describing frame i. All or nothing: returns 0 if
+// there is no GOP or it needs more than buffer_size bytes / max_frames entries
+// (see chiaki_python_session_get_gop_info). The copy happens outside the lock.
+// Returns the number of frames written.
+CHIAKI_EXPORT size_t chiaki_python_session_get_gop(
+    PythonSession *sess,
+    uint8_t *buffer,
+    size_t buffer_size,
+    FrameDesc *descs_out,
+    size_t max_frames)
+{
+    if (!sess || !buffer || !descs_out)
+        return 0;
+    return gop_copy(sess, 0, 0, buffer, buffer_size, descs_out, max_frames);
+}
+
+// Like chiaki_python_session_get_gop, but only the frames newer than after_seq,
+// so a decoder that already consumed part of the GOP can catch up with the rest.
+// Returns 0 (nothing copied) if the cached GOP no longer starts at keyframe_seq.
+CHIAKI_EXPORT size_t chiaki_python_session_get_gop_tail(
+    PythonSession *sess,
+    uint64_t keyframe_seq,
+    uint64_t after_seq,
+    uint8_t *buffer,
+    size_t buffer_size,
+    FrameDesc *descs_out,
+    size_t max_frames)
+{
+    if (!sess || !buffer || !descs_out)
+        return 0;
+    return gop_copy(sess, keyframe_seq, after_seq, buffer, buffer_size, descs_out, max_frames);
+}
+
+// ============================================================
+// Instant replay
+// ============================================================
+
+// Configure the replay ring: max_bytes of arena (0 disables it and frees the
+// memory), GOPs older than max_ms are dropped once newer ones cover that span,
+// and a keyframe is requested whenever the newest GOP is keyframe_interval_ms
+// old (0 = only the console's own keyframes). A new arena size starts over
+// with the cached GOP. Returns false if the arena couldn't be allocated.
+CHIAKI_EXPORT bool chiaki_python_session_set_replay(
+    PythonSession *sess,
+    size_t max_bytes,
+    uint32_t max_ms,
+    uint32_t keyframe_interval_ms)
 {
     if (!sess)
+        return false;
+
+    bool ok = true;
+    chiaki_mutex_lock(&sess->frame_mutex);
+    ReplayRing *replay = &sess->replay;
+    replay->max_ns = (uint64_t)max_ms * 1000000ull;
+    replay->keyframe_interval_ns = (uint64_t)keyframe_interval_ms * 1000000ull;
+    if (max_bytes != replay->max_bytes || !replay->data) {
+        replay_free(replay);
+        replay->max_bytes = max_bytes;
+        if (max_bytes > 0 && !(replay->data = malloc(max_bytes))) {
+            replay->max_bytes = 0;
+            ok = false;
+        }
+        // Start with the cached GOP instead of waiting for the next keyframe
+        GopCache *gop = &sess->gop;
+        if (replay->data && gop->complete) {
+            for (size_t i = 0; i < gop->count; i++) {
+                if (!replay_append(replay, gop->entries[i].buf->data, gop->entries[i].buf->size,
+                                   &gop->entries[i].desc, i == 0)) {
+                    replay_drop_front(replay, replay->count);
+                    break;
+                }
+            }
+            if (replay->count > 0)
+                replay->gop_time_ns = replay_gop_time(replay, 0);
+        }
+    }
+    if (replay->data)
+        replay_trim(replay);
+    chiaki_mutex_unlock(&sess->frame_mutex);
+
+    return ok;
+}
+
+// Describe the replay ring. Returns false if it holds nothing.
+CHIAKI_EXPORT bool chiaki_python_session_get_replay_info(PythonSession *sess, ReplayInfo *out)
+{
+    if (!sess || !out)
+        return false;
+
+    chiaki_mutex_lock(&sess->frame_mutex);
+    ReplayRing *replay = &sess->replay;
+    memset(out, 0, sizeof(*out));
+    out->dropped_gops = replay->dropped_gops;
+    out->overflows = replay->overflows;
+    bool have = replay->count > 0;
+    if (have) {
+        out->first_seq = replay_entry(replay, 0)->desc.seq;
+        out->last_seq = replay_entry(replay, replay->count - 1)->desc.seq;
+        out->start_time_ns = replay_gop_time(replay, 0);
+        out->end_time_ns = replay_entry(replay, replay->count - 1)->desc.recv_time_ns;
+        out->bytes = replay->head_pos - replay->tail_pos;
+        out->frame_count = (uint32_t)replay->count;
+        out->gop_count = (uint32_t)replay->gops;
+    }
+    chiaki_mutex_unlock(&sess->frame_mutex);
+
+    return have;
+}
+
+// Copy the replay ring's newest GOPs back to back into buffer, descs_out[i]
+// describing frame i: the fewest whole GOPs spanning at least max_ms (0 = all
+// of them), so the copy decodes from its first frame. All or nothing: returns
+// 0 if the ring is empty or the copy needs more than buffer_size bytes /
+// max_frames entries (see chiaki_python_session_get_replay_info). The bytes
+// are copied in REPLAY_COPY_CHUNK pieces, so the video callback never waits
+// for more than one piece. Returns the number of frames written.
+CHIAKI_EXPORT size_t chiaki_python_session_get_replay(
+    PythonSession *sess,
+    uint32_t max_ms,
+    uint8_t *buffer,
+    size_t buffer_size,
+    FrameDesc *descs_out,
+    size_t max_frames)
+{
+    if (!sess || !buffer || !descs_out)
         return 0;
-    return sess->frame_seq;
+
+    chiaki_mutex_lock(&sess->frame_mutex);
+    ReplayRing *replay = &sess->replay;
+    size_t first = 0;
+    if (max_ms && replay->count > 0) {
+        uint64_t max_ns = (uint64_t)max_ms * 1000000ull;
+        uint64_t newest = replay_entry(replay, replay->count - 1)->desc.recv_time_ns;
+        for (size_t i = replay->count; i-- > 1;) {
+            if (replay_entry(replay, i)->gop_start && newest - replay_gop_time(replay, i) >= max_ns) {
+                first = i;
+                break;
+            }
+        }
+    }
+    size_t count = replay->count - first;
+    uint64_t start = count ? replay_entry(replay, first)->pos : 0;
+    uint64_t end = replay->head_pos;
+    bool fits = count > 0 && count <= max_frames && end - start <= buffer_size;
+    if (fits) {
+        for (size_t i = 0; i < count; i++)
+            descs_out[i] = replay_entry(replay, first + i)->desc;
+    }
+    chiaki_mutex_unlock(&sess->frame_mutex);
+    if (!fits)
+        return 0;
+
+    for (uint64_t pos = start; pos < end && count; pos += REPLAY_COPY_CHUNK) {
+        size_t size = end - pos < REPLAY_COPY_CHUNK ? (size_t)(end - pos) : REPLAY_COPY_CHUNK;
+        chiaki_mutex_lock(&sess->frame_mutex);
+        // Dropped meanwhile (the ring outran the copy, or was reconfigured)
+        if (!replay->data || pos < replay->tail_pos)
+            count = 0;
+        else
+            replay_read(replay, pos, buffer + (pos - start), size);
+        chiaki_mutex_unlock(&sess->frame_mutex);
+    }
+    return count;
 }
 
 // Get a complete I-frame (keyframe) for screenshots
@@ -368,10 +2625,134 @@ CHIAKI_EXPORT size_t chiaki_python_session_get_iframe(
 
     chiaki_mutex_lock(&sess->frame_mutex);
 
-    size_t size = 0;
-    if (sess->have_iframe && sess->iframe && sess->iframe_size <= buffer_size) {
-        memcpy(buffer, sess->iframe, sess->iframe_size);
-        size = sess->iframe_size;
+    size_t size = copy_iframe(sess, buffer, buffer_size);
+
+    chiaki_mutex_unlock(&sess->frame_mutex);
+
+    return size;
+}
+
+// Largest buffer any frame or I-frame seen so far needs.
+// Frames are not capped at MAX_FRAME_SIZE, callers grow their buffer to this.
+CHIAKI_EXPORT size_t chiaki_python_session_get_max_frame_size(PythonSession *sess)
+{
+    if (!sess)
+        return 0;
+    chiaki_mutex_lock(&sess->frame_mutex);
+    size_t size = sess->pool.max_size;
+    if (sess->sps_pps)
+        size += sess->sps_pps->size;
+    chiaki_mutex_unlock(&sess->frame_mutex);
+    return size;
+}
+
+// Get the stream parameters parsed from the last SPS.
+// Returns false until an SPS has been seen (width/height are 0 then).
+CHIAKI_EXPORT bool chiaki_python_session_get_video_info(PythonSession *sess, PythonVideoInfo *out)
+{
+    if (!sess || !out)
+        return false;
+    chiaki_mutex_lock(&sess->frame_mutex);
+    *out = sess->video_info;
+    chiaki_mutex_unlock(&sess->frame_mutex);
+    return out->width > 0;
+}
+
+// Check if an I-frame is available
+CHIAKI_EXPORT bool chiaki_python_session_has_iframe(PythonSession *sess)
+{
+    if (!sess)
+        return false;
+    return sess->have_iframe;
+}
+
+// Clear the current I-frame to wait for a fresh one
+CHIAKI_EXPORT void chiaki_python_session_clear_iframe(PythonSession *sess)
+{
+    if (!sess)
+        return;
+    chiaki_mutex_lock(&sess->frame_mutex);
+    sess->have_iframe = false;
+    chiaki_mutex_unlock(&sess->frame_mutex);
+}
+
+// Request a fresh IDR frame from the PS4
+// Requests are coalesced with the recovery policy's cooldown (see idr_request),
+// so a burst of callers costs the console a single IDR.
+// The stored I-frame is left in place for concurrent readers, wait for the new
+// one with chiaki_python_session_wait_iframe(frame_seq before the request).
+CHIAKI_EXPORT bool chiaki_python_session_request_idr(PythonSession *sess)
+{
+    if (!sess || !sess->connected)
+        return false;
+
+    return idr_request(sess, true);
+}
+
+// Keyframe for a screenshot that is at most max_age_ms old.
+// The stored I-frame is returned right away if it is fresh enough. Otherwise one
+// IDR is requested and every concurrent caller waits for that same keyframe (up
+// to timeout_ms, negative waits forever) instead of firing its own request.
+// seq_out and age_ns_out (optional) receive the keyframe's sequence number and
+// how long ago it was received.
+// Returns the keyframe size, or 0 on timeout/quit/buffer too small.
+CHIAKI_EXPORT size_t chiaki_python_session_screenshot(
+    PythonSession *sess,
+    uint32_t max_age_ms,
+    int timeout_ms,
+    uint8_t *buffer,
+    size_t buffer_size,
+    uint64_t *seq_out,
+    uint64_t *age_ns_out)
+{
+    if (!sess || !buffer)
+        return 0;
+
+    uint64_t max_age_ns = (uint64_t)max_age_ms * 1000000ull;
+
+    chiaki_mutex_lock(&sess->frame_mutex);
+    sess->screenshot_stats.requests++;
+
+    bool fresh = sess->have_iframe && monotonic_ns() - sess->iframe_time_ns <= max_age_ns;
+    bool send_idr = false;
+    if (fresh) {
+        sess->screenshot_stats.cache_hits++;
+    } else if (sess->screenshot_idr_pending) {
+        sess->screenshot_stats.shared_waits++;
+    } else {
+        sess->screenshot_idr_pending = true;
+        sess->screenshot_stats.idr_requests++;
+        send_idr = true;
+    }
+    FrameWait wait = { sess, sess->iframe_seq };
+    chiaki_mutex_unlock(&sess->frame_mutex);
+
+    if (send_idr && !(sess->connected && idr_request(sess, true))) {
+        chiaki_mutex_lock(&sess->frame_mutex);
+        sess->screenshot_idr_pending = false;
+        chiaki_mutex_unlock(&sess->frame_mutex);
+        return 0;
+    }
+
+    chiaki_mutex_lock(&sess->frame_mutex);
+
+    if (!fresh) {
+        frame_cond_wait(sess, timeout_ms, newer_iframe_pred, &wait);
+        fresh = sess->have_iframe && sess->iframe_seq > wait.since_seq;
+        if (!fresh) {
+            sess->screenshot_stats.timeouts++;
+            // Let the next caller ask again
+            if (send_idr)
+                sess->screenshot_idr_pending = false;
+        }
+    }
+
+    size_t size = fresh ? copy_iframe(sess, buffer, buffer_size) : 0;
+    if (size > 0) {
+        if (seq_out)
+            *seq_out = sess->iframe_seq;
+        if (age_ns_out)
+            *age_ns_out = monotonic_ns() - sess->iframe_time_ns;
     }
 
     chiaki_mutex_unlock(&sess->frame_mutex);
@@ -379,43 +2760,160 @@ CHIAKI_EXPORT size_t chiaki_python_session_get_iframe(
     return size;
 }
 
-// Check if an I-frame is available
-CHIAKI_EXPORT bool chiaki_python_session_has_iframe(PythonSession *sess)
+CHIAKI_EXPORT bool chiaki_python_session_get_screenshot_stats(PythonSession *sess, ScreenshotStats *out)
 {
-    if (!sess)
+    if (!sess || !out)
         return false;
-    return sess->have_iframe;
+    chiaki_mutex_lock(&sess->frame_mutex);
+    *out = sess->screenshot_stats;
+    chiaki_mutex_unlock(&sess->frame_mutex);
+    return true;
 }
 
-// Clear the current I-frame to wait for a fresh one
-CHIAKI_EXPORT void chiaki_python_session_clear_iframe(PythonSession *sess)
+// Replace the loss recovery policy (takes effect with the next frame)
+CHIAKI_EXPORT void chiaki_python_session_set_recovery_policy(PythonSession *sess, const RecoveryPolicy *policy)
 {
-    if (!sess)
+    if (!sess || !policy)
         return;
     chiaki_mutex_lock(&sess->frame_mutex);
-    sess->have_iframe = false;
+    sess->recovery_policy = *policy;
     chiaki_mutex_unlock(&sess->frame_mutex);
 }
 
-// Request a fresh IDR frame from the PS4
-#include <chiaki/streamconnection.h>
-
-CHIAKI_EXPORT bool chiaki_python_session_request_idr(PythonSession *sess)
+CHIAKI_EXPORT bool chiaki_python_session_get_recovery_policy(PythonSession *sess, RecoveryPolicy *out)
 {
-    if (!sess || !sess->connected)
+    if (!sess || !out)
         return false;
+    chiaki_mutex_lock(&sess->frame_mutex);
+    *out = sess->recovery_policy;
+    chiaki_mutex_unlock(&sess->frame_mutex);
+    return true;
+}
 
-    // Clear current iframe and request new one
+// Get the loss/recovery counters
+CHIAKI_EXPORT bool chiaki_python_session_get_recovery_stats(PythonSession *sess, RecoveryStats *out)
+{
+    if (!sess || !out)
+        return false;
     chiaki_mutex_lock(&sess->frame_mutex);
-    sess->have_iframe = false;
+    *out = sess->recovery;
     chiaki_mutex_unlock(&sess->frame_mutex);
+    return true;
+}
 
-    ChiakiErrorCode err = stream_connection_send_idr_request(&sess->session.stream_connection);
-    if (err == CHIAKI_ERR_SUCCESS) {
-        fprintf(stderr, "[PY_WRAPPER] Requested IDR frame\n");
-        fflush(stderr);
+// ============================================================
+// Logging
+// ============================================================
+
+// Change the levels handed to Python. Levels outside the mask given at creation
+// (plus the flight recorder's) are not produced at all.
+CHIAKI_EXPORT void chiaki_python_session_set_log_mask(PythonSession *sess, uint32_t level_mask)
+{
+    if (!sess)
+        return;
+    atomic_store_explicit(&sess->log_ring.level_mask, level_mask, memory_order_relaxed);
+}
+
+// Copy one complete slot, false if it is still being written or was overwritten
+static bool log_ring_read(LogRing *ring, uint64_t seq, LogEntry *out, bool *pending)
+{
+    LogSlot *slot = &ring->slots[seq % LOG_RING_SLOTS];
+    uint64_t state = atomic_load_explicit(&slot->state, memory_order_acquire);
+    *pending = state < 2 * seq + 2;
+    if (state != 2 * seq + 2)
+        return false;
+    memcpy(out, &slot->entry, sizeof(*out));
+    atomic_thread_fence(memory_order_acquire);
+    return atomic_load_explicit(&slot->state, memory_order_relaxed) == state;
+}
+
+// Move the messages logged since the last drain into out, oldest first,
+// keeping only the levels in the Python mask. Single consumer.
+// dropped_out (optional) receives the messages lost so far because the ring
+// overran; quit_dump_out (optional) is set once after the session quit on an
+// error, see chiaki_python_session_log_dump.
+// Returns the number of entries written.
+CHIAKI_EXPORT size_t chiaki_python_session_log_drain(
+    PythonSession *sess,
+    LogEntry *out,
+    size_t max_entries,
+    uint64_t *dropped_out,
+    bool *quit_dump_out)
+{
+    if (!sess || !out)
+        return 0;
+
+    LogRing *ring = &sess->log_ring;
+    uint32_t mask = atomic_load_explicit(&ring->level_mask, memory_order_relaxed);
+    uint64_t head = atomic_load_explicit(&ring->head, memory_order_acquire);
+    if (head - ring->tail > LOG_RING_SLOTS) {
+        ring->dropped += head - LOG_RING_SLOTS - ring->tail;
+        ring->tail = head - LOG_RING_SLOTS;
     }
-    return err == CHIAKI_ERR_SUCCESS;
+
+    size_t count = 0;
+    while (ring->tail < head && count < max_entries) {
+        bool pending;
+        if (log_ring_read(ring, ring->tail, &out[count], &pending)) {
+            if (out[count].level & mask)
+                count++;
+        } else if (pending) {
+            break;  // A producer is still writing it, pick it up next time
+        } else {
+            ring->dropped++;
+        }
+        ring->tail++;
+    }
+
+    if (dropped_out)
+        *dropped_out = ring->dropped;
+    if (quit_dump_out)
+        *quit_dump_out = atomic_exchange_explicit(&ring->quit_dump, false, memory_order_acq_rel);
+    return count;
+}
+
+// Flight recorder: copy the most recent messages of every recorded level,
+// drained or not, oldest first. Returns the number of entries written.
+CHIAKI_EXPORT size_t chiaki_python_session_log_dump(PythonSession *sess, LogEntry *out, size_t max_entries)
+{
+    if (!sess || !out)
+        return 0;
+
+    LogRing *ring = &sess->log_ring;
+    uint64_t head = atomic_load_explicit(&ring->head, memory_order_acquire);
+    uint64_t span = max_entries < LOG_RING_SLOTS ? max_entries : LOG_RING_SLOTS;
+    uint64_t seq = head > span ? head - span : 0;
+
+    size_t count = 0;
+    for (; seq < head && count < max_entries; seq++) {
+        bool pending;
+        if (log_ring_read(ring, seq, &out[count], &pending))
+            count++;
+    }
+    return count;
+}
+
+// Pollable fd that becomes readable when frames or session events are pending.
+// Register it with select/epoll/asyncio and call ack_events once it fires.
+CHIAKI_EXPORT int chiaki_python_session_get_fd(PythonSession *sess)
+{
+    if (!sess)
+        return -1;
+    return sess->notify_fd;
+}
+
+// Clear the fd's readiness and return the PYTHON_EVENT_* bits that were pending.
+// The fd is reset before the bits are taken, so an event racing with the ack
+// either shows up in the result or re-arms the fd, it is never lost.
+CHIAKI_EXPORT uint32_t chiaki_python_session_ack_events(PythonSession *sess)
+{
+    if (!sess)
+        return 0;
+    if (sess->notify_fd >= 0) {
+        eventfd_t value;
+        eventfd_read(sess->notify_fd, &value);
+    }
+    return atomic_exchange_explicit(&sess->pending_events, 0, memory_order_acq_rel);
 }
 
 // Stop session
@@ -437,18 +2935,937 @@ CHIAKI_EXPORT void chiaki_python_session_destroy(PythonSession *sess)
     chiaki_session_fini(&sess->session);
 
     chiaki_mutex_lock(&sess->frame_mutex);
-    if (sess->latest_frame)
-        free(sess->latest_frame);
-    if (sess->sps_pps)
-        free(sess->sps_pps);
-    if (sess->iframe)
-        free(sess->iframe);
+    frame_pool_release(&sess->pool, sess->latest_frame);
+    frame_pool_release(&sess->pool, sess->sps_pps);
+    frame_pool_release(&sess->pool, sess->iframe_header);
+    frame_pool_release(&sess->pool, sess->iframe_body);
+    broadcast_clear(sess);
+    for (int i = 0; i < MAX_CONSUMERS; i++) {
+        frame_refs_release(&sess->pool, sess->consumers[i].preroll, sess->consumers[i].preroll_count);
+        free(sess->consumers[i].preroll);
+    }
+    gop_cache_clear(sess);
+    free(sess->gop.entries);
+    replay_free(&sess->replay);
+    frame_pool_fini(&sess->pool);
     chiaki_mutex_unlock(&sess->frame_mutex);
 
+    frame_ring_fini(&sess->ring);
+
+    if (sess->notify_fd >= 0)
+        close(sess->notify_fd);
+
+    chiaki_cond_fini(&sess->event_cond);
+    chiaki_mutex_fini(&sess->event_mutex);
+    chiaki_cond_fini(&sess->space_cond);
+    chiaki_cond_fini(&sess->frame_cond);
+    chiaki_mutex_fini(&sess->drain_mutex);
     chiaki_mutex_fini(&sess->frame_mutex);
     free(sess);
 }
 
+// ============================================================
+// Decoding (libavcodec)
+// ============================================================
+
+// Last decoded picture (mirrored by _chiaki.DecodedPicture)
+typedef struct {
+    uint64_t seq;        // Sequence number of the frame that produced it
+    int32_t width;
+    int32_t height;
+    int32_t pix_fmt;     // AVPixelFormat
+    int32_t keyframe;
+} DecodedPicture;
+
+// Decoder counters (mirrored by _chiaki.DecoderStats)
+typedef struct {
+    uint64_t packets;
+    uint64_t pictures;
+    uint64_t errors;
+    uint64_t decode_ns;  // Time spent in libavcodec
+    uint64_t convert_ns; // Time spent converting pictures to RGB
+    uint64_t encode_ns;  // Time spent encoding images
+} DecoderStats;
+
+// One libavcodec decoder. Not thread safe: use it from one thread at a time.
+typedef struct {
+    AVCodecContext *ctx;
+    AVPacket *pkt;
+    AVFrame *frame;      // Scratch for avcodec_receive_frame
+    AVFrame *picture;    // Last decoded picture
+    DecodedPicture info;
+    DecoderStats stats;
+    int flags;           // DECODER_* options
+    uint8_t *scratch;    // 8-bit rows of high bit depth pictures and block sums
+    size_t scratch_size;
+    AVCodecContext *enc_ctx;  // Image encoder, opened for one format, size and quality
+    AVFrame *enc_frame;       // Its input
+    AVPacket *enc_pkt;
+    int enc_format;
+    int enc_quality;
+} PythonDecoder;
+
+// Options of chiaki_python_decoder_create
+#define DECODER_EXPORT_MVS (1 << 0)  // Keep motion vectors as picture side data (H.264 only)
+
+// Channels of a chiaki_python_decoder_motion_grid tile
+#define MOTION_GRID_CHANNELS 3
+
+// Output formats of chiaki_python_decoder_convert
+#define CONVERT_RGB 0
+#define CONVERT_BGR 1
+#define CONVERT_GREY 2
+
+// Largest integer downscale factor
+#define CONVERT_MAX_SCALE 16
+
+// Formats of chiaki_python_decoder_encode_image
+#define IMAGE_JPEG 0
+#define IMAGE_PNG 1
+#define IMAGE_WEBP 2
+
+// What chiaki_python_decoder_convert produces (mirrored by _chiaki.ConvertParams)
+typedef struct {
+    int32_t format;  // CONVERT_RGB, CONVERT_BGR or CONVERT_GREY
+    int32_t x;       // Region of interest in picture pixels
+    int32_t y;
+    int32_t width;   // 0 = up to the right edge
+    int32_t height;  // 0 = up to the bottom edge
+    int32_t scale;   // Integer downscale factor (box filter), 1 = none
+} ConvertParams;
+
+// Zero-copy view of the last picture's planes (mirrored by _chiaki.PicturePlanes)
+typedef struct {
+    const uint8_t *data[3];  // Y, U, V; or Y, interleaved UV, NULL (NV12/P010)
+    int32_t linesize[3];
+    int32_t width;
+    int32_t height;
+    int32_t pix_fmt;
+    int32_t bytes_per_sample;  // 2 for 10-bit formats (little endian)
+} PicturePlanes;
+
+// YUV to RGB coefficients in 16.16 fixed point
+typedef struct {
+    int32_t y;
+    int32_t y_off;
+    int32_t rv;
+    int32_t gu;
+    int32_t gv;
+    int32_t bu;
+} YuvCoeffs;
+
+// codec is a ChiakiCodec. threads > 1 enables slice threading, which (unlike
+// frame threading) adds no delay. flags are DECODER_* options.
+// Returns NULL if libavcodec lacks the codec.
+CHIAKI_EXPORT PythonDecoder *chiaki_python_decoder_create(int codec, int threads, int flags)
+{
+    const AVCodec *av_codec = avcodec_find_decoder(codec == CHIAKI_CODEC_H264 ? AV_CODEC_ID_H264 : AV_CODEC_ID_HEVC);
+    if (!av_codec)
+        return NULL;
+
+    PythonDecoder *dec = calloc(1, sizeof(PythonDecoder));
+    if (!dec)
+        return NULL;
+
+    dec->ctx = avcodec_alloc_context3(av_codec);
+    dec->pkt = av_packet_alloc();
+    dec->frame = av_frame_alloc();
+    dec->picture = av_frame_alloc();
+    if (!dec->ctx || !dec->pkt || !dec->frame || !dec->picture)
+        goto error;
+
+    // The console never sends B-frames, every packet yields its picture right away
+    dec->ctx->flags |= AV_CODEC_FLAG_LOW_DELAY;
+    dec->ctx->thread_count = threads > 0 ? threads : 1;
+    dec->ctx->thread_type = FF_THREAD_SLICE;
+    if (flags & DECODER_EXPORT_MVS)
+        dec->ctx->flags2 |= AV_CODEC_FLAG2_EXPORT_MVS;
+    dec->flags = flags;
+    if (avcodec_open2(dec->ctx, av_codec, NULL) < 0)
+        goto error;
+    return dec;
+
+error:
+    avcodec_free_context(&dec->ctx);
+    av_packet_free(&dec->pkt);
+    av_frame_free(&dec->frame);
+    av_frame_free(&dec->picture);
+    free(dec);
+    return NULL;
+}
+
+CHIAKI_EXPORT void chiaki_python_decoder_destroy(PythonDecoder *dec)
+{
+    if (!dec)
+        return;
+    avcodec_free_context(&dec->ctx);
+    av_packet_free(&dec->pkt);
+    av_frame_free(&dec->frame);
+    av_frame_free(&dec->picture);
+    avcodec_free_context(&dec->enc_ctx);
+    av_frame_free(&dec->enc_frame);
+    av_packet_free(&dec->enc_pkt);
+    free(dec->scratch);
+    free(dec);
+}
+
+// New decoder without a codec that holds a reference to dec's last picture
+// (no copy: libavcodec decodes later pictures into other buffers). It
+// converts and encodes like dec, so that work can move to another thread
+// while dec keeps decoding; decoding into it fails. NULL without a picture.
+CHIAKI_EXPORT PythonDecoder *chiaki_python_decoder_snapshot(PythonDecoder *dec)
+{
+    if (!dec || !dec->picture->data[0])
+        return NULL;
+    PythonDecoder *snap = calloc(1, sizeof(PythonDecoder));
+    if (!snap)
+        return NULL;
+    snap->picture = av_frame_alloc();
+    if (!snap->picture || av_frame_ref(snap->picture, dec->picture) < 0) {
+        av_frame_free(&snap->picture);
+        free(snap);
+        return NULL;
+    }
+    snap->info = dec->info;
+    snap->flags = dec->flags;
+    return snap;
+}
+
+// Move src's picture into dst, dropping dst's, so a long-lived snapshot
+// keeps its open encoder for the pictures of later snapshots. src is left
+// without a picture. False if src has none.
+CHIAKI_EXPORT bool chiaki_python_decoder_take_picture(PythonDecoder *dst, PythonDecoder *src)
+{
+    if (!dst || !src || dst == src || !src->picture->data[0])
+        return false;
+    av_frame_unref(dst->picture);
+    av_frame_move_ref(dst->picture, src->picture);
+    dst->info = src->info;
+    dst->flags = src->flags;
+    return true;
+}
+
+// Feed one frame (Annex-B access unit) to the decoder. size 0 drains the
+// pictures libavcodec still holds and resets it for a new stream.
+// Returns 1 if a new picture was decoded (described in out), 0 if none came
+// out, -1 if libavcodec rejected the data.
+CHIAKI_EXPORT int chiaki_python_decoder_decode(
+    PythonDecoder *dec,
+    const uint8_t *buf,
+    size_t size,
+    uint64_t seq,
+    DecodedPicture *out)
+{
+    if (!dec || !dec->ctx)
+        return -1;
+
+    uint64_t start = monotonic_ns();
+    int err;
+    if (size > 0) {
+        // Not reference counted, so libavcodec copies what it keeps
+        dec->pkt->data = (uint8_t *)buf;
+        dec->pkt->size = (int)size;
+        dec->pkt->pts = (int64_t)seq;
+        err = avcodec_send_packet(dec->ctx, dec->pkt);
+        dec->pkt->data = NULL;
+        dec->pkt->size = 0;
+        dec->stats.packets++;
+    } else {
+        err = avcodec_send_packet(dec->ctx, NULL);
+    }
+
+    int ret = 0;
+    if (err < 0 && err != AVERROR(EAGAIN) && err != AVERROR_EOF) {
+        dec->stats.errors++;
+        ret = -1;
+    }
+
+    // Keep only the newest picture
+    while (avcodec_receive_frame(dec->ctx, dec->frame) == 0) {
+        av_frame_unref(dec->picture);
+        av_frame_move_ref(dec->picture, dec->frame);
+        dec->info.seq = (uint64_t)dec->picture->pts;
+        dec->info.width = dec->picture->width;
+        dec->info.height = dec->picture->height;
+        dec->info.pix_fmt = dec->picture->format;
+        dec->info.keyframe = (dec->picture->flags & AV_FRAME_FLAG_KEY) != 0;
+        dec->stats.pictures++;
+        ret = 1;
+    }
+
+    if (size == 0)
+        avcodec_flush_buffers(dec->ctx);
+
+    dec->stats.decode_ns += monotonic_ns() - start;
+    if (ret == 1 && out)
+        *out = dec->info;
+    return ret;
+}
+
+// Drop buffered state after a gap in the stream, the next frame fed should
+// be a keyframe. The last picture stays available.
+CHIAKI_EXPORT void chiaki_python_decoder_reset(PythonDecoder *dec)
+{
+    if (dec && dec->ctx)
+        avcodec_flush_buffers(dec->ctx);
+}
+
+// Describe the last decoded picture, false before the first one
+CHIAKI_EXPORT bool chiaki_python_decoder_get_picture(PythonDecoder *dec, DecodedPicture *out)
+{
+    if (!dec || !dec->picture->data[0])
+        return false;
+    *out = dec->info;
+    return true;
+}
+
+CHIAKI_EXPORT void chiaki_python_decoder_get_stats(PythonDecoder *dec, DecoderStats *out)
+{
+    if (dec && out)
+        *out = dec->stats;
+}
+
+// Layout of the 4:2:0 formats the converter understands, false for others.
+// shift reduces a 16-bit sample to 8 bits, 0 for 8-bit formats.
+static bool yuv420_layout(int pix_fmt, bool *interleaved, int *shift)
+{
+    switch (pix_fmt) {
+        case AV_PIX_FMT_YUV420P:
+        case AV_PIX_FMT_YUVJ420P:
+            *interleaved = false;
+            *shift = 0;
+            return true;
+        case AV_PIX_FMT_NV12:
+            *interleaved = true;
+            *shift = 0;
+            return true;
+        case AV_PIX_FMT_YUV420P10LE:
+            *interleaved = false;
+            *shift = 2;
+            return true;
+        case AV_PIX_FMT_P010LE:
+            *interleaved = true;
+            *shift = 8;  // 10 bits in the high bits of each sample
+            return true;
+        default:
+            return false;
+    }
+}
+
+// Describe the planes of the last picture without copying them. They stay
+// valid until the next picture is decoded or the decoder is destroyed.
+// Returns false without a picture or for formats other than 4:2:0.
+CHIAKI_EXPORT bool chiaki_python_decoder_get_planes(PythonDecoder *dec, PicturePlanes *out)
+{
+    if (!dec || !out || !dec->picture->data[0])
+        return false;
+
+    const AVFrame *pic = dec->picture;
+    bool interleaved;
+    int shift;
+    if (!yuv420_layout(pic->format, &interleaved, &shift))
+        return false;
+
+    memset(out, 0, sizeof(*out));
+    for (int i = 0; i < (interleaved ? 2 : 3); i++) {
+        out->data[i] = pic->data[i];
+        out->linesize[i] = pic->linesize[i];
+    }
+    out->width = pic->width;
+    out->height = pic->height;
+    out->pix_fmt = pic->format;
+    out->bytes_per_sample = shift ? 2 : 1;
+    return true;
+}
+
+static void yuv_coeffs(const AVFrame *frame, YuvCoeffs *c)
+{
+    bool full = frame->color_range == AVCOL_RANGE_JPEG || frame->format == AV_PIX_FMT_YUVJ420P;
+    // The console signals BT.709 for HD streams, so that is also the default
+    bool bt601 = frame->colorspace == AVCOL_SPC_BT470BG || frame->colorspace == AVCOL_SPC_SMPTE170M;
+    double kr = bt601 ? 0.299 : 0.2126;
+    double kb = bt601 ? 0.114 : 0.0722;
+    double kg = 1.0 - kr - kb;
+    double ys = full ? 1.0 : 255.0 / 219.0;
+    double cs = full ? 1.0 : 255.0 / 224.0;
+
+    c->y = (int32_t)lround(ys * 65536.0);
+    c->y_off = full ? 0 : 16;
+    c->rv = (int32_t)lround(2.0 * (1.0 - kr) * cs * 65536.0);
+    c->gu = (int32_t)lround(2.0 * (1.0 - kb) * kb / kg * cs * 65536.0);
+    c->gv = (int32_t)lround(2.0 * (1.0 - kr) * kr / kg * cs * 65536.0);
+    c->bu = (int32_t)lround(2.0 * (1.0 - kb) * cs * 65536.0);
+}
+
+static inline uint8_t clamp_u8(int32_t v)
+{
+    return v < 0 ? 0 : v > 255 ? 255 : (uint8_t)v;
+}
+
+// Write one pixel. luma is already scaled and rounded, the chroma terms are
+// shared by the pixels of a chroma sample. r and b are the channel indices.
+static inline void yuv_pixel(int32_t luma, int32_t rv, int32_t guv, int32_t bu, uint8_t *dst, int r, int b)
+{
+    dst[r] = clamp_u8((luma + rv) >> 16);
+    dst[1] = clamp_u8((luma - guv) >> 16);
+    dst[b] = clamp_u8((luma + bu) >> 16);
+}
+
+// Convert pixels x0 .. x0 + width - 1 of one row to packed RGB/BGR.
+// uv_step is 1 for planar chroma and 2 for interleaved (NV12) chroma.
+static void yuv_row_to_rgb(
+    const uint8_t *y_row,
+    const uint8_t *u_row,
+    const uint8_t *v_row,
+    int uv_step,
+    int x0,
+    int width,
+    const YuvCoeffs *c,
+    uint8_t *dst,
+    int r,
+    int b)
+{
+    int x = x0;
+    int end = x0 + width;
+    while (x < end) {
+        int32_t u = (int32_t)u_row[(x >> 1) * uv_step] - 128;
+        int32_t v = (int32_t)v_row[(x >> 1) * uv_step] - 128;
+        int32_t rv = c->rv * v;
+        int32_t guv = c->gu * u + c->gv * v;
+        int32_t bu = c->bu * u;
+        // Both pixels of a chroma sample share its terms
+        int pair_end = (x | 1) + 1 < end ? (x | 1) + 1 : end;
+        for (; x < pair_end; x++) {
+            yuv_pixel(((int32_t)y_row[x] - c->y_off) * c->y + 32768, rv, guv, bu, dst, r, b);
+            dst += 3;
+        }
+    }
+}
+
+// Reduce a row of 16-bit samples to their top 8 bits
+static void row_to_8bit(const uint8_t *src, int count, int shift, uint8_t *dst)
+{
+    const uint16_t *samples = (const uint16_t *)src;
+    for (int i = 0; i < count; i++)
+        dst[i] = (uint8_t)(samples[i] >> shift);
+}
+
+// Hands out 8-bit rows of a 4:2:0 picture, reducing 10-bit rows on the way
+typedef struct {
+    const AVFrame *pic;
+    bool interleaved;
+    int shift;
+    int chroma_width;  // Samples per chroma row (both components for interleaved)
+    uint8_t *y_tmp;
+    uint8_t *u_tmp;
+    uint8_t *v_tmp;
+    int chroma_row;    // Chroma row held in u_tmp/v_tmp, -1 for none
+} RowReader;
+
+static void row_reader_get(RowReader *rr, int y, const uint8_t **y_row, const uint8_t **u_row, const uint8_t **v_row)
+{
+    const AVFrame *pic = rr->pic;
+    const uint8_t *ys = pic->data[0] + (size_t)y * pic->linesize[0];
+    const uint8_t *us = pic->data[1] + (size_t)(y >> 1) * pic->linesize[1];
+    const uint8_t *vs = rr->interleaved ? us : pic->data[2] + (size_t)(y >> 1) * pic->linesize[2];
+    if (rr->shift) {
+        row_to_8bit(ys, pic->width, rr->shift, rr->y_tmp);
+        ys = rr->y_tmp;
+        // Chroma rows are shared by two picture rows, reduce them once
+        if (rr->chroma_row != (y >> 1)) {
+            row_to_8bit(us, rr->chroma_width, rr->shift, rr->u_tmp);
+            if (!rr->interleaved)
+                row_to_8bit(vs, rr->chroma_width, rr->shift, rr->v_tmp);
+            rr->chroma_row = y >> 1;
+        }
+        us = rr->u_tmp;
+        vs = rr->interleaved ? rr->u_tmp : rr->v_tmp;
+    }
+    *y_row = ys;
+    *u_row = us;
+    *v_row = rr->interleaved ? vs + 1 : vs;
+}
+
+// Grow the decoder's scratch memory to at least size bytes
+static uint8_t *decoder_scratch(PythonDecoder *dec, size_t size)
+{
+    if (dec->scratch_size < size) {
+        uint8_t *scratch = realloc(dec->scratch, size);
+        if (!scratch)
+            return NULL;
+        dec->scratch = scratch;
+        dec->scratch_size = size;
+    }
+    return dec->scratch;
+}
+
+// Convert a region of the last decoded picture into out, whose rows are
+// stride bytes apart: packed RGB or BGR (3 bytes per pixel) or grey (luma
+// mapped to full range, 1 byte per pixel). With scale > 1 every output pixel
+// is the average of a scale x scale block, so the output is
+// (height / scale) x (width / scale) pixels. Handles 8-bit and 10-bit 4:2:0
+// pictures (YUV420P, YUVJ420P, NV12, YUV420P10, P010).
+// Returns false without a picture, for other pixel formats, for a region
+// outside the picture or if out is too small.
+CHIAKI_EXPORT bool chiaki_python_decoder_convert(
+    PythonDecoder *dec,
+    const ConvertParams *params,
+    uint8_t *out,
+    size_t out_size,
+    size_t stride)
+{
+    if (!dec || !params || !out || !dec->picture->data[0])
+        return false;
+
+    const AVFrame *pic = dec->picture;
+    RowReader rr = { .pic = pic, .chroma_row = -1 };
+    if (!yuv420_layout(pic->format, &rr.interleaved, &rr.shift))
+        return false;
+
+    int x0 = params->x;
+    int y0 = params->y;
+    int width = params->width ? params->width : pic->width - x0;
+    int height = params->height ? params->height : pic->height - y0;
+    int scale = params->scale;
+    if (params->format < CONVERT_RGB || params->format > CONVERT_GREY
+        || scale < 1 || scale > CONVERT_MAX_SCALE
+        || x0 < 0 || y0 < 0 || width <= 0 || height <= 0
+        || x0 + width > pic->width || y0 + height > pic->height)
+        return false;
+
+    int out_width = width / scale;
+    int out_height = height / scale;
+    size_t channels = params->format == CONVERT_GREY ? 1 : 3;
+    size_t row_bytes = (size_t)out_width * channels;
+    if (out_width == 0 || out_height == 0 || stride < row_bytes
+        || out_size < stride * (size_t)(out_height - 1) + row_bytes)
+        return false;
+
+    uint64_t start = monotonic_ns();
+    YuvCoeffs c;
+    yuv_coeffs(pic, &c);
+    int r = params->format == CONVERT_BGR ? 2 : 0;
+    int b = 2 - r;
+    int uv_step = rr.interleaved ? 2 : 1;
+
+    // 10-bit rows, then Y/U/V block sums when downscaling
+    rr.chroma_width = rr.interleaved ? pic->width + 1 : (pic->width + 1) / 2;
+    size_t rows_size = rr.shift ? (size_t)pic->width + 2 * (size_t)rr.chroma_width : 0;
+    rows_size = (rows_size + 7) & ~(size_t)7;
+    size_t sums_size = scale > 1 ? 3 * (size_t)out_width * sizeof(uint32_t) : 0;
+    uint8_t *scratch = decoder_scratch(dec, rows_size + sums_size);
+    if (!scratch && rows_size + sums_size > 0)
+        return false;
+    rr.y_tmp = scratch;
+    rr.u_tmp = rr.y_tmp + pic->width;
+    rr.v_tmp = rr.u_tmp + rr.chroma_width;
+    uint32_t *y_sum = (uint32_t *)(scratch + rows_size);
+    uint32_t *u_sum = y_sum + out_width;
+    uint32_t *v_sum = u_sum + out_width;
+
+    // Grey only needs luma, mapped to full range through a table
+    uint8_t grey_lut[256];
+    if (channels == 1) {
+        for (int i = 0; i < 256; i++)
+            grey_lut[i] = clamp_u8(((i - c.y_off) * c.y + 32768) >> 16);
+    }
+
+    const uint8_t *y_row;
+    const uint8_t *u_row;
+    const uint8_t *v_row;
+    for (int oy = 0; oy < out_height; oy++) {
+        uint8_t *dst = out + (size_t)oy * stride;
+
+        if (scale == 1) {
+            row_reader_get(&rr, y0 + oy, &y_row, &u_row, &v_row);
+            if (channels == 1) {
+                for (int x = 0; x < out_width; x++)
+                    dst[x] = grey_lut[y_row[x0 + x]];
+            } else {
+                yuv_row_to_rgb(y_row, u_row, v_row, uv_step, x0, out_width, &c, dst, r, b);
+            }
+            continue;
+        }
+
+        memset(y_sum, 0, sums_size);
+        for (int k = 0; k < scale; k++) {
+            row_reader_get(&rr, y0 + oy * scale + k, &y_row, &u_row, &v_row);
+            for (int ox = 0; ox < out_width; ox++) {
+                int xs = x0 + ox * scale;
+                uint32_t ys = 0;
+                for (int j = 0; j < scale; j++)
+                    ys += y_row[xs + j];
+                y_sum[ox] += ys;
+                if (channels == 1)
+                    continue;
+                uint32_t us = 0;
+                uint32_t vs = 0;
+                for (int j = 0; j < scale; j++) {
+                    us += u_row[((xs + j) >> 1) * uv_step];
+                    vs += v_row[((xs + j) >> 1) * uv_step];
+                }
+                u_sum[ox] += us;
+                v_sum[ox] += vs;
+            }
+        }
+
+        uint32_t count = (uint32_t)(scale * scale);
+        for (int ox = 0; ox < out_width; ox++) {
+            int32_t luma = (int32_t)((y_sum[ox] + count / 2) / count);
+            if (channels == 1) {
+                dst[ox] = grey_lut[luma];
+                continue;
+            }
+            int32_t u = (int32_t)((u_sum[ox] + count / 2) / count) - 128;
+            int32_t v = (int32_t)((v_sum[ox] + count / 2) / count) - 128;
+            yuv_pixel((luma - c.y_off) * c.y + 32768, c.rv * v, c.gu * u + c.gv * v, c.bu * u,
+                      dst + 3 * (size_t)ox, r, b);
+        }
+    }
+
+    dec->stats.convert_ns += monotonic_ns() - start;
+    return true;
+}
+
+// Convert the whole last decoded picture to packed RGB (height x width x 3),
+// see chiaki_python_decoder_convert.
+CHIAKI_EXPORT bool chiaki_python_decoder_get_rgb(PythonDecoder *dec, uint8_t *out, size_t out_size, size_t stride)
+{
+    ConvertParams params = { .format = CONVERT_RGB, .scale = 1 };
+    return chiaki_python_decoder_convert(dec, &params, out, out_size, stride);
+}
+
+// (Re)open the decoder's image encoder unless it already has this format,
+// size and quality. pix_fmt is the encoder input.
+static bool image_encoder_open(PythonDecoder *dec, int format, int pix_fmt, int width, int height, int quality)
+{
+    if (dec->enc_ctx && dec->enc_format == format && dec->enc_ctx->pix_fmt == pix_fmt
+        && dec->enc_ctx->width == width && dec->enc_ctx->height == height && dec->enc_quality == quality)
+        return true;
+
+    avcodec_free_context(&dec->enc_ctx);
+    av_frame_free(&dec->enc_frame);
+    // WebP needs libavcodec built with libwebp
+    const AVCodec *codec = avcodec_find_encoder(
+        format == IMAGE_PNG ? AV_CODEC_ID_PNG : format == IMAGE_WEBP ? AV_CODEC_ID_WEBP : AV_CODEC_ID_MJPEG);
+    if (!codec)
+        return false;
+    if (!dec->enc_pkt && !(dec->enc_pkt = av_packet_alloc()))
+        return false;
+
+    AVCodecContext *ctx = avcodec_alloc_context3(codec);
+    AVFrame *frame = av_frame_alloc();
+    if (!ctx || !frame)
+        goto error;
+    ctx->width = width;
+    ctx->height = height;
+    ctx->pix_fmt = pix_fmt;
+    ctx->color_range = format == IMAGE_JPEG ? AVCOL_RANGE_JPEG : AVCOL_RANGE_MPEG;
+    ctx->time_base = (AVRational){ 1, 1 };
+    if (format == IMAGE_JPEG) {
+        // Fixed quantizer: quality 100 .. 1 maps to qscale 2 .. 31
+        ctx->flags |= AV_CODEC_FLAG_QSCALE;
+        ctx->global_quality = FF_QP2LAMBDA * (2 + (100 - quality) * 29 / 99);
+    } else if (format == IMAGE_WEBP) {
+        // libwebp takes its 0 .. 100 quality factor from the quantizer
+        ctx->flags |= AV_CODEC_FLAG_QSCALE;
+        ctx->global_quality = FF_QP2LAMBDA * quality;
+    } else {
+        // PNG is lossless; a fast zlib level keeps encoding off the critical path
+        ctx->compression_level = 3;
+    }
+    if (avcodec_open2(ctx, codec, NULL) < 0)
+        goto error;
+
+    frame->format = pix_fmt;
+    frame->width = width;
+    frame->height = height;
+    frame->color_range = ctx->color_range;
+    frame->pts = 0;
+    if (av_frame_get_buffer(frame, 0) < 0)
+        goto error;
+
+    dec->enc_ctx = ctx;
+    dec->enc_frame = frame;
+    dec->enc_format = format;
+    dec->enc_quality = quality;
+    return true;
+
+error:
+    avcodec_free_context(&ctx);
+    av_frame_free(&frame);
+    return false;
+}
+
+// Downscale a region of the last picture into frame (planar 4:2:0 of the
+// output size): luma like chiaki_python_decoder_convert, chroma averaged
+// over the 2 x 2 output pixels of each sample, both mapped to full range
+// (JPEG) or limited range (WebP).
+static bool picture_to_yuv420_frame(PythonDecoder *dec, int x0, int y0, int scale, bool full_range, AVFrame *frame)
+{
+    const AVFrame *pic = dec->picture;
+    RowReader rr = { .pic = pic, .chroma_row = -1 };
+    if (!yuv420_layout(pic->format, &rr.interleaved, &rr.shift))
+        return false;
+
+    int out_width = frame->width;
+    int out_height = frame->height;
+    int chroma_width = (out_width + 1) / 2;
+    int uv_step = rr.interleaved ? 2 : 1;
+
+    // 10-bit rows, then Y/U/V block sums and U/V sums of a chroma row
+    rr.chroma_width = rr.interleaved ? pic->width + 1 : (pic->width + 1) / 2;
+    size_t rows_size = rr.shift ? (size_t)pic->width + 2 * (size_t)rr.chroma_width : 0;
+    rows_size = (rows_size + 7) & ~(size_t)7;
+    size_t sums_size = 3 * (size_t)out_width * sizeof(uint32_t);
+    size_t chroma_size = 2 * (size_t)chroma_width * sizeof(uint32_t);
+    uint8_t *scratch = decoder_scratch(dec, rows_size + sums_size + chroma_size);
+    if (!scratch)
+        return false;
+    rr.y_tmp = scratch;
+    rr.u_tmp = rr.y_tmp + pic->width;
+    rr.v_tmp = rr.u_tmp + rr.chroma_width;
+    uint32_t *y_sum = (uint32_t *)(scratch + rows_size);
+    uint32_t *u_sum = y_sum + out_width;
+    uint32_t *v_sum = u_sum + out_width;
+    uint32_t *u_acc = v_sum + out_width;
+    uint32_t *v_acc = u_acc + chroma_width;
+
+    // Map the picture's range to the encoder's
+    bool pic_full = pic->color_range == AVCOL_RANGE_JPEG || pic->format == AV_PIX_FMT_YUVJ420P;
+    uint8_t luma_lut[256];
+    uint8_t chroma_lut[256];
+    for (int i = 0; i < 256; i++) {
+        double luma = pic_full ? i / 255.0 : (i - 16) / 219.0;
+        double chroma = (i - 128) / (pic_full ? 255.0 : 224.0);
+        luma_lut[i] = clamp_u8((int32_t)lround(full_range ? luma * 255.0 : 16.0 + luma * 219.0));
+        chroma_lut[i] = clamp_u8((int32_t)lround(128.0 + chroma * (full_range ? 255.0 : 224.0)));
+    }
+
+    uint32_t count = (uint32_t)(scale * scale);
+    const uint8_t *y_row;
+    const uint8_t *u_row;
+    const uint8_t *v_row;
+    memset(u_acc, 0, chroma_size);
+    for (int oy = 0; oy < out_height; oy++) {
+        memset(y_sum, 0, sums_size);
+        for (int k = 0; k < scale; k++) {
+            row_reader_get(&rr, y0 + oy * scale + k, &y_row, &u_row, &v_row);
+            for (int ox = 0; ox < out_width; ox++) {
+                int xs = x0 + ox * scale;
+                for (int j = 0; j < scale; j++) {
+                    y_sum[ox] += y_row[xs + j];
+                    u_sum[ox] += u_row[((xs + j) >> 1) * uv_step];
+                    v_sum[ox] += v_row[((xs + j) >> 1) * uv_step];
+                }
+            }
+        }
+
+        uint8_t *y_dst = frame->data[0] + (size_t)oy * frame->linesize[0];
+        for (int ox = 0; ox < out_width; ox++) {
+            y_dst[ox] = luma_lut[(y_sum[ox] + count / 2) / count];
+            u_acc[ox >> 1] += (u_sum[ox] + count / 2) / count;
+            v_acc[ox >> 1] += (v_sum[ox] + count / 2) / count;
+        }
+
+        // A chroma row is complete after its second output row (or the last)
+        if ((oy & 1) == 0 && oy + 1 < out_height)
+            continue;
+        uint8_t *u_dst = frame->data[1] + (size_t)(oy >> 1) * frame->linesize[1];
+        uint8_t *v_dst = frame->data[2] + (size_t)(oy >> 1) * frame->linesize[2];
+        uint32_t rows = (oy & 1) ? 2 : 1;
+        for (int cx = 0; cx < chroma_width; cx++) {
+            uint32_t n = rows * (2 * cx + 1 < out_width ? 2 : 1);
+            u_dst[cx] = chroma_lut[(u_acc[cx] + n / 2) / n];
+            v_dst[cx] = chroma_lut[(v_acc[cx] + n / 2) / n];
+        }
+        memset(u_acc, 0, chroma_size);
+    }
+    return true;
+}
+
+// Encode a region of the last decoded picture as a JPEG, PNG or WebP image
+// (IMAGE_*), downscaled by params->scale. PNG is RGB, or grey for
+// params->format CONVERT_GREY; JPEG and WebP ignore params->format. quality
+// (1 .. 100) applies to JPEG and WebP. The encoder is kept open, so
+// repeated images of one size only pay for the encode. size_out receives
+// the image size, also when out is too small.
+// Returns false without a picture, for other pixel formats, for a region
+// outside the picture, without the encoder, if encoding failed or if out is
+// too small.
+CHIAKI_EXPORT bool chiaki_python_decoder_encode_image(
+    PythonDecoder *dec,
+    const ConvertParams *params,
+    int format,
+    int quality,
+    uint8_t *out,
+    size_t out_size,
+    size_t *size_out)
+{
+    if (size_out)
+        *size_out = 0;
+    if (!dec || !params || !dec->picture->data[0] || format < IMAGE_JPEG || format > IMAGE_WEBP)
+        return false;
+
+    const AVFrame *pic = dec->picture;
+    int x0 = params->x;
+    int y0 = params->y;
+    int width = params->width ? params->width : pic->width - x0;
+    int height = params->height ? params->height : pic->height - y0;
+    int scale = params->scale;
+    if (scale < 1 || scale > CONVERT_MAX_SCALE
+        || x0 < 0 || y0 < 0 || width <= 0 || height <= 0
+        || x0 + width > pic->width || y0 + height > pic->height
+        || width / scale == 0 || height / scale == 0)
+        return false;
+    width /= scale;
+    height /= scale;
+    quality = quality < 1 ? 1 : quality > 100 ? 100 : quality;
+
+    int pix_fmt = AV_PIX_FMT_YUV420P;
+    if (format == IMAGE_JPEG)
+        pix_fmt = AV_PIX_FMT_YUVJ420P;
+    else if (format == IMAGE_PNG)
+        pix_fmt = params->format == CONVERT_GREY ? AV_PIX_FMT_GRAY8 : AV_PIX_FMT_RGB24;
+
+    uint64_t start = monotonic_ns();
+    if (!image_encoder_open(dec, format, pix_fmt, width, height, quality)
+        || av_frame_make_writable(dec->enc_frame) < 0)
+        return false;
+
+    AVFrame *frame = dec->enc_frame;
+    bool ok;
+    if (format == IMAGE_PNG) {
+        ConvertParams rgb = *params;
+        rgb.format = params->format == CONVERT_GREY ? CONVERT_GREY : CONVERT_RGB;
+        size_t row_bytes = (size_t)width * (pix_fmt == AV_PIX_FMT_GRAY8 ? 1 : 3);
+        size_t stride = (size_t)frame->linesize[0];
+        ok = chiaki_python_decoder_convert(dec, &rgb, frame->data[0], stride * (size_t)(height - 1) + row_bytes, stride);
+    } else {
+        ok = picture_to_yuv420_frame(dec, x0, y0, scale, format == IMAGE_JPEG, frame);
+    }
+    if (!ok)
+        return false;
+
+    // Every image is a keyframe, the pts only has to increase
+    frame->pts++;
+    frame->quality = dec->enc_ctx->global_quality;
+    ok = avcodec_send_frame(dec->enc_ctx, frame) == 0
+         && avcodec_receive_packet(dec->enc_ctx, dec->enc_pkt) == 0;
+    if (ok) {
+        size_t size = (size_t)dec->enc_pkt->size;
+        if (size_out)
+            *size_out = size;
+        ok = out && size <= out_size;
+        if (ok)
+            memcpy(out, dec->enc_pkt->data, size);
+        av_packet_unref(dec->enc_pkt);
+    }
+    dec->stats.encode_ns += monotonic_ns() - start;
+    return ok;
+}
+
+// Motion vectors of the last picture, without copying them: they stay valid
+// until the next picture is decoded or the decoder is destroyed. count is 0
+// for pictures without inter blocks (keyframes). Returns false without a
+// picture or without DECODER_EXPORT_MVS.
+CHIAKI_EXPORT bool chiaki_python_decoder_get_motion_vectors(
+    PythonDecoder *dec,
+    const AVMotionVector **vectors,
+    size_t *count)
+{
+    if (!dec || !vectors || !count || !dec->picture->data[0] || !(dec->flags & DECODER_EXPORT_MVS))
+        return false;
+    const AVFrameSideData *sd = av_frame_get_side_data(dec->picture, AV_FRAME_DATA_MOTION_VECTORS);
+    *vectors = sd ? (const AVMotionVector *)sd->data : NULL;
+    *count = sd ? sd->size / sizeof(AVMotionVector) : 0;
+    return true;
+}
+
+// Summarise the last picture's motion vectors per tile x tile pixel tile,
+// without touching any pixels. out receives rows x cols x
+// MOTION_GRID_CHANNELS floats (rows and cols rounded up), per tile:
+//   0: mean motion in pixels over the tile's inter blocks
+//   1: fraction of the tile whose blocks move at least min_motion pixels
+//   2: fraction of the tile without motion vectors (intra coded)
+// Keyframes come out as all intra. Returns false without a picture, without
+// DECODER_EXPORT_MVS or if out is too small.
+CHIAKI_EXPORT bool chiaki_python_decoder_motion_grid(
+    PythonDecoder *dec,
+    int tile,
+    float min_motion,
+    float *out,
+    size_t out_count)
+{
+    const AVMotionVector *mvs;
+    size_t count;
+    if (tile <= 0 || !out || !chiaki_python_decoder_get_motion_vectors(dec, &mvs, &count))
+        return false;
+
+    const AVFrame *pic = dec->picture;
+    int cols = (pic->width + tile - 1) / tile;
+    int rows = (pic->height + tile - 1) / tile;
+    size_t cells = (size_t)rows * (size_t)cols;
+    if (out_count < cells * MOTION_GRID_CHANNELS)
+        return false;
+
+    uint64_t start = monotonic_ns();
+    memset(out, 0, cells * MOTION_GRID_CHANNELS * sizeof(float));
+
+    // Area weighted motion, moving area and covered area per tile
+    for (size_t i = 0; i < count; i++) {
+        const AVMotionVector *mv = &mvs[i];
+        float scale = mv->motion_scale ? (float)mv->motion_scale : 1.0f;
+        float dx = (float)mv->motion_x / scale;
+        float dy = (float)mv->motion_y / scale;
+        float motion = sqrtf(dx * dx + dy * dy);
+        bool moving = motion > 0.0f && motion >= min_motion;
+
+        // dst_x/dst_y is the block's centre
+        int x0 = mv->dst_x - mv->w / 2;
+        int y0 = mv->dst_y - mv->h / 2;
+        int x1 = x0 + mv->w;
+        int y1 = y0 + mv->h;
+        x0 = x0 < 0 ? 0 : x0;
+        y0 = y0 < 0 ? 0 : y0;
+        x1 = x1 > pic->width ? pic->width : x1;
+        y1 = y1 > pic->height ? pic->height : y1;
+        if (x0 >= x1 || y0 >= y1)
+            continue;
+
+        for (int ty = y0 / tile; ty <= (y1 - 1) / tile; ty++) {
+            int top = ty * tile > y0 ? ty * tile : y0;
+            int bottom = (ty + 1) * tile < y1 ? (ty + 1) * tile : y1;
+            for (int tx = x0 / tile; tx <= (x1 - 1) / tile; tx++) {
+                int left = tx * tile > x0 ? tx * tile : x0;
+                int right = (tx + 1) * tile < x1 ? (tx + 1) * tile : x1;
+                float area = (float)((right - left) * (bottom - top));
+                float *cell = out + ((size_t)ty * (size_t)cols + (size_t)tx) * MOTION_GRID_CHANNELS;
+                cell[0] += motion * area;
+                if (moving)
+                    cell[1] += area;
+                cell[2] += area;
+            }
+        }
+    }
+
+    // Turn the sums into the mean motion and fractions of each tile's area
+    for (int ty = 0; ty < rows; ty++) {
+        int tile_height = (ty + 1) * tile < pic->height ? tile : pic->height - ty * tile;
+        for (int tx = 0; tx < cols; tx++) {
+            int tile_width = (tx + 1) * tile < pic->width ? tile : pic->width - tx * tile;
+            float tile_area = (float)(tile_width * tile_height);
+            float *cell = out + ((size_t)ty * (size_t)cols + (size_t)tx) * MOTION_GRID_CHANNELS;
+            float covered = cell[2];
+            cell[0] = covered > 0.0f ? cell[0] / covered : 0.0f;
+            cell[1] = fminf(cell[1] / tile_area, 1.0f);
+            cell[2] = 1.0f - fminf(covered / tile_area, 1.0f);
+        }
+    }
+    dec->stats.convert_ns += monotonic_ns() - start;
+    return true;
+}
+
 // Simple discovery function
 CHIAKI_EXPORT bool chiaki_python_discover(
     const char *host,
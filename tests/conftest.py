@@ -0,0 +1,107 @@
+"""
+Test setup: the pure-Python modules without libchiaki.
+
+mux, gop_index and analytics need nothing native but _chiaki's constants and
+its NAL scan, so chiaki_python is registered as a bare package (its
+__init__ would import the session and load the library) around a small
+stand-in for _chiaki.
+"""
+
+import os
+import sys
+import types
+from typing import List, Tuple
+
+import pytest
+
+PACKAGE_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "chiaki_python")
+
+# Reported by the stand-in's scan_nals() for any SPS
+WIDTH = 1280
+HEIGHT = 720
+
+
+class NalScan:
+    """The fields of _chiaki.NalScan that mux reads."""
+
+    def __init__(self, flags: int = 0, width: int = 0, height: int = 0):
+        self.flags = flags
+        self.width = width
+        self.height = height
+        self.bit_depth = 8 if width else 0
+        self.chroma_format_idc = 1 if width else 0
+
+
+def _install_stub():
+    package = types.ModuleType("chiaki_python")
+    package.__path__ = [PACKAGE_DIR]
+    stub = types.ModuleType("chiaki_python._chiaki")
+    stub.CHIAKI_CODEC_H264 = 0
+    stub.CHIAKI_CODEC_H265 = 1
+    stub.NAL_FLAG_SPS = 1 << 0
+    stub.NAL_FLAG_PPS = 1 << 1
+    stub.NAL_FLAG_VPS = 1 << 2
+    stub.NAL_FLAG_IDR = 1 << 3
+    stub.NAL_FLAG_SLICE = 1 << 6
+    stub.NalScan = NalScan
+
+    def scan_nals(data, codec: int = stub.CHIAKI_CODEC_H264) -> NalScan:
+        """H.264 only: NAL classes, and a fixed picture size for an SPS."""
+        flags = 0
+        for nal in _split(bytes(data)):
+            kind = nal[0] & 0x1f
+            if kind == 7:
+                flags |= stub.NAL_FLAG_SPS
+            elif kind == 8:
+                flags |= stub.NAL_FLAG_PPS
+            elif 1 <= kind <= 5:
+                flags |= stub.NAL_FLAG_SLICE | (stub.NAL_FLAG_IDR if kind == 5 else 0)
+        if flags & stub.NAL_FLAG_SPS:
+            return NalScan(flags, WIDTH, HEIGHT)
+        return NalScan(flags)
+
+    stub.scan_nals = scan_nals
+    package._chiaki = stub
+    sys.modules["chiaki_python"] = package
+    sys.modules["chiaki_python._chiaki"] = stub
+
+
+def _split(data: bytes) -> List[bytes]:
+    # A 4 byte start code's leading zero ends up behind the previous NAL
+    return [nal.rstrip(b'\x00') for nal in data.split(b'\x00\x00\x01')[1:] if nal.rstrip(b'\x00')]
+
+
+_install_stub()
+
+
+# A synthetic H.264 stream, delivered the way chiaki does: the codec header
+# (SPS + PPS) as a frame of its own in front of every keyframe
+
+SPS = bytes((0x67, 100, 0, 31, 0xac, 0xd9, 0x40, 0x50, 0x05, 0xbb, 0x01, 0x10))
+PPS = bytes((0x68, 0xeb, 0xe3, 0xcb, 0x22, 0xc0))
+START = b'\x00\x00\x00\x01'
+FRAME_NS = 16_666_667
+
+
+def nal_frame(*nals: bytes) -> bytes:
+    return b''.join(START + nal for nal in nals)
+
+
+def picture(index: int, keyframe: bool) -> bytes:
+    """An IDR or P slice whose payload tells the frames apart (no zero bytes)."""
+    payload = bytes((0x80 | (index >> 7) & 0x7f, 0x80 | index & 0x7f)) + b'\x9a' * (40 if keyframe else 8)
+    return nal_frame((b'\x65\x88' if keyframe else b'\x41\x9a') + payload)
+
+
+@pytest.fixture
+def h264_stream() -> List[Tuple[bytes, int, bool]]:
+    """(Annex-B frame, arrival ns, keyframe) for 3 GOPs of 120 pictures at 60 fps, header frames included."""
+    frames = []
+    time_ns = 1_000_000_000
+    for index in range(360):
+        keyframe = index % 120 == 0
+        if keyframe:
+            frames.append((nal_frame(SPS, PPS), time_ns, False))
+        frames.append((picture(index, keyframe), time_ns, keyframe))
+        time_ns += FRAME_NS
+    return frames
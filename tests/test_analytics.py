@@ -0,0 +1,107 @@
+"""ActivityAnalyzer statistics and change points on synthetic frame sizes."""
+
+import numpy as np
+import pytest
+
+from chiaki_python.analytics import ActivityAnalyzer
+from conftest import FRAME_NS
+
+DESC_DTYPE = np.dtype([
+    ("seq", np.uint64),
+    ("recv_time_ns", np.uint64),
+    ("size", np.uint32),
+    ("keyframe", np.uint8),
+    ("frames_lost", np.int32),
+])
+
+
+class FakeSession:
+    """frame_descs() over a fixed list of frames, like the wrapper's descriptor history."""
+
+    def __init__(self, sizes, keyframe_every=600, history=None):
+        self.descs = np.zeros(len(sizes), dtype=DESC_DTYPE)
+        self.descs['seq'] = np.arange(1, len(sizes) + 1)
+        self.descs['recv_time_ns'] = 1_000_000_000 + np.arange(len(sizes)) * FRAME_NS
+        self.descs['size'] = sizes
+        self.descs['keyframe'] = np.arange(len(sizes)) % keyframe_every == 0
+        self.history = history
+        self.available = len(sizes)
+
+    def frame_descs(self, since_seq=0):
+        descs = self.descs[:self.available]
+        if self.history is not None:
+            descs = descs[-self.history:]
+        return descs[descs['seq'] > since_seq]
+
+
+def analyzer_for(sizes, **kwargs):
+    analyzer = ActivityAnalyzer(FakeSession(sizes, **kwargs), start=False)
+    analyzer.update()
+    return analyzer
+
+
+def noisy(level, count, seed):
+    return np.random.default_rng(seed).normal(level, level * 0.1, count).clip(min=1).astype(np.uint32)
+
+
+def test_update_is_incremental():
+    session = FakeSession(np.full(100, 500))
+    analyzer = ActivityAnalyzer(session, history=64, start=False)
+    session.available = 40
+    assert analyzer.update() == 40
+    assert analyzer.update() == 0
+    session.available = 100
+    assert analyzer.update() == 60
+    # The ring keeps the newest frames, oldest first
+    assert analyzer.frames()['seq'].tolist() == list(range(37, 101))
+    assert analyzer.stats == {'frames': 100, 'held': 64, 'missed': 0, 'lost': 0}
+
+
+def test_missed_frames():
+    session = FakeSession(np.full(100, 500), history=30)
+    analyzer = ActivityAnalyzer(session, start=False)
+    session.available = 10
+    analyzer.update()
+    session.available = 100
+    assert analyzer.update() == 30
+    assert analyzer.stats['missed'] == 60
+
+
+def test_bitrate_and_sizes():
+    analyzer = analyzer_for(np.full(600, 1000), keyframe_every=120)
+    assert analyzer.bitrate(1.0) == pytest.approx(1000 * 8 * 60, rel=0.02)
+    assert analyzer.size_percentiles((50,)).tolist() == [1000.0]
+    assert analyzer.keyframe_intervals() == pytest.approx([2.0] * 4, abs=1e-6)
+
+
+def test_change_points_on_a_step():
+    # 20 s of a static screen, then 20 s of motion
+    analyzer = analyzer_for(np.concatenate((noisy(300, 1200, 1), noisy(6000, 1200, 2))))
+    changes = analyzer.change_points(bin=0.5)
+    assert len(changes) == 1
+    change = changes[0]
+    assert change['time'] == pytest.approx(1.0 + 20.0, abs=0.5)
+    assert change['after'] / change['before'] == pytest.approx(20, rel=0.1)
+
+
+def test_change_points_up_and_down():
+    sizes = np.concatenate((noisy(2000, 900, 3), noisy(200, 900, 4), noisy(2000, 900, 5)))
+    changes = analyzer_for(sizes).change_points(bin=0.5)
+    assert [round(change['time'] - 1.0) for change in changes] == [15, 30]
+    assert changes[0]['after'] < changes[0]['before'] and changes[1]['after'] > changes[1]['before']
+
+
+def test_no_change_points_without_a_step():
+    analyzer = analyzer_for(noisy(1500, 2400, 6))
+    assert analyzer.change_points(bin=0.5) == []
+    # Too short for two segments of min_bins
+    assert analyzer_for(noisy(1500, 200, 7)).change_points(bin=0.5, min_bins=4) == []
+
+
+def test_idle_and_activity():
+    analyzer = analyzer_for(np.concatenate((noisy(3000, 600, 8), noisy(300, 600, 9))))
+    assert analyzer.is_idle(2.0)
+    assert analyzer.activity_score(2.0) < 0.5
+    times, scores = analyzer.activity(bin=1.0)
+    assert times.size == scores.size == 20
+    assert scores[:10].mean() > 5 * scores[10:].mean()
@@ -0,0 +1,115 @@
+"""GOP index entries written along a recording, and random access with RecordingReader."""
+
+import pytest
+
+from chiaki_python import _chiaki, gop_index, mux
+from conftest import PPS, SPS, nal_frame
+
+H264 = _chiaki.CHIAKI_CODEC_H264
+
+
+def write_recording(path, container, stream, interval=0.5):
+    """Mux the stream and index its GOPs like a Recorder does, returns the index entries."""
+    fmt = mux.video_format(stream[0][0] + stream[1][0], H264)
+    muxer = mux.MUXERS[container](fmt)
+    fragmenter = mux.Fragmenter(H264, muxer.timescale, stream[0][1], interval)
+    indexer = gop_index.GopIndexer(muxer.timescale)
+    header = muxer.header()
+    chunks = [header]
+    index = [gop_index.index_header(container, H264, len(header), mux.parameter_sets(stream[0][0], H264))]
+    offset = len(header)
+    for data, time_ns, keyframe in stream:
+        samples = fragmenter.push(data, time_ns, keyframe)
+        if samples:
+            chunk = muxer.fragment(samples)
+            index.append(indexer.fragment(samples, offset, len(chunk)))
+            chunks.append(chunk)
+            offset += len(chunk)
+    samples = fragmenter.flush()
+    chunk = muxer.fragment(samples)
+    index.append(indexer.fragment(samples, offset, len(chunk)) + indexer.flush())
+    chunks.append(chunk)
+    with open(path, 'wb') as f:
+        f.write(b''.join(chunks))
+    with open(str(path) + gop_index.INDEX_SUFFIX, 'wb') as f:
+        f.write(b''.join(index))
+    return indexer
+
+
+@pytest.fixture(params=sorted(mux.MUXERS))
+def recording(request, tmp_path, h264_stream):
+    path = tmp_path / f"capture.{request.param}"
+    write_recording(path, request.param, h264_stream)
+    with gop_index.RecordingReader(str(path)) as reader:
+        yield reader
+
+
+def test_indexer_makes_an_entry_per_gop(tmp_path, h264_stream):
+    indexer = write_recording(tmp_path / "capture.mp4", "mp4", h264_stream)
+    assert (indexer.gop_count, indexer.frame_count) == (3, 360)
+
+
+def test_entries(recording):
+    gops = recording.gops
+    assert len(recording) == 3
+    assert gops['first_frame'].tolist() == [0, 120, 240]
+    assert gops['frame_count'].tolist() == [120, 120, 120]
+    # The GOPs follow the header and each other without gaps
+    assert int(gops['offset'][0]) == len(recording.header)
+    assert (gops['offset'][1:] == gops['offset'][:-1] + gops['size'][:-1]).all()
+    assert (gops['time_ns'][1:] == gops['time_ns'][:-1] + gops['duration_ns'][:-1]).all()
+    assert recording.frame_count == 360
+    assert recording.duration == pytest.approx(6.0, abs=0.01)
+    assert recording.parameter_sets == nal_frame(SPS, PPS)
+
+
+def test_find(recording):
+    starts = (recording.gops['time_ns'] / 1e9).tolist()
+    assert starts[0] == 0.0
+    for index, start in enumerate(starts):
+        assert recording.find(start) == index
+        assert recording.find(start + 0.5) == index
+        if index:
+            assert recording.find(start - 0.001) == index - 1
+    # Clamped to the first and the last GOP
+    assert recording.find(-1.0) == 0
+    assert recording.find(recording.duration + 60) == 2
+    assert recording.seek(3.0).index == recording.find(3.0) == 1
+
+
+def test_segment_decodes_on_its_own(recording):
+    segment = recording.seek(2.5)
+    samples = segment.samples()
+    assert len(samples) == segment.frame_count == 120
+    assert samples[0].keyframe and not any(sample.keyframe for sample in samples[1:])
+    frames = segment.frames()
+    assert [number for number, _ in frames] == list(range(120, 240))
+    # The keyframe gets the parameter sets in front
+    assert frames[0][1].startswith(recording.parameter_sets)
+    assert not frames[1][1].startswith(recording.parameter_sets)
+    assert len(mux.MUXERS[recording.container].samples(segment.file()[len(recording.header):])) == 120
+
+
+def test_cut_short_recording(tmp_path, h264_stream):
+    path = tmp_path / "capture.mp4"
+    write_recording(path, "mp4", h264_stream)
+    index_path = str(path) + gop_index.INDEX_SUFFIX
+    with gop_index.RecordingReader(str(path)) as reader:
+        last = reader.gops[-1]
+        end = int(last['offset']) + int(last['size'])
+    # A crash mid GOP: its data and half of its entry never made it
+    with open(path, 'r+b') as f:
+        f.truncate(end - 1)
+    with open(index_path, 'r+b') as f:
+        f.truncate(f.seek(0, 2) - gop_index.GOP_INDEX_DTYPE.itemsize // 2)
+    with gop_index.RecordingReader(str(path)) as reader:
+        assert len(reader) == 2
+        assert reader.find(5.0) == 1
+
+
+def test_not_an_index(tmp_path):
+    path = tmp_path / "capture.mp4"
+    path.write_bytes(b'')
+    (tmp_path / ("capture.mp4" + gop_index.INDEX_SUFFIX)).write_bytes(b'not an index')
+    with pytest.raises(ValueError):
+        gop_index.RecordingReader(str(path))
@@ -0,0 +1,126 @@
+"""Fragmenting and muxing into MP4/Matroska, read back with the muxers' samples()."""
+
+import pytest
+
+from chiaki_python import _chiaki, mux
+from conftest import FRAME_NS, HEIGHT, PPS, SPS, WIDTH, nal_frame, picture
+
+H264 = _chiaki.CHIAKI_CODEC_H264
+
+
+def mux_stream(muxer_class, stream, interval=1.0):
+    """Mux the stream like a Recorder: (file bytes, header size, fragments pushed out)."""
+    fmt = mux.video_format(stream[0][0] + stream[1][0], H264)
+    muxer = muxer_class(fmt)
+    fragmenter = mux.Fragmenter(H264, muxer.timescale, stream[0][1], interval)
+    header = muxer.header()
+    chunks = [header]
+    fragments = []
+    for data, time_ns, keyframe in stream:
+        samples = fragmenter.push(data, time_ns, keyframe)
+        if samples:
+            fragments.append(samples)
+            chunks.append(muxer.fragment(samples))
+    samples = fragmenter.flush()
+    fragments.append(samples)
+    chunks.append(muxer.fragment(samples) + muxer.trailer())
+    return b''.join(chunks), len(header), fragments
+
+
+def pictures(stream):
+    """The stream as the samples should carry it: each header joined with its keyframe."""
+    expected = []
+    prefix = b''
+    for data, _, keyframe in stream:
+        if data.startswith(nal_frame(SPS)):
+            prefix = data
+            continue
+        expected.append((prefix + data, keyframe))
+        prefix = b''
+    return expected
+
+
+def test_split_nals_and_back():
+    frame = nal_frame(b'\x09\xf0', SPS, PPS) + b'\x00\x00\x01' + picture(0, True)[4:] + b'\x00'
+    nals = [bytes(nal) for nal in mux.split_nals(frame)]
+    assert nals == [b'\x09\xf0', SPS, PPS, picture(0, True)[4:]]
+    # The access unit delimiter is dropped, the rest survives the round trip
+    assert mux.annex_b(mux.length_prefixed(mux.split_nals(frame), H264)) == nal_frame(*nals[1:])
+
+
+def test_video_format():
+    fmt = mux.video_format(nal_frame(SPS, PPS) + picture(0, True), H264)
+    assert (fmt.codec, fmt.width, fmt.height) == (H264, WIDTH, HEIGHT)
+    # avcC: version, profile, compatibility, level, then one SPS and one PPS
+    assert fmt.config[:4] == bytes((1, 100, 0, 31))
+    assert SPS in fmt.config and PPS in fmt.config
+    assert mux.video_format(nal_frame(SPS) + picture(0, True), H264) is None
+    assert mux.video_format(picture(1, False), H264) is None
+
+
+def test_fragmenter_cuts_at_keyframes(h264_stream):
+    fragmenter = mux.Fragmenter(H264, mux.MP4_TIMESCALE, h264_stream[0][1], interval=10.0)
+    fragments = [samples for data, time_ns, keyframe in h264_stream
+                 if (samples := fragmenter.push(data, time_ns, keyframe))]
+    fragments.append(fragmenter.flush())
+    # No interval cut within 10 s: one fragment per GOP, each starting at its keyframe
+    assert [len(samples) for samples in fragments] == [120, 120, 120]
+    for samples in fragments:
+        assert samples[0].keyframe
+        assert not any(sample.keyframe for sample in samples[1:])
+
+
+def test_fragmenter_cuts_at_interval(h264_stream):
+    fragmenter = mux.Fragmenter(H264, mux.MP4_TIMESCALE, h264_stream[0][1], interval=0.5)
+    fragments = [samples for data, time_ns, keyframe in h264_stream
+                 if (samples := fragmenter.push(data, time_ns, keyframe))]
+    fragments.append(fragmenter.flush())
+    assert sum(len(samples) for samples in fragments) == 360
+    assert sum(samples[0].keyframe for samples in fragments) == 3
+    max_ticks = mux.MP4_TIMESCALE // 2
+    for samples in fragments:
+        assert samples[-1].time - samples[0].time < max_ticks
+    # Every fragment starts where the previous one ended
+    for before, after in zip(fragments, fragments[1:]):
+        assert before[-1].time + before[-1].duration == after[0].time
+
+
+def test_fragmenter_joins_header_and_keeps_duration():
+    fragmenter = mux.Fragmenter(H264, 1000, 0, interval=10.0)
+    assert fragmenter.push(nal_frame(SPS, PPS), 0, False) is None
+    assert fragmenter.push(picture(0, True), 0, True) is None
+    # Frames of one batch share an arrival time, the later one moves a tick on
+    assert fragmenter.push(picture(1, False), 0, False) is None
+    assert fragmenter.push(picture(2, False), 20_000_000, False) is None
+    samples = fragmenter.flush()
+    assert [(s.time, s.duration, s.keyframe) for s in samples] == [(0, 1, True), (1, 19, False), (20, 19, False)]
+    assert mux.annex_b(samples[0].data) == nal_frame(SPS, PPS) + picture(0, True)
+
+
+@pytest.mark.parametrize("muxer_class", [mux.Mp4Muxer, mux.MkvMuxer])
+def test_round_trip(muxer_class, h264_stream):
+    data, header_size, fragments = mux_stream(muxer_class, h264_stream)
+    samples = muxer_class.samples(data[header_size:])
+    assert len(samples) == 360
+    assert [(mux.annex_b(sample.data), sample.keyframe) for sample in samples] == pictures(h264_stream)
+    assert [sample.time for sample in samples] == [sample.time for samples in fragments for sample in samples]
+    ticks = FRAME_NS * muxer_class.timescale // 1_000_000_000
+    assert all(ticks <= sample.duration <= ticks + 1 for sample in samples[:-1])
+
+
+def test_mp4_samples_skip_the_init_segment(h264_stream):
+    data, header_size, _ = mux_stream(mux.Mp4Muxer, h264_stream)
+    assert data[4:8] == b'ftyp'
+    assert mux.Mp4Muxer.samples(data) == mux.Mp4Muxer.samples(data[header_size:])
+
+
+def test_mkv_cluster_split():
+    fmt = mux.video_format(nal_frame(SPS, PPS) + picture(0, True), H264)
+    muxer = mux.MkvMuxer(fmt)
+    # 40 s apart, past the 16-bit relative time of a SimpleBlock
+    samples = [mux.Sample(0, 40_000, True, mux.length_prefixed(mux.split_nals(picture(0, True)), H264)),
+               mux.Sample(40_000, 1, False, mux.length_prefixed(mux.split_nals(picture(1, False)), H264))]
+    data = muxer.fragment(samples)
+    assert data.count(b'\x1f\x43\xb6\x75') == 2
+    assert [(s.time, s.keyframe, s.data) for s in mux.MkvMuxer.samples(data)] == \
+        [(s.time, s.keyframe, s.data) for s in samples]